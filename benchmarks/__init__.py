@@ -0,0 +1 @@
+"""End-to-end performance benchmarks for ingest, enrich and export (run with ``python -m benchmarks``)."""
@@ -0,0 +1,219 @@
+"""
+Run the end-to-end benchmarks: ``python -m benchmarks [OPTIONS]``.
+
+Builds a synthetic corpus, then runs the selected stages against it:
+
+* ``startup``: ``doctrail --help``, the import cost every command pays
+* ``ingest``: ``doctrail ingest`` of text and HTML files
+* ``query``: ``execute_query_optimized`` over the enrichment's input query
+* ``enrich``: ``doctrail enrich`` of a schema-driven enrichment, against
+  ``doctrail stub``
+* ``export``: ``doctrail export`` of the enriched rows to Markdown
+
+Results are written as JSON and compared with the baseline file, if there is
+one; the exit code is 1 when a metric regressed (see ``benchmarks.compare``).
+"""
+
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+from datetime import datetime
+from typing import Any, Dict
+
+import click
+import yaml
+
+from .compare import DEFAULT_THRESHOLD, compare, format_comparison
+from .corpus import populate_database, write_corpus
+from .harness import REPO_ROOT, StubAPI, doctrail_command, llm_latency, query_benchmark, run_stage
+
+STAGES = ('startup', 'ingest', 'query', 'enrich', 'export')
+ENRICHMENT = 'bench_summary'
+INPUT_QUERY = "SELECT rowid, sha1, content FROM documents"
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+BASELINE = os.path.join(REPO_ROOT, 'benchmarks', 'baseline.json')
+
+
+def benchmark_config(db_path: str, api_concurrency: int, batch_size: int, enriched: bool) -> Dict[str, Any]:
+    """A doctrail config with one schema-driven enrichment and a Markdown export of its results."""
+    export_query = (f"SELECT d.sha1, d.filename AS title, s.summary FROM documents d JOIN {ENRICHMENT} s ON s.sha1 = d.sha1"
+                    if enriched else "SELECT sha1, filename AS title FROM documents")
+    return {
+        'database': db_path,
+        'default_model': 'gpt-4o-mini',
+        'default_table': 'documents',
+        'api_concurrency': api_concurrency,
+        'batch_size': batch_size,
+        'sql_queries': {'all_documents': INPUT_QUERY},
+        'enrichments': [{
+            'name': ENRICHMENT,
+            'input': {'query': 'all_documents', 'input_columns': ['content']},
+            'output_table': ENRICHMENT,
+            'schema': {
+                'summary': {'type': 'string'},
+                'topic': {'enum': ['court', 'health', 'budget', 'other']},
+                'keywords': {'type': 'array', 'items': {'type': 'string'}, 'maxItems': 5},
+                'amount': {'type': 'integer', 'minimum': 0},
+            },
+            'prompt': "Summarise the document, classify its topic and list up to five keywords.",
+        }],
+        'exports': {'bench_export': {
+            'query': export_query,
+            'formats': [],  # Markdown only; other formats need pandoc
+            'template': 'parallel-translation',
+            'template_config': {'template': 'templates/parallel-translation.md', 'styling': {}},
+        }},
+    }
+
+
+def _count(db_path: str, table: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds else 0.0
+
+
+@click.command()
+@click.option('--docs', type=int, default=500, help='Number of synthetic documents')
+@click.option('--doc-chars', type=int, default=4000, help='Average document size in characters')
+@click.option('--zh-share', type=float, default=0.5, help='Share of Chinese documents (the rest are English)')
+@click.option('--html-share', type=float, default=0.3, help='Share of documents written as HTML for ingest')
+@click.option('--stages', default=','.join(STAGES), help=f"Comma-separated stages to run ({', '.join(STAGES)})")
+@click.option('--stub-latency-ms', type=float, default=200.0, help='Median latency of the stub LLM API')
+@click.option('--stub-rate-limit', type=float, default=0.0, help='Share of stub requests answered with 429')
+@click.option('--api-concurrency', type=int, default=100, help='api_concurrency for the enrich stage')
+@click.option('--batch-size', type=int, default=100, help='batch_size for the enrich stage')
+@click.option('--seed', type=int, default=0, help='Seed for the corpus and the stub')
+@click.option('--workdir', help='Directory for the corpus, database and logs (default: a temporary directory)')
+@click.option('--output', help='Results JSON file (default: benchmarks/results/<timestamp>.json)')
+@click.option('--baseline', default=BASELINE, show_default=True, help='Baseline results to compare with')
+@click.option('--threshold', type=float, default=DEFAULT_THRESHOLD, show_default=True,
+              help='Allowed slowdown before a metric counts as a regression (0.2 = 20%)')
+@click.option('--update-baseline', is_flag=True, help='Save these results as the new baseline')
+@click.pass_context
+def main(ctx, docs: int, doc_chars: int, zh_share: float, html_share: float, stages: str, stub_latency_ms: float,
+         stub_rate_limit: float, api_concurrency: int, batch_size: int, seed: int, workdir: str, output: str,
+         baseline: str, threshold: float, update_baseline: bool):
+    """Benchmark ingest, enrich and export end to end."""
+    selected = [s.strip() for s in stages.split(',') if s.strip()]
+    unknown = set(selected) - set(STAGES)
+    if unknown:
+        raise click.BadParameter(f"unknown stages: {', '.join(sorted(unknown))}", param_hint='--stages')
+    workdir = workdir or tempfile.mkdtemp(prefix='doctrail-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, 'bench.db')
+    if os.path.exists(db_path):
+        raise click.UsageError(f"{db_path} already exists; use an empty --workdir")
+    config_path = os.path.join(workdir, 'bench.yml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(benchmark_config(db_path, api_concurrency, batch_size, 'enrich' in selected), f)
+    click.echo(f"📂 Working in {workdir}")
+
+    params = {'docs': docs, 'doc_chars': doc_chars, 'zh_share': zh_share, 'html_share': html_share,
+              'stub_latency_ms': stub_latency_ms, 'stub_rate_limit': stub_rate_limit,
+              'api_concurrency': api_concurrency, 'batch_size': batch_size, 'seed': seed}
+    results: Dict[str, Any] = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': params,
+        'stages': {},
+    }
+    stage_results = results['stages']
+
+    if 'startup' in selected:
+        click.echo("⏱️  startup")
+        stage_results['startup'] = run_stage('startup', doctrail_command('--help'), db_path, workdir)
+        for size in ('db_size_mb', 'wal_peak_mb'):
+            del stage_results['startup'][size]
+
+    if 'ingest' in selected:
+        corpus = os.path.join(workdir, 'corpus')
+        write_corpus(corpus, docs, doc_chars, zh_share, html_share, seed)
+        click.echo("⏱️  ingest")
+        metrics = run_stage('ingest', doctrail_command('ingest', '--input-dir', corpus, '--db-path', db_path, '--yes'),
+                            db_path, workdir)
+        ingested = _count(db_path, 'documents')
+        stage_results['ingest'] = {'docs': ingested, 'docs_per_s': _rate(ingested, metrics['wall_s']), **metrics}
+    else:
+        populate_database(db_path, docs, doc_chars, zh_share, seed)
+
+    if 'query' in selected:
+        click.echo("⏱️  query")
+        stage_results['query'] = query_benchmark(db_path, INPUT_QUERY, ['content'])
+
+    if 'enrich' in selected:
+        click.echo("⏱️  enrich")
+        with StubAPI(workdir, stub_latency_ms, stub_rate_limit, seed) as stub:
+            metrics = run_stage('enrich', doctrail_command('enrich', '--config', config_path, '--enrichments', ENRICHMENT,
+                                                           '--skip-cost-check', '--overwrite'),
+                                db_path, workdir, env=stub.env())
+            stub_stats = stub.stats()
+        rows = _count(db_path, ENRICHMENT)
+        stage_results['enrich'] = {
+            'rows': rows,
+            'rows_per_s': _rate(rows, metrics['wall_s']),
+            **metrics,
+            **llm_latency(db_path, ENRICHMENT),
+            'peak_concurrency': stub_stats['peak_in_flight'],
+            'rate_limited': stub_stats['rate_limited'],
+        }
+
+    if 'export' in selected:
+        click.echo("⏱️  export")
+        export_dir = os.path.join(workdir, 'export')
+        metrics = run_stage('export', doctrail_command('export', '--config', config_path, '--export-type', 'bench_export',
+                                                       '--output-dir', export_dir), db_path, workdir)
+        exported = len(os.listdir(export_dir)) if os.path.isdir(export_dir) else 0
+        stage_results['export'] = {'docs': exported, 'docs_per_s': _rate(exported, metrics['wall_s']), **metrics}
+
+    output = output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for stage, metrics in stage_results.items():
+        click.echo(f"{stage:>7}: " + ", ".join(f"{k}={v}" for k, v in metrics.items()))
+    click.echo(f"📝 Results written to {output}")
+
+    if update_baseline:
+        with open(baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        click.echo(f"📌 Baseline updated: {baseline}")
+        return
+    if not os.path.exists(baseline):
+        click.echo(f"No baseline at {baseline}; run with --update-baseline to create one.")
+        return
+    with open(baseline) as f:
+        stored = json.load(f)
+    if stored.get('params') != params:
+        click.echo(f"⚠️  The baseline was recorded with different parameters: {stored.get('params')}")
+    comparisons = compare(results, stored, threshold)
+    click.echo(f"\nCompared with baseline {baseline} (commit {stored.get('commit', '?')}):")
+    click.echo(format_comparison(comparisons))
+    regressions = [c for c in comparisons if c['regressed']]
+    if regressions:
+        click.echo(f"\n❌ {len(regressions)} metrics regressed by more than their threshold")
+        ctx.exit(1)
+    click.echo("\n✅ No regressions")
+
+
+if __name__ == '__main__':
+    main()
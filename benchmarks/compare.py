@@ -0,0 +1,71 @@
+"""
+Comparing benchmark results with a stored baseline.
+
+Results are nested ``{stage: {metric: value}}`` dictionaries. Metrics are
+compared by their name: ``*_per_s`` is a throughput, where higher is better;
+``*_s``, ``*_ms`` and ``*_mb`` are times and sizes, where lower is better.
+Other metrics, such as counts, are reported but not compared. A metric
+regresses when it is worse than the baseline by more than its threshold, a
+ratio (0.2 = 20%) that the baseline file can set per metric under
+``thresholds``.
+"""
+
+from typing import Any, Dict, List, Optional
+
+DEFAULT_THRESHOLD = 0.2
+
+# Timings this short are dominated by noise; they are not compared
+MIN_COMPARED_MS = 5.0
+
+
+def flatten(stages: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+    """{'stage.metric': value} for the numeric metrics of each stage."""
+    return {f"{stage}.{metric}": value
+            for stage, metrics in stages.items()
+            for metric, value in metrics.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+
+def direction(metric: str) -> Optional[int]:
+    """+1 if higher is better, -1 if lower is better, None if the metric is not compared."""
+    name = metric.rsplit('.', 1)[-1]
+    if name.endswith('_per_s'):
+        return 1
+    if name.endswith(('_s', '_ms', '_mb')):
+        return -1
+    return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """One entry per compared metric: baseline and current value, change and whether it regressed."""
+    current, before = flatten(results['stages']), flatten(baseline['stages'])
+    thresholds = baseline.get('thresholds') or {}
+    comparisons = []
+    for metric, value in sorted(current.items()):
+        sign = direction(metric)
+        old = before.get(metric)
+        if sign is None or old is None or old == 0:
+            continue
+        if metric.endswith('_ms') and max(old, value) < MIN_COMPARED_MS:
+            continue
+        change = (value - old) / old
+        limit = thresholds.get(metric, threshold)
+        comparisons.append({
+            'metric': metric,
+            'baseline': old,
+            'current': value,
+            'change': change,
+            'regressed': -sign * change > limit,
+        })
+    return comparisons
+
+
+def format_comparison(comparisons: List[Dict[str, Any]]) -> str:
+    if not comparisons:
+        return "No metrics in common with the baseline."
+    lines = [f"{'metric':<28} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for c in comparisons:
+        flag = "  ❌ regression" if c['regressed'] else ""
+        lines.append(f"{c['metric']:<28} {c['baseline']:>12,.2f} {c['current']:>12,.2f} {c['change']:>+8.1%}{flag}")
+    return "\n".join(lines)
@@ -0,0 +1,84 @@
+"""
+Synthetic corpora for the benchmarks.
+
+Documents are built from a fixed vocabulary with a seeded generator, so the
+same parameters always give the same corpus. ``write_corpus`` writes text and
+HTML files for the ingest benchmark; ``populate_database`` fills a documents
+table directly, for enrichment benchmarks that skip ingest.
+"""
+
+import hashlib
+import os
+import random
+import sqlite3
+from typing import List
+
+EN_WORDS = (
+    "the court ruled that compensation for the family was paid by the provincial hospital after a review "
+    "of medical records donor transplant committee report annual budget village county city government "
+    "policy regulation evidence witness statement appeal judgment insurance payment amount yuan"
+).split()
+ZH_WORDS = (
+    "法院 判决 赔偿 家属 医院 省级 审查 病历 捐献 移植 委员会 报告 年度 预算 村 县 市 政府 政策 规定 "
+    "证据 证人 陈述 上诉 判决书 保险 支付 金额 元 红十字会 慰问金"
+).split()
+
+
+def make_text(rng: random.Random, chars: int, chinese: bool) -> str:
+    """About ``chars`` characters of sentences in one language."""
+    words, joiner, stop = (ZH_WORDS, '', '。') if chinese else (EN_WORDS, ' ', '. ')
+    sentences, length = [], 0
+    while length < chars:
+        sentence = joiner.join(rng.choice(words) for _ in range(rng.randint(6, 18))) + stop
+        sentences.append(sentence)
+        length += len(sentence)
+    return ''.join(sentences)[:chars]
+
+
+def _documents(docs: int, doc_chars: int, zh_share: float, seed: int):
+    rng = random.Random(seed)
+    for i in range(docs):
+        chinese = rng.random() < zh_share
+        # Sizes vary around doc_chars, like a real collection
+        chars = max(200, int(rng.gauss(doc_chars, doc_chars / 4)))
+        yield i, chinese, f"Document {i}\n\n" + make_text(rng, chars, chinese)
+
+
+def write_corpus(directory: str, docs: int, doc_chars: int, zh_share: float = 0.5,
+                 html_share: float = 0.3, seed: int = 0) -> List[str]:
+    """Write ``docs`` .txt and .html files into ``directory``; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed + 1)
+    paths = []
+    for i, chinese, text in _documents(docs, doc_chars, zh_share, seed):
+        if rng.random() < html_share:
+            title, _, body = text.partition('\n\n')
+            paragraphs = ''.join(f"<p>{p}</p>" for p in body.split('。' if chinese else '. ') if p)
+            path = os.path.join(directory, f"doc_{i:06d}.html")
+            content = f"<html><head><title>{title}</title></head><body><h1>{title}</h1>{paragraphs}</body></html>"
+        else:
+            path = os.path.join(directory, f"doc_{i:06d}.txt")
+            content = text
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+
+def populate_database(db_path: str, docs: int, doc_chars: int, zh_share: float = 0.5,
+                      seed: int = 0, table: str = 'documents') -> None:
+    """Create ``table`` with the columns ingest creates and fill it with ``docs`` documents."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+            sha1 TEXT PRIMARY KEY, filename TEXT, filepath TEXT, content TEXT,
+            file_created TEXT, file_modified TEXT)""")
+        rows = []
+        for i, _, text in _documents(docs, doc_chars, zh_share, seed):
+            name = f"doc_{i:06d}.txt"
+            rows.append((hashlib.sha1(text.encode('utf-8')).hexdigest(), name, name, text,
+                         '2024-01-01T00:00:00', '2024-01-01T00:00:00'))
+        conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
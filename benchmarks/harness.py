@@ -0,0 +1,161 @@
+"""
+Running doctrail commands as measured benchmark stages.
+
+Each stage runs the real CLI in a child process, so its peak RSS is its own
+(read from ``wait4``). While it runs, the database's WAL file is sampled for
+its peak size. Enrichment stages talk to ``doctrail stub`` instead of a real
+API (see ``StubAPI``).
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WAL_SAMPLE_SECONDS = 0.05
+
+
+def doctrail_command(*args: str) -> List[str]:
+    return [sys.executable, os.path.join(REPO_ROOT, 'doctrail.py'), '--skip-requirements', *args]
+
+
+def _mb(size: float) -> float:
+    return round(size / (1024 * 1024), 2)
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def run_stage(name: str, command: List[str], db_path: str, log_dir: str,
+              env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Run one command; returns wall time, peak RSS, database size and peak WAL size.
+
+    Raises:
+        RuntimeError: If the command fails (its log is named in the message)
+    """
+    log_path = os.path.join(log_dir, f"{name}.log")
+    # doctrail creates an OpenAI client on import, which wants a key even for ingest and export
+    env = {'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'unused'), **(env or {})}
+    wal_path = db_path + '-wal'
+    wal_peak = _file_size(wal_path)
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT,
+                                   env={**os.environ, **env}, cwd=REPO_ROOT)
+        done = threading.Event()
+
+        def sample_wal():
+            nonlocal wal_peak
+            while not done.wait(WAL_SAMPLE_SECONDS):
+                wal_peak = max(wal_peak, _file_size(wal_path))
+
+        sampler = threading.Thread(target=sample_wal, daemon=True)
+        sampler.start()
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        done.set()
+        sampler.join()
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark stage '{name}' failed with exit code {process.returncode}; see {log_path}")
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return {
+        'wall_s': round(wall, 3),
+        'peak_rss_mb': _mb(peak_rss),
+        'db_size_mb': _mb(_file_size(db_path)),
+        'wal_peak_mb': _mb(max(wal_peak, _file_size(wal_path))),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class StubAPI:
+    """A ``doctrail stub`` process for the duration of a ``with`` block."""
+
+    def __init__(self, log_dir: str, latency_ms: float, rate_limit: float = 0.0, seed: int = 0):
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.args = ['stub', '--port', str(self.port), '--latency-ms', str(latency_ms),
+                     '--rate-limit', str(rate_limit), '--seed', str(seed)]
+        self.log_path = os.path.join(log_dir, 'stub.log')
+        self.process: Optional[subprocess.Popen] = None
+
+    def env(self) -> Dict[str, str]:
+        """Environment that sends a doctrail process's LLM requests to the stub."""
+        return {'OPENAI_API_KEY': 'stub', 'OPENAI_BASE_URL': f"{self.base_url}/v1",
+                'GEMINI_API_KEY': 'stub', 'GOOGLE_GEMINI_BASE_URL': self.base_url}
+
+    def stats(self) -> Dict[str, Any]:
+        with urllib.request.urlopen(f"{self.base_url}/stats", timeout=5) as response:
+            return json.loads(response.read())
+
+    def __enter__(self) -> 'StubAPI':
+        self._log = open(self.log_path, 'w')
+        self.process = subprocess.Popen(doctrail_command(*self.args), stdout=self._log, stderr=subprocess.STDOUT,
+                                        env={**os.environ, **self.env()}, cwd=REPO_ROOT)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                self.stats()
+                return self
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.__exit__(None, None, None)
+                    raise RuntimeError(f"doctrail stub did not start; see {self.log_path}")
+                time.sleep(0.2)
+
+    def __exit__(self, *exc) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+        self._log.close()
+
+
+def llm_latency(db_path: str, enrichment_name: str) -> Dict[str, Any]:
+    """Latency percentiles of the enrichment's successful calls, from llm_calls."""
+    sys.path.insert(0, REPO_ROOT)
+    from src.db_operations import get_llm_calls
+    from src.llm.telemetry import summarize_calls
+
+    summaries = summarize_calls(get_llm_calls(db_path, [enrichment_name]))
+    if not summaries:
+        return {}
+    s = summaries[0]
+    ms = lambda value: round(value, 1) if value is not None else None
+    return {'llm_p50_ms': ms(s['p50_ms']), 'llm_p95_ms': ms(s['p95_ms']), 'llm_p99_ms': ms(s['p99_ms']),
+            'llm_calls': s['calls'], 'llm_errors': s['errors']}
+
+
+def query_benchmark(db_path: str, query: str, input_columns: List[str], repeats: int = 5) -> Dict[str, Any]:
+    """Time ``execute_query_optimized`` over the enrichment's input query (in this process)."""
+    sys.path.insert(0, REPO_ROOT)
+    from src.db_operations import execute_query_optimized
+
+    timings, rows = [], 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = len(execute_query_optimized(db_path, query, input_columns))
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        'rows': rows,
+        'best_ms': round(best * 1000, 2),
+        'median_ms': round(sorted(timings)[len(timings) // 2] * 1000, 2),
+        'rows_per_s': round(rows / best, 1) if best else None,
+    }
+
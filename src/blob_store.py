@@ -0,0 +1,101 @@
+"""
+Content-addressed, deduplicated blob storage inside the SQLite database.
+
+Prompts, document inputs and long responses are stored once in the ``blobs``
+table keyed by their SHA1 and referenced by hash, so identical prompt
+templates and the same document text sent to several enrichments or models
+are kept once.
+
+Texts shorter than ``COMPRESS_MIN_CHARS`` are stored as plain text (codec
+``none``) and larger ones zlib-compressed (codec ``zlib``). Two views expose
+the original column shape:
+
+* ``enrichment_responses_full`` resolves every blob through ``blob_text()``,
+  a SQL function registered on doctrail's connections.
+* ``enrichment_responses_plain`` is plain SQL for other clients (the
+  ``sqlite3`` shell, Datasette, pandas); values held in compressed blobs read
+  as NULL there.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import zlib
+from typing import Optional, Tuple, Union
+
+BLOBS_TABLE = "blobs"
+
+# Responses shorter than this stay inline in enrichment_responses.raw_json
+RAW_JSON_INLINE_LIMIT = 2048
+
+# Blobs shorter than this are stored uncompressed, readable with plain SQL
+COMPRESS_MIN_CHARS = 2048
+
+PLAIN_CODEC = 'none'
+ZLIB_LEVEL = 6
+
+
+def blob_hash(text: str) -> str:
+    """SHA1 of the UTF-8 text, used as the blob key."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def compress_text(text: str) -> Tuple[str, Union[str, bytes]]:
+    """Encode text for storage, returning (codec, data); short texts are kept as plain text."""
+    if len(text) < COMPRESS_MIN_CHARS:
+        return PLAIN_CODEC, text
+    return 'zlib', zlib.compress(text.encode('utf-8'), ZLIB_LEVEL)
+
+
+def decompress_text(codec: Optional[str], data) -> Optional[str]:
+    """Inverse of compress_text; NULL in, NULL out (so it can back SQL views)."""
+    if data is None:
+        return None
+    if codec == PLAIN_CODEC:
+        return data if isinstance(data, str) else bytes(data).decode('utf-8')
+    if codec == 'zlib':
+        return zlib.decompress(data).decode('utf-8')
+    raise ValueError(f"Unknown blob codec: {codec}")
+
+
+def register_blob_functions(conn: sqlite3.Connection) -> None:
+    """Register blob_text(codec, data), which backs the enrichment_responses_full view."""
+    conn.create_function('blob_text', 2, decompress_text, deterministic=True)
+
+
+def ensure_blobs_table(conn: sqlite3.Connection, schema: str = 'main') -> None:
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{BLOBS_TABLE} (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+def put_blob(conn: sqlite3.Connection, text: Optional[str]) -> Optional[str]:
+    """Store text if not already present and return its hash. Does not commit."""
+    if text is None:
+        return None
+    key = blob_hash(text)
+    # Skip compression entirely when the content is already stored
+    if conn.execute(f"SELECT 1 FROM {BLOBS_TABLE} WHERE hash = ?", (key,)).fetchone():
+        return key
+    codec, data = compress_text(text)
+    conn.execute(
+        f"INSERT OR IGNORE INTO {BLOBS_TABLE} (hash, codec, size, data) VALUES (?, ?, ?, ?)",
+        (key, codec, len(text), data)
+    )
+    return key
+
+
+def get_blob(conn: sqlite3.Connection, key: Optional[str]) -> Optional[str]:
+    """Return the text for a hash, or None if unknown."""
+    if key is None:
+        return None
+    row = conn.execute(f"SELECT codec, data FROM {BLOBS_TABLE} WHERE hash = ?", (key,)).fetchone()
+    if row is None:
+        logging.warning(f"Blob {key[:12]} referenced but not found")
+        return None
+    return decompress_text(row[0], row[1])
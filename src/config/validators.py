@@ -3,6 +3,8 @@
 import os
 from typing import List, Dict, Any
 
+from ..constants import LLM_TRANSPORT_MODES, PROMPT_LAYOUTS, PROVIDER_POOL_ROUTING
+
 
 class ConfigValidator:
     """Validates configuration structure and values."""
@@ -40,6 +42,31 @@ class ConfigValidator:
         if 'exports' in config:
             errors.extend(self._validate_exports(config['exports']))
         
+        # Validate storage layout
+        if 'storage' in config:
+            errors.extend(self._validate_storage(config['storage']))
+        
+        if 'prompt_layout' in config and config['prompt_layout'] not in PROMPT_LAYOUTS:
+            errors.append(f"'prompt_layout' must be one of: {', '.join(PROMPT_LAYOUTS)}")
+        
+        if 'streaming' in config and not isinstance(config['streaming'], bool):
+            errors.append("'streaming' must be true or false")
+        
+        if 'provider_pool' in config:
+            errors.extend(self._validate_provider_pool(config['provider_pool']))
+        
+        if 'llm_transport' in config:
+            errors.extend(self._validate_llm_transport(config['llm_transport']))
+        
+        if 'metrics' in config:
+            errors.extend(self._validate_metrics(config['metrics']))
+        
+        # Validate the shared API budget
+        if 'api_concurrency' in config:
+            concurrency = config['api_concurrency']
+            if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+                errors.append("'api_concurrency' must be a positive integer")
+        
         return errors
     
     def _validate_enrichments(self, enrichments: List[Dict[str, Any]]) -> List[str]:
@@ -92,6 +119,24 @@ class ConfigValidator:
                 schema_errors = self._validate_schema(enrichment['schema'], enrichment.get('name', i))
                 errors.extend(schema_errors)
         
+        for enrichment in enrichments:
+            if 'prompt_layout' in enrichment and enrichment['prompt_layout'] not in PROMPT_LAYOUTS:
+                errors.append(f"Enrichment '{enrichment.get('name')}': 'prompt_layout' must be one of: {', '.join(PROMPT_LAYOUTS)}")
+            if 'streaming' in enrichment and not isinstance(enrichment['streaming'], bool):
+                errors.append(f"Enrichment '{enrichment.get('name')}': 'streaming' must be true or false")
+        
+        # depends_on must name other enrichments
+        for enrichment in enrichments:
+            depends_on = enrichment.get('depends_on', [])
+            if isinstance(depends_on, str):
+                depends_on = [depends_on]
+            if not isinstance(depends_on, list):
+                errors.append(f"Enrichment '{enrichment.get('name')}': 'depends_on' must be a list of enrichment names")
+                continue
+            for dep in depends_on:
+                if dep not in names_seen or dep == enrichment.get('name'):
+                    errors.append(f"Enrichment '{enrichment.get('name')}' depends on unknown enrichment '{dep}'")
+        
         return errors
     
     def _validate_schema(self, schema: Any, enrichment_name: str) -> List[str]:
@@ -186,4 +231,133 @@ class ConfigValidator:
                         if fmt not in valid_formats:
                             errors.append(f"Export '{export_name}' has invalid format: '{fmt}'")
         
-        return errors
\ No newline at end of file
+        return errors
+    
+    def _validate_storage(self, storage: Any) -> List[str]:
+        """Validate the storage layout section.
+        
+        Args:
+            storage: Storage configuration
+            
+        Returns:
+            List of error messages
+        """
+        errors = []
+        
+        if not isinstance(storage, dict):
+            return ["'storage' must be a dictionary"]
+        
+        layout = storage.get('layout', 'single')
+        if layout not in ('single', 'split'):
+            errors.append(f"storage.layout must be 'single' or 'split', got '{layout}'")
+        
+        for key in ('audit_database', 'output_dir'):
+            if key in storage and not isinstance(storage[key], str):
+                errors.append(f"storage.{key} must be a path")
+        
+        return errors
+    
+    def _validate_provider_pool(self, pool: Any) -> List[str]:
+        """Validate the provider_pool section (OpenAI-compatible endpoints).
+        
+        Args:
+            pool: Provider pool configuration
+            
+        Returns:
+            List of error messages
+        """
+        if not isinstance(pool, dict):
+            return ["'provider_pool' must be a dictionary"]
+        errors = []
+        
+        routing = pool.get('routing', PROVIDER_POOL_ROUTING[0])
+        if routing not in PROVIDER_POOL_ROUTING:
+            errors.append(f"provider_pool.routing must be one of: {', '.join(PROVIDER_POOL_ROUTING)}")
+        
+        endpoints = pool.get('endpoints')
+        if not isinstance(endpoints, list) or not endpoints:
+            return errors + ["provider_pool.endpoints must be a non-empty list"]
+        for i, endpoint in enumerate(endpoints):
+            label = f"provider_pool endpoint {endpoint.get('name', i + 1) if isinstance(endpoint, dict) else i + 1}"
+            if not isinstance(endpoint, dict):
+                errors.append(f"{label} must be a dictionary")
+                continue
+            if 'api_key' in endpoint and 'api_key_env' in endpoint:
+                errors.append(f"{label}: give either 'api_key' or 'api_key_env', not both")
+            for key in ('weight', 'requests_per_minute'):
+                value = endpoint.get(key)
+                if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0):
+                    errors.append(f"{label}: '{key}' must be a positive number")
+            value = endpoint.get('max_concurrency')
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+                errors.append(f"{label}: 'max_concurrency' must be a positive integer")
+            models = endpoint.get('models')
+            if models is not None and not (isinstance(models, list) and all(isinstance(m, str) for m in models)):
+                errors.append(f"{label}: 'models' must be a list of model names")
+        
+        return errors
+    
+    def _validate_llm_transport(self, transport: Any) -> List[str]:
+        """Validate the llm_transport section (record/replay of LLM traffic).
+        
+        Args:
+            transport: Transport configuration
+            
+        Returns:
+            List of error messages
+        """
+        if not isinstance(transport, dict):
+            return ["'llm_transport' must be a dictionary"]
+        errors = []
+        
+        if transport.get('mode', 'replay') not in LLM_TRANSPORT_MODES:
+            errors.append(f"llm_transport.mode must be one of: {', '.join(LLM_TRANSPORT_MODES)}")
+        if not isinstance(transport.get('cassette'), str):
+            errors.append("llm_transport.cassette must be a file path")
+        
+        latency = transport.get('latency', 'recorded')
+        if isinstance(latency, dict):
+            if not isinstance(latency.get('median_ms'), (int, float)) or latency['median_ms'] <= 0:
+                errors.append("llm_transport.latency.median_ms must be a positive number")
+            if not isinstance(latency.get('sigma', 0.5), (int, float)) or latency.get('sigma', 0.5) < 0:
+                errors.append("llm_transport.latency.sigma must be a non-negative number")
+        elif not (latency in ('recorded', 'none') or (isinstance(latency, (int, float)) and not isinstance(latency, bool) and latency >= 0)):
+            errors.append("llm_transport.latency must be 'recorded', 'none', milliseconds or {median_ms, sigma}")
+        
+        error_rate = transport.get('error_rate', 0)
+        if not isinstance(error_rate, (int, float)) or isinstance(error_rate, bool) or not 0 <= error_rate <= 1:
+            errors.append("llm_transport.error_rate must be between 0 and 1")
+        statuses = transport.get('error_statuses')
+        if statuses is not None and not (isinstance(statuses, list) and statuses and all(isinstance(c, int) for c in statuses)):
+            errors.append("llm_transport.error_statuses must be a list of HTTP status codes")
+        
+        return errors
+    
+    def _validate_metrics(self, metrics: Any) -> List[str]:
+        """Validate the metrics section (Prometheus endpoint and textfile).
+        
+        Args:
+            metrics: Metrics configuration
+            
+        Returns:
+            List of error messages
+        """
+        if not isinstance(metrics, dict):
+            return ["'metrics' must be a dictionary"]
+        errors = []
+        
+        port = metrics.get('port')
+        textfile = metrics.get('textfile')
+        if port is None and textfile is None:
+            errors.append("metrics needs a 'port', a 'textfile' or both")
+        if port is not None and not (isinstance(port, int) and not isinstance(port, bool) and 0 <= port <= 65535):
+            errors.append("metrics.port must be a port number")
+        if textfile is not None and not isinstance(textfile, str):
+            errors.append("metrics.textfile must be a file path")
+        if not isinstance(metrics.get('host', ''), str):
+            errors.append("metrics.host must be a string")
+        interval = metrics.get('interval', 1)
+        if not isinstance(interval, (int, float)) or isinstance(interval, bool) or interval <= 0:
+            errors.append("metrics.interval must be a positive number of seconds")
+        
+        return errors
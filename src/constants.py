@@ -9,9 +9,21 @@ DEFAULT_DB_SEMAPHORE_LIMIT = 2    # Maximum concurrent database writes
 # Batch processing
 DEFAULT_BATCH_SIZE = 100
 MAX_BATCH_SIZE = 1000
+DEFAULT_WRITE_BATCH_SIZE = 200   # Enrichment results committed per write transaction
+DEFAULT_WRITE_MAX_DELAY = 2.0    # Seconds a buffered result may wait before it is committed
+DEFAULT_PAGE_SIZE = 1000         # Rows read per keyset page when selecting rows to enrich
 
 # Database settings
 DEFAULT_BUSY_TIMEOUT = 30.0  # SQLite busy timeout in seconds
+DEFAULT_POOL_SIZE = 8  # Idle connections kept open per database
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024  # Bytes of the database file memory-mapped per connection
+DEFAULT_STATEMENT_CACHE_SIZE = 256  # Prepared statements cached per connection
+
+# WAL checkpointing (see wal_checkpoint.py)
+WAL_CHECK_INTERVAL = 5.0  # Seconds between WAL size checks during a run
+WAL_PASSIVE_BYTES = 16 * 1024 * 1024  # Checkpoint once the -wal file is this large
+WAL_RESTART_BYTES = 256 * 1024 * 1024  # Escalate to RESTART beyond this even while busy
+WAL_IDLE_SECONDS = 1.0  # No connection activity for this long counts as an idle point
 DEFAULT_TABLE_NAME = "documents"
 DEFAULT_KEY_COLUMN = "sha1"
 
@@ -20,6 +32,11 @@ DEFAULT_MODEL = "gpt-4o-mini"
 DEFAULT_TEMPERATURE = 0.1
 DEFAULT_MAX_TOKENS = 4096
 
+# Prompt caching (prompt_layout: prefix)
+PROMPT_LAYOUTS = ('inline', 'prefix')  # inline: document substituted into the prompt; prefix: stable prompt first
+MIN_CACHED_PREFIX_TOKENS = 1024  # Shorter prefixes are not cached by providers
+PROMPT_CACHE_TTL_SECONDS = 900  # Lifetime of explicit (Gemini) context caches
+
 # File types
 SUPPORTED_FILE_EXTENSIONS: Set[str] = {
     # Documents
@@ -69,7 +86,7 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 # Progress display
-PROGRESS_BAR_FORMAT = '{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]'
+PROGRESS_BAR_FORMAT = '{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]'
 SPINNER_CHARS = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
 
 # Text extraction quality thresholds
@@ -80,6 +97,28 @@ MAX_EXTRACTION_ATTEMPTS = 3
 # API retry settings
 MAX_RETRY_ATTEMPTS = 3
 RETRY_DELAY_BASE = 2  # Base delay in seconds for exponential backoff
+RETRY_MAX_DELAY = 60  # Longest backoff between LLM request attempts (seconds)
+RETRY_AFTER_MAX = 300  # Longest provider Retry-After we wait for (seconds)
+RETRY_BUDGET_RATIO = 0.2  # LLM retries allowed per run, as a share of its requests...
+RETRY_BUDGET_MIN = 10  # ...on top of this many
+
+# Hedged requests (enrich --hedge)
+HEDGE_PERCENTILE = 95  # Resend a request still unanswered at this latency percentile of its model
+HEDGE_MIN_SAMPLES = 20  # Recorded calls needed before a model's percentile is trusted
+HEDGE_MAX_PER_RUN = 10  # Duplicate requests allowed per run
+HEDGE_MAX_EXTRA_COST = 0.50  # Estimated USD the duplicates of one run may add
+HEDGE_MAX_ROWS = 20  # Larger runs are bulk runs and are never hedged
+
+# provider_pool routing policies (first is the default)
+PROVIDER_POOL_ROUTING = ('least_loaded', 'weighted')
+
+# llm_transport modes, and the statuses replay injects at its error_rate
+LLM_TRANSPORT_MODES = ('record', 'replay')
+REPLAY_ERROR_STATUSES = (429, 500, 503)
+
+# metrics: seconds between rewrites of the textfile, and the window tokens/s is measured over
+METRICS_TEXTFILE_INTERVAL = 15.0
+METRICS_RATE_WINDOW = 60.0
 
 # Export formats
 SUPPORTED_EXPORT_FORMATS: Set[str] = {
@@ -297,7 +297,8 @@ def parse_input_columns_with_limits(input_columns: List[str]) -> List[Tuple[str,
     
     return parsed_columns
 
-def apply_column_limits(row_data: Dict, parsed_columns: List[Tuple[str, Optional[int]]]) -> Dict[str, str]:
+def apply_column_limits(row_data: Dict, parsed_columns: List[Tuple[str, Optional[int]]],
+                        warn_missing: bool = True) -> Dict[str, str]:
     """
     Apply character limits to row data based on parsed column specifications.
     Handles both table.column syntax and plain column names.
@@ -305,6 +306,7 @@ def apply_column_limits(row_data: Dict, parsed_columns: List[Tuple[str, Optional
     Args:
         row_data: Dictionary containing row data from database
         parsed_columns: List of (column_name, character_limit) tuples
+        warn_missing: Log a warning for columns missing from row_data
     
     Returns:
         Dictionary with column names as keys and (potentially truncated) values as strings
@@ -343,12 +345,31 @@ def apply_column_limits(row_data: Dict, parsed_columns: List[Tuple[str, Optional
             else:
                 result[col_name] = str_value
         else:
-            logging.warning(f"Column '{col_name}' not found in row data. Available columns: {list(row_data.keys())}")
+            if warn_missing:
+                logging.warning(f"Column '{col_name}' not found in row data. Available columns: {list(row_data.keys())}")
             result[col_name] = ""
     
     return result
 
 
+def build_input_text(limited_data: Dict[str, str], parsed_columns: List[Tuple[str, Optional[int]]]) -> str:
+    """
+    Format limited column values as the "column: value" block sent to the LLM.
+    
+    Args:
+        limited_data: Output of apply_column_limits
+        parsed_columns: List of (column_name, character_limit) tuples
+    
+    Returns:
+        One "column: value" line per input column (rowid/sha1 excluded)
+    """
+    return "\n".join([
+        f"{col}: {limited_data.get(col, '')}" 
+        for col, _ in parsed_columns 
+        if col not in ['rowid', 'sha1']
+    ])
+
+
 def detect_mojibake(text: str, threshold: float = 0.15) -> bool:
     """
     Detect if text contains mojibake (garbled text from encoding issues).
@@ -1,67 +1,44 @@
+import os
 import sqlite3
 import logging
 import click
 import time
 import threading
 import json
+import re
 from datetime import datetime
 from contextlib import contextmanager
-from typing import List, Dict, Optional, Any, Tuple, Iterator, Union
+from functools import lru_cache
+from itertools import groupby
+from typing import List, Dict, Optional, Any, Tuple, Iterator, Union, Iterable
 
-from .constants import DEFAULT_BUSY_TIMEOUT, MAX_RETRY_ATTEMPTS, DEFAULT_KEY_COLUMN
+from .constants import (
+    DEFAULT_BUSY_TIMEOUT, MAX_RETRY_ATTEMPTS, DEFAULT_KEY_COLUMN, DEFAULT_WRITE_BATCH_SIZE, DEFAULT_WRITE_MAX_DELAY,
+    DEFAULT_PAGE_SIZE
+)
 from .types import RowDict, RowList, DatabaseUpdate
+from .schema_catalog import schema_catalog
+from .db_pool import connection_pool
+from .storage_layout import file_for, qualified, schema_for, table_exists
+from .blob_store import ensure_blobs_table, put_blob, RAW_JSON_INLINE_LIMIT, BLOBS_TABLE, PLAIN_CODEC
+from .profiling import span
 
 @contextmanager
 def get_db_connection(db_path: str, timeout: float = DEFAULT_BUSY_TIMEOUT, retries: int = MAX_RETRY_ATTEMPTS) -> Iterator[sqlite3.Connection]:
-    """Get a database connection with proper timeout and retry logic."""
-    for attempt in range(retries):
-        try:
-            conn = sqlite3.connect(db_path, timeout=timeout)
-            # Enable WAL mode for better concurrency
-            conn.execute("PRAGMA journal_mode=WAL")
-            # Set busy timeout to 30 seconds
-            conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
-            # Use NORMAL synchronous mode for better performance
-            conn.execute("PRAGMA synchronous=NORMAL")
-            # Increase cache size for better performance
-            conn.execute("PRAGMA cache_size=-64000")  # 64MB cache
-            yield conn
-            conn.close()
-            return
-        except sqlite3.OperationalError as e:
-            error_str = str(e).lower()
-            if "database is locked" in error_str or "unable to open database file" in error_str:
-                if attempt < retries - 1:
-                    wait_time = (attempt + 1) * 2  # Exponential backoff
-                    logging.warning(f"Database locked/unavailable: {e}")
-                    logging.warning(f"Retrying in {wait_time}s... (attempt {attempt + 1}/{retries})")
-                    time.sleep(wait_time)
-                else:
-                    logging.error(f"Failed to connect after {retries} attempts: {e}")
-                    logging.error(f"Database path: {db_path}")
-                    logging.error("Possible causes:")
-                    logging.error("  1. Too many concurrent connections")
-                    logging.error("  2. Database file permissions issue")
-                    logging.error("  3. Disk space or I/O issues")
-                    logging.error("  4. Another process has exclusive lock")
-                    raise
-            else:
-                raise
-        except Exception as e:
-            logging.error(f"Unexpected database connection error: {e}")
-            if 'conn' in locals() and conn:
-                conn.close()
-            raise
+    """Borrow a configured connection from the pool (see db_pool), retrying while the database is locked.
+    
+    Uncommitted changes are rolled back when the block exits.
+    """
+    conn = connection_pool.acquire(db_path, timeout, retries)
+    try:
+        yield conn
+    finally:
+        connection_pool.release(db_path, conn)
 
 def ensure_metadata_column(db_path: str, table: str) -> None:
     try:
         with get_db_connection(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"PRAGMA table_info({table})")
-            columns = [col[1] for col in cursor.fetchall()]
-            if 'metadata_updated' not in columns:
-                cursor.execute(f"ALTER TABLE {table} ADD COLUMN metadata_updated TIMESTAMP")
-                logging.info(f"Added 'metadata_updated' column to {table}")
+            schema_catalog.ensure_columns(conn, db_path, table, {'metadata_updated': 'TIMESTAMP'})
             conn.commit()
     except sqlite3.Error as e:
         logging.error(f"Database error while ensuring metadata column: {e}")
@@ -158,10 +135,11 @@ def execute_query_optimized(db_path: str, query: str, input_columns: List[str],
             cursor = conn.cursor()
             
             # First, execute the query to get rowids
-            if params:
-                results = cursor.execute(query, params).fetchall()
-            else:
-                results = cursor.execute(query).fetchall()
+            with span('query.select'):
+                if params:
+                    results = cursor.execute(query, params).fetchall()
+                else:
+                    results = cursor.execute(query).fetchall()
             
             # Extract rowids and any other columns that were selected
             initial_results = [dict(row) for row in results]
@@ -198,93 +176,93 @@ def execute_query_optimized(db_path: str, query: str, input_columns: List[str],
             # Build optimized results
             optimized_results = []
             
-            for row in initial_results:
-                result_row = dict(row)  # Start with query results
+            with span('query.fetch_columns'):
+                for row in initial_results:
+                    result_row = dict(row)  # Start with query results
                 
-                # Multi-table fetch using sha1
-                if has_sha1 and row.get('sha1'):
-                    sha1 = row['sha1']
+                    # Multi-table fetch using sha1
+                    if has_sha1 and row.get('sha1'):
+                        sha1 = row['sha1']
                     
-                    # Fetch columns from each table
-                    for table, table_columns in columns_by_table.items():
-                        # Build column list for this table
-                        col_names = [col for col, _ in table_columns]
+                        # Fetch columns from each table
+                        for table, table_columns in columns_by_table.items():
+                            # Build column list for this table
+                            col_names = [col for col, _ in table_columns]
                         
-                        # Always include sha1 and rowid if fetching from the table
-                        fetch_cols = ['rowid', 'sha1'] + [c for c in col_names if c not in ['rowid', 'sha1']]
-                        columns_str = ', '.join(fetch_cols)
+                            # Always include sha1 and rowid if fetching from the table
+                            fetch_cols = ['rowid', 'sha1'] + [c for c in col_names if c not in ['rowid', 'sha1']]
+                            columns_str = ', '.join(fetch_cols)
                         
-                        try:
-                            # Check if table exists
-                            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
-                            if not cursor.fetchone():
-                                logging.debug(f"Table '{table}' not found, skipping columns: {col_names}")
-                                # Set missing columns to None
-                                for col, _ in table_columns:
-                                    if col not in result_row:
-                                        result_row[col] = None
-                                continue
+                            try:
+                                # Check if table exists
+                                if not table_exists(conn, table):
+                                    logging.debug(f"Table '{table}' not found, skipping columns: {col_names}")
+                                    # Set missing columns to None
+                                    for col, _ in table_columns:
+                                        if col not in result_row:
+                                            result_row[col] = None
+                                    continue
                             
-                            # Fetch from this table using sha1
-                            fetch_query = f"SELECT {columns_str} FROM {table} WHERE sha1 = ?"
-                            cursor.execute(fetch_query, (sha1,))
-                            table_row = cursor.fetchone()
+                                # Fetch from this table using sha1
+                                fetch_query = f"SELECT {columns_str} FROM {table} WHERE sha1 = ?"
+                                cursor.execute(fetch_query, (sha1,))
+                                table_row = cursor.fetchone()
                             
-                            if table_row:
-                                # Add columns from this table
-                                table_data = dict(table_row)
-                                for col, char_limit in table_columns:
-                                    if col in table_data:
-                                        # Apply character limit if specified
-                                        value = table_data[col]
-                                        if char_limit and isinstance(value, str) and len(value) > char_limit:
-                                            value = value[:char_limit]
-                                        result_row[col] = value
-                                    else:
-                                        result_row[col] = None
+                                if table_row:
+                                    # Add columns from this table
+                                    table_data = dict(table_row)
+                                    for col, char_limit in table_columns:
+                                        if col in table_data:
+                                            # Apply character limit if specified
+                                            value = table_data[col]
+                                            if char_limit and isinstance(value, str) and len(value) > char_limit:
+                                                value = value[:char_limit]
+                                            result_row[col] = value
+                                        else:
+                                            result_row[col] = None
                                         
-                                # Preserve rowid from the default table if this is the default table
-                                if table == default_table and 'rowid' in table_data:
-                                    result_row['rowid'] = table_data['rowid']
-                            else:
-                                # No matching row in this table
+                                    # Preserve rowid from the default table if this is the default table
+                                    if table == default_table and 'rowid' in table_data:
+                                        result_row['rowid'] = table_data['rowid']
+                                else:
+                                    # No matching row in this table
+                                    for col, _ in table_columns:
+                                        if col not in result_row:
+                                            result_row[col] = None
+                                        
+                            except sqlite3.Error as e:
+                                logging.warning(f"Error fetching from table '{table}': {e}")
+                                # Set missing columns to None
                                 for col, _ in table_columns:
                                     if col not in result_row:
                                         result_row[col] = None
-                                        
-                        except sqlite3.Error as e:
-                            logging.warning(f"Error fetching from table '{table}': {e}")
-                            # Set missing columns to None
-                            for col, _ in table_columns:
-                                if col not in result_row:
-                                    result_row[col] = None
                 
-                # Fallback: single-table fetch using rowid (backward compatibility)
-                elif has_rowid and row.get('rowid'):
-                    rowid = row['rowid']
-                    # Original single-table logic
-                    all_columns = []
-                    for table, table_columns in columns_by_table.items():
-                        if table == default_table:
-                            all_columns.extend([col for col, _ in table_columns])
+                    # Fallback: single-table fetch using rowid (backward compatibility)
+                    elif has_rowid and row.get('rowid'):
+                        rowid = row['rowid']
+                        # Original single-table logic
+                        all_columns = []
+                        for table, table_columns in columns_by_table.items():
+                            if table == default_table:
+                                all_columns.extend([col for col, _ in table_columns])
                     
-                    if all_columns:
-                        # Always include rowid and sha1
-                        fetch_cols = ['rowid']
-                        if 'sha1' not in fetch_cols:
-                            fetch_cols.append('sha1')
-                        fetch_cols.extend([c for c in all_columns if c not in fetch_cols])
+                        if all_columns:
+                            # Always include rowid and sha1
+                            fetch_cols = ['rowid']
+                            if 'sha1' not in fetch_cols:
+                                fetch_cols.append('sha1')
+                            fetch_cols.extend([c for c in all_columns if c not in fetch_cols])
                         
-                        columns_str = ', '.join(fetch_cols)
-                        fetch_query = f"SELECT {columns_str} FROM {default_table} WHERE rowid = ?"
+                            columns_str = ', '.join(fetch_cols)
+                            fetch_query = f"SELECT {columns_str} FROM {default_table} WHERE rowid = ?"
                         
-                        cursor.execute(fetch_query, (rowid,))
-                        full_row = cursor.fetchone()
+                            cursor.execute(fetch_query, (rowid,))
+                            full_row = cursor.fetchone()
                         
-                        if full_row:
-                            result_row.update(dict(full_row))
+                            if full_row:
+                                result_row.update(dict(full_row))
                 
-                optimized_results.append(result_row)
+                    optimized_results.append(result_row)
             
             # Log summary
             total_cols = sum(len(cols) for cols in columns_by_table.values())
@@ -298,46 +276,21 @@ def execute_query_optimized(db_path: str, query: str, input_columns: List[str],
         logging.warning(f"Optimized query failed, falling back to standard execution: {e}")
         return execute_query(db_path, query, params)
 
-def checkpoint_wal(db_path: str) -> None:
-    """Run WAL checkpoint to prevent it from growing too large."""
-    try:
-        with get_db_connection(db_path) as conn:
-            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-            logging.debug("WAL checkpoint completed")
-    except Exception as e:
-        logging.warning(f"WAL checkpoint failed (non-critical): {e}")
-
 def get_table_primary_key(db_path: str, table: str) -> str:
     """Get the primary key column for a table. Returns 'rowid' for tables without explicit PK."""
     with get_db_connection(db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info({table})")
-        columns = cursor.fetchall()
-        
-        # Look for explicit primary key
-        for col in columns:
-            if col[5] == 1:  # col[5] is the pk flag
-                return col[1]  # col[1] is the column name
-        
-        # No explicit primary key found, use rowid
-        return 'rowid'
+        info = schema_catalog.get(conn, db_path, table)
+        return info.primary_key if info else 'rowid'
 
 def update_database(db_path: str, table: str, output_col: str, results: List[DatabaseUpdate]) -> None:
     try:
-        ensure_metadata_column(db_path, table)
-        
-        # Determine the appropriate key column for updates
-        primary_key = get_table_primary_key(db_path, table)
-        
         with get_db_connection(db_path) as conn:
             cursor = conn.cursor()
             
-            # Check if output_col exists, if not, create it
-            cursor.execute(f"PRAGMA table_info({table})")
-            columns = [col[1] for col in cursor.fetchall()]
-            if output_col not in columns:
-                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {output_col} TEXT")
-                logging.info(f"Added '{output_col}' column to {table}")
+            # Columns are normally created up front by prepare_enrichment_schema; this is a cached no-op then
+            schema_catalog.ensure_columns(conn, db_path, table, {output_col: 'TEXT', 'metadata_updated': 'TIMESTAMP'})
+            # Determine the appropriate key column for updates
+            primary_key = schema_catalog.get(conn, db_path, table).primary_key
             
             current_time = datetime.now().isoformat()
             updated_count = 0
@@ -375,9 +328,8 @@ def verify_updates(db_path: str, table: str, output_col: str, results: List[Data
             cursor = conn.cursor()
             
             # Check if output_col exists, if not, log a warning and return
-            cursor.execute(f"PRAGMA table_info({table})")
-            columns = [col[1] for col in cursor.fetchall()]
-            if output_col not in columns:
+            info = schema_catalog.get(conn, db_path, table)
+            if not info or not info.has_column(output_col):
                 logging.warning(f"Column '{output_col}' does not exist in table '{table}'. Skipping verification.")
                 return
             
@@ -400,16 +352,70 @@ def verify_updates(db_path: str, table: str, output_col: str, results: List[Data
 def ensure_output_column(db_path: str, table: str, column: str) -> None:
     """Ensure the output column exists in the table."""
     with get_db_connection(db_path) as conn:
-        cursor = conn.cursor()
-        
-        # Check if column exists
-        cursor.execute(f"PRAGMA table_info({table})")
-        columns = [info[1] for info in cursor.fetchall()]
-        
-        if column not in columns:
-            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+        if schema_catalog.ensure_columns(conn, db_path, table, {column: 'TEXT'}):
             conn.commit()
-            logging.info(f"Added '{column}' column to {table}")
+
+_LIMIT_RE = re.compile(r'\s+LIMIT\s+(\d+)\s*;?\s*$', re.IGNORECASE)
+_ORDER_BY_ROWID_RE = re.compile(r'\s+ORDER\s+BY\s+rowid(\s+ASC)?\s*$', re.IGNORECASE)
+
+def split_limit(query: str) -> Tuple[str, Optional[int]]:
+    """Split a trailing ``LIMIT n`` off a query: (query, n or None)."""
+    query = query.strip().rstrip(';')
+    match = _LIMIT_RE.search(query)
+    if not match:
+        return query, None
+    return query[:match.start()], int(match.group(1))
+
+def fetch_rows_keyset(db_path: str, query: str, input_columns: Optional[List[str]] = None,
+                      after_rowid: Optional[int] = None, limit: Optional[int] = None,
+                      page_size: int = DEFAULT_PAGE_SIZE) -> RowList:
+    """Run a row-selection query in keyset pages (``rowid > ? ORDER BY rowid LIMIT ?``).
+    
+    Each page is a short read, so no read transaction stays open for the whole
+    scan (which would stop WAL checkpoints from completing), and nothing is
+    skipped with OFFSET. ``after_rowid`` starts after a resume checkpoint.
+    The query must select ``rowid`` and end in ``ORDER BY rowid`` (optionally
+    followed by ``LIMIT n``, which caps the total); other queries are run in
+    one go, without ``after_rowid``.
+    
+    Args:
+        db_path: Path to the database
+        query: Row-selection query
+        input_columns: Columns to fetch, as for execute_query_optimized (None: everything the query selects)
+        after_rowid: Only rows with a larger rowid
+        limit: Maximum number of rows (overrides the query's own LIMIT)
+        page_size: Rows per page
+    """
+    def run(sql: str, params: Optional[Tuple[Any, ...]] = None) -> RowList:
+        if input_columns:
+            return execute_query_optimized(db_path, sql, input_columns, params)
+        with get_db_connection(db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(sql, params or ()).fetchall()]
+    
+    base, query_limit = split_limit(query)
+    limit = limit if limit is not None else query_limit
+    order = _ORDER_BY_ROWID_RE.search(base)
+    if not order:
+        if after_rowid is not None:
+            logging.warning("Query is not ordered by rowid; reading all of its rows instead of resuming after a rowid")
+        return run(f"{base} LIMIT {limit}" if limit is not None else base)
+    
+    base = base[:order.start()]
+    rows: RowList = []
+    last = after_rowid
+    while limit is None or len(rows) < limit:
+        size = page_size if limit is None else min(page_size, limit - len(rows))
+        if last is None:
+            page = run(f"SELECT * FROM ({base}) ORDER BY rowid LIMIT ?", (size,))
+        else:
+            page = run(f"SELECT * FROM ({base}) WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, size))
+        rows.extend(page)
+        if len(page) < size:
+            break
+        last = page[-1]['rowid']
+    logging.debug(f"Read {len(rows)} rows in keyset pages of {page_size}")
+    return rows
 
 def ensure_output_table(db_path: str, table_name: str, key_column: str = "sha1", output_columns: Optional[List[str]] = None, 
                        is_derived_table: bool = False) -> None:
@@ -429,10 +435,9 @@ def ensure_output_table(db_path: str, table_name: str, key_column: str = "sha1",
         cursor = conn.cursor()
         
         # Check if table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-        table_exists = cursor.fetchone() is not None
+        table_info = schema_catalog.get(conn, db_path, table_name)
         
-        if not table_exists:
+        if table_info is None:
             # Create new table with appropriate schema
             if is_derived_table:
                 # Derived tables use auto-increment ID and composite unique constraint
@@ -459,51 +464,103 @@ def ensure_output_table(db_path: str, table_name: str, key_column: str = "sha1",
             if is_derived_table:
                 columns_def.append(f"UNIQUE({key_column}, model_used)")
             
-            create_sql = f"CREATE TABLE {table_name} (\n    " + ",\n    ".join(columns_def) + "\n)"
+            create_sql = f"CREATE TABLE {qualified(db_path, table_name)} (\n    " + ",\n    ".join(columns_def) + "\n)"
             cursor.execute(create_sql)
             
-            # Create indices for performance
-            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{key_column} ON {table_name}({key_column})")
+            # Key lookups use the primary key / UNIQUE constraint index; add one for per-model queries
             if is_derived_table:
-                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_model ON {table_name}(model_used)")
-                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_sha1_model ON {table_name}({key_column}, model_used)")
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {qualified(db_path, table_name, f'idx_{table_name}_model')} ON {table_name}(model_used)")
             
             conn.commit()
+            schema_catalog.invalidate(db_path, table_name)
             logging.info(f"Created {'derived' if is_derived_table else 'output'} table '{table_name}' with key column '{key_column}' and columns: {output_columns}")
         else:
             # Table exists - ensure it has necessary columns
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            existing_columns = [info[1] for info in cursor.fetchall()]
-            
-            # Add enrichment_id column if it doesn't exist
-            if "enrichment_id" not in existing_columns:
-                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN enrichment_id TEXT")
-                logging.info(f"Added enrichment_id column to existing table '{table_name}'")
-            
-            # Add model_used column for derived tables if it doesn't exist
-            if is_derived_table and "model_used" not in existing_columns:
-                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN model_used TEXT")
-                logging.info(f"Added model_used column to existing table '{table_name}'")
-                
-                # Create index on model_used for performance
-                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_model ON {table_name}(model_used)")
-                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_sha1_model ON {table_name}({key_column}, model_used)")
+            needed = {"enrichment_id": "TEXT"}
+            if is_derived_table:
+                needed["model_used"] = "TEXT"
+            needed.update({col: "TEXT" for col in output_columns})
+            added = schema_catalog.ensure_columns(conn, db_path, table_name, needed)
             
-            for col in output_columns:
-                if col not in existing_columns:
-                    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {col} TEXT")
-                    logging.info(f"Added '{col}' column to existing table {table_name}")
+            if "model_used" in added:
+                # Create index on model_used for performance; the (key, model_used)
+                # unique index is added by prepare_enrichment_schema
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {qualified(db_path, table_name, f'idx_{table_name}_model')} ON {table_name}(model_used)")
+                schema_catalog.invalidate(db_path, table_name)
             
             conn.commit()
 
+def ensure_upsert_index(conn: sqlite3.Connection, db_path: str, output_table: str, key_column: str) -> bool:
+    """Make sure an output table has the unique index its UPSERTs conflict on.
+    
+    That is (key_column, model_used) for derived tables and key_column otherwise.
+    Tables created by ensure_output_table already have it; older tables get a
+    unique index added. If existing duplicate rows prevent that, a warning is
+    logged and writes to the table keep using the row-by-row UPDATE/INSERT path.
+    Runs on ``conn`` without committing.
+    
+    Returns:
+        True if UPSERTs can be used for the table
+    """
+    info = schema_catalog.get(conn, db_path, output_table)
+    if info is None:
+        return False
+    target = (key_column, 'model_used') if info.has_column('model_used') else (key_column,)
+    if info.has_unique_key(target):
+        return True
+    index_name = f"idx_{output_table}_{'_'.join(target)}_unique"
+    try:
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {qualified(db_path, output_table, index_name)} ON {output_table}({', '.join(target)})")
+    except sqlite3.IntegrityError:
+        logging.warning(f"{output_table} has duplicate rows for ({', '.join(target)}); "
+                        f"writes to it will use row-by-row updates instead of UPSERTs")
+        return False
+    logging.info(f"Created unique index {index_name}")
+    schema_catalog.refresh(conn, db_path, output_table)
+    return True
+
+def prepare_enrichment_schema(db_path: str, table: Optional[str] = None, output_columns: Optional[List[str]] = None,
+                              output_table: Optional[str] = None, key_column: str = DEFAULT_KEY_COLUMN) -> None:
+    """Apply every column an enrichment run writes to in one migration transaction.
+    
+    Run once before processing so per-row writes find all columns in the schema
+    catalog and never issue DDL. Output tables also get the unique index their
+    UPSERTs conflict on.
+    
+    Args:
+        db_path: Path to database
+        table: Source table (direct column mode)
+        output_columns: Output columns written by the enrichment
+        output_table: Separate output table, if results are stored there
+        key_column: Key column of the output table
+    """
+    columns = {col: 'TEXT' for col in (output_columns or []) if col}
+    with get_db_connection(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if output_table:
+                if schema_catalog.get(conn, db_path, output_table) is not None:
+                    schema_catalog.ensure_columns(conn, db_path, output_table, {
+                        'enrichment_id': 'TEXT', 'created_at': 'TEXT', 'updated_at': 'TEXT', **columns
+                    })
+                    ensure_upsert_index(conn, db_path, output_table, key_column)
+            elif table and schema_catalog.get(conn, db_path, table) is not None:
+                schema_catalog.ensure_columns(conn, db_path, table, {**columns, 'metadata_updated': 'TIMESTAMP'})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            schema_catalog.invalidate(db_path)
+            raise
+
 def ensure_enrichment_responses_table(db_path: str) -> None:
     """Ensure the enrichment_responses audit table exists."""
+    schema = schema_for(db_path, 'enrichment_responses')
     with get_db_connection(db_path) as conn:
         cursor = conn.cursor()
         
         # Create enrichment_responses table for audit trail
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS enrichment_responses (
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.enrichment_responses (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 enrichment_id TEXT UNIQUE,
                 sha1 TEXT NOT NULL,
@@ -512,6 +569,11 @@ def ensure_enrichment_responses_table(db_path: str) -> None:
                 model_used TEXT NOT NULL,
                 prompt_id TEXT,
                 full_prompt TEXT,
+                chunk_index INTEGER,
+                chunk_count INTEGER,
+                prompt_hash TEXT,
+                input_hash TEXT,
+                raw_json_hash TEXT,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP
             )
         """)
@@ -533,15 +595,28 @@ def ensure_enrichment_responses_table(db_path: str) -> None:
             cursor.execute("ALTER TABLE enrichment_responses ADD COLUMN full_prompt TEXT")
             logging.info("Added full_prompt column to existing enrichment_responses table")
         
+        # Chunk position for chunked (map-reduce) enrichments; NULL for whole-document responses
+        if "chunk_index" not in columns:
+            cursor.execute("ALTER TABLE enrichment_responses ADD COLUMN chunk_index INTEGER")
+            cursor.execute("ALTER TABLE enrichment_responses ADD COLUMN chunk_count INTEGER")
+            logging.info("Added chunk_index/chunk_count columns to existing enrichment_responses table")
+        
+        # References into the blobs table; full_prompt/raw_json are left NULL/empty when these are set
+        if "prompt_hash" not in columns:
+            cursor.execute("ALTER TABLE enrichment_responses ADD COLUMN prompt_hash TEXT")
+            cursor.execute("ALTER TABLE enrichment_responses ADD COLUMN input_hash TEXT")
+            cursor.execute("ALTER TABLE enrichment_responses ADD COLUMN raw_json_hash TEXT")
+            logging.info("Added blob reference columns to existing enrichment_responses table")
+        
         # Migrate existing table if needed - check for old constraints
-        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='enrichment_responses'")
+        cursor.execute(f"SELECT sql FROM {schema}.sqlite_master WHERE type='table' AND name='enrichment_responses'")
         table_sql = cursor.fetchone()
         if table_sql and ('UNIQUE(sha1, enrichment_name)' in table_sql[0] or 
                          'UNIQUE(sha1, enrichment_name, model_used)' in table_sql[0]):
             logging.info("Migrating enrichment_responses table to remove unique constraints")
             # We need to recreate the table without the constraint
-            cursor.execute("""
-                CREATE TABLE enrichment_responses_new (
+            cursor.execute(f"""
+                CREATE TABLE {schema}.enrichment_responses_new (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     enrichment_id TEXT UNIQUE,
                     sha1 TEXT NOT NULL,
@@ -549,6 +624,12 @@ def ensure_enrichment_responses_table(db_path: str) -> None:
                     raw_json TEXT NOT NULL,
                     model_used TEXT NOT NULL,
                     prompt_id TEXT,
+                    full_prompt TEXT,
+                    chunk_index INTEGER,
+                    chunk_count INTEGER,
+                    prompt_hash TEXT,
+                    input_hash TEXT,
+                    raw_json_hash TEXT,
                     created_at TEXT DEFAULT CURRENT_TIMESTAMP
                 )
             """)
@@ -558,55 +639,87 @@ def ensure_enrichment_responses_table(db_path: str) -> None:
                 SELECT id, enrichment_id, sha1, enrichment_name, raw_json, model_used, created_at FROM enrichment_responses
             """)
             # Drop old table and rename new one
-            cursor.execute("DROP TABLE enrichment_responses")
-            cursor.execute("ALTER TABLE enrichment_responses_new RENAME TO enrichment_responses")
+            cursor.execute(f"DROP TABLE {schema}.enrichment_responses")
+            cursor.execute(f"ALTER TABLE {schema}.enrichment_responses_new RENAME TO enrichment_responses")
             logging.info("Migration completed")
         
-        # Create indices for performance
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_enrichment_responses_sha1 
-            ON enrichment_responses(sha1)
+        # Create indices for performance. The resume index covers the skip check
+        # (sha1, enrichment_name, model_used, chunk_index IS NULL) and chunk reuse
+        # lookups; enrichment_id is already indexed by its UNIQUE constraint.
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {schema}.idx_enrichment_responses_resume 
+            ON enrichment_responses(sha1, enrichment_name, model_used, chunk_index)
         """)
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_enrichment_responses_enrichment 
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {schema}.idx_enrichment_responses_enrichment 
             ON enrichment_responses(enrichment_name)
         """)
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_enrichment_responses_created 
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {schema}.idx_enrichment_responses_created 
             ON enrichment_responses(created_at)
         """)
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_enrichment_responses_enrichment_id 
-            ON enrichment_responses(enrichment_id)
+        # Content-addressed storage for prompts, inputs and long responses, plus views
+        # exposing the original column shape with the texts resolved: _full through
+        # blob_text() on doctrail's connections, _plain in plain SQL for other clients
+        # (texts held in compressed blobs are NULL there)
+        ensure_blobs_table(conn, schema)
+        cursor.execute(f"""
+            CREATE VIEW IF NOT EXISTS {schema}.enrichment_responses_full AS
+            SELECT er.id, er.enrichment_id, er.sha1, er.enrichment_name,
+                   COALESCE(blob_text(rb.codec, rb.data), er.raw_json) AS raw_json,
+                   er.model_used, er.prompt_id,
+                   COALESCE(er.full_prompt,
+                            blob_text(pb.codec, pb.data) || COALESCE(blob_text(ib.codec, ib.data), '')) AS full_prompt,
+                   er.chunk_index, er.chunk_count, er.created_at
+            FROM enrichment_responses er
+            LEFT JOIN {BLOBS_TABLE} rb ON rb.hash = er.raw_json_hash
+            LEFT JOIN {BLOBS_TABLE} pb ON pb.hash = er.prompt_hash
+            LEFT JOIN {BLOBS_TABLE} ib ON ib.hash = er.input_hash
         """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_enrichment_responses_composite 
-            ON enrichment_responses(sha1, enrichment_name, model_used)
+        cursor.execute(f"""
+            CREATE VIEW IF NOT EXISTS {schema}.enrichment_responses_plain AS
+            SELECT er.id, er.enrichment_id, er.sha1, er.enrichment_name,
+                   CASE WHEN er.raw_json_hash IS NULL THEN er.raw_json ELSE CAST(rb.data AS TEXT) END AS raw_json,
+                   er.model_used, er.prompt_id,
+                   COALESCE(er.full_prompt,
+                            CASE WHEN er.input_hash IS NULL OR ib.hash IS NOT NULL
+                                 THEN CAST(pb.data AS TEXT) || COALESCE(CAST(ib.data AS TEXT), '') END) AS full_prompt,
+                   er.chunk_index, er.chunk_count, er.created_at
+            FROM enrichment_responses er
+            LEFT JOIN {BLOBS_TABLE} rb ON rb.hash = er.raw_json_hash AND rb.codec = '{PLAIN_CODEC}'
+            LEFT JOIN {BLOBS_TABLE} pb ON pb.hash = er.prompt_hash AND pb.codec = '{PLAIN_CODEC}'
+            LEFT JOIN {BLOBS_TABLE} ib ON ib.hash = er.input_hash AND ib.codec = '{PLAIN_CODEC}'
         """)
         
         conn.commit()
+        schema_catalog.invalidate(db_path, 'enrichment_responses')
         logging.debug("Ensured enrichment_responses table exists")
 
 def store_raw_enrichment_response(db_path: str, sha1: str, enrichment_name: str, 
                                  raw_json: str, model_used: str, enrichment_id: Optional[str] = None, 
-                                 prompt_id: Optional[str] = None, full_prompt: Optional[str] = None) -> None:
-    """Store raw LLM response in audit table."""
+                                 prompt_id: Optional[str] = None, full_prompt: Optional[str] = None,
+                                 chunk_index: Optional[int] = None, chunk_count: Optional[int] = None,
+                                 input_text: Optional[str] = None) -> None:
+    """Store raw LLM response in audit table.
+    
+    chunk_index/chunk_count are set for the per-chunk responses of chunked
+    enrichments; the merged whole-document response leaves them NULL.
+    
+    The full prompt is stored in the blobs table rather than inline. When
+    ``input_text`` (the document portion at the end of the prompt) is given, the
+    instruction part and the document part are stored as separate blobs, so a
+    shared prompt template and a document sent to several enrichments are each
+    kept once. Long responses are moved to blobs as well; read them back through
+    the ``enrichment_responses_full`` view (or ``enrichment_responses_plain``
+    outside doctrail, where texts held in compressed blobs are NULL).
+    """
     try:
         with get_db_connection(db_path) as conn:
-            cursor = conn.cursor()
-            
-            current_time = datetime.now().isoformat()
-            
-            cursor.execute("""
-                INSERT INTO enrichment_responses 
-                (enrichment_id, sha1, enrichment_name, raw_json, model_used, prompt_id, full_prompt, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (enrichment_id, sha1, enrichment_name, raw_json, model_used, prompt_id, full_prompt, current_time))
-            
+            _insert_enrichment_response(conn, sha1, enrichment_name, raw_json, model_used, enrichment_id,
+                                        prompt_id, full_prompt, chunk_index, chunk_count, input_text)
             conn.commit()
             logging.debug(f"Stored raw response for {enrichment_name} on {sha1[:8]}")
             
@@ -614,6 +727,230 @@ def store_raw_enrichment_response(db_path: str, sha1: str, enrichment_name: str,
         logging.error(f"Error storing raw enrichment response: {e}")
         raise
 
+def _insert_enrichment_response(conn: sqlite3.Connection, sha1: str, enrichment_name: str, raw_json: str,
+                                model_used: str, enrichment_id: Optional[str] = None, prompt_id: Optional[str] = None,
+                                full_prompt: Optional[str] = None, chunk_index: Optional[int] = None,
+                                chunk_count: Optional[int] = None, input_text: Optional[str] = None) -> None:
+    """Insert one enrichment_responses row on ``conn`` without committing."""
+    current_time = datetime.now().isoformat()
+    
+    prompt_hash = input_hash = raw_json_hash = None
+    if full_prompt is not None:
+        prompt_part, input_part = full_prompt, None
+        if input_text and full_prompt.endswith(input_text):
+            prompt_part, input_part = full_prompt[:-len(input_text)], input_text
+        prompt_hash = put_blob(conn, prompt_part)
+        input_hash = put_blob(conn, input_part)
+        full_prompt = None
+    if raw_json is not None and len(raw_json) >= RAW_JSON_INLINE_LIMIT:
+        raw_json_hash = put_blob(conn, raw_json)
+        raw_json = ''
+    
+    conn.execute("""
+        INSERT INTO enrichment_responses 
+        (enrichment_id, sha1, enrichment_name, raw_json, model_used, prompt_id, full_prompt, chunk_index, chunk_count,
+         prompt_hash, input_hash, raw_json_hash, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (enrichment_id, sha1, enrichment_name, raw_json, model_used, prompt_id, full_prompt, chunk_index, chunk_count,
+          prompt_hash, input_hash, raw_json_hash, current_time))
+
+def get_chunk_responses(db_path: str, sha1: str, enrichment_name: str, model_used: str,
+                        prompt_id: Optional[str], chunk_count: int) -> Dict[int, Dict[str, Any]]:
+    """Return successful stored chunk responses keyed by chunk_index.
+    
+    Only chunks from the same prompt version and chunk layout are reused, so a
+    changed prompt or chunk size re-runs every chunk.
+    """
+    chunks = {}
+    with get_db_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT chunk_index, raw_json FROM enrichment_responses_full
+            WHERE sha1 = ? AND enrichment_name = ? AND model_used = ?
+              AND prompt_id IS ? AND chunk_count = ? AND chunk_index IS NOT NULL
+            ORDER BY id
+        """, (sha1, enrichment_name, model_used, prompt_id, chunk_count))
+        for chunk_index, raw_json in cursor.fetchall():
+            try:
+                data = json.loads(raw_json)
+            except (TypeError, json.JSONDecodeError):
+                continue
+            # Failed chunks are stored as {'error': ...} for the audit trail
+            if isinstance(data, dict) and set(data) != {'error'}:
+                chunks[chunk_index] = data
+    return chunks
+
+def compact_enrichment_responses(db_path: str, batch_size: int = 1000, vacuum: bool = True) -> Dict[str, int]:
+    """Move inline full_prompt and long raw_json values of existing rows into blobs.
+    
+    Where a row's prompt starts with its stored prompt text (untemplated prompts),
+    the instruction part and the document part become separate blobs, matching
+    what new rows store. Blobs no longer referenced by any row are deleted. Work
+    is committed in batches to keep the WAL small, and the file is vacuumed
+    afterwards so the freed pages are returned to the OS.
+    
+    Returns:
+        Dict with rows compacted, blob count and file size before/after in bytes
+    """
+    ensure_enrichment_responses_table(db_path)
+    # With split storage the audit tables (and so all the savings) are in their own file
+    audit_file = file_for(db_path, 'enrichment_responses')
+    size_before = os.path.getsize(audit_file)
+    compacted = 0
+    prompt_texts: Dict[str, Optional[str]] = {}
+    
+    with get_db_connection(db_path) as conn:
+        has_prompts = table_exists(conn, 'prompts')
+        
+        def prompt_text_for(prompt_id: Optional[str]) -> Optional[str]:
+            if not prompt_id or not has_prompts:
+                return None
+            if prompt_id not in prompt_texts:
+                row = conn.execute("SELECT prompt_text FROM prompts WHERE prompt_id = ?", (prompt_id,)).fetchone()
+                prompt_texts[prompt_id] = row[0] if row else None
+            return prompt_texts[prompt_id]
+        
+        while True:
+            rows = conn.execute("""
+                SELECT id, prompt_id, full_prompt, raw_json FROM enrichment_responses
+                WHERE full_prompt IS NOT NULL OR (raw_json_hash IS NULL AND length(raw_json) >= ?)
+                LIMIT ?
+            """, (RAW_JSON_INLINE_LIMIT, batch_size)).fetchall()
+            if not rows:
+                break
+            
+            updates = []
+            for row_id, prompt_id, full_prompt, raw_json in rows:
+                prompt_hash = input_hash = raw_json_hash = None
+                if full_prompt is not None:
+                    template = prompt_text_for(prompt_id)
+                    if template and full_prompt.startswith(template + "\n\n"):
+                        split = len(template) + 2
+                        prompt_hash = put_blob(conn, full_prompt[:split])
+                        input_hash = put_blob(conn, full_prompt[split:])
+                    else:
+                        prompt_hash = put_blob(conn, full_prompt)
+                if raw_json is not None and len(raw_json) >= RAW_JSON_INLINE_LIMIT:
+                    raw_json_hash = put_blob(conn, raw_json)
+                    raw_json = ''
+                updates.append((prompt_hash, input_hash, raw_json, raw_json_hash, row_id))
+            
+            conn.executemany("""
+                UPDATE enrichment_responses
+                SET full_prompt = NULL,
+                    prompt_hash = COALESCE(?, prompt_hash),
+                    input_hash = COALESCE(?, input_hash),
+                    raw_json = ?,
+                    raw_json_hash = COALESCE(?, raw_json_hash)
+                WHERE id = ?
+            """, updates)
+            conn.commit()
+            compacted += len(updates)
+            logging.info(f"Compacted {compacted} enrichment responses...")
+        
+        conn.execute(f"""
+            DELETE FROM {BLOBS_TABLE} WHERE hash NOT IN (
+                SELECT prompt_hash FROM enrichment_responses WHERE prompt_hash IS NOT NULL
+                UNION SELECT input_hash FROM enrichment_responses WHERE input_hash IS NOT NULL
+                UNION SELECT raw_json_hash FROM enrichment_responses WHERE raw_json_hash IS NOT NULL
+            )
+        """)
+        conn.commit()
+        blob_count = conn.execute(f"SELECT COUNT(*) FROM {BLOBS_TABLE}").fetchone()[0]
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if vacuum:
+            conn.execute(f"VACUUM {schema_for(db_path, 'enrichment_responses')}")
+    
+    return {
+        'rows_compacted': compacted,
+        'blobs': blob_count,
+        'size_before': size_before,
+        'size_after': os.path.getsize(audit_file),
+    }
+
+LLM_CALL_COLUMNS = (
+    'run_id', 'enrichment_name', 'sha1', 'model', 'provider', 'attempt', 'status', 'http_status',
+    'error', 'queue_wait_ms', 'ttfb_ms', 'latency_ms', 'prompt_tokens', 'completion_tokens',
+    'cached_tokens', 'cost_usd', 'started_at', 'ttft_ms'
+)
+
+def ensure_llm_calls_table(db_path: str) -> None:
+    """Ensure the llm_calls telemetry table exists."""
+    schema = schema_for(db_path, 'llm_calls')
+    with get_db_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.llm_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT,
+                enrichment_name TEXT,
+                sha1 TEXT,
+                model TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                attempt INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL,
+                http_status INTEGER,
+                error TEXT,
+                queue_wait_ms REAL,
+                ttfb_ms REAL,
+                latency_ms REAL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                cached_tokens INTEGER,
+                cost_usd REAL,
+                started_at TEXT NOT NULL,
+                ttft_ms REAL
+            )
+        """)
+        # Tables created before streamed responses were recorded lack the time to first token
+        cursor.execute(f"PRAGMA {schema}.table_info(llm_calls)")
+        if 'ttft_ms' not in [info[1] for info in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {schema}.llm_calls ADD COLUMN ttft_ms REAL")
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {schema}.idx_llm_calls_enrichment_model
+            ON llm_calls(enrichment_name, model)
+        """)
+        conn.commit()
+
+def store_llm_calls(db_path: str, calls: List[Dict[str, Any]]) -> None:
+    """Append per-call telemetry records to llm_calls in one transaction."""
+    if not calls:
+        return
+    ensure_llm_calls_table(db_path)
+    with get_db_connection(db_path) as conn:
+        conn.executemany(
+            f"INSERT INTO llm_calls ({', '.join(LLM_CALL_COLUMNS)}) VALUES ({', '.join('?' * len(LLM_CALL_COLUMNS))})",
+            [tuple(call.get(col) for col in LLM_CALL_COLUMNS) for call in calls]
+        )
+        conn.commit()
+        logging.debug(f"Stored {len(calls)} LLM call records")
+
+def get_llm_calls(db_path: str, enrichment_names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Return llm_calls rows, optionally limited to some enrichments."""
+    with get_db_connection(db_path) as conn:
+        cursor = conn.cursor()
+        if not table_exists(conn, 'llm_calls'):
+            return []
+        # Older tables may lack newer columns (ttft_ms); those read as NULL
+        present = {info[1] for info in cursor.execute("PRAGMA table_info(llm_calls)").fetchall()}
+        query = f"SELECT {', '.join(col if col in present else 'NULL' for col in LLM_CALL_COLUMNS)} FROM llm_calls"
+        params: Tuple[Any, ...] = ()
+        if enrichment_names:
+            query += f" WHERE enrichment_name IN ({', '.join('?' * len(enrichment_names))})"
+            params = tuple(enrichment_names)
+        cursor.execute(query, params)
+        return [dict(zip(LLM_CALL_COLUMNS, row)) for row in cursor.fetchall()]
+
+def get_recent_llm_latencies(db_path: str, model: str, limit: int) -> List[Tuple[float, Optional[float]]]:
+    """(latency_ms, cost_usd) of the most recent successful calls to a model, newest first."""
+    with get_db_connection(db_path) as conn:
+        if not table_exists(conn, 'llm_calls'):
+            return []
+        return conn.execute(
+            "SELECT latency_ms, cost_usd FROM llm_calls WHERE model = ? AND status = 'ok' AND latency_ms IS NOT NULL "
+            "ORDER BY id DESC LIMIT ?", (model, limit)
+        ).fetchall()
+
 def get_enrichment_response_history(db_path: str, sha1: Optional[str] = None, 
                                    enrichment_name: Optional[str] = None) -> List[Dict[str, Any]]:
     """Retrieve enrichment response history for debugging/audit."""
@@ -621,8 +958,8 @@ def get_enrichment_response_history(db_path: str, sha1: Optional[str] = None,
         with get_db_connection(db_path) as conn:
             cursor = conn.cursor()
             
-            # Build query based on filters
-            query = "SELECT * FROM enrichment_responses WHERE 1=1"
+            # Build query based on filters (the view resolves blob-stored prompts and responses)
+            query = "SELECT * FROM enrichment_responses_full WHERE 1=1"
             params = []
             
             if sha1:
@@ -669,146 +1006,220 @@ def update_output_table(db_path: str, output_table: str, key_column: str, key_va
     """
     try:
         with get_db_connection(db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Check if table has model_used column (i.e., is a derived table)
-            cursor.execute(f"PRAGMA table_info({output_table})")
-            columns_info = cursor.fetchall()
-            column_names = [info[1] for info in columns_info]
-            has_model_column = "model_used" in column_names
-            
-            # Ensure updated_at column exists (add it if missing)
-            if "updated_at" not in column_names:
-                cursor.execute(f"ALTER TABLE {output_table} ADD COLUMN updated_at TEXT")
-                logging.info(f"Added 'updated_at' column to {output_table}")
-                column_names.append("updated_at")
-            
-            # Also ensure created_at column exists (add it if missing)
-            if "created_at" not in column_names:
-                cursor.execute(f"ALTER TABLE {output_table} ADD COLUMN created_at TEXT")
-                logging.info(f"Added 'created_at' column to {output_table}")
-                column_names.append("created_at")
-            
-            has_updated_at_column = True  # Now we know it exists
-            
-            # Check if record exists
-            if has_model_column and model_used:
-                # For derived tables, check using both key and model
-                cursor.execute(f"SELECT 1 FROM {output_table} WHERE {key_column} = ? AND model_used = ?", 
-                             (key_value, model_used))
-            else:
-                # For regular tables, check using just the key
-                cursor.execute(f"SELECT 1 FROM {output_table} WHERE {key_column} = ?", (key_value,))
-            exists = cursor.fetchone() is not None
-            
-            # First check if there's any meaningful data
-            has_meaningful_data = False
-            cleaned_data = {}
-            
-            for col, val in output_data.items():
-                # Skip null-like values
-                if val is None or val == "null" or val == "" or (isinstance(val, str) and val.lower() == "null"):
-                    continue
-                    
-                # For lists/dicts, check if they're empty
-                if isinstance(val, (list, dict)) and not val:
-                    continue
-                    
-                # If we get here, we have some data
-                has_meaningful_data = True
-                cleaned_data[col] = val
-            
-            # Don't insert rows with no meaningful data
-            if not has_meaningful_data:
-                logging.debug(f"Skipping insert for {key_column}={key_value} (model={model_used}) - no meaningful data")
-                return
-            
-            
-            current_time = datetime.now().isoformat()
-            
-            # Serialize complex types to JSON strings
-            serialized_data = {}
-            for col, val in cleaned_data.items():
-                if isinstance(val, (list, dict)):
-                    serialized_data[col] = json.dumps(val, ensure_ascii=False)
-                elif hasattr(val, 'value'):  # Handle enum values
-                    serialized_data[col] = val.value
-                else:
-                    serialized_data[col] = val
-            
-            if exists:
-                # Update existing record
-                set_clauses = []
-                values = []
-                for col, val in serialized_data.items():
-                    set_clauses.append(f"{col} = ?")
-                    values.append(val)
-                
-                # Add enrichment_id if provided
-                if enrichment_id:
-                    set_clauses.append("enrichment_id = ?")
-                    values.append(enrichment_id)
-                
-                # Add updated_at timestamp if column exists
-                if has_updated_at_column:
-                    set_clauses.append("updated_at = ?")
-                    values.append(current_time)
-                
-                # Build WHERE clause based on table type
-                if has_model_column and model_used:
-                    where_clause = f"WHERE {key_column} = ? AND model_used = ?"
-                    values.extend([key_value, model_used])
-                else:
-                    where_clause = f"WHERE {key_column} = ?"
-                    values.append(key_value)
-                
-                update_query = f"UPDATE {output_table} SET {', '.join(set_clauses)} {where_clause}"
-                cursor.execute(update_query, values)
-                logging.debug(f"Updated {output_table} for {key_column}={key_value}" + 
-                            (f" with model={model_used}" if model_used else ""))
-            else:
-                # Insert new record
-                columns = [key_column]
-                values = [key_value]
-                
-                # Add model_used for derived tables
-                if has_model_column and model_used:
-                    columns.append("model_used")
-                    values.append(model_used)
-                
-                # Add enrichment_id if provided
-                if enrichment_id:
-                    columns.append("enrichment_id")
-                    values.append(enrichment_id)
-                
-                # Add output data columns
-                columns.extend(list(serialized_data.keys()))
-                values.extend(list(serialized_data.values()))
-                
-                # Add timestamps
-                columns.extend(["created_at", "updated_at"])
-                values.extend([current_time, current_time])
-                
-                placeholders = ", ".join(["?"] * len(columns))
-                
-                insert_query = f"INSERT INTO {output_table} ({', '.join(columns)}) VALUES ({placeholders})"
-                cursor.execute(insert_query, values)
-                logging.debug(f"Inserted into {output_table} for {key_column}={key_value}" + 
-                            (f" with model={model_used}" if model_used else ""))
-            
+            write_output_rows(conn, db_path, output_table, key_column,
+                              [(key_value, output_data, enrichment_id, model_used)])
             conn.commit()
             
     except sqlite3.Error as e:
         logging.error(f"Error updating output table {output_table}: {e}")
         raise
 
+def _clean_output_data(output_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop null-like values and serialise the rest for storage.
+    
+    None, "null" (any case), "" and empty lists/dicts are skipped so they never
+    overwrite stored values; lists/dicts become JSON strings and enums their value.
+    """
+    serialized_data = {}
+    for col, val in output_data.items():
+        if val is None or (isinstance(val, str) and (val == "" or val.lower() == "null")):
+            continue
+        if isinstance(val, (list, dict)):
+            if not val:
+                continue
+            serialized_data[col] = json.dumps(val, ensure_ascii=False)
+        elif hasattr(val, 'value'):  # Handle enum values
+            serialized_data[col] = val.value
+        else:
+            serialized_data[col] = val
+    return serialized_data
+
+@lru_cache(maxsize=256)
+def _output_upsert_sql(output_table: str, key_column: str, with_model: bool, with_enrichment_id: bool,
+                       columns: Tuple[str, ...]) -> str:
+    """INSERT ... ON CONFLICT DO UPDATE for one output table and column set.
+    
+    created_at is only written on insert; on conflict the data columns,
+    enrichment_id (when given) and updated_at are overwritten.
+    """
+    conflict = [key_column] + (["model_used"] if with_model else [])
+    updated = (["enrichment_id"] if with_enrichment_id else []) + list(columns)
+    insert_columns = conflict + updated + ["created_at", "updated_at"]
+    assignments = [f"{col} = excluded.{col}" for col in updated + ["updated_at"]]
+    return (f"INSERT INTO {output_table} ({', '.join(insert_columns)}) "
+            f"VALUES ({', '.join(['?'] * len(insert_columns))}) "
+            f"ON CONFLICT({', '.join(conflict)}) DO UPDATE SET {', '.join(assignments)}")
+
+def write_output_rows(conn: sqlite3.Connection, db_path: str, output_table: str, key_column: str,
+                      rows: Iterable[Tuple[str, Dict[str, Any], Optional[str], Optional[str]]]) -> int:
+    """Write (key_value, output_data, enrichment_id, model_used) rows to an output table on ``conn``.
+    
+    Rows with no meaningful data are skipped. Consecutive rows with the same
+    column set are written with one executemany of a cached UPSERT statement;
+    tables without a matching unique index fall back to SELECT then UPDATE or
+    INSERT per row. Does not commit.
+    
+    Returns:
+        Number of rows written
+    """
+    # Timestamps are normally added up front by prepare_enrichment_schema; this is a cached no-op then
+    schema_catalog.ensure_columns(conn, db_path, output_table, {"updated_at": "TEXT", "created_at": "TEXT"})
+    info = schema_catalog.get(conn, db_path, output_table)
+    # Check if table has model_used column (i.e., is a derived table)
+    has_model_column = info.has_column("model_used")
+    current_time = datetime.now().isoformat()
+    
+    written = 0
+    batch_sql, batch = None, []
+    for key_value, output_data, enrichment_id, model_used in rows:
+        serialized_data = _clean_output_data(output_data)
+        # Don't insert rows with no meaningful data
+        if not serialized_data:
+            logging.debug(f"Skipping insert for {key_column}={key_value} (model={model_used}) - no meaningful data")
+            continue
+        written += 1
+        
+        with_model = bool(has_model_column and model_used)
+        conflict = (key_column, "model_used") if with_model else (key_column,)
+        if not info.has_unique_key(conflict):
+            if batch:
+                conn.executemany(batch_sql, batch)
+                batch_sql, batch = None, []
+            _update_or_insert_output_row(conn, output_table, key_column, key_value, serialized_data,
+                                         enrichment_id, model_used if with_model else None, current_time)
+            continue
+        
+        sql = _output_upsert_sql(output_table, key_column, with_model, bool(enrichment_id), tuple(serialized_data))
+        if sql != batch_sql and batch:
+            conn.executemany(batch_sql, batch)
+            batch = []
+        batch_sql = sql
+        batch.append(
+            [key_value] + ([model_used] if with_model else []) + ([enrichment_id] if enrichment_id else [])
+            + list(serialized_data.values()) + [current_time, current_time]
+        )
+    if batch:
+        conn.executemany(batch_sql, batch)
+    return written
+
+def _update_or_insert_output_row(conn: sqlite3.Connection, output_table: str, key_column: str, key_value: str,
+                                 serialized_data: Dict[str, Any], enrichment_id: Optional[str],
+                                 model_used: Optional[str], current_time: str) -> None:
+    """Row-by-row write for output tables that have no unique index to UPSERT against."""
+    cursor = conn.cursor()
+    if model_used:
+        where_clause = f"WHERE {key_column} = ? AND model_used = ?"
+        where_values = [key_value, model_used]
+    else:
+        where_clause = f"WHERE {key_column} = ?"
+        where_values = [key_value]
+    
+    cursor.execute(f"SELECT 1 FROM {output_table} {where_clause}", where_values)
+    if cursor.fetchone() is not None:
+        set_clauses = [f"{col} = ?" for col in serialized_data]
+        values = list(serialized_data.values())
+        if enrichment_id:
+            set_clauses.append("enrichment_id = ?")
+            values.append(enrichment_id)
+        set_clauses.append("updated_at = ?")
+        values.append(current_time)
+        cursor.execute(f"UPDATE {output_table} SET {', '.join(set_clauses)} {where_clause}", values + where_values)
+    else:
+        columns = [key_column] + (["model_used"] if model_used else []) + (["enrichment_id"] if enrichment_id else [])
+        values = [key_value] + ([model_used] if model_used else []) + ([enrichment_id] if enrichment_id else [])
+        columns.extend(list(serialized_data.keys()) + ["created_at", "updated_at"])
+        values.extend(list(serialized_data.values()) + [current_time, current_time])
+        placeholders = ", ".join(["?"] * len(columns))
+        cursor.execute(f"INSERT INTO {output_table} ({', '.join(columns)}) VALUES ({placeholders})", values)
+
+class EnrichmentWriteBuffer:
+    """Collects an enrichment run's per-row writes and commits them in batches.
+    
+    A row's enrichment_responses entry and its output-table row are always
+    committed in the same transaction. Rows are skipped on later runs once they
+    have a response, so an interrupted run must never leave a response without
+    its output.
+    """
+    
+    def __init__(self, db_path: str, batch_size: int = DEFAULT_WRITE_BATCH_SIZE,
+                 max_delay: float = DEFAULT_WRITE_MAX_DELAY):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._responses: List[Tuple] = []
+        self._outputs: List[Tuple] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._responses) + len(self._outputs)
+    
+    def _mark(self) -> None:
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+    
+    def add_response(self, sha1: str, enrichment_name: str, raw_json: str, model_used: str,
+                     enrichment_id: Optional[str] = None, prompt_id: Optional[str] = None,
+                     full_prompt: Optional[str] = None, input_text: Optional[str] = None) -> None:
+        """Queue an enrichment_responses row (see store_raw_enrichment_response)."""
+        with self._lock:
+            self._responses.append((sha1, enrichment_name, raw_json, model_used, enrichment_id, prompt_id,
+                                    full_prompt, None, None, input_text))
+            self._mark()
+    
+    def add_output(self, output_table: str, key_column: str, key_value: str, output_data: Dict[str, Any],
+                   enrichment_id: Optional[str] = None, model_used: Optional[str] = None) -> None:
+        """Queue an output-table row (see update_output_table)."""
+        with self._lock:
+            self._outputs.append((output_table, key_column, key_value, output_data, enrichment_id, model_used))
+            self._mark()
+    
+    def should_flush(self) -> bool:
+        with self._lock:
+            if self._oldest is None:
+                return False
+            return (len(self._responses) + len(self._outputs) >= self.batch_size
+                    or time.monotonic() - self._oldest >= self.max_delay)
+    
+    def flush(self) -> int:
+        """Commit everything queued so far in one transaction. Returns the number of responses written.
+        
+        On a database error the rows stay queued and the error is raised.
+        """
+        with self._lock:
+            responses, outputs = self._responses, self._outputs
+            self._responses, self._outputs, self._oldest = [], [], None
+        if not responses and not outputs:
+            return 0
+        try:
+            with get_db_connection(self.db_path) as conn:
+                with span('write.audit'):
+                    for response in responses:
+                        _insert_enrichment_response(conn, *response)
+                with span('write.output'):
+                    for (output_table, key_column), group in groupby(outputs, key=lambda output: output[:2]):
+                        write_output_rows(conn, self.db_path, output_table, key_column, [output[2:] for output in group])
+                with span('write.commit'):
+                    conn.commit()
+        except sqlite3.Error as e:
+            # Put the rows back (ahead of anything queued meanwhile) so the flush can be retried
+            with self._lock:
+                self._responses = responses + self._responses
+                self._outputs = outputs + self._outputs
+                self._mark()
+            logging.error(f"Error writing {len(responses)} enrichment results: {e}")
+            raise
+        logging.debug(f"Committed {len(responses)} responses and {len(outputs)} output rows")
+        return len(responses)
+
 def ensure_prompts_table(db_path: str) -> None:
     """Ensure the prompts table exists for tracking prompt versions."""
+    schema = schema_for(db_path, 'prompts')
     with get_db_connection(db_path) as conn:
         cursor = conn.cursor()
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS prompts (
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.prompts (
                 prompt_id TEXT PRIMARY KEY,
                 enrichment_name TEXT NOT NULL,
                 prompt_text TEXT NOT NULL,
@@ -820,18 +1231,18 @@ def ensure_prompts_table(db_path: str) -> None:
         """)
         
         # Create indices for performance
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_prompts_enrichment 
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {schema}.idx_prompts_enrichment 
             ON prompts(enrichment_name)
         """)
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_prompts_hash 
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {schema}.idx_prompts_hash 
             ON prompts(prompt_hash)
         """)
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_prompts_created 
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {schema}.idx_prompts_created 
             ON prompts(created_at)
         """)
         
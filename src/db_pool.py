@@ -0,0 +1,253 @@
+"""
+Pooled SQLite connections.
+
+Opening a connection and running the PRAGMA setup costs far more than the
+single-row statements doctrail issues from its worker threads, so connections
+are configured once and reused. A connection is handed to one thread at a time
+and returned to its database's idle queue when the ``connection`` context
+exits, with any open transaction rolled back and per-use state (row factory,
+trace callback) reset.
+
+``run_db`` runs a blocking database function in a worker thread and retries it
+when the database is locked, sleeping on the event loop between attempts
+instead of blocking the worker. Connections opened inside ``run_db`` therefore
+fail at once on a lock instead of sleeping in ``acquire``; synchronous callers
+keep the blocking retry.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .blob_store import register_blob_functions
+from .constants import (
+    DEFAULT_BUSY_TIMEOUT, DEFAULT_MMAP_SIZE, DEFAULT_POOL_SIZE, DEFAULT_STATEMENT_CACHE_SIZE, MAX_RETRY_ATTEMPTS
+)
+from .storage_layout import attach_databases
+
+# Idle connections are kept for at most this many databases (least recently used are closed)
+MAX_POOLED_DATABASES = 16
+
+WaitListener = Callable[[str, float, bool], None]
+
+
+def is_lock_error(error: Exception) -> bool:
+    """True for the transient errors worth retrying: a locked database or a file that can't be opened yet."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and (
+        "database is locked" in message or "unable to open database file" in message
+    )
+
+
+@dataclass
+class PoolStats:
+    acquired: int = 0
+    opened: int = 0
+    reused: int = 0
+    wait_seconds: float = 0.0
+
+
+class ConnectionPool:
+    """Per-database queues of configured connections, shared by all threads."""
+
+    def __init__(self, max_idle: int = DEFAULT_POOL_SIZE):
+        self.max_idle = max_idle
+        self.stats = PoolStats()
+        self._idle: "OrderedDict[str, Deque[sqlite3.Connection]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners: List[WaitListener] = []
+        self._pid = os.getpid()
+        self._in_use: Dict[str, int] = {}
+        self._last_release: Dict[str, float] = {}
+
+    @staticmethod
+    def _key(db_path: str) -> str:
+        return os.path.abspath(os.path.expanduser(db_path))
+
+    def add_wait_listener(self, listener: WaitListener) -> None:
+        """Call ``listener(db_path, wait_seconds, reused)`` for every connection handed out."""
+        self._listeners.append(listener)
+
+    def remove_wait_listener(self, listener: WaitListener) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    @staticmethod
+    def _open(db_path: str, timeout: float) -> sqlite3.Connection:
+        conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False,
+                               cached_statements=DEFAULT_STATEMENT_CACHE_SIZE)
+        try:
+            # Enable WAL mode for better concurrency
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+            # Use NORMAL synchronous mode for better performance
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA cache_size=-64000")  # 64MB cache
+            conn.execute(f"PRAGMA mmap_size={DEFAULT_MMAP_SIZE}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            # blob_text() backs the enrichment_responses_full view
+            register_blob_functions(conn)
+            # Audit and output table files, when the database uses split storage
+            attach_databases(conn, db_path)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _take_idle(self, key: str):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Connections must not be shared with a forked child
+                self._idle.clear()
+                self._pid = os.getpid()
+            idle = self._idle.get(key)
+            if idle:
+                self._idle.move_to_end(key)
+                return idle.pop()
+        return None
+
+    def acquire(self, db_path: str, timeout: float = DEFAULT_BUSY_TIMEOUT,
+                retries: int = MAX_RETRY_ATTEMPTS) -> sqlite3.Connection:
+        """Take an idle connection for ``db_path`` or open a new one, retrying while the database is locked.
+
+        Inside ``run_db`` a lock error is raised straight away, so ``run_db``
+        backs off on the event loop rather than sleeping in the worker thread.
+        """
+        start = time.perf_counter()
+        key = self._key(db_path)
+        conn = self._take_idle(key)
+        reused = conn is not None
+        attempt = 0
+        if _in_run_db.get():
+            retries = 1
+        while conn is None:
+            try:
+                conn = self._open(db_path, timeout)
+            except sqlite3.OperationalError as e:
+                attempt += 1
+                if not is_lock_error(e) or attempt >= retries:
+                    if is_lock_error(e) and retries > 1:
+                        logging.error(f"Failed to connect after {retries} attempts: {e}")
+                        logging.error(f"Database path: {db_path}")
+                    raise
+                wait_time = attempt * 2
+                logging.warning(f"Database locked/unavailable: {e}")
+                logging.warning(f"Retrying in {wait_time}s... (attempt {attempt}/{retries})")
+                time.sleep(wait_time)
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            self.stats.acquired += 1
+            self.stats.reused += reused
+            self.stats.opened += not reused
+            self.stats.wait_seconds += waited
+        for listener in list(self._listeners):
+            try:
+                listener(db_path, waited, reused)
+            except Exception as e:
+                logging.debug(f"Connection pool listener failed: {e}")
+        return conn
+
+    def release(self, db_path: str, conn: sqlite3.Connection) -> None:
+        """Return a connection to the pool, or close it if it is unusable or the pool is full."""
+        key = self._key(db_path)
+        with self._lock:
+            self._in_use[key] = max(self._in_use.get(key, 0) - 1, 0)
+            self._last_release[key] = time.monotonic()
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            conn.text_factory = str
+            conn.set_trace_callback(None)
+        except sqlite3.Error:
+            # Closed by the caller or broken; don't pool it
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return
+
+        evicted: List[sqlite3.Connection] = []
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            self._idle.move_to_end(key)
+            if len(idle) < self.max_idle and self._pid == os.getpid():
+                idle.append(conn)
+                conn = None
+            while len(self._idle) > MAX_POOLED_DATABASES:
+                _, old = self._idle.popitem(last=False)
+                evicted.extend(old)
+        for stale in evicted + ([conn] if conn is not None else []):
+            stale.close()
+
+    @contextmanager
+    def connection(self, db_path: str, timeout: float = DEFAULT_BUSY_TIMEOUT,
+                   retries: int = MAX_RETRY_ATTEMPTS) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire(db_path, timeout, retries)
+        try:
+            yield conn
+        finally:
+            self.release(db_path, conn)
+
+    def close_all(self, db_path: Optional[str] = None) -> None:
+        """Close idle connections, for one database or all of them."""
+        with self._lock:
+            if db_path is None:
+                pools = list(self._idle.values())
+                self._idle.clear()
+            else:
+                pools = [self._idle.pop(self._key(db_path), deque())]
+        for idle in pools:
+            for conn in idle:
+                conn.close()
+
+    def activity(self, db_path: str) -> Tuple[int, Optional[float]]:
+        """(connections currently borrowed, seconds since one was last returned) for a database."""
+        key = self._key(db_path)
+        with self._lock:
+            last = self._last_release.get(key)
+            return self._in_use.get(key, 0), (time.monotonic() - last if last is not None else None)
+
+    def idle_count(self, db_path: str) -> int:
+        with self._lock:
+            return len(self._idle.get(self._key(db_path), ()))
+
+
+connection_pool = ConnectionPool()
+
+# Set in run_db's worker threads (asyncio.to_thread copies the context), where acquire must not sleep
+_in_run_db: contextvars.ContextVar[bool] = contextvars.ContextVar('doctrail_in_run_db', default=False)
+
+
+def _run_in_worker(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    _in_run_db.set(True)
+    return func(*args, **kwargs)
+
+
+async def run_db(func: Callable[..., Any], *args: Any, retries: int = MAX_RETRY_ATTEMPTS, **kwargs: Any) -> Any:
+    """Run a blocking database function in a worker thread, retrying if the database is locked.
+
+    The backoff is an ``asyncio.sleep``, so no worker thread is held while
+    waiting. ``func`` must be safe to re-run after a failed attempt (the
+    doctrail write helpers are: a failed transaction is rolled back).
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            return await asyncio.to_thread(_run_in_worker, func, *args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e) or attempt >= retries:
+                raise
+            wait_time = attempt * 2
+            logging.warning(f"Database locked during {getattr(func, '__name__', 'write')}: {e}; "
+                            f"retrying in {wait_time}s (attempt {attempt}/{retries})")
+            await asyncio.sleep(wait_time)
@@ -0,0 +1,195 @@
+"""
+Fused enrichments: several schema-driven enrichments answered by one LLM call per document.
+
+With ``enrich --fuse``, enrichments that would send the same document text
+(same input table, query, input columns, models, system prompt and truncation)
+are grouped. A group sends one structured request per row whose response model
+has one field per enrichment, each typed with that enrichment's own schema
+model, and whose prompt lists every enrichment's prompt as a separate task.
+The response is split back into each enrichment's ``enrichment_responses``
+record and output table, so the stored results look the same as unfused ones.
+
+Only enrichments with their own ``output_table`` (and no ``chunking``) are
+fused; enrichments that depend on each other never are.
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
+
+from pydantic import BaseModel, create_model
+
+from .db_operations import get_db_connection
+from .enrichment_config import EnrichmentStrategy
+from .storage_layout import table_exists
+from .types import RowList
+
+FUSED_PROMPT_HEADER = (
+    "Complete each of the following tasks for the same document. "
+    "Answer each task under the response key given in its heading, following that task's own instructions."
+)
+
+
+@dataclass
+class FusedGroup:
+    """Enrichments answered together; the first one leads (its query and models are used)."""
+    enrichments: List[Dict[str, Any]]
+    strategies: List[EnrichmentStrategy]
+
+    @property
+    def names(self) -> List[str]:
+        return [e['name'] for e in self.enrichments]
+
+    @property
+    def label(self) -> str:
+        return '+'.join(self.names)
+
+    @property
+    def members(self) -> List[Tuple[Dict[str, Any], EnrichmentStrategy]]:
+        return list(zip(self.enrichments, self.strategies))
+
+    def fields(self) -> Dict[str, str]:
+        """{enrichment name: response field}; names are made into valid, distinct identifiers."""
+        fields: Dict[str, str] = {}
+        for i, name in enumerate(self.names):
+            field = re.sub(r'\W', '_', name)
+            if not field or field[0].isdigit() or field.startswith('_') or field in fields.values():
+                field = f"task_{i + 1}_{field.strip('_')}"
+            fields[name] = field
+        return fields
+
+    def response_model(self) -> Type[BaseModel]:
+        """Composite model with one field per enrichment, each typed with the enrichment's schema model."""
+        parts = {self.fields()[e['name']]: s.pydantic_model for e, s in self.members}
+        model = create_model('FusedResponse', **{field: (part, ...) for field, part in parts.items()})
+
+        # Field conversions and language checks run per part, like for unfused responses
+        def apply_conversions(instance):
+            for field, part in parts.items():
+                if hasattr(part, 'apply_conversions'):
+                    part.apply_conversions(getattr(instance, field))
+
+        def validate_languages(instance):
+            for field, part in parts.items():
+                if hasattr(part, 'validate_languages'):
+                    part.validate_languages(getattr(instance, field))
+
+        model.apply_conversions = staticmethod(apply_conversions)
+        model.validate_languages = staticmethod(validate_languages)
+        return model
+
+    def prompt(self, config: Optional[Dict[str, Any]] = None) -> str:
+        """The members' prompts (with append_file content) as numbered tasks under one header."""
+        from .llm_operations import load_enrichment_prompt
+
+        fields = self.fields()
+        tasks = [f"## Task {i}: respond under `{fields[e['name']]}`\n\n{load_enrichment_prompt(e, config).strip()}"
+                 for i, e in enumerate(self.enrichments, 1)]
+        return '\n\n'.join([FUSED_PROMPT_HEADER] + tasks)
+
+    def schema(self) -> Dict[str, Any]:
+        """All members' schema fields in one dict (prefixed with the enrichment name), for cost estimates."""
+        return {f"{e['name']}.{field}": definition
+                for e in self.enrichments for field, definition in (e.get('schema') or {}).items()}
+
+    def split(self, response: Optional[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """{enrichment name: its part of a fused response (model_dump output), or None}."""
+        response = response or {}
+        return {name: response.get(field) for name, field in self.fields().items()}
+
+
+def fusion_key(enrichment: Dict[str, Any], strategy: EnrichmentStrategy, config_data: Dict[str, Any],
+               model_override: Optional[str] = None) -> Optional[Tuple]:
+    """What an enrichment's requests have in common with those of enrichments it can be fused with.
+
+    None if the enrichment can't be fused.
+    """
+    if not strategy.pydantic_model or strategy.storage_mode != 'separate_table' or enrichment.get('chunking'):
+        return None
+    input_config = enrichment.get('input') or {}
+    query = input_config.get('query', '')
+    query = (config_data.get('sql_queries') or {}).get(query, query)
+    models = model_override or enrichment.get('model', config_data.get('default_model', 'gpt-4o-mini'))
+    if isinstance(models, str):
+        models = [models]
+    columns = input_config.get('input_columns') or []
+    if isinstance(columns, str):
+        columns = [columns]
+    return (strategy.input_table, ' '.join(str(query).split()), tuple(columns), tuple(models),
+            enrichment.get('system_prompt'), bool(enrichment.get('truncate')), strategy.key_column)
+
+
+def plan_fusion(enrichments: List[Dict[str, Any]], strategies: Dict[str, EnrichmentStrategy],
+                config_data: Dict[str, Any], dependencies: Dict[str, Set[str]],
+                model_override: Optional[str] = None) -> List[FusedGroup]:
+    """Groups of two or more enrichments that can share requests, in config order."""
+    upstream = _upstream(dependencies)
+    buckets: Dict[Tuple, List[List[Dict[str, Any]]]] = {}
+    for enrichment in enrichments:
+        name = enrichment['name']
+        key = fusion_key(enrichment, strategies[name], config_data, model_override)
+        if key is None:
+            continue
+        for group in buckets.setdefault(key, []):
+            # Enrichments that read each other's output must still run one after the other
+            if all(name not in upstream.get(other['name'], ()) and other['name'] not in upstream.get(name, ())
+                   for other in group):
+                group.append(enrichment)
+                break
+        else:
+            buckets[key].append([enrichment])
+    groups = [FusedGroup(group, [strategies[e['name']] for e in group])
+              for bucket in buckets.values() for group in bucket if len(group) > 1]
+    groups.sort(key=lambda g: [e['name'] for e in enrichments].index(g.names[0]))
+    for group in groups:
+        logging.info(f"Fusing enrichments {', '.join(group.names)} into one request per row")
+    return groups
+
+
+def _upstream(dependencies: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    """{name: every enrichment it waits for, directly or through others}."""
+    upstream: Dict[str, Set[str]] = {}
+
+    def visit(name: str, seen: Set[str]) -> Set[str]:
+        if name not in upstream:
+            found: Set[str] = set()
+            for dep in dependencies.get(name, ()):
+                if dep not in seen:
+                    found |= {dep} | visit(dep, seen | {dep})
+            upstream[name] = found
+        return upstream[name]
+
+    for name in dependencies:
+        visit(name, {name})
+    return upstream
+
+
+def rows_needing(db_path: str, enrichment_name: str, output_table: str, key_column: str, model: str,
+                 rows: RowList) -> RowList:
+    """Rows this enrichment has no result for yet (no enrichment_responses record and no output row for the model)."""
+    with get_db_connection(db_path) as conn:
+        has_responses = table_exists(conn, 'enrichment_responses')
+        has_output = table_exists(conn, output_table)
+        has_model_column = has_output and any(
+            info[1] == 'model_used' for info in conn.execute(f"PRAGMA table_info({output_table})").fetchall()
+        )
+        pending = []
+        for row in rows:
+            if has_responses and conn.execute(
+                "SELECT 1 FROM enrichment_responses WHERE sha1 = ? AND enrichment_name = ? AND model_used = ? "
+                "AND chunk_index IS NULL LIMIT 1", (row.get('sha1', 'NO_SHA1'), enrichment_name, model)
+            ).fetchone():
+                continue
+            if has_output:
+                key_value = row.get(key_column, 'NO_KEY')
+                if has_model_column:
+                    found = conn.execute(f"SELECT 1 FROM {output_table} WHERE {key_column} = ? AND model_used = ? LIMIT 1",
+                                         (key_value, model)).fetchone()
+                else:
+                    found = conn.execute(f"SELECT 1 FROM {output_table} WHERE {key_column} = ? LIMIT 1",
+                                         (key_value,)).fetchone()
+                if found:
+                    continue
+            pending.append(row)
+    return pending
@@ -0,0 +1,227 @@
+"""
+Persistent enrichment runs: a checkpoint per (enrichment, model) run.
+
+Every run gets a row in ``enrichment_runs`` recording the query it selects rows
+with (and its hash), its progress and its status. ``RunTracker`` follows the
+rows as they finish and keeps ``last_rowid`` at the highest rowid below which
+every row is finished, writing it only after the results it covers have been
+committed. ``enrich --resume <run_id>`` re-runs the same query from
+``rowid > last_rowid`` (see ``db_operations.fetch_rows_keyset``), so finished
+rows are neither read nor re-checked.
+
+The watermark needs the rows in rowid order. For queries with another ORDER
+BY, ``last_rowid`` stays NULL and a resumed run falls back to the normal
+already-processed checks.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from .constants import DEFAULT_WRITE_MAX_DELAY
+from .db_operations import get_db_connection
+from .storage_layout import schema_for, table_exists
+
+RUN_COLUMNS = (
+    'run_id', 'enrichment_name', 'model', 'query_hash', 'query', 'row_limit', 'status', 'last_rowid', 'last_sha1',
+    'rows_total', 'rows_done', 'rows_skipped', 'rows_failed', 'elapsed_seconds', 'started_at', 'updated_at',
+    'finished_at'
+)
+
+
+def query_hash(query: str) -> str:
+    """Hash of a query, ignoring whitespace differences."""
+    return hashlib.sha256(' '.join(query.split()).encode('utf-8')).hexdigest()[:16]
+
+
+def ensure_enrichment_runs_table(db_path: str) -> None:
+    schema = schema_for(db_path, 'enrichment_runs')
+    with get_db_connection(db_path) as conn:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.enrichment_runs (
+                run_id TEXT PRIMARY KEY,
+                enrichment_name TEXT NOT NULL,
+                model TEXT NOT NULL,
+                query_hash TEXT NOT NULL,
+                query TEXT NOT NULL,
+                row_limit INTEGER,
+                status TEXT NOT NULL,
+                last_rowid INTEGER,
+                last_sha1 TEXT,
+                rows_total INTEGER NOT NULL DEFAULT 0,
+                rows_done INTEGER NOT NULL DEFAULT 0,
+                rows_skipped INTEGER NOT NULL DEFAULT 0,
+                rows_failed INTEGER NOT NULL DEFAULT 0,
+                elapsed_seconds REAL NOT NULL DEFAULT 0,
+                started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                finished_at TEXT
+            )
+        """)
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS {schema}.idx_enrichment_runs_enrichment
+            ON enrichment_runs(enrichment_name, started_at)
+        """)
+        conn.commit()
+
+
+def start_run(db_path: str, enrichment_name: str, model: str, query: str, row_limit: Optional[int] = None,
+              rows_total: int = 0, run_id: Optional[str] = None) -> str:
+    """Record a new run, or mark a resumed one (``run_id``) as running again. Returns the run_id."""
+    ensure_enrichment_runs_table(db_path)
+    with get_db_connection(db_path) as conn:
+        if run_id:
+            conn.execute(
+                "UPDATE enrichment_runs SET status = 'running', finished_at = NULL, updated_at = CURRENT_TIMESTAMP "
+                "WHERE run_id = ?", (run_id,)
+            )
+        else:
+            run_id = str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO enrichment_runs (run_id, enrichment_name, model, query_hash, query, row_limit, status, rows_total) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'running', ?)",
+                (run_id, enrichment_name, model, query_hash(query), query, row_limit, rows_total)
+            )
+        conn.commit()
+    return run_id
+
+
+def get_run(db_path: str, run_id: str) -> Optional[Dict[str, Any]]:
+    """A run by its id or a unique prefix of it.
+
+    Raises:
+        ValueError: If the prefix matches more than one run
+    """
+    if not _has_runs_table(db_path):
+        return None
+    with get_db_connection(db_path) as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(RUN_COLUMNS)} FROM enrichment_runs WHERE run_id LIKE ? || '%' LIMIT 2", (run_id,)
+        ).fetchall()
+    if len(rows) > 1:
+        raise ValueError(f"Run id '{run_id}' is ambiguous; give more characters")
+    return dict(zip(RUN_COLUMNS, rows[0])) if rows else None
+
+
+def list_runs(db_path: str, enrichment_names: Optional[List[str]] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Most recent runs first, optionally for some enrichments."""
+    if not _has_runs_table(db_path):
+        return []
+    query = f"SELECT {', '.join(RUN_COLUMNS)} FROM enrichment_runs"
+    params: List[Any] = []
+    if enrichment_names:
+        query += f" WHERE enrichment_name IN ({', '.join('?' * len(enrichment_names))})"
+        params.extend(enrichment_names)
+    query += " ORDER BY started_at DESC, rowid DESC LIMIT ?"
+    params.append(limit)
+    with get_db_connection(db_path) as conn:
+        return [dict(zip(RUN_COLUMNS, row)) for row in conn.execute(query, params).fetchall()]
+
+
+def _has_runs_table(db_path: str) -> bool:
+    with get_db_connection(db_path) as conn:
+        return table_exists(conn, 'enrichment_runs')
+
+
+class RunTracker:
+    """Tracks which of a run's rows are finished and checkpoints the run record.
+
+    Rows are given in processing order. ``done`` marks a row finished (its
+    results queued or written); ``checkpoint`` persists the progress made up to
+    a ``snapshot`` taken before the pending results were committed.
+    """
+
+    def __init__(self, db_path: str, run_id: str, rows: Iterable[Dict[str, Any]]):
+        self.db_path = db_path
+        self.run_id = run_id
+        rows = list(rows)
+        rowids = [row.get('rowid') for row in rows]
+        # The watermark is only meaningful for rows in ascending integer rowid order
+        self.ordered = all(isinstance(r, int) for r in rowids) and all(a < b for a, b in zip(rowids, rowids[1:]))
+        self._keys = [(row.get('rowid'), row.get('sha1')) for row in rows]
+        self._position = {key: i for i, key in enumerate(self._keys)}
+        self._finished = [False] * len(self._keys)
+        self._next = 0  # first position not yet finished
+        self._counts = {'rows_done': 0, 'rows_skipped': 0, 'rows_failed': 0}
+        self._saved = dict(self._counts)
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+
+    def done(self, row: Dict[str, Any], skipped: bool = False, failed: bool = False) -> None:
+        with self._lock:
+            i = self._position.get((row.get('rowid'), row.get('sha1')))
+            if i is None or self._finished[i]:
+                return
+            self._finished[i] = True
+            self._counts['rows_done'] += 1
+            self._counts['rows_skipped'] += skipped
+            self._counts['rows_failed'] += failed
+            while self._next < len(self._finished) and self._finished[self._next]:
+                self._next += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Progress so far: counts and the watermark row, if any."""
+        with self._lock:
+            last = self._keys[self._next - 1] if self.ordered and self._next else (None, None)
+            return {**self._counts, 'last_rowid': last[0], 'last_sha1': last[1]}
+
+    def checkpoint(self, snapshot: Dict[str, Any], status: Optional[str] = None) -> None:
+        """Write a snapshot's progress (and optionally a final status) to the run record."""
+        now = time.monotonic()
+        with self._lock:
+            elapsed, self._last_save = now - self._last_save, now
+            deltas = {key: snapshot[key] - self._saved[key] for key in self._counts}
+            self._saved = {key: snapshot[key] for key in self._counts}
+        sets = ["rows_done = rows_done + ?", "rows_skipped = rows_skipped + ?", "rows_failed = rows_failed + ?",
+                "elapsed_seconds = elapsed_seconds + ?", "updated_at = CURRENT_TIMESTAMP"]
+        params: List[Any] = [deltas['rows_done'], deltas['rows_skipped'], deltas['rows_failed'], elapsed]
+        if snapshot['last_rowid'] is not None:
+            sets.append("last_rowid = MAX(COALESCE(last_rowid, ?), ?)")
+            sets.append("last_sha1 = CASE WHEN ? >= COALESCE(last_rowid, ?) THEN ? ELSE last_sha1 END")
+            params.extend([snapshot['last_rowid']] * 2 + [snapshot['last_rowid']] * 2 + [snapshot['last_sha1']])
+        if status:
+            sets.append("status = ?")
+            params.append(status)
+            if status != 'running':
+                sets.append("finished_at = CURRENT_TIMESTAMP")
+        params.append(self.run_id)
+        with get_db_connection(self.db_path) as conn:
+            conn.execute(f"UPDATE enrichment_runs SET {', '.join(sets)} WHERE run_id = ?", params)
+            conn.commit()
+        logging.debug(f"Run {self.run_id[:8]} checkpoint: {snapshot}")
+
+    def due(self, interval: float = DEFAULT_WRITE_MAX_DELAY) -> bool:
+        """True if the last checkpoint is more than ``interval`` seconds old."""
+        return time.monotonic() - self._last_save >= interval
+
+    def finish(self, status: str, snapshot: Optional[Dict[str, Any]] = None) -> None:
+        """Record the final progress and status; never raises."""
+        try:
+            self.checkpoint(snapshot or self.snapshot(), status)
+        except Exception as e:
+            logging.warning(f"Could not record the end of run {self.run_id[:8]}: {e}")
+
+
+def format_runs(runs: List[Dict[str, Any]]) -> str:
+    """Render list_runs output for the terminal."""
+    if not runs:
+        return "No enrichment runs recorded yet."
+
+    lines = ["🧾 Enrichment runs", "=" * 60]
+    for run in runs:
+        processed = run['rows_done'] - run['rows_skipped']
+        elapsed = run['elapsed_seconds'] or 0
+        throughput = f"{processed / elapsed * 60:.1f} docs/min" if elapsed > 0 and processed else "-"
+        lines.extend([
+            f"{run['run_id'][:8]}  {run['enrichment_name']} / {run['model']}  [{run['status']}]",
+            f"  Rows: {run['rows_done']:,}/{run['rows_total']:,} done "
+            f"({run['rows_skipped']:,} skipped, {run['rows_failed']:,} failed)"
+            + (f", resume after rowid {run['last_rowid']}" if run['status'] != 'completed' and run['last_rowid'] is not None else ""),
+            f"  Throughput: {throughput} over {elapsed:.0f}s",
+            f"  Started {run['started_at']}" + (f", finished {run['finished_at']}" if run['finished_at'] else ""),
+            "",
+        ])
+    return "\n".join(lines).rstrip()
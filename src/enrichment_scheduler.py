@@ -0,0 +1,197 @@
+"""
+Scheduling of several enrichments in one ``enrich`` invocation.
+
+Enrichments form a dependency graph: B depends on A when B's query or
+``input_columns`` mention A's output (its ``output_table``, or its output
+column for direct-column enrichments), or when B lists A under
+``depends_on``. ``EnrichmentScheduler`` starts every enrichment as soon as the
+ones it depends on have finished, so independent enrichments run
+concurrently; the caller shares one API semaphore between them so the total
+number of requests in flight stays bounded.
+
+``SharedRowSource`` lets enrichments that start together and select the same
+rows and columns share one fetch. Cached fetches are dropped whenever an
+enrichment finishes, because its writes may change what a query selects.
+"""
+
+import asyncio
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .constants import DEFAULT_TABLE_NAME
+from .db_operations import fetch_rows_keyset
+from .types import RowList
+
+
+def enrichment_outputs(enrichment: Dict[str, Any]) -> Set[str]:
+    """Names other enrichments would use to read this enrichment's results."""
+    if enrichment.get('output_table'):
+        return {enrichment['output_table']}
+    columns = enrichment.get('output_columns') or [enrichment.get('output_column')]
+    if isinstance(columns, str):
+        columns = [columns]
+    outputs = {col for col in columns if col}
+    # Schema-driven direct-column enrichments write the schema's fields
+    schema = enrichment.get('schema')
+    if isinstance(schema, dict) and not outputs:
+        outputs.update(schema.keys())
+    return outputs
+
+
+def enrichment_reads(enrichment: Dict[str, Any], config_data: Dict[str, Any]) -> str:
+    """The query (resolved through sql_queries / tables) and input columns of an enrichment, as one string."""
+    input_config = enrichment.get('input') or {}
+    query = input_config.get('query', '')
+    query = (config_data.get('sql_queries') or {}).get(query, query)
+    table = enrichment.get('table') or config_data.get('default_table', DEFAULT_TABLE_NAME)
+    table_query = ((config_data.get('tables') or {}).get(table) or {}).get('base_query', '')
+    columns = input_config.get('input_columns') or []
+    if isinstance(columns, str):
+        columns = [columns]
+    return ' '.join([str(query), str(table_query)] + [str(col) for col in columns])
+
+
+def build_dependencies(enrichments: List[Dict[str, Any]], config_data: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """{enrichment name: names of the enrichments it must wait for} among ``enrichments``."""
+    names = {e['name'] for e in enrichments}
+    outputs = {e['name']: enrichment_outputs(e) for e in enrichments}
+    dependencies: Dict[str, Set[str]] = {}
+    for enrichment in enrichments:
+        name = enrichment['name']
+        reads = enrichment_reads(enrichment, config_data)
+        own = outputs[name]
+        deps = set()
+        for other, other_outputs in outputs.items():
+            if other == name:
+                continue
+            # A direct-column enrichment's query mentions its own column (IS NULL filter); that is not a read
+            for output in other_outputs - own:
+                if re.search(rf'\b{re.escape(output)}\b', reads, re.IGNORECASE):
+                    deps.add(other)
+                    break
+        explicit = enrichment.get('depends_on') or []
+        if isinstance(explicit, str):
+            explicit = [explicit]
+        deps.update(dep for dep in explicit if dep in names)
+        dependencies[name] = deps
+    return dependencies
+
+
+def execution_levels(dependencies: Dict[str, Set[str]]) -> List[List[str]]:
+    """Group enrichments into levels that can run together (each level only depends on earlier ones).
+
+    Raises:
+        ValueError: If the dependencies contain a cycle
+    """
+    remaining = {name: set(deps) for name, deps in dependencies.items()}
+    levels = []
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+        if not ready:
+            raise ValueError(f"Enrichments depend on each other in a cycle: {', '.join(sorted(remaining))}")
+        levels.append(ready)
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return levels
+
+
+class EnrichmentScheduler:
+    """Runs enrichments as their dependencies complete."""
+
+    def __init__(self, enrichments: List[Dict[str, Any]], config_data: Dict[str, Any]):
+        self.enrichments = {e['name']: e for e in enrichments}
+        self.order = [e['name'] for e in enrichments]
+        self.dependencies = build_dependencies(enrichments, config_data)
+        self.groups: Dict[str, List[str]] = {}  # leader -> fused enrichment names (see fuse)
+        self.levels = execution_levels(self.dependencies)
+
+    def fuse(self, groups: List[List[str]]) -> None:
+        """Run each group of enrichments as one step, under its first member's name.
+
+        Raises:
+            ValueError: If merging the groups creates a cycle
+        """
+        for names in groups:
+            leader, rest = names[0], set(names[1:])
+            self.dependencies[leader] = set().union(*(self.dependencies.pop(name) for name in names)) - set(names)
+            self.order = [name for name in self.order if name not in rest]
+            for deps in self.dependencies.values():
+                if deps & rest:
+                    deps.difference_update(rest)
+                    deps.add(leader)
+            self.groups[leader] = list(names)
+        self.levels = execution_levels(self.dependencies)
+
+    def describe(self) -> str:
+        """One line per level, e.g. 'classify, summarize → translate_summary' (fused groups as 'a+b')."""
+        return ' → '.join(', '.join('+'.join(self.groups.get(name, [name])) for name in level)
+                          for level in self.levels)
+
+    async def run(self, run_one: Callable[[Dict[str, Any]], Awaitable[Any]],
+                  on_done: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Run every enrichment with ``run_one(config)``, each once its dependencies have succeeded.
+
+        Enrichments whose dependencies failed are skipped; independent ones
+        still run. The first error is raised once everything has settled.
+
+        Returns:
+            {enrichment name: run_one result}
+        """
+        finished: Dict[str, asyncio.Future] = {name: asyncio.get_running_loop().create_future() for name in self.order}
+
+        async def run_node(name: str) -> Any:
+            try:
+                for dep in self.dependencies[name]:
+                    if not await asyncio.shield(finished[dep]):
+                        logging.error(f"Skipping enrichment '{name}' because '{dep}' failed")
+                        finished[name].set_result(False)
+                        return None
+                result = await run_one(self.enrichments[name])
+            except BaseException:
+                if not finished[name].done():
+                    finished[name].set_result(False)
+                raise
+            finished[name].set_result(True)
+            if on_done:
+                on_done(name)
+            return result
+
+        outcomes = await asyncio.gather(*(run_node(name) for name in self.order), return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        if errors:
+            raise errors[0]
+        return dict(zip(self.order, outcomes))
+
+
+class SharedRowSource:
+    """Row fetches shared by enrichments that select the same rows and columns."""
+
+    def __init__(self):
+        self._fetches: Dict[Tuple, asyncio.Future] = {}
+        self.shared = 0
+
+    async def fetch(self, db_path: str, query: str, input_columns: List[str],
+                    after_rowid: Optional[int] = None, limit: Optional[int] = None) -> RowList:
+        """Rows as returned by fetch_rows_keyset; each caller gets its own copies."""
+        key = (db_path, ' '.join(query.split()), tuple(input_columns), after_rowid, limit)
+        future = self._fetches.get(key)
+        if future is None:
+            future = asyncio.ensure_future(asyncio.to_thread(
+                fetch_rows_keyset, db_path, query, input_columns, after_rowid=after_rowid, limit=limit
+            ))
+            self._fetches[key] = future
+        else:
+            self.shared += 1
+            logging.info("Reusing rows already being fetched for another enrichment")
+        try:
+            rows = await asyncio.shield(future)
+        except Exception:
+            self._fetches.pop(key, None)
+            raise
+        return [dict(row) for row in rows]
+
+    def invalidate(self, *_: Any) -> None:
+        self._fetches.clear()
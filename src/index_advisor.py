@@ -0,0 +1,245 @@
+"""
+Index advisor for the queries doctrail issues against its own tables.
+
+Doctrail's hot read paths are few and fixed: the resume check on
+``enrichment_responses``, chunk reuse lookups, output-table existence checks
+and the ``<column> IS NULL`` filter added to source-table queries in append
+mode. ``plan_index_changes`` works out which indexes serve those queries
+(a covering index for the resume check, partial indexes for pending rows)
+and which existing indexes are redundant because another index already
+covers their columns. ``advise_indexes`` reports the changes together with
+``EXPLAIN QUERY PLAN`` output for each probe query, before and after applying.
+"""
+
+import logging
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .constants import DEFAULT_KEY_COLUMN, DEFAULT_TABLE_NAME
+from .pydantic_schema import analyze_schema_complexity
+from .schema_catalog import schema_catalog
+from .storage_layout import schema_for, table_exists
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """An index doctrail wants to exist."""
+    table: str
+    name: str
+    columns: Tuple[str, ...]
+    where: Optional[str] = None  # partial index predicate
+    reason: str = ''
+
+    def create_sql(self, schema: str = 'main') -> str:
+        sql = f"CREATE INDEX IF NOT EXISTS {schema}.{self.name} ON {self.table}({', '.join(self.columns)})"
+        return f"{sql} WHERE {self.where}" if self.where else sql
+
+
+@dataclass(frozen=True)
+class IndexDrop:
+    """An existing index made redundant by another one."""
+    table: str
+    name: str
+    reason: str
+
+
+@dataclass(frozen=True)
+class ProbeQuery:
+    """A query doctrail issues, used to show which index the planner picks."""
+    label: str
+    table: str
+    sql: str
+
+
+@dataclass(frozen=True)
+class IndexTarget:
+    """Where one enrichment reads and writes, as far as indexing is concerned."""
+    table: str
+    key_column: str = DEFAULT_KEY_COLUMN
+    output_table: Optional[str] = None
+    pending_column: Optional[str] = None  # source column filtered with IS NULL in append mode
+
+
+@dataclass
+class IndexPlan:
+    create: List[IndexSpec] = field(default_factory=list)
+    drop: List[IndexDrop] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.create or self.drop)
+
+
+RESUME_INDEX = IndexSpec(
+    'enrichment_responses', 'idx_enrichment_responses_resume',
+    ('sha1', 'enrichment_name', 'model_used', 'chunk_index'),
+    reason='covers the resume check and chunk reuse lookups'
+)
+
+RESUME_QUERIES = [
+    ProbeQuery('resume check', 'enrichment_responses',
+               "SELECT 1 FROM enrichment_responses WHERE sha1 = ? AND enrichment_name = ? "
+               "AND model_used = ? AND chunk_index IS NULL LIMIT 1"),
+    ProbeQuery('chunk reuse', 'enrichment_responses',
+               "SELECT chunk_index, raw_json FROM enrichment_responses WHERE sha1 = ? AND enrichment_name = ? "
+               "AND model_used = ? AND prompt_id IS ? AND chunk_count = ? AND chunk_index IS NOT NULL"),
+]
+
+
+def targets_from_config(config: Dict[str, Any]) -> List[IndexTarget]:
+    """One IndexTarget per configured enrichment."""
+    default_table = config.get('default_table', DEFAULT_TABLE_NAME)
+    targets = []
+    for enrichment in config.get('enrichments') or []:
+        table = enrichment.get('input_table') or enrichment.get('table') or default_table
+        key_column = enrichment.get('key_column', DEFAULT_KEY_COLUMN)
+        output_table = enrichment.get('output_table')
+        pending_column = None
+        if not output_table:
+            field_names = analyze_schema_complexity(enrichment.get('schema'))['field_names']
+            pending_column = enrichment.get('output_column') or (field_names[0] if field_names else None)
+        targets.append(IndexTarget(table, key_column, output_table, pending_column))
+    return targets
+
+
+def pending_index(table: str, column: str, key_column: str = DEFAULT_KEY_COLUMN) -> IndexSpec:
+    """Partial index over the rows an append-mode run still has to process."""
+    return IndexSpec(table, f"idx_{table}_{column}_pending", (key_column,), where=f"{column} IS NULL",
+                     reason=f"rows where {column} IS NULL (append-mode selection)")
+
+
+def probe_queries(conn: sqlite3.Connection, targets: List[IndexTarget]) -> List[ProbeQuery]:
+    """The queries doctrail runs for these targets, limited to tables that exist."""
+    probes = list(RESUME_QUERIES)
+    seen = set()
+    for target in targets:
+        if target.output_table and target.output_table not in seen:
+            seen.add(target.output_table)
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({target.output_table})").fetchall()]
+            model_filter = " AND model_used = ?" if 'model_used' in columns else ""
+            probes.append(ProbeQuery(
+                f'{target.output_table} lookup', target.output_table,
+                f"SELECT 1 FROM {target.output_table} WHERE {target.key_column} = ?{model_filter} LIMIT 1"
+            ))
+        if target.pending_column and (target.table, target.pending_column) not in seen:
+            seen.add((target.table, target.pending_column))
+            probes.append(ProbeQuery(
+                f'{target.table}.{target.pending_column} pending', target.table,
+                f"SELECT rowid, * FROM {target.table} WHERE {target.pending_column} IS NULL"
+            ))
+    return [probe for probe in probes if table_exists(conn, probe.table)]
+
+
+def _existing_indexes(conn: sqlite3.Connection, table: str) -> List[Dict[str, Any]]:
+    """Indexes of a table as dicts: name, columns, unique, origin ('c', 'u' or 'pk'), partial."""
+    indexes = []
+    for row in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        name = row[1]
+        columns = tuple(col[2] for col in conn.execute(f"PRAGMA index_info({name})").fetchall())
+        indexes.append({'name': name, 'columns': columns, 'unique': bool(row[2]),
+                        'origin': row[3], 'partial': bool(row[4])})
+    return indexes
+
+
+def _redundant_indexes(table: str, indexes: List[Dict[str, Any]]) -> List[IndexDrop]:
+    """Plain CREATE INDEX indexes whose columns are a leading prefix of another full index."""
+    drops = []
+    dropped = set()
+    for index in indexes:
+        if index['origin'] != 'c' or index['unique'] or index['partial']:
+            continue
+        cols = [c.lower() for c in index['columns'] if c is not None]
+        covering = []
+        for other in indexes:
+            if other is index or other['partial'] or other['name'] in dropped:
+                continue
+            other_cols = [c.lower() for c in other['columns'] if c is not None]
+            if cols == other_cols[:len(cols)]:
+                covering.append(other)
+        # Of two identical plain indexes only the later one is dropped
+        covering = [other for other in covering if len(other['columns']) > len(cols) or other['origin'] != 'c'
+                    or other['unique'] or indexes.index(other) < indexes.index(index)]
+        if covering:
+            other = max(covering, key=lambda other: len(other['columns']))
+            drops.append(IndexDrop(table, index['name'], f"covered by {other['name']} ({', '.join(other['columns'])})"))
+            dropped.add(index['name'])
+    return drops
+
+
+def plan_index_changes(conn: sqlite3.Connection, targets: List[IndexTarget]) -> IndexPlan:
+    """Indexes to create and drop for the given enrichment targets."""
+    wanted = [RESUME_INDEX]
+    for target in targets:
+        if target.pending_column:
+            wanted.append(pending_index(target.table, target.pending_column, target.key_column))
+
+    plan = IndexPlan()
+    tables = {spec.table for spec in wanted} | {t.output_table for t in targets if t.output_table}
+    for table in sorted(tables):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        if not columns:
+            continue
+        indexes = _existing_indexes(conn, table)
+        names = {index['name'] for index in indexes}
+        for spec in wanted:
+            if spec.table != table or spec.name in names:
+                continue
+            if not all(col in columns for col in spec.columns):
+                continue
+            if spec.where and spec.where.split()[0] not in columns:
+                continue
+            plan.create.append(spec)
+            indexes.append({'name': spec.name, 'columns': spec.columns, 'unique': False,
+                            'origin': 'c', 'partial': spec.where is not None})
+        plan.drop.extend(_redundant_indexes(table, indexes))
+    return plan
+
+
+def explain(conn: sqlite3.Connection, sql: str) -> str:
+    """The EXPLAIN QUERY PLAN detail lines of a query, joined into one string."""
+    params = (None,) * sql.count('?')
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.OperationalError as e:
+        return f"n/a ({e})"
+    return '; '.join(row[-1] for row in rows)
+
+
+def apply_index_changes(conn: sqlite3.Connection, db_path: str, plan: IndexPlan) -> None:
+    """Create and drop the planned indexes in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for spec in plan.create:
+            conn.execute(spec.create_sql(schema_for(db_path, spec.table)))
+            logging.info(f"Created index {spec.name}")
+        for drop in plan.drop:
+            conn.execute(f"DROP INDEX IF EXISTS {drop.name}")
+            logging.info(f"Dropped index {drop.name}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        schema_catalog.invalidate(db_path)
+    # Refresh planner statistics for the tables that changed
+    conn.execute("PRAGMA optimize")
+
+
+def advise_indexes(db_path: str, targets: List[IndexTarget], apply: bool = False) -> Dict[str, Any]:
+    """Plan index changes and report query plans for doctrail's probe queries.
+
+    Returns:
+        Dict with 'plan' (IndexPlan), 'applied' and 'queries': a list of
+        {'label', 'before', 'after'} where 'after' is None unless applied.
+    """
+    from .db_operations import get_db_connection
+
+    with get_db_connection(db_path) as conn:
+        plan = plan_index_changes(conn, targets)
+        probes = probe_queries(conn, targets)
+        queries = [{'label': p.label, 'before': explain(conn, p.sql), 'after': None} for p in probes]
+        if apply and plan:
+            apply_index_changes(conn, db_path, plan)
+            for probe, query in zip(probes, queries):
+                query['after'] = explain(conn, probe.sql)
+    return {'plan': plan, 'applied': bool(apply and plan), 'queries': queries}
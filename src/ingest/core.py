@@ -24,8 +24,11 @@ from loguru import logger
 
 # Import from sibling modules
 from .database import insert_document, check_db_schema, setup_fts, clean_metadata
-from .document_processor import process_document, SkippedFileException
+from .document_processor import process_document, SkippedFileException, default_registry
+from .extractor_scheduler import ExtractorScheduler, ExtractorStats
 from ..file_filters import should_skip_file, apply_file_patterns
+from ..wal_checkpoint import CheckpointManager, format_wal_size
+from ..profiling import span
 from .manifest import load_manifest, get_file_metadata, find_manifest_in_directory
 
 # Initialize Rich console for pretty output
@@ -99,6 +102,15 @@ async def process_ingest(
     
     # Initialize database connection
     db = sqlite_utils.Database(db_path)
+    checkpointer = CheckpointManager(db_path, conn=db.conn)
+    
+    # Extractor history lets the cascade skip extractors that never work for this corpus
+    extractor_stats = ExtractorStats()
+    try:
+        extractor_stats.load(db)
+    except Exception as e:
+        logger.warning(f"Could not load extractor statistics: {e}")
+    scheduler = ExtractorScheduler(default_registry, extractor_stats)
     
     # Get existing documents if not overwriting
     existing_sha1s = set()
@@ -123,8 +135,9 @@ async def process_ingest(
         logger.info(f"Processing single file: {input_path}")
     else:
         # Directory mode - find all files recursively
-        all_files = list(input_path.rglob("*"))
-        all_files = [f for f in all_files if f.is_file()]
+        with span('ingest.scan'):
+            all_files = list(input_path.rglob("*"))
+            all_files = [f for f in all_files if f.is_file()]
         logger.info(f"Found {len(all_files)} total files in {input_dir}")
     
     # Apply include/exclude patterns
@@ -181,7 +194,7 @@ async def process_ingest(
             
             # Calculate SHA1
             try:
-                with open(file_path, 'rb') as f:
+                with span('ingest.hash'), open(file_path, 'rb') as f:
                     file_sha1 = hashlib.sha1(f.read()).hexdigest()
                 
                 # Skip if already processed (unless overwriting)
@@ -235,7 +248,8 @@ async def process_ingest(
         async def process_file_wrapper(file_info):
             file_path, file_sha1 = file_info
             try:
-                sha1, content, metadata = await process_document(str(file_path), file_sha1, use_readability=readability, html_extractor=html_extractor, skip_garbage_check=skip_garbage_check)
+                with span('ingest.extract'):
+                    sha1, content, metadata = await process_document(str(file_path), file_sha1, use_readability=readability, html_extractor=html_extractor, skip_garbage_check=skip_garbage_check, scheduler=scheduler)
                 
                 # Clean metadata
                 metadata = clean_metadata(metadata)
@@ -249,7 +263,8 @@ async def process_ingest(
                     logger.debug(f"Added {len(manifest_metadata)} fields from manifest for {file_path.name}")
                 
                 # Insert into database
-                insert_document(db, table, sha1, str(file_path), content, metadata)
+                with span('ingest.insert'):
+                    insert_document(db, table, sha1, str(file_path), content, metadata)
                 
                 return True, None
             except SkippedFileException as e:
@@ -283,25 +298,24 @@ async def process_ingest(
                     warnings += 1
                     logger.debug(f"Skipped {file_path.name}: {error}")
             
-            # WAL checkpoint after each batch
-            if successful > 0 and (successful % 100) == 0:
-                try:
-                    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-                    logger.debug("Performed WAL checkpoint")
-                except Exception as e:
-                    logger.warning(f"WAL checkpoint failed: {e}")
+            try:
+                extractor_stats.save(db)
+            except Exception as e:
+                logger.warning(f"Could not save extractor statistics: {e}")
+            
+            # Between batches nothing is being written: checkpoint if the WAL has grown
+            with span('ingest.checkpoint'):
+                checkpointer.tick(idle=True)
+            progress.update(task, description=f"Processing files... (WAL {format_wal_size(checkpointer.wal_size())})")
     
     # Final WAL checkpoint
-    try:
-        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-        logger.debug("Performed final WAL checkpoint")
-    except Exception as e:
-        logger.warning(f"Final WAL checkpoint failed: {e}")
+    checkpointer.finish()
     
     # Create FTS index if requested
     if fulltext and successful > 0:
         console.print("\n[bold]Creating full-text search index...[/bold]")
-        setup_fts(db_path, table)
+        with span('ingest.fts'):
+            setup_fts(db_path, table)
     
     # Show results
     console.print(f"\n[bold]Ingestion Complete![/bold]")
@@ -38,6 +38,9 @@ from .text_processing import (
 from ..file_filters import (
     should_skip_file, get_unsupported_file_error, check_for_manual_override
 )
+from .extractor_scheduler import (
+    ExtractionResult, ExtractorRegistry, ExtractorScheduler, extraction_scope
+)
 
 # Custom exception for skipped files
 class SkippedFileException(Exception):
@@ -45,8 +48,13 @@ class SkippedFileException(Exception):
     pass
 
 
-async def process_document(file_path: str, file_sha1: str, use_readability: bool = False, html_extractor: str = 'default', skip_garbage_check: bool = False) -> Tuple[str, str, Dict]:
-    """Process a document using specialized extractors and return (sha1, content, metadata)"""
+async def process_document(file_path: str, file_sha1: str, use_readability: bool = False, html_extractor: str = 'default', skip_garbage_check: bool = False,
+                           scheduler: Optional[ExtractorScheduler] = None) -> Tuple[str, str, Dict]:
+    """Process a document using specialized extractors and return (sha1, content, metadata).
+
+    ``scheduler`` orders the PDF/HTML extractor cascades; a process-wide default
+    with in-memory statistics is used when none is given.
+    """
     # Ensure proper UTF-8 encoding for Python I/O
     os.environ['PYTHONIOENCODING'] = 'utf8'
     
@@ -94,7 +102,7 @@ async def process_document(file_path: str, file_sha1: str, use_readability: bool
 
     # Handle PDF files
     if file_extension == '.pdf':
-        return await _process_pdf_file(file_path, file_sha1, original_file_path)
+        return await _process_pdf_file(file_path, file_sha1, original_file_path, scheduler)
 
     # Handle EPUB files
     if file_extension == '.epub':
@@ -122,7 +130,7 @@ async def process_document(file_path: str, file_sha1: str, use_readability: bool
 
     # Handle HTML files (including converted MHTML)
     if file_extension in ['.html', '.htm']:
-        result = await _process_html_file(file_path, file_sha1, original_file_path, use_readability, mhtml_metadata, html_extractor, skip_garbage_check)
+        result = await _process_html_file(file_path, file_sha1, original_file_path, use_readability, mhtml_metadata, html_extractor, skip_garbage_check, scheduler)
         
         # Clean up temporary HTML file if it was created
         if temp_html_file and os.path.exists(temp_html_file):
@@ -179,8 +187,66 @@ async def _process_text_file(file_path: str, file_sha1: str, original_file_path:
         raise ValueError(get_unsupported_file_error(file_path))
 
 
-async def _process_pdf_file(file_path: str, file_sha1: str, original_file_path: str) -> Tuple[str, str, Dict]:
-    """Process PDF files with multiple extraction methods"""
+def _pdftotext(file_path: str) -> Optional[ExtractionResult]:
+    result = subprocess.run(
+        ['pdftotext', file_path, '-'],
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    if result.returncode == 0 and result.stdout.strip():
+        # Add page markers if form feeds are present
+        return ExtractionResult(add_page_markers(result.stdout.strip()))
+    return None
+
+
+def _mutool(file_path: str) -> Optional[ExtractionResult]:
+    content = extract_text_with_mutool(file_path)
+    return ExtractionResult(content) if content else None
+
+
+def _ocrmypdf(file_path: str) -> Optional[ExtractionResult]:
+    ocr_pdf_path = ocr_pdf_with_ocrmypdf(file_path)
+    result = subprocess.run(
+        ['pdftotext', ocr_pdf_path, '-'],
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    if result.returncode == 0 and result.stdout.strip():
+        return ExtractionResult(
+            clean_ocr_text(result.stdout.strip()),
+            {'ocr_applied': True, 'ocr_file_path': ocr_pdf_path}
+        )
+    raise ValueError("OCR extraction failed")
+
+
+def _w3m(file_path: str) -> Optional[ExtractionResult]:
+    content, title = extract_text_with_w3m(file_path)
+    return ExtractionResult(content, {'title': title}) if content else None
+
+
+def _chrome_headless(file_path: str) -> Optional[ExtractionResult]:
+    content, title = extract_with_chrome_headless(file_path)
+    return ExtractionResult(content, {'title': title}) if content else None
+
+
+# Candidate extractors per format; costs are rough seconds per document and are
+# replaced by observed timings once enough history exists for a corpus.
+default_registry = ExtractorRegistry()
+default_registry.register('pdf', 'pdftotext', 0.5, _pdftotext, lambda c: not is_text_garbage(c))
+default_registry.register('pdf', 'mutool', 1.0, _mutool, lambda c: not is_text_garbage(c))
+default_registry.register('pdf', 'ocrmypdf', 60.0, _ocrmypdf)
+default_registry.register('html_garbage', 'w3m_browser', 1.0, _w3m, lambda c: not is_content_garbage(c))
+default_registry.register('html_garbage', 'chrome_headless', 5.0, _chrome_headless, lambda c: not is_content_garbage(c))
+
+_default_scheduler = ExtractorScheduler(default_registry)
+
+
+async def _process_pdf_file(file_path: str, file_sha1: str, original_file_path: str,
+                            scheduler: Optional[ExtractorScheduler] = None) -> Tuple[str, str, Dict]:
+    """Process PDF files with the scheduled extractor cascade"""
+    scheduler = scheduler or _default_scheduler
     try:
         logger.info(f"Processing PDF file: {file_path}")
         
@@ -193,89 +259,23 @@ async def _process_pdf_file(file_path: str, file_sha1: str, original_file_path:
         else:
             metadata_update = {}
         
-        # Try pdftotext first
-        result = subprocess.run(
-            ['pdftotext', file_path, '-'],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
+        scope = extraction_scope(original_file_path, 'pdf')
+        extracted, extraction_method, rejected = scheduler.run('pdf', file_path, scope)
         
-        if result.returncode == 0 and result.stdout.strip():
-            content = result.stdout.strip()
-            
-            # Add page markers if form feeds are present
-            content = add_page_markers(content)
-            
-            # Check if text looks like garbage (encoding issues, etc.)
-            if is_text_garbage(content):
-                logger.warning(f"PDF text appears to be garbage, trying alternative methods...")
-                # Try mutool as alternative
-                mutool_content = extract_text_with_mutool(file_path)
-                if mutool_content and not is_text_garbage(mutool_content):
-                    content = mutool_content
-                    extraction_method = 'mutool'
-                else:
-                    # If still garbage, try OCR
-                    logger.info("PDF text extraction failed, attempting OCR...")
-                    try:
-                        ocr_pdf_path = ocr_pdf_with_ocrmypdf(file_path)
-                        # Try extracting from OCR'd PDF
-                        result = subprocess.run(
-                            ['pdftotext', ocr_pdf_path, '-'],
-                            capture_output=True,
-                            text=True,
-                            timeout=60
-                        )
-                        if result.returncode == 0 and result.stdout.strip():
-                            content = result.stdout.strip()
-                            content = clean_ocr_text(content)
-                            extraction_method = 'ocrmypdf'
-                            metadata_update['ocr_applied'] = True
-                            metadata_update['ocr_file_path'] = ocr_pdf_path
-                        else:
-                            raise ValueError("OCR extraction failed")
-                    except Exception as ocr_e:
-                        logger.error(f"OCR failed: {ocr_e}")
-                        content = content  # Use original garbage content
-                        extraction_method = 'pdftotext_with_issues'
-                        metadata_update['text_quality_issue'] = 'garbage_text_detected'
-            else:
-                extraction_method = 'pdftotext'
-        else:
-            # pdftotext failed, try alternatives
-            logger.warning(f"pdftotext failed for {file_path}, trying mutool...")
-            mutool_content = extract_text_with_mutool(file_path)
-            
-            if mutool_content:
-                content = mutool_content
-                extraction_method = 'mutool'
-            else:
-                # Last resort: OCR
-                logger.info("All PDF text extraction methods failed, attempting OCR...")
-                try:
-                    ocr_pdf_path = ocr_pdf_with_ocrmypdf(file_path)
-                    result = subprocess.run(
-                        ['pdftotext', ocr_pdf_path, '-'],
-                        capture_output=True,
-                        text=True,
-                        timeout=60
-                    )
-                    if result.returncode == 0 and result.stdout.strip():
-                        content = clean_ocr_text(result.stdout.strip())
-                        extraction_method = 'ocrmypdf'
-                        metadata_update['ocr_applied'] = True
-                        metadata_update['ocr_file_path'] = ocr_pdf_path
-                    else:
-                        raise ValueError("All PDF extraction methods failed")
-                except Exception as ocr_e:
-                    logger.error(f"OCR failed: {ocr_e}")
-                    metadata_update['ocr_attempted'] = True
-                    metadata_update['ocr_failed'] = str(ocr_e)
-                    raise ValueError(get_unsupported_file_error(original_file_path))
+        if extracted is None:
+            if rejected is None:
+                logger.error(f"All PDF extraction methods failed for {file_path}")
+                raise ValueError(get_unsupported_file_error(original_file_path))
+            # Keep the garbage text rather than losing the document
+            logger.warning(f"PDF text appears to be garbage, keeping {rejected.metadata['rejected_extractor']} output")
+            extracted = rejected
+            extraction_method = f"{rejected.metadata.pop('rejected_extractor')}_with_issues"
+            metadata_update['text_quality_issue'] = 'garbage_text_detected'
+        
+        metadata_update.update(extracted.metadata)
         
         # Clean up the text
-        content = clean_extracted_text(content)
+        content = clean_extracted_text(extracted.content)
         
         # Build metadata
         metadata = {
@@ -438,7 +438,8 @@ async def _convert_mhtml_to_html(file_path: str, original_file_path: str) -> Tup
 
 async def _process_html_file(file_path: str, file_sha1: str, original_file_path: str, 
                              use_readability: bool, mhtml_metadata: Optional[Dict],
-                             html_extractor: str = 'default', skip_garbage_check: bool = False) -> Tuple[str, str, Dict]:
+                             html_extractor: str = 'default', skip_garbage_check: bool = False,
+                             scheduler: Optional[ExtractorScheduler] = None) -> Tuple[str, str, Dict]:
     """Process HTML files (including converted MHTML)"""
     try:
         logger.info(f"Processing HTML file: {file_path}")
@@ -458,28 +459,22 @@ async def _process_html_file(file_path: str, file_sha1: str, original_file_path:
         if not skip_garbage_check and is_content_garbage(html_content):
             logger.warning("HTML content appears to be garbage, trying alternative extraction methods...")
             
-            # Try w3m extraction
-            w3m_content, w3m_title = extract_text_with_w3m(file_path)
-            if w3m_content and not is_content_garbage(w3m_content):
-                content = w3m_content
-                title = w3m_title
-                extraction_method = 'w3m_browser'
+            # Try the scheduled alternative extractors (w3m, Chrome headless)
+            extracted, extraction_method, _ = (scheduler or _default_scheduler).run(
+                'html_garbage', file_path, extraction_scope(original_file_path, 'html_garbage')
+            )
+            if extracted is not None:
+                content = extracted.content
+                title = extracted.metadata.get('title', '')
             else:
-                # Try Chrome headless extraction
-                chrome_content, chrome_title = extract_with_chrome_headless(file_path)
-                if chrome_content and not is_content_garbage(chrome_content):
-                    content = chrome_content
-                    title = chrome_title
-                    extraction_method = 'chrome_headless'
+                # Use BeautifulSoup as last resort
+                soup = BeautifulSoup(html_content, 'html.parser')
+                if html_extractor == 'smart':
+                    content = extract_html_text_smart(html_content)
                 else:
-                    # Use BeautifulSoup as last resort
-                    soup = BeautifulSoup(html_content, 'html.parser')
-                    if html_extractor == 'smart':
-                        content = extract_html_text_smart(html_content)
-                    else:
-                        content = soup.get_text(separator='\n', strip=True)
-                    title = soup.title.string if soup.title else ""
-                    extraction_method = 'beautifulsoup_with_issues' if html_extractor != 'smart' else 'smart_with_issues'
+                    content = soup.get_text(separator='\n', strip=True)
+                title = soup.title.string if soup.title else ""
+                extraction_method = 'beautifulsoup_with_issues' if html_extractor != 'smart' else 'smart_with_issues'
         else:
             # Content looks good, use readability if requested
             if use_readability:
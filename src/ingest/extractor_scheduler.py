@@ -0,0 +1,244 @@
+"""
+Extractor cascade scheduling for document ingestion.
+
+Each file format registers candidate extractors with an estimated cost (in
+seconds) and a quality check. For every file the scheduler orders the
+candidates by expected cost to a successful extraction, using success rates
+recorded per corpus scope (PDF producer or source directory), and skips
+extractors that have never succeeded for that scope. A skipped extractor is
+tried again, first, once every ``REEXPLORE_AFTER_SKIPS`` documents of the
+scope, so a tool upgrade or a new kind of document can bring it back.
+"""
+
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+STATS_TABLE = "extractor_stats"
+
+# Attempts needed before observed timings/success rates replace the priors
+MIN_ATTEMPTS_FOR_STATS = 5
+
+# Documents planned without a skipped extractor before it is tried again
+REEXPLORE_AFTER_SKIPS = 50
+
+
+@dataclass
+class ExtractionResult:
+    """Output of a single extractor attempt."""
+    content: str
+    metadata: Dict = field(default_factory=dict)
+
+
+@dataclass
+class ExtractorCandidate:
+    """A registered extractor for one file format."""
+    name: str
+    cost: float
+    extract: Callable[[str], Optional[ExtractionResult]]
+    quality_check: Callable[[str], bool]
+
+
+@dataclass
+class ExtractorStat:
+    """Historical outcome counters for one (format, scope, extractor)."""
+    attempts: int = 0
+    successes: int = 0
+    total_seconds: float = 0.0
+    skipped: int = 0  # documents planned without it since its last attempt
+
+    @property
+    def success_rate(self) -> float:
+        # Laplace-smoothed so a single failure does not zero the estimate
+        return (self.successes + 1) / (self.attempts + 2)
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.attempts if self.attempts else 0.0
+
+
+class ExtractorRegistry:
+    """Candidate extractors keyed by file format."""
+
+    def __init__(self):
+        self._candidates: Dict[str, List[ExtractorCandidate]] = {}
+
+    def register(self, fmt: str, name: str, cost: float,
+                 extract: Callable[[str], Optional[ExtractionResult]],
+                 quality_check: Optional[Callable[[str], bool]] = None) -> None:
+        """Register (or replace) an extractor for a format."""
+        candidates = self._candidates.setdefault(fmt, [])
+        candidates[:] = [c for c in candidates if c.name != name]
+        candidates.append(ExtractorCandidate(
+            name=name,
+            cost=cost,
+            extract=extract,
+            quality_check=quality_check or (lambda content: bool(content and content.strip())),
+        ))
+
+    def candidates(self, fmt: str) -> List[ExtractorCandidate]:
+        return list(self._candidates.get(fmt, []))
+
+
+class ExtractorStats:
+    """In-memory extractor statistics with optional SQLite persistence."""
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str, str], ExtractorStat] = {}
+        self._dirty: set = set()
+
+    def get(self, fmt: str, scope: str, extractor: str) -> ExtractorStat:
+        return self._stats.get((fmt, scope, extractor), ExtractorStat())
+
+    def record(self, fmt: str, scope: str, extractor: str, success: bool, seconds: float) -> None:
+        key = (fmt, scope, extractor)
+        stat = self._stats.setdefault(key, ExtractorStat())
+        stat.attempts += 1
+        stat.successes += int(success)
+        stat.total_seconds += seconds
+        stat.skipped = 0
+        self._dirty.add(key)
+
+    def skip(self, fmt: str, scope: str, extractor: str) -> None:
+        key = (fmt, scope, extractor)
+        self._stats.setdefault(key, ExtractorStat()).skipped += 1
+        self._dirty.add(key)
+
+    def load(self, db) -> None:
+        """Load persisted statistics from a sqlite_utils Database."""
+        if STATS_TABLE not in db.table_names():
+            return
+        skipped = "skipped" if "skipped" in db[STATS_TABLE].columns_dict else "0"
+        for row in db.execute(
+            f"SELECT format, scope, extractor, attempts, successes, total_seconds, {skipped} FROM {STATS_TABLE}"
+        ).fetchall():
+            self._stats[(row[0], row[1], row[2])] = ExtractorStat(row[3], row[4], row[5], row[6])
+
+    def save(self, db) -> None:
+        """Persist statistics changed since the last save."""
+        if not self._dirty:
+            return
+        db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+                format TEXT NOT NULL,
+                scope TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                successes INTEGER NOT NULL DEFAULT 0,
+                total_seconds REAL NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (format, scope, extractor)
+            )
+        """)
+        if "skipped" not in db[STATS_TABLE].columns_dict:
+            db.execute(f"ALTER TABLE {STATS_TABLE} ADD COLUMN skipped INTEGER NOT NULL DEFAULT 0")
+        with db.conn:
+            db.conn.executemany(
+                f"INSERT OR REPLACE INTO {STATS_TABLE} "
+                f"(format, scope, extractor, attempts, successes, total_seconds, skipped) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*key, self._stats[key].attempts, self._stats[key].successes, self._stats[key].total_seconds,
+                  self._stats[key].skipped)
+                 for key in self._dirty]
+            )
+        self._dirty.clear()
+
+
+_PDF_PRODUCER_RE = re.compile(rb"/Producer\s*\(([^)]{1,120})\)")
+
+
+def detect_pdf_producer(file_path: str, window: int = 65536) -> Optional[str]:
+    """Cheaply read the PDF Producer string from the head/tail of the file."""
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(window)
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(max(0, size - window))
+            tail = f.read(window)
+    except OSError:
+        return None
+    for chunk in (tail, head):
+        match = _PDF_PRODUCER_RE.search(chunk)
+        if match:
+            producer = match.group(1).decode('latin-1', errors='ignore').strip()
+            # Drop version numbers so "Foo 1.2" and "Foo 1.3" share history
+            producer = re.sub(r"[\d.]+", "", producer).strip()
+            if producer:
+                return producer
+    return None
+
+
+def extraction_scope(file_path: str, fmt: str) -> str:
+    """Scope key used to group extractor statistics for a file."""
+    if fmt == 'pdf':
+        producer = detect_pdf_producer(file_path)
+        if producer:
+            return f"producer:{producer}"
+    return f"dir:{Path(file_path).parent}"
+
+
+class ExtractorScheduler:
+    """Runs a format's extractor cascade cheapest-likely-winner first."""
+
+    def __init__(self, registry: ExtractorRegistry, stats: Optional[ExtractorStats] = None):
+        self.registry = registry
+        self.stats = stats or ExtractorStats()
+
+    def expected_cost(self, fmt: str, scope: str, candidate: ExtractorCandidate) -> float:
+        stat = self.stats.get(fmt, scope, candidate.name)
+        cost = stat.mean_seconds if stat.attempts >= MIN_ATTEMPTS_FOR_STATS else candidate.cost
+        # cost / p(success) is the optimal ordering for a stop-on-first-success cascade
+        return cost / stat.success_rate
+
+    def plan(self, fmt: str, scope: str) -> List[ExtractorCandidate]:
+        """Order candidates, skipping those that always fail for this scope except for periodic re-tries."""
+        candidates = self.registry.candidates(fmt)
+        failing = [c for c in candidates if self._always_fails(fmt, scope, c)]
+        viable = [c for c in candidates if c not in failing]
+        # Never skip everything; fall back to the full list
+        if not viable:
+            return sorted(candidates, key=lambda c: self.expected_cost(fmt, scope, c))
+        retry = []
+        for candidate in failing:
+            if self.stats.get(fmt, scope, candidate.name).skipped >= REEXPLORE_AFTER_SKIPS:
+                retry.append(candidate)
+            else:
+                self.stats.skip(fmt, scope, candidate.name)
+        # Re-tries go first: behind an extractor that succeeds they would never run
+        return retry + sorted(viable, key=lambda c: self.expected_cost(fmt, scope, c))
+
+    def _always_fails(self, fmt: str, scope: str, candidate: ExtractorCandidate) -> bool:
+        stat = self.stats.get(fmt, scope, candidate.name)
+        return stat.attempts >= MIN_ATTEMPTS_FOR_STATS and stat.successes == 0
+
+    def run(self, fmt: str, file_path: str, scope: Optional[str] = None) -> Tuple[Optional[ExtractionResult], Optional[str], Optional[ExtractionResult]]:
+        """
+        Try candidates in planned order until one passes its quality check.
+
+        Returns:
+            Tuple of (result, extractor_name, rejected) where rejected is the first
+            non-empty output that failed its quality check (usable as a last resort).
+        """
+        scope = scope or extraction_scope(file_path, fmt)
+        rejected = None
+        for candidate in self.plan(fmt, scope):
+            start = time.monotonic()
+            try:
+                result = candidate.extract(file_path)
+            except Exception as e:
+                logger.warning(f"Extractor {candidate.name} failed for {file_path}: {e}")
+                result = None
+            ok = bool(result and result.content and candidate.quality_check(result.content))
+            self.stats.record(fmt, scope, candidate.name, ok, time.monotonic() - start)
+            if ok:
+                return result, candidate.name, rejected
+            if result and result.content and rejected is None:
+                result.metadata.setdefault('rejected_extractor', candidate.name)
+                rejected = result
+            logger.debug(f"Extractor {candidate.name} gave no usable text for {file_path}")
+        return None, None, rejected
@@ -0,0 +1,141 @@
+"""Token-accurate chunking and map-reduce merging for long documents."""
+
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from .token_utils import get_model_context_limit, get_encoding
+
+# Defaults for the `chunking:` enrichment option
+DEFAULT_CHUNK_TOKENS = 8000
+DEFAULT_OVERLAP_TOKENS = 200
+DEFAULT_SAFETY_MARGIN = 2000
+
+REDUCERS = ('union', 'first', 'last', 'concat', 'max', 'min', 'sum')
+
+
+def parse_chunking_config(value: Any) -> Optional[Dict[str, Any]]:
+    """Normalise the `chunking:` enrichment option.
+
+    Accepts ``true`` (all defaults) or a mapping with ``chunk_tokens``,
+    ``overlap_tokens``, ``reduce`` ("merge" or "llm"), ``reduce_prompt`` and
+    per-field ``reducers``. Returns None when chunking is disabled.
+    """
+    if not value:
+        return None
+    if value is True:
+        value = {}
+    if not isinstance(value, dict):
+        raise ValueError(f"chunking must be true or a mapping, got: {value!r}")
+
+    settings = {
+        'chunk_tokens': int(value.get('chunk_tokens', DEFAULT_CHUNK_TOKENS)),
+        'overlap_tokens': int(value.get('overlap_tokens', DEFAULT_OVERLAP_TOKENS)),
+        'reduce': value.get('reduce', 'merge'),
+        'reduce_prompt': value.get('reduce_prompt'),
+        'reducers': dict(value.get('reducers') or {}),
+    }
+    if settings['chunk_tokens'] <= 0:
+        raise ValueError("chunking.chunk_tokens must be positive")
+    if not 0 <= settings['overlap_tokens'] < settings['chunk_tokens']:
+        raise ValueError("chunking.overlap_tokens must be between 0 and chunk_tokens")
+    if settings['reduce'] not in ('merge', 'llm'):
+        raise ValueError(f"chunking.reduce must be 'merge' or 'llm', got: {settings['reduce']}")
+    for field_name, reducer in settings['reducers'].items():
+        if reducer not in REDUCERS:
+            raise ValueError(f"Unknown reducer '{reducer}' for field '{field_name}'. Use one of: {', '.join(REDUCERS)}")
+    return settings
+
+
+def chunk_budget(model: str, prompt_tokens: int, chunk_tokens: int,
+                 safety_margin: int = DEFAULT_SAFETY_MARGIN) -> int:
+    """Clamp the configured chunk size to what fits beside the prompt."""
+    available = get_model_context_limit(model) - prompt_tokens - safety_margin
+    return max(1, min(chunk_tokens, available))
+
+
+def chunk_text(text: str, model: str, chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+               overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, encoding=None) -> List[str]:
+    """Split text into chunks of at most ``chunk_tokens`` tokens.
+
+    Consecutive chunks share ``overlap_tokens`` tokens so facts straddling a
+    boundary are seen whole at least once. Boundaries are moved back to the
+    nearest UTF-8 character start so multi-byte text is never split mid-character.
+    """
+    if not text:
+        return [text]
+    encoding = encoding or get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= chunk_tokens:
+        return [text]
+
+    # Byte offset of every token boundary
+    data = text.encode('utf-8')
+    offsets = [0]
+    for token_bytes in encoding.decode_tokens_bytes(tokens):
+        offsets.append(offsets[-1] + len(token_bytes))
+
+    def char_start(pos: int) -> int:
+        while 0 < pos < len(data) and (data[pos] & 0xC0) == 0x80:
+            pos -= 1
+        return pos
+
+    chunks = []
+    step = chunk_tokens - overlap_tokens
+    for start in range(0, len(tokens), step):
+        end = min(start + chunk_tokens, len(tokens))
+        chunk = data[char_start(offsets[start]):char_start(offsets[end])].decode('utf-8', errors='ignore')
+        if chunk.strip():
+            chunks.append(chunk)
+        if end == len(tokens):
+            break
+    logging.debug(f"Split {len(tokens)} tokens into {len(chunks)} chunks of <= {chunk_tokens} tokens")
+    return chunks
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _reduce_field(values: List[Any], reducer: str) -> Any:
+    present = [v for v in values if not _is_empty(v)]
+    if not present:
+        return None
+    if reducer == 'first':
+        return present[0]
+    if reducer == 'last':
+        return present[-1]
+    if reducer == 'concat':
+        return "\n\n".join(str(v) for v in present)
+    if reducer in ('max', 'min', 'sum'):
+        return {'max': max, 'min': min, 'sum': sum}[reducer](present)
+    # union: ordered, de-duplicated merge of list items
+    merged, seen = [], set()
+    for value in present:
+        for item in (value if isinstance(value, list) else [value]):
+            key = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+            if key not in seen:
+                seen.add(key)
+                merged.append(item)
+    return merged
+
+
+def merge_chunk_results(results: List[Dict[str, Any]], reducers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Merge per-chunk structured outputs into a single result.
+
+    Lists (including ``enum_list`` fields) are unioned and scalars take the first
+    non-null value, unless ``reducers`` overrides the strategy for a field.
+    """
+    reducers = reducers or {}
+    fields: List[str] = []
+    for result in results:
+        for name in result:
+            if name not in fields:
+                fields.append(name)
+
+    merged = {}
+    for name in fields:
+        values = [result.get(name) for result in results]
+        default = 'union' if any(isinstance(v, list) for v in values) else 'first'
+        merged[name] = _reduce_field(values, reducers.get(name, default))
+    return merged
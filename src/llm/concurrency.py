@@ -0,0 +1,88 @@
+"""
+Adaptive limit on concurrent LLM requests.
+
+``AdaptiveLimiter`` is used like an ``asyncio.Semaphore`` (``async with
+limiter``), but its limit moves: the retry engine calls ``throttle()`` when a
+provider rate-limits a request, which halves the limit, and ``succeeded()``
+after each successful request, which raises it by one slot per limit's worth
+of successes until it is back at the configured maximum (additive increase,
+multiplicative decrease). During an outage fewer requests are in flight
+instead of more being retried.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Optional
+
+logger = logging.getLogger(__name__)
+
+# Rate limits reported within this window after a decrease are from the same burst
+THROTTLE_WINDOW_SECONDS = 1.0
+
+
+class AdaptiveLimiter:
+    """Semaphore-like limit on requests in flight that backs off on rate limits."""
+
+    def __init__(self, limit: int, min_limit: int = 1):
+        self.max_limit = limit
+        self.min_limit = min(min_limit, limit)
+        self.limit = limit
+        self.in_use = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._successes = 0
+        self._throttled_at = float('-inf')
+
+    async def __aenter__(self) -> 'AdaptiveLimiter':
+        while self.in_use >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                # A wake-up meant for this waiter goes to the next one
+                self._wake()
+                raise
+        self.in_use += 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.in_use -= 1
+        self._wake()
+
+    def locked(self) -> bool:
+        return self.in_use >= self.limit
+
+    def throttle(self, retry_after: Optional[float] = None) -> None:
+        """A request was rate-limited: halve the limit (once per burst of rate limits)."""
+        now = time.monotonic()
+        if now - self._throttled_at < max(THROTTLE_WINDOW_SECONDS, retry_after or 0):
+            return
+        self._throttled_at = now
+        self._successes = 0
+        limit = max(self.min_limit, self.limit // 2)
+        if limit < self.limit:
+            logger.warning(f"Rate limited: lowering concurrent requests from {self.limit} to {limit}")
+            self.limit = limit
+
+    def succeeded(self) -> None:
+        """A request succeeded: add a slot after a full limit's worth of successes."""
+        if self.limit >= self.max_limit:
+            return
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            self.limit += 1
+            logger.debug(f"Raising concurrent requests to {self.limit}")
+            self._wake()
+
+    def _wake(self) -> None:
+        free = self.limit - self.in_use
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
@@ -0,0 +1,108 @@
+"""
+Hedged LLM requests for small, interactive runs (``enrich --hedge``).
+
+A request that is still unanswered once it has taken longer than its model's
+p95 latency is sent a second time; whichever copy succeeds first is used and
+the other is cancelled. One slow request then no longer sets the wall time of
+a ``--sha1`` spot check. The p95 comes from the latency window that telemetry
+keeps of recent successful calls, seeded from the database's ``llm_calls``
+history. Models without enough history are not hedged.
+
+Each run has a ``HedgePolicy`` which caps the number of duplicates and their
+estimated extra cost. Hedging is enabled through the call context, so it is
+off unless a run asks for it.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from ..constants import (
+    HEDGE_MAX_EXTRA_COST, HEDGE_MAX_PER_RUN, HEDGE_MIN_SAMPLES, HEDGE_PERCENTILE
+)
+from .telemetry import LATENCY_WINDOW, latency_window
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class HedgePolicy:
+    """When to send a duplicate request, and how many a run may send."""
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, min_samples: int = HEDGE_MIN_SAMPLES,
+                 max_hedges: int = HEDGE_MAX_PER_RUN, max_extra_cost: float = HEDGE_MAX_EXTRA_COST):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.max_extra_cost = max_extra_cost
+        self.hedges = 0
+        self.won = 0
+        self.extra_cost = 0.0
+
+    def seed(self, db_path: str, model: str) -> None:
+        """Load the model's recorded latencies so the first requests can be hedged too."""
+        from ..db_operations import get_recent_llm_latencies
+        try:
+            calls = get_recent_llm_latencies(db_path, model, LATENCY_WINDOW)
+        except Exception as e:
+            logger.debug(f"Could not read recorded latencies for {model}: {e}")
+            return
+        latency_window.seed(model, reversed(calls))
+
+    def delay(self, model: str) -> Optional[float]:
+        """Seconds after which a request to ``model`` is hedged, or None if it can't be."""
+        if latency_window.count(model) < self.min_samples:
+            return None
+        return latency_window.percentile(model, self.percentile) / 1000
+
+    def take(self, model: str) -> bool:
+        """Reserve one duplicate request; False once the count or cost cap is reached."""
+        cost = latency_window.mean_cost(model) or 0.0
+        if self.hedges >= self.max_hedges or self.extra_cost + cost > self.max_extra_cost:
+            return False
+        self.hedges += 1
+        self.extra_cost += cost
+        return True
+
+    def summary(self) -> Optional[str]:
+        if not self.hedges:
+            return None
+        return (f"Hedged {self.hedges} slow request{'s' if self.hedges != 1 else ''} "
+                f"({self.won} answered first, ~${self.extra_cost:.4f} extra)")
+
+
+async def hedged(request: Callable[[], Awaitable[T]], policy: HedgePolicy, model: str) -> T:
+    """Await ``request()``, sending one duplicate if it is slower than the policy's delay.
+
+    The first successful response wins; an error is only raised once both
+    copies have failed (the primary's error).
+    """
+    delay = policy.delay(model)
+    if delay is None:
+        return await request()
+
+    tasks: List[asyncio.Future] = [asyncio.ensure_future(request())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and policy.take(model):
+            logger.info(f"{model} request unanswered after {delay:.1f}s (p{policy.percentile:g}); sending a hedge")
+            tasks.append(asyncio.ensure_future(request()))
+
+        errors = {}
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        policy.won += 1
+                    return task.result()
+                errors[task] = task.exception()
+        raise next(errors[task] for task in tasks if task in errors)
+    finally:
+        losers = [task for task in tasks if not task.done()]
+        for task in losers:
+            task.cancel()
+        # Let cancelled copies finish their telemetry record
+        await asyncio.gather(*losers, return_exceptions=True)
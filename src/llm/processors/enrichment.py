@@ -12,8 +12,10 @@ from ...types import RowDict, EnrichmentResult
 from ...constants import DEFAULT_API_SEMAPHORE_LIMIT, DEFAULT_DB_SEMAPHORE_LIMIT
 from ...db_operations import (
     store_raw_enrichment_response, update_output_table,
-    update_database, checkpoint_wal
+    update_database
 )
+from ...db_pool import run_db
+from ...wal_checkpoint import CheckpointManager
 from ...schema_managers import validate_with_schema
 from ...core_utils import parse_input_columns_with_limits, apply_column_limits
 from ..client import LLMClient
@@ -103,9 +105,9 @@ class EnrichmentProcessor(BaseProcessor):
         
         results = await asyncio.gather(*tasks)
         
-        # Checkpoint WAL after batch
+        # End of batch is an idle point: checkpoint if the WAL has grown
         if not kwargs.get('suppress_wal_checkpoint', False):
-            await asyncio.to_thread(checkpoint_wal, self.db_path)
+            await asyncio.to_thread(CheckpointManager(self.db_path).tick, True)
         
         return results
     
@@ -239,7 +241,7 @@ class EnrichmentProcessor(BaseProcessor):
         async with self.db_semaphore:
             # Store raw response
             raw_json = json.dumps(result, ensure_ascii=False) if result else '{}'
-            await asyncio.to_thread(
+            await run_db(
                 store_raw_enrichment_response,
                 self.db_path,
                 sha1,
@@ -256,7 +258,7 @@ class EnrichmentProcessor(BaseProcessor):
                 if enrichment_strategy.storage_mode == "separate_table":
                     # Store in separate table
                     key_value = row.get(key_column, sha1)
-                    await asyncio.to_thread(
+                    await run_db(
                         update_output_table,
                         self.db_path,
                         output_table or enrichment_strategy.output_table,
@@ -276,7 +278,7 @@ class EnrichmentProcessor(BaseProcessor):
                         if hasattr(column_value, 'value'):
                             column_value = column_value.value
                             
-                        await asyncio.to_thread(
+                        await run_db(
                             update_database,
                             self.db_path,
                             table or enrichment_strategy.input_table,
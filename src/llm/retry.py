@@ -0,0 +1,209 @@
+"""
+Retries for LLM provider requests.
+
+Providers wrap every request in ``call_with_retries``. Failures are
+classified (``classify_error``) and only transient ones are retried:
+
+* ``rate_limit`` (429): also lowers the concurrency limit of the slot the
+  request holds
+* ``timeout``: timeouts and dropped connections
+* ``server``: 5xx responses
+* ``invalid_schema``: a response that does not parse into the requested
+  schema; retried once, as another sample may parse
+
+``content_filter`` refusals and other client errors (bad request,
+authentication) fail at once. Waits honour the provider's ``Retry-After``
+when it sends one and are jittered exponential backoff otherwise, and
+each run has a retry budget: once retries exceed a share of its requests,
+failures are returned to the caller instead of retried, so an outage does not
+multiply the load on the provider. Every attempt is recorded by telemetry
+with its attempt number.
+"""
+
+import asyncio
+import email.utils
+import json
+import logging
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import openai
+from pydantic import ValidationError
+
+from ..constants import (
+    MAX_RETRY_ATTEMPTS, RETRY_AFTER_MAX, RETRY_BUDGET_MIN, RETRY_BUDGET_RATIO, RETRY_DELAY_BASE, RETRY_MAX_DELAY
+)
+from .hedging import hedged
+from .telemetry import call_context, context_value
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+RATE_LIMIT = 'rate_limit'
+TIMEOUT = 'timeout'
+SERVER = 'server'
+INVALID_SCHEMA = 'invalid_schema'
+CONTENT_FILTER = 'content_filter'
+CLIENT = 'client'
+
+RETRYABLE = {RATE_LIMIT, TIMEOUT, SERVER, INVALID_SCHEMA}
+
+
+class ContentFilteredError(Exception):
+    """The provider refused to answer or blocked the response."""
+
+
+class InvalidResponseError(ValueError):
+    """The provider's response could not be parsed into the requested schema."""
+
+
+def _status(error: BaseException) -> Optional[int]:
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(error: BaseException) -> str:
+    """The kind of failure: rate_limit, timeout, server, invalid_schema, content_filter or client."""
+    if isinstance(error, (ContentFilteredError, openai.ContentFilterFinishReasonError)):
+        return CONTENT_FILTER
+    if isinstance(error, (InvalidResponseError, ValidationError, json.JSONDecodeError,
+                          openai.LengthFinishReasonError, openai.APIResponseValidationError)):
+        return INVALID_SCHEMA
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError,
+                          openai.APIConnectionError)):
+        return TIMEOUT
+    status = _status(error)
+    if status == 429:
+        return RATE_LIMIT
+    if status == 408:
+        return TIMEOUT
+    if status is not None and status >= 500:
+        return SERVER
+    return CLIENT
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait, from Retry-After headers or Gemini's RetryInfo."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                when = email.utils.parsedate_to_datetime(value)
+                return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    # Gemini puts the delay in the error body: {"@type": ".../google.rpc.RetryInfo", "retryDelay": "31s"}
+    details = getattr(error, 'details', None)
+    if details:
+        match = re.search(r'"retryDelay":\s*"(\d+(?:\.\d+)?)s"', json.dumps(details, default=str))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+@dataclass
+class RetryPolicy:
+    """How often and how long to retry one request."""
+    max_attempts: int = 1 + MAX_RETRY_ATTEMPTS
+    base_delay: float = RETRY_DELAY_BASE
+    max_delay: float = RETRY_MAX_DELAY
+    max_retry_after: float = RETRY_AFTER_MAX
+    invalid_schema_attempts: int = 2
+
+    def attempts_for(self, kind: str) -> int:
+        if kind not in RETRYABLE:
+            return 1
+        if kind == INVALID_SCHEMA:
+            return min(self.max_attempts, self.invalid_schema_attempts)
+        return self.max_attempts
+
+    def delay(self, attempt: int, requested: Optional[float] = None) -> float:
+        """Seconds to wait after failed attempt number ``attempt``.
+
+        A provider-requested delay is honoured (up to ``max_retry_after``) with
+        a little jitter so waiting requests don't all return at once; otherwise
+        the wait is "full jitter" exponential backoff.
+        """
+        if requested is not None:
+            return min(requested, self.max_retry_after) * random.uniform(1.0, 1.2)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class RetryBudget:
+    """Retries allowed for one run: ``minimum`` plus ``ratio`` of the requests made so far."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, minimum: int = RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.requests = 0
+        self.retries = 0
+        self._warned = False
+
+    def record_request(self) -> None:
+        self.requests += 1
+
+    def withdraw(self) -> bool:
+        """Take one retry from the budget; False if it is spent."""
+        if self.retries >= self.minimum + self.ratio * self.requests:
+            if not self._warned:
+                logger.warning(f"Retry budget spent ({self.retries} retries for {self.requests} requests); "
+                               f"failing requests without retrying until more succeed")
+                self._warned = True
+            return False
+        self.retries += 1
+        self._warned = False
+        return True
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+async def call_with_retries(request: Callable[[], Awaitable[T]], policy: Optional[RetryPolicy] = None,
+                            description: str = "LLM request", model: Optional[str] = None) -> T:
+    """Await ``request()``, retrying transient failures.
+
+    The run's ``retry_budget`` and ``hedge`` policy and the ``limiter`` of the
+    slot being held come from the call context (see ``call_context`` and
+    ``acquire_slot``); attempts are only hedged when ``model`` is given.
+    Attempt numbers continue from the context's ``attempt``, so telemetry
+    counts every request sent for a row.
+    """
+    policy = policy or DEFAULT_POLICY
+    budget = context_value('retry_budget')
+    limiter = context_value('limiter')
+    hedge = context_value('hedge') if model else None
+    first_attempt = context_value('attempt', 1)
+    attempt = 1
+    while True:
+        if budget:
+            budget.record_request()
+        try:
+            with call_context(attempt=first_attempt + attempt - 1):
+                result = await (hedged(request, hedge, model) if hedge else request())
+        except Exception as e:
+            kind = classify_error(e)
+            wait = retry_after(e)
+            if kind == RATE_LIMIT and limiter is not None:
+                limiter.throttle(wait)
+            if attempt >= policy.attempts_for(kind) or (budget and not budget.withdraw()):
+                raise
+            delay = policy.delay(attempt, wait)
+            logger.warning(f"{description} failed ({kind}): {str(e)[:200]}; "
+                           f"retrying in {delay:.1f}s (attempt {attempt + 1}/{policy.attempts_for(kind)})")
+            await asyncio.sleep(delay)
+            attempt += 1
+        else:
+            if limiter is not None:
+                limiter.succeeded()
+            return result
@@ -0,0 +1,151 @@
+"""
+Incremental parsing and validation of streamed structured responses.
+
+With ``streaming: true`` providers read structured responses as a token
+stream. ``IncrementalJSONObject`` is fed the text as it arrives and reports
+each top-level field of the JSON object once its value is complete.
+``StreamValidator`` checks those fields against the response model straight
+away:
+
+* each completed field is validated against its schema type, and fields that
+  the schema does not define are rejected
+* the field's language requirement (``lang``) is checked when it completes
+* an ``en`` field is rejected at the first Chinese character, while it is
+  still streaming
+
+A failed check raises at once. The provider then closes the stream, so a bad
+response is retried without waiting for the rest of it.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from ..schema_managers import LanguageValidationError, contains_hanzi, validate_language
+from .retry import InvalidResponseError
+
+
+class IncrementalJSONObject:
+    """A JSON object read from text chunks; completed top-level fields are reported as they close."""
+
+    def __init__(self):
+        self.text = ''
+        self.fields: Dict[str, Any] = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._field_start: Optional[int] = None
+        self._colon: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add text; returns the (key, value) fields completed by it.
+
+        Raises:
+            json.JSONDecodeError: If a completed field is not valid JSON
+        """
+        self.text += chunk
+        completed = []
+        for i in range(self._pos, len(self.text)):
+            char = self.text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    self._field_start = i + 1
+            elif char in '}]':
+                if self._depth == 1:
+                    self._close_field(i, completed)
+                self._depth -= 1
+            elif self._depth == 1 and char == ',':
+                self._close_field(i, completed)
+                self._field_start = i + 1
+            elif self._depth == 1 and char == ':':
+                self._colon = i
+        self._pos = len(self.text)
+        return completed
+
+    def partial_string(self) -> Optional[Tuple[str, str]]:
+        """(key, raw text so far) while a top-level string value is streaming, else None."""
+        if not (self._in_string and self._depth == 1 and self._colon is not None):
+            return None
+        start = self.text.find('"', self._colon + 1)
+        return self._key(), self.text[start + 1:]
+
+    def _key(self) -> str:
+        return json.loads(self.text[self._field_start:self._colon])
+
+    def _close_field(self, end: int, completed: List[Tuple[str, Any]]) -> None:
+        if self._field_start is None or self._colon is None:
+            return  # empty object, or a trailing comma the final parse will reject
+        key, value = self._key(), json.loads(self.text[self._colon + 1:end])
+        self.fields[key] = value
+        completed.append((key, value))
+        self._colon = None
+
+
+class StreamValidator:
+    """Checks fields of a streamed response against a response model as they complete."""
+
+    def __init__(self, pydantic_model: Type[BaseModel]):
+        self.model = pydantic_model
+        self._blank = pydantic_model.model_construct()
+        converted = set(getattr(pydantic_model, '_conversion_requirements', {})) | \
+            set(getattr(pydantic_model, '_array_conversion_requirements', {}))
+        # Converted fields are only checked after conversion, on the whole response
+        self.languages = {k: v for k, v in getattr(pydantic_model, '_language_requirements', {}).items()
+                          if k not in converted}
+        self.array_languages = {k: v for k, v in getattr(pydantic_model, '_array_language_requirements', {}).items()
+                                if k not in converted}
+
+    def check_field(self, key: str, value: Any) -> None:
+        """Raises pydantic's ValidationError, InvalidResponseError or LanguageValidationError."""
+        if key not in self.model.model_fields:
+            raise InvalidResponseError(f"Response has a field the schema doesn't define: '{key}'")
+        self.model.__pydantic_validator__.validate_assignment(self._blank, key, value)
+        lang = self.languages.get(key)
+        if lang and value is not None and not validate_language(str(value), lang):
+            raise LanguageValidationError(f"Field '{key}' must be in {lang}, got: {str(value)[:50]}...")
+        lang = self.array_languages.get(key)
+        if lang and isinstance(value, list):
+            for i, item in enumerate(value):
+                if item is not None and not validate_language(str(item), lang):
+                    raise LanguageValidationError(f"Array field '{key}' item {i} must be in {lang}, got: {str(item)[:50]}...")
+
+    def check_partial(self, partial: Optional[Tuple[str, str]]) -> None:
+        """Reject an English field as soon as Chinese text shows up in it."""
+        if partial is None:
+            return
+        key, text = partial
+        if self.languages.get(key, '').lower() == 'en' and contains_hanzi(text):
+            raise LanguageValidationError(f"Field '{key}' must be in en, but the response is writing Chinese: {text[-50:]}")
+
+
+async def read_structured_stream(chunks, pydantic_model: Type[BaseModel], record=None) -> BaseModel:
+    """Consume an async iterator of text chunks into a validated model instance, checking fields as they complete.
+
+    ``record`` (a telemetry CallRecord) gets its time to first token stamped.
+    """
+    parser = IncrementalJSONObject()
+    validator = StreamValidator(pydantic_model)
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if record is not None:
+            record.mark_first_token()
+        for key, value in parser.feed(chunk):
+            validator.check_field(key, value)
+        validator.check_partial(parser.partial_string())
+    if not parser.text.strip():
+        raise InvalidResponseError("Streamed response was empty")
+    return pydantic_model.model_validate_json(parser.text)
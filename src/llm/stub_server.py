@@ -0,0 +1,241 @@
+"""
+Local stand-in for the OpenAI and Gemini APIs (``doctrail stub``).
+
+An aiohttp app that answers the requests doctrail's providers send:
+
+* ``POST /v1/chat/completions``: chat completions, structured output
+  (``response_format`` with a JSON schema, as sent by ``parse``) and streaming
+* ``GET /v1/models``: the endpoint pool's health check
+* ``POST /v1beta/models/{model}:generateContent`` and ``:streamGenerateContent``
+
+Structured answers are generated from the request's JSON schema, so they
+parse into the enrichment's Pydantic model. Point OpenAI-compatible models at
+it with ``OPENAI_BASE_URL`` or a ``provider_pool`` endpoint, and Gemini models
+with ``GOOGLE_GEMINI_BASE_URL``. ``StubSettings`` sets the latency
+distribution, the share of requests answered with 429, and the token usage
+reported. ``GET /stats`` returns request counts and the peak concurrency seen.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_CHARS = 16
+
+
+@dataclass
+class StubSettings:
+    """Behaviour of the stub server."""
+    latency_ms: float = 500.0  # median response time
+    latency_sigma: float = 0.5  # log-normal spread; 0 for a fixed latency
+    rate_limit_rate: float = 0.0  # share of requests answered with 429
+    retry_after: float = 1.0  # seconds, sent with each 429
+    prompt_tokens: Optional[int] = None  # reported usage; default: estimated from the text
+    completion_tokens: Optional[int] = None
+    seed: Optional[int] = None
+
+
+def fake_value(schema: Dict[str, Any], defs: Dict[str, Any], rng: random.Random, name: str = 'value') -> Any:
+    """A value that satisfies a JSON schema (or a Gemini response schema)."""
+    if '$ref' in schema:
+        return fake_value(defs[schema['$ref'].split('/')[-1]], defs, rng, name)
+    for key in ('anyOf', 'oneOf', 'any_of'):
+        if key in schema:
+            options = [o for o in schema[key] if str(o.get('type', '')).lower() != 'null'] or schema[key]
+            return fake_value(options[0], defs, rng, name)
+    if 'enum' in schema:
+        return rng.choice(schema['enum'])
+    if 'const' in schema:
+        return schema['const']
+    kind = schema.get('type', 'string')
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != 'null'), 'null')
+    kind = str(kind).lower()
+    if kind == 'object':
+        return {key: fake_value(prop, defs, rng, key) for key, prop in (schema.get('properties') or {}).items()}
+    if kind == 'array':
+        count = max(1, int(schema.get('minItems', 1)))
+        if schema.get('maxItems') is not None:
+            count = min(count, int(schema['maxItems']))
+        return [fake_value(schema.get('items') or {}, defs, rng, name) for _ in range(count)]
+    if kind == 'integer':
+        return int(schema.get('minimum', 1))
+    if kind == 'number':
+        return float(schema.get('minimum', 0.5))
+    if kind == 'boolean':
+        return rng.random() < 0.5
+    if kind == 'null':
+        return None
+    if schema.get('format') == 'date':
+        return '2024-01-01'
+    return f"stub {name}"
+
+
+def fake_json(schema: Dict[str, Any], rng: random.Random) -> str:
+    return json.dumps(fake_value(schema, schema.get('$defs') or schema.get('definitions') or {}, rng),
+                      ensure_ascii=False)
+
+
+class StubServer:
+    """Request handlers and counters of one stub server."""
+
+    def __init__(self, settings: Optional[StubSettings] = None):
+        self.settings = settings or StubSettings()
+        self.rng = random.Random(self.settings.seed)
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.started = time.monotonic()
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.add_routes([
+            web.post('/v1/chat/completions', self.chat_completions),
+            web.get('/v1/models', self.models),
+            web.post('/v1beta/models/{call}', self.generate_content),
+            web.get('/stats', self.stats),
+        ])
+        return app
+
+    async def _wait(self) -> None:
+        median = self.settings.latency_ms
+        if median <= 0:
+            return
+        if self.settings.latency_sigma > 0:
+            median = self.rng.lognormvariate(math.log(median), self.settings.latency_sigma)
+        await asyncio.sleep(median / 1000)
+
+    def _rate_limited(self) -> bool:
+        if self.settings.rate_limit_rate and self.rng.random() < self.settings.rate_limit_rate:
+            self.rate_limited += 1
+            return True
+        return False
+
+    def _usage(self, prompt: str, answer: str):
+        prompt_tokens = self.settings.prompt_tokens or max(1, len(prompt) // 4)
+        completion_tokens = self.settings.completion_tokens or max(1, len(answer) // 4)
+        return prompt_tokens, completion_tokens
+
+    def _track(self, delta: int) -> None:
+        self.in_flight += delta
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    # OpenAI
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        if self._rate_limited():
+            return web.json_response({'error': {
+                'message': 'Rate limit reached (doctrail stub)', 'type': 'rate_limit_exceeded', 'code': 'rate_limit_exceeded'
+            }}, status=429, headers={'retry-after': str(self.settings.retry_after)})
+        self._track(1)
+        try:
+            await self._wait()
+            response_format = body.get('response_format') or {}
+            if response_format.get('type') == 'json_schema':
+                answer = fake_json(response_format['json_schema'].get('schema') or {}, self.rng)
+            elif response_format.get('type') == 'json_object':
+                answer = '{}'
+            else:
+                answer = 'stub response'
+            prompt = ''.join(str(m.get('content', '')) for m in body.get('messages', []))
+            prompt_tokens, completion_tokens = self._usage(prompt, answer)
+            usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                     'total_tokens': prompt_tokens + completion_tokens}
+            base = {'id': f"chatcmpl-{uuid.uuid4().hex[:12]}", 'created': int(time.time()),
+                    'model': body.get('model', 'stub')}
+            if not body.get('stream'):
+                return web.json_response({**base, 'object': 'chat.completion', 'usage': usage, 'choices': [{
+                    'index': 0, 'finish_reason': 'stop',
+                    'message': {'role': 'assistant', 'content': answer, 'refusal': None},
+                }]})
+            chunks = [{'index': 0, 'delta': {'role': 'assistant', 'content': answer[i:i + STREAM_CHUNK_CHARS]},
+                       'finish_reason': None} for i in range(0, len(answer), STREAM_CHUNK_CHARS)]
+            events = [{**base, 'object': 'chat.completion.chunk', 'choices': [choice]} for choice in chunks]
+            events.append({**base, 'object': 'chat.completion.chunk',
+                           'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+            if (body.get('stream_options') or {}).get('include_usage'):
+                events.append({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})
+            return await self._sse(request, events, done=True)
+        finally:
+            self._track(-1)
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({'object': 'list', 'data': [{'id': 'stub', 'object': 'model', 'owned_by': 'doctrail'}]})
+
+    # Gemini
+
+    async def generate_content(self, request: web.Request) -> web.StreamResponse:
+        model, _, method = request.match_info['call'].partition(':')
+        if method not in ('generateContent', 'streamGenerateContent'):
+            raise web.HTTPNotFound()
+        body = await request.json()
+        self.requests += 1
+        if self._rate_limited():
+            return web.json_response({'error': {
+                'code': 429, 'message': 'Resource has been exhausted (doctrail stub)', 'status': 'RESOURCE_EXHAUSTED'
+            }}, status=429, headers={'retry-after': str(self.settings.retry_after)})
+        self._track(1)
+        try:
+            await self._wait()
+            config = body.get('generationConfig') or body.get('generation_config') or {}
+            schema = config.get('responseJsonSchema') or config.get('responseSchema')
+            answer = fake_json(schema, self.rng) if schema else 'stub response'
+            prompt = ''.join(part.get('text', '') for content in body.get('contents', [])
+                             for part in content.get('parts', []))
+            prompt_tokens, completion_tokens = self._usage(prompt, answer)
+            usage = {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': completion_tokens,
+                     'totalTokenCount': prompt_tokens + completion_tokens}
+
+            def candidate(text: str, finish: Optional[str]) -> Dict[str, Any]:
+                return {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0,
+                        **({'finishReason': finish} if finish else {})}
+
+            if method == 'generateContent':
+                return web.json_response({'candidates': [candidate(answer, 'STOP')], 'usageMetadata': usage,
+                                          'modelVersion': model})
+            pieces = [answer[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(answer), STREAM_CHUNK_CHARS)]
+            events = [{'candidates': [candidate(piece, 'STOP' if i == len(pieces) - 1 else None)], 'modelVersion': model,
+                       **({'usageMetadata': usage} if i == len(pieces) - 1 else {})}
+                      for i, piece in enumerate(pieces)]
+            return await self._sse(request, events)
+        finally:
+            self._track(-1)
+
+    async def _sse(self, request: web.Request, events: List[Dict[str, Any]], done: bool = False) -> web.StreamResponse:
+        response = web.StreamResponse(headers={'content-type': 'text/event-stream'})
+        await response.prepare(request)
+        for event in events:
+            await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+        if done:
+            await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def stats(self, request: web.Request) -> web.Response:
+        elapsed = time.monotonic() - self.started
+        return web.json_response({
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'requests_per_second': round(self.requests / elapsed, 2) if elapsed else None,
+        })
+
+
+def run_stub_server(host: str, port: int, settings: StubSettings) -> None:
+    """Serve until interrupted."""
+    # A deep accept backlog, for load tests with thousands of concurrent requests
+    web.run_app(StubServer(settings).app(), host=host, port=port, backlog=4096, print=None)
@@ -0,0 +1,330 @@
+"""
+Per-call LLM telemetry.
+
+Providers wrap every request in ``track_call`` which records queue wait, time
+to first byte (and to first token for streamed responses), total latency, provider-reported token usage, computed cost and
+the retry attempt. Call-site details (database, enrichment, document, attempt)
+travel in a context variable so providers need no extra arguments. Records are
+buffered in memory and flushed to the ``llm_calls`` table by the enrichment
+batch loop. Successful calls also feed a per-model latency window that times
+hedged requests.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..metrics import observe_call
+from .token_utils import observe_usage
+
+# Flush buffered records once this many are pending for a database
+FLUSH_THRESHOLD = 500
+# Successful calls per model kept for latency percentiles
+LATENCY_WINDOW = 500
+
+_call_context: ContextVar[Dict[str, Any]] = ContextVar('llm_call_context', default={})
+_current_call: ContextVar[Optional['CallRecord']] = ContextVar('llm_current_call', default=None)
+
+
+@dataclass
+class CallRecord:
+    """One provider request."""
+    model: str
+    provider: str
+    started_at: str
+    db_path: Optional[str] = None
+    run_id: Optional[str] = None
+    enrichment_name: Optional[str] = None
+    sha1: Optional[str] = None
+    attempt: int = 1
+    status: str = 'ok'
+    http_status: Optional[int] = None
+    error: Optional[str] = None
+    queue_wait_ms: Optional[float] = None
+    ttfb_ms: Optional[float] = None
+    ttft_ms: Optional[float] = None
+    latency_ms: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    cost_usd: Optional[float] = None
+    _start: float = field(default=0.0, repr=False)
+
+    def set_usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int],
+                  cached_tokens: Optional[int] = None) -> None:
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+        self.cost_usd = compute_cost(self.model, prompt_tokens or 0, completion_tokens or 0, cached_tokens or 0)
+
+    def mark_first_byte(self) -> None:
+        if self.ttfb_ms is None:
+            self.ttfb_ms = (time.monotonic() - self._start) * 1000
+
+    def mark_first_token(self) -> None:
+        """Streamed responses: the first content has arrived."""
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.monotonic() - self._start) * 1000
+
+
+@lru_cache(maxsize=None)
+def _pricing(model: str):
+    from ..utils.cost_estimation import get_model_pricing
+    return get_model_pricing(model)
+
+
+def compute_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Cost in USD of one call from MODEL_PRICING (cached input billed at the cached rate)."""
+    input_price, cached_price, output_price = _pricing(model)
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    if cached_price is None:
+        cached_price = input_price
+    return (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * output_price
+    ) / 1_000_000
+
+
+class CallRecorder:
+    """Thread-safe buffer of call records awaiting a database flush, keyed by database."""
+
+    def __init__(self):
+        self._records: Dict[str, List[CallRecord]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, record: CallRecord) -> None:
+        with self._lock:
+            self._records.setdefault(record.db_path, []).append(record)
+
+    def pending(self, db_path: str) -> int:
+        with self._lock:
+            return len(self._records.get(db_path, ()))
+
+    def drain(self, db_path: str) -> List[CallRecord]:
+        with self._lock:
+            return self._records.pop(db_path, [])
+
+
+recorder = CallRecorder()
+
+
+class LatencyWindow:
+    """Latency and cost of the most recent successful calls, per model (used to time hedged requests)."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self.size = size
+        self._calls: Dict[str, Deque[Tuple[float, Optional[float]]]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, model: str, latency_ms: float, cost_usd: Optional[float] = None) -> None:
+        with self._lock:
+            self._calls.setdefault(model, deque(maxlen=self.size)).append((latency_ms, cost_usd))
+
+    def seed(self, model: str, calls: Iterable[Tuple[float, Optional[float]]]) -> None:
+        """Add recorded (latency_ms, cost_usd) pairs, oldest first, if nothing was observed yet this session."""
+        with self._lock:
+            if self._calls.get(model):
+                return
+            self._calls[model] = deque(calls, maxlen=self.size)
+
+    def count(self, model: str) -> int:
+        with self._lock:
+            return len(self._calls.get(model, ()))
+
+    def percentile(self, model: str, pct: float) -> Optional[float]:
+        with self._lock:
+            return _percentile([latency for latency, _ in self._calls.get(model, ())], pct)
+
+    def mean_cost(self, model: str) -> Optional[float]:
+        with self._lock:
+            costs = [cost for _, cost in self._calls.get(model, ()) if cost is not None]
+        return sum(costs) / len(costs) if costs else None
+
+
+latency_window = LatencyWindow()
+
+
+@contextmanager
+def call_context(**fields) -> Iterator[None]:
+    """Attach call-site details (db_path, run_id, enrichment_name, sha1, attempt...) to calls made inside."""
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def context_value(key: str, default: Any = None) -> Any:
+    """A call-site detail set by an enclosing ``call_context``."""
+    return _call_context.get().get(key, default)
+
+
+@asynccontextmanager
+async def acquire_slot(semaphore):
+    """``async with semaphore`` that records how long the caller queued for it.
+
+    An adaptive limiter (one with ``throttle``) is put in the call context so
+    retries can report rate limits to it.
+    """
+    start = time.monotonic()
+    async with semaphore:
+        extra = {'limiter': semaphore} if hasattr(semaphore, 'throttle') else {}
+        with call_context(queue_wait_ms=(time.monotonic() - start) * 1000, **extra):
+            yield
+
+
+@contextmanager
+def track_call(provider: str, model: str, prompt_text: Optional[str] = None) -> Iterator[CallRecord]:
+    """Time a provider request and buffer its record.
+
+    Providers call ``record.set_usage(...)`` with the response's usage; the
+    prompt tokens also calibrate the chars-per-token estimate.
+    """
+    context = _call_context.get()
+    record = CallRecord(
+        model=model,
+        provider=provider,
+        started_at=datetime.now().isoformat(),
+        db_path=context.get('db_path'),
+        run_id=context.get('run_id'),
+        enrichment_name=context.get('enrichment_name'),
+        sha1=context.get('sha1'),
+        attempt=context.get('attempt', 1),
+        queue_wait_ms=context.get('queue_wait_ms'),
+        _start=time.monotonic(),
+    )
+    token = _current_call.set(record)
+    try:
+        yield record
+    except BaseException as e:
+        record.status = 'cancelled' if isinstance(e, asyncio.CancelledError) else 'error'
+        status = getattr(e, 'status_code', None) or getattr(e, 'code', None)
+        record.http_status = status if isinstance(status, int) else None
+        record.error = str(e)[:500]
+        raise
+    finally:
+        _current_call.reset(token)
+        record.latency_ms = (time.monotonic() - record._start) * 1000
+        if record.status == 'ok' and record.http_status is None:
+            record.http_status = 200
+        if record.prompt_tokens and prompt_text:
+            observe_usage(prompt_text, record.prompt_tokens)
+        if record.status == 'ok':
+            latency_window.add(model, record.latency_ms, record.cost_usd)
+        observe_call(record)
+        # Only calls made on behalf of a database run are persisted
+        if record.db_path:
+            recorder.add(record)
+
+
+async def on_response_headers(response) -> None:
+    """httpx response hook: headers have arrived, so stamp time to first byte."""
+    record = _current_call.get()
+    if record is not None:
+        record.mark_first_byte()
+
+
+def flush_call_records(db_path: str) -> int:
+    """Write buffered records for a database to ``llm_calls``. Returns the count written."""
+    from ..db_operations import store_llm_calls
+    records = recorder.drain(db_path)
+    if records:
+        try:
+            store_llm_calls(db_path, [
+                {k: v for k, v in asdict(r).items() if k not in ('_start', 'db_path')} for r in records
+            ])
+        except Exception as e:
+            logging.warning(f"Could not store {len(records)} LLM call records: {e}")
+            return 0
+    return len(records)
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def summarize_calls(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Aggregate llm_calls rows per (enrichment, model).
+
+    Throughput is documents per minute of wall-clock run time, summed over runs
+    so idle time between runs is not counted.
+    """
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault((row['enrichment_name'] or '-', row['model']), []).append(row)
+
+    summaries = []
+    for (enrichment, model), calls in sorted(groups.items()):
+        latencies = [c['latency_ms'] for c in calls if c['latency_ms'] is not None and c['status'] == 'ok']
+        docs = {c['sha1'] for c in calls if c['sha1']}
+        cost = sum(c['cost_usd'] or 0 for c in calls)
+
+        run_seconds = 0.0
+        runs: Dict[Any, List[Dict[str, Any]]] = {}
+        for c in calls:
+            runs.setdefault(c['run_id'], []).append(c)
+        for run_calls in runs.values():
+            starts = [datetime.fromisoformat(c['started_at']) for c in run_calls]
+            end = max(s.timestamp() + (c['latency_ms'] or 0) / 1000 for s, c in zip(starts, run_calls))
+            run_seconds += end - min(starts).timestamp()
+
+        summaries.append({
+            'enrichment_name': enrichment,
+            'model': model,
+            'calls': len(calls),
+            'errors': sum(1 for c in calls if c['status'] != 'ok'),
+            'retries': sum(1 for c in calls if (c['attempt'] or 1) > 1),
+            'documents': len(docs),
+            'docs_per_minute': len(docs) / run_seconds * 60 if run_seconds > 0 else None,
+            'p50_ms': _percentile(latencies, 50),
+            'p95_ms': _percentile(latencies, 95),
+            'p99_ms': _percentile(latencies, 99),
+            'p50_ttfb_ms': _percentile([c['ttfb_ms'] for c in calls if c['ttfb_ms'] is not None], 50),
+            'p50_ttft_ms': _percentile([c['ttft_ms'] for c in calls if c.get('ttft_ms') is not None], 50),
+            'p50_queue_ms': _percentile([c['queue_wait_ms'] for c in calls if c['queue_wait_ms'] is not None], 50),
+            'prompt_tokens': sum(c['prompt_tokens'] or 0 for c in calls),
+            'completion_tokens': sum(c['completion_tokens'] or 0 for c in calls),
+            'cached_tokens': sum(c['cached_tokens'] or 0 for c in calls),
+            'cost_usd': cost,
+            'cost_per_1k_docs': cost / len(docs) * 1000 if docs else None,
+        })
+    return summaries
+
+
+def format_call_stats(summaries: List[Dict[str, Any]]) -> str:
+    """Render summarize_calls output for the terminal."""
+    if not summaries:
+        return "No LLM calls recorded yet."
+
+    def ms(value: Optional[float]) -> str:
+        return f"{value / 1000:.2f}s" if value is not None else "-"
+
+    lines = ["📈 LLM call statistics", "=" * 60]
+    for s in summaries:
+        throughput = f"{s['docs_per_minute']:.1f} docs/min" if s['docs_per_minute'] is not None else "-"
+        per_1k = f"${s['cost_per_1k_docs']:.4f}" if s['cost_per_1k_docs'] is not None else "-"
+        lines.extend([
+            f"{s['enrichment_name']} / {s['model']}",
+            f"  Calls: {s['calls']:,} ({s['errors']:,} errors, {s['retries']:,} retries) over {s['documents']:,} documents",
+            f"  Throughput: {throughput}",
+            f"  Latency p50/p95/p99: {ms(s['p50_ms'])} / {ms(s['p95_ms'])} / {ms(s['p99_ms'])}"
+            f"  (TTFB p50 {ms(s['p50_ttfb_ms'])}, "
+            + (f"first token p50 {ms(s['p50_ttft_ms'])}, " if s['p50_ttft_ms'] is not None else "")
+            + f"queue p50 {ms(s['p50_queue_ms'])})",
+            f"  Tokens: {s['prompt_tokens']:,} in ({s['cached_tokens']:,} cached), {s['completion_tokens']:,} out",
+            f"  Cost: ${s['cost_usd']:.4f} total, {per_1k} per 1k documents",
+            "",
+        ])
+    return "\n".join(lines).rstrip()
@@ -1,7 +1,17 @@
-"""Token estimation and truncation utilities."""
+"""Token accounting: context limits, cached encoders, counting and truncation.
+
+This is the single place doctrail counts tokens. Encoders are loaded lazily
+once per process, exact counts are memoised per (encoding, sha1, column,
+limit), and a per-script chars-per-token ratio learned from exact counts gives
+a cheap approximation where tokenising would be too slow.
+"""
 
 import logging
-from typing import Tuple, Optional
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List, Optional, Tuple
 
 # Model context limits (in tokens)
 MODEL_CONTEXT_LIMITS = {
@@ -9,6 +19,8 @@ MODEL_CONTEXT_LIMITS = {
     'gpt-4o': 128000,
     'gpt-4': 8192,
     'gpt-4-32k': 32768,
+    'gpt-4-turbo': 128000,
+    'gpt-4-turbo-preview': 128000,
     'gpt-3.5-turbo': 16384,
     'gpt-3.5-turbo-16k': 16384,
     'gemini-2.5-flash-preview-05-20': 1000000,
@@ -17,96 +29,384 @@ MODEL_CONTEXT_LIMITS = {
     'models/gemini-2.5-flash': 1000000,
     'gemini-2.0-flash': 1000000,
     'models/gemini-2.0-flash': 1000000,
+    'gemini-1.5-flash': 1048576,
+    'gemini-1.5-flash-8b': 1048576,
+    'gemini-1.5-pro': 2097152,
+    'gemini-pro': 32768,
 }
 
+DEFAULT_CONTEXT_LIMIT = 8192
+DEFAULT_GEMINI_CONTEXT_LIMIT = 1048576
+
+# Model to tiktoken encoding mapping
+MODEL_ENCODINGS = {
+    # GPT-4.x models likely use o200k_base
+    "gpt-4.1": "o200k_base",
+    "gpt-4.1-mini": "o200k_base",
+    "gpt-4.1-nano": "o200k_base",
+    "gpt-4.5-preview": "o200k_base",
+    # GPT-4o models use o200k_base
+    "gpt-4o": "o200k_base",
+    "gpt-4o-mini": "o200k_base",
+    # O-series models likely use o200k_base
+    "o1": "o200k_base",
+    "o3": "o200k_base",
+    "o3-mini": "o200k_base",
+    "o4-mini": "o200k_base",
+    # Legacy models
+    "gpt-4": "cl100k_base",
+    "gpt-4-turbo": "cl100k_base",
+    "gpt-4-turbo-preview": "cl100k_base",
+    "gpt-3.5-turbo": "cl100k_base",
+    "gpt-3.5-turbo-0125": "cl100k_base",
+    "gpt-3.5-turbo-1106": "cl100k_base",
+}
+
+# Max memoised document counts
+COUNT_CACHE_SIZE = 50000
+
 
 def estimate_tokens(text: str) -> int:
     """Rough token estimation (1 token ≈ 4 characters)."""
     return len(text) // 4
 
 
+def get_model_context_limit(model: str) -> int:
+    """Get the context limit for a model.
+
+    Args:
+        model: Model name
+
+    Returns:
+        Context limit in tokens
+    """
+    if model in MODEL_CONTEXT_LIMITS:
+        return MODEL_CONTEXT_LIMITS[model]
+    base_model = model.replace('models/', '').split("-20")[0]
+    if base_model in MODEL_CONTEXT_LIMITS:
+        return MODEL_CONTEXT_LIMITS[base_model]
+    return DEFAULT_GEMINI_CONTEXT_LIMIT if 'gemini' in model.lower() else DEFAULT_CONTEXT_LIMIT
+
+
+def calculate_available_tokens(
+    model: str,
+    prompt_tokens: int,
+    safety_margin: int = 2000
+) -> int:
+    """Calculate available tokens for output.
+
+    Args:
+        model: Model name
+        prompt_tokens: Number of tokens in prompt
+        safety_margin: Safety margin to reserve
+
+    Returns:
+        Available tokens for output
+    """
+    context_limit = get_model_context_limit(model)
+    available = context_limit - prompt_tokens - safety_margin
+    return max(0, available)
+
+
+@lru_cache(maxsize=None)
+def get_encoding_for_model(model: str) -> str:
+    """Get the encoding name for a model."""
+    # Strip version suffixes for lookup
+    base_model = model.split("-20")[0]
+
+    # Check direct mapping first
+    if model in MODEL_ENCODINGS:
+        return MODEL_ENCODINGS[model]
+    elif base_model in MODEL_ENCODINGS:
+        return MODEL_ENCODINGS[base_model]
+    elif 'gemini' in model.lower():
+        # No public Gemini tokenizer; o200k_base is a close proxy
+        return "o200k_base"
+    else:
+        # Default to o200k_base for newer models
+        logging.warning(f"Unknown model '{model}', defaulting to o200k_base encoding")
+        return "o200k_base"
+
+
+class ApproximateEncoding:
+    """Fallback encoding treating every 4 characters as one token.
+
+    Used when tiktoken or its BPE files are unavailable (e.g. offline).
+    """
+
+    name = "approximate"
+    chars_per_token = 4
+
+    def encode(self, text: str, disallowed_special=()) -> List[str]:
+        n = self.chars_per_token
+        return [text[i:i + n] for i in range(0, len(text), n)]
+
+    def encode_batch(self, texts: List[str], num_threads: int = 1, disallowed_special=()) -> List[List[str]]:
+        return [self.encode(text) for text in texts]
+
+    def decode_tokens_bytes(self, tokens: List[str]) -> List[bytes]:
+        return [token.encode('utf-8') for token in tokens]
+
+
+_encoders: Dict[str, Any] = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoding(model: str):
+    """Return the process-wide cached encoder for a model."""
+    name = get_encoding_for_model(model)
+    encoding = _encoders.get(name)
+    if encoding is None:
+        with _encoders_lock:
+            encoding = _encoders.get(name)
+            if encoding is None:
+                try:
+                    import tiktoken
+                    encoding = tiktoken.get_encoding(name)
+                except Exception as e:
+                    logging.warning(f"tiktoken encoding '{name}' unavailable ({e}); using 4 chars/token approximation")
+                    encoding = ApproximateEncoding()
+                _encoders[name] = encoding
+    return encoding
+
+
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+_NON_ASCII_RE = re.compile(r'[^\x00-\x7f]')
+
+
+def detect_script(text: str, sample: int = 2000) -> str:
+    """Classify text as 'cjk', 'other' (non-Latin) or 'latin' for ratio calibration."""
+    head = text[:sample]
+    if not head or head.isascii():
+        return 'latin'
+    if len(_CJK_RE.findall(head)) / len(head) > 0.3:
+        return 'cjk'
+    non_ascii = len(_NON_ASCII_RE.findall(head))
+    return 'other' if non_ascii / len(head) > 0.3 else 'latin'
+
+
+class TokenRatioCalibrator:
+    """Chars-per-token ratios per script, learned from exact counts and provider usage."""
+
+    DEFAULT_RATIOS = {'latin': 4.0, 'cjk': 1.0, 'other': 2.5}
+    # Observed tokens needed before a learned ratio replaces the default
+    MIN_OBSERVED_TOKENS = 1000
+
+    def __init__(self):
+        self._chars: Dict[str, int] = {}
+        self._tokens: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, text: str, tokens: int) -> None:
+        if not text or tokens <= 0:
+            return
+        script = detect_script(text)
+        with self._lock:
+            self._chars[script] = self._chars.get(script, 0) + len(text)
+            self._tokens[script] = self._tokens.get(script, 0) + tokens
+
+    def ratio(self, script: str) -> float:
+        tokens = self._tokens.get(script, 0)
+        if tokens >= self.MIN_OBSERVED_TOKENS:
+            return self._chars[script] / tokens
+        return self.DEFAULT_RATIOS.get(script, 4.0)
+
+    def approximate(self, text: str) -> int:
+        if not text:
+            return 0
+        return max(1, round(len(text) / self.ratio(detect_script(text))))
+
+
+calibrator = TokenRatioCalibrator()
+
+_count_cache: "OrderedDict[Tuple, int]" = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Exact token count for a model (approximate only if tiktoken is unavailable)."""
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    tokens = len(encoding.encode(text, disallowed_special=()))
+    if not isinstance(encoding, ApproximateEncoding):
+        calibrator.observe(text, tokens)
+    return tokens
+
+
+def count_tokens_batch(texts: List[str], model: str, num_threads: int = 8) -> List[int]:
+    """Exact token counts for many texts using tiktoken's threaded encode_batch."""
+    if not texts:
+        return []
+    encoding = get_encoding(model)
+    encoded = encoding.encode_batch(list(texts), num_threads=num_threads, disallowed_special=())
+    counts = [len(tokens) for tokens in encoded]
+    if not isinstance(encoding, ApproximateEncoding):
+        for text, tokens in zip(texts, counts):
+            calibrator.observe(text, tokens)
+    return counts
+
+
+def _cache_key(model: str, sha1: Hashable, column: str, limit: Optional[int]) -> Tuple:
+    return (get_encoding_for_model(model), sha1, column, limit)
+
+
+def get_cached_count(model: str, sha1: Hashable, column: str, limit: Optional[int] = None) -> Optional[int]:
+    """Return a memoised count, or None if this document was not counted yet."""
+    key = _cache_key(model, sha1, column, limit)
+    with _count_cache_lock:
+        count = _count_cache.get(key)
+        if count is not None:
+            _count_cache.move_to_end(key)
+        return count
+
+
+def cache_count(model: str, sha1: Hashable, column: str, limit: Optional[int], count: int) -> None:
+    key = _cache_key(model, sha1, column, limit)
+    with _count_cache_lock:
+        _count_cache[key] = count
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+
+
+def input_column_key(parsed_input_cols: List[Tuple[str, Optional[int]]]) -> str:
+    """Stable memo key for an enrichment's input column spec (e.g. "content:500,title")."""
+    return ",".join(f"{col}:{limit}" if limit else col for col, limit in parsed_input_cols)
+
+
+def count_document_tokens(text: str, model: str, sha1: Optional[Hashable] = None,
+                          column: str = '', limit: Optional[int] = None) -> int:
+    """Count tokens for a document field, memoised per (sha1, column, limit).
+
+    Without a sha1 the count is not memoised.
+    """
+    if sha1 is None:
+        return count_tokens(text, model)
+    count = get_cached_count(model, sha1, column, limit)
+    if count is None:
+        count = count_tokens(text, model)
+        cache_count(model, sha1, column, limit, count)
+    return count
+
+
+def approximate_tokens(text: str) -> int:
+    """Fast token estimate using the calibrated per-script chars-per-token ratio."""
+    return calibrator.approximate(text)
+
+
+def observe_usage(text: str, tokens: int) -> None:
+    """Feed a provider-reported token count back into the ratio calibration."""
+    calibrator.observe(text, tokens)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    """Cut text at a token boundary (never mid UTF-8 character)."""
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    cut = sum(len(b) for b in encoding.decode_tokens_bytes(tokens[:max_tokens]))
+    return text.encode('utf-8')[:cut].decode('utf-8', errors='ignore')
+
+
+def truncate_input_text(
+    prompt: str,
+    input_text: str,
+    model: str,
+    safety_margin: int = 2000,
+    input_tokens: Optional[int] = None
+) -> Tuple[str, bool]:
+    """
+    Truncate input_text so prompt + input fits the model's context window.
+
+    Args:
+        prompt: The instruction part of the message (kept whole)
+        input_text: The document text that may be truncated
+        model: The model name
+        safety_margin: Tokens to reserve for response and safety
+        input_tokens: Pre-computed (e.g. memoised) token count of input_text
+
+    Returns:
+        Tuple of (truncated input_text, was_truncated)
+    """
+    prompt_tokens = count_tokens(prompt, model)
+    if input_tokens is None:
+        input_tokens = count_tokens(input_text, model)
+    max_allowed_tokens = get_model_context_limit(model) - safety_margin
+
+    if prompt_tokens + input_tokens <= max_allowed_tokens:
+        return input_text, False
+
+    max_input_tokens = max_allowed_tokens - prompt_tokens
+    if max_input_tokens <= 0:
+        logging.warning(f"Prompt itself is too long ({prompt_tokens} tokens), cannot fit any input")
+        return "", True
+
+    truncated_input = _truncate_to_tokens(input_text, max_input_tokens, model)
+
+    # Try to truncate at word boundary
+    last_space = truncated_input.rfind(' ')
+    if last_space > len(truncated_input) * 0.8:  # If we can find a space in the last 20%
+        truncated_input = truncated_input[:last_space]
+
+    logging.warning(f"Truncated input from {len(input_text)} to {len(truncated_input)} chars ({input_tokens} -> <= {max_input_tokens} tokens)")
+    return truncated_input, True
+
+
 def truncate_input_for_model(
-    full_prompt: str, 
-    input_text: str, 
-    model: str, 
+    full_prompt: str,
+    input_text: str,
+    model: str,
     safety_margin: int = 2000
 ) -> Tuple[str, bool]:
     """
     Truncate input text to fit within model's context window.
-    
+
+    Legacy variant used by LLMClient-based processors: works on the full prompt
+    with the 4 chars/token heuristic. New code should use truncate_input_text.
+
     Args:
         full_prompt: The complete prompt including the input text
         input_text: The input text portion that can be truncated
         model: The model name
         safety_margin: Tokens to reserve for response and safety
-        
+
     Returns:
         Tuple of (truncated prompt, was_truncated boolean)
     """
     # Get model's context limit
-    context_limit = MODEL_CONTEXT_LIMITS.get(model, 8192)  # Default to 8k if unknown
-    
+    context_limit = get_model_context_limit(model)
+
     # Estimate tokens in full prompt
     estimated_tokens = estimate_tokens(full_prompt)
-    
+
     # Check if we're within limits
     if estimated_tokens <= (context_limit - safety_margin):
         return full_prompt, False
-    
+
     # Calculate how much we need to truncate
     # First, find the base prompt size (without input text)
     base_prompt = full_prompt.replace(input_text, "")
     base_tokens = estimate_tokens(base_prompt)
-    
+
     # Calculate available tokens for input text
     available_for_input = context_limit - safety_margin - base_tokens
-    
+
     if available_for_input <= 0:
         # Even without input text, we exceed the limit
         logging.warning(f"Prompt without input text exceeds model limit for {model}")
         return full_prompt, True
-    
+
     # Calculate how many characters we can keep (4 chars per token estimate)
     max_input_chars = available_for_input * 4
-    
+
     # Truncate the input text
     if len(input_text) > max_input_chars:
         truncated_input = input_text[:max_input_chars] + "... [TRUNCATED]"
         truncated_prompt = full_prompt.replace(input_text, truncated_input)
-        
+
         logging.info(f"Truncated input from {len(input_text)} to {len(truncated_input)} characters for {model}")
         return truncated_prompt, True
-    
-    return full_prompt, False
-
-
-def get_model_context_limit(model: str) -> int:
-    """Get the context limit for a model.
-    
-    Args:
-        model: Model name
-        
-    Returns:
-        Context limit in tokens
-    """
-    return MODEL_CONTEXT_LIMITS.get(model, 8192)
 
-
-def calculate_available_tokens(
-    model: str,
-    prompt_tokens: int,
-    safety_margin: int = 2000
-) -> int:
-    """Calculate available tokens for output.
-    
-    Args:
-        model: Model name
-        prompt_tokens: Number of tokens in prompt
-        safety_margin: Safety margin to reserve
-        
-    Returns:
-        Available tokens for output
-    """
-    context_limit = get_model_context_limit(model)
-    available = context_limit - prompt_tokens - safety_margin
-    return max(0, available)
\ No newline at end of file
+    return full_prompt, False
@@ -0,0 +1,257 @@
+"""
+Record and replay of LLM HTTP traffic (``llm_transport`` in the config).
+
+The providers send their requests through an httpx transport. In ``record``
+mode, requests go out as usual and each successful response is appended to a
+cassette, a JSON-lines file keyed by a hash of the request. In ``replay`` mode
+nothing leaves the machine; every request is answered from the cassette, so
+an ``enrich`` run can be repeated offline, for free and at any concurrency.
+
+Replay can shape the traffic to look like a real provider:
+
+* ``latency``: ``recorded`` (default) waits as long as the recorded response
+  took, ``none`` answers at once, a number is a fixed delay in milliseconds and
+  ``{median_ms, sigma}`` draws delays from a log-normal distribution.
+* ``error_rate``: the share of requests answered with an error status from
+  ``error_statuses`` instead, to exercise retries and backoff.
+
+Delays and errors are drawn from ``seed``, the request key and the number of
+times that request was seen, so a replay does the same whatever the
+concurrency. A request that is not in the cassette gets a 404, which is not
+retried.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import httpx
+
+from ..constants import LLM_TRANSPORT_MODES, REPLAY_ERROR_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Response headers kept in the cassette (the SDKs read these)
+RECORDED_HEADERS = ('content-type', 'retry-after', 'retry-after-ms', 'x-request-id')
+
+# The OpenAI SDK's default timeout, for clients that send through the transport
+OPENAI_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+
+def request_key(request: httpx.Request) -> str:
+    """Hash of a request's method, path, query and (canonical) JSON body.
+
+    Host and headers are left out, so a request matches whichever endpoint or
+    API key it was recorded with.
+    """
+    body = request.content or b''
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode('utf-8')
+    except ValueError:
+        pass
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.url.raw_path, body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class Cassette:
+    """Recorded responses by request key, backed by a JSON-lines file."""
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry['key'], []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self.entries.values())
+
+    def next(self, key: str) -> Optional[Dict[str, Any]]:
+        """The recorded response for ``key`` and how often it was asked for before.
+
+        A request recorded several times is answered with its recordings in turn.
+        """
+        with self._lock:
+            entries = self.entries.get(key)
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+        if not entries:
+            return None
+        return {**entries[seen % len(entries)], 'seen': seen}
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.entries.setdefault(entry['key'], []).append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+class RecordReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport (sync and async) that records to or replays from a cassette."""
+
+    def __init__(self, mode: str, cassette: Cassette, latency: Union[str, float, Dict[str, float]] = 'recorded',
+                 error_rate: float = 0.0, error_statuses: Optional[List[int]] = None, seed: int = 0):
+        if mode not in LLM_TRANSPORT_MODES:
+            raise ValueError(f"llm_transport.mode must be one of: {', '.join(LLM_TRANSPORT_MODES)}")
+        self.mode = mode
+        self.cassette = cassette
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses or REPLAY_ERROR_STATUSES)
+        self.seed = seed
+        self.replayed = 0
+        self.missed = 0
+        self.injected = 0
+        self._sync: Optional[httpx.HTTPTransport] = None
+        self._async: Optional[httpx.AsyncHTTPTransport] = None
+
+    @classmethod
+    def from_config(cls, transport_config: Dict[str, Any]) -> 'RecordReplayTransport':
+        if not transport_config.get('cassette'):
+            raise ValueError("llm_transport needs a 'cassette' file")
+        return cls(
+            mode=transport_config.get('mode', 'replay'),
+            cassette=Cassette(transport_config['cassette']),
+            latency=transport_config.get('latency', 'recorded'),
+            error_rate=float(transport_config.get('error_rate', 0.0)),
+            error_statuses=transport_config.get('error_statuses'),
+            seed=int(transport_config.get('seed', 0)),
+        )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == 'replay':
+            response, delay = self._replay(request)
+            time.sleep(delay)
+            return response
+        if self._sync is None:
+            self._sync = httpx.HTTPTransport()
+        start = time.monotonic()
+        response = self._sync.handle_request(request)
+        body = response.read()
+        return self._record(request, response, body, start)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == 'replay':
+            response, delay = self._replay(request)
+            await asyncio.sleep(delay)
+            return response
+        if self._async is None:
+            self._async = httpx.AsyncHTTPTransport()
+        start = time.monotonic()
+        response = await self._async.handle_async_request(request)
+        body = await response.aread()
+        return self._record(request, response, body, start)
+
+    def _record(self, request: httpx.Request, response: httpx.Response, body: bytes, start: float) -> httpx.Response:
+        # Only answers are recorded; replay injects its own errors
+        if 200 <= response.status_code < 300:
+            self.cassette.add({
+                'key': request_key(request),
+                'method': request.method,
+                'path': request.url.path,
+                'status': response.status_code,
+                'headers': {k: v for k, v in response.headers.items() if k.lower() in RECORDED_HEADERS},
+                'body': body.decode('utf-8'),
+                'latency_ms': round((time.monotonic() - start) * 1000, 1),
+            })
+        # The body has been read (and decompressed), so it is handed on as plain content
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ('content-encoding', 'content-length')]
+        return httpx.Response(response.status_code, headers=headers, content=body,
+                              request=request, extensions=response.extensions)
+
+    def _replay(self, request: httpx.Request):
+        """(response, seconds to wait before it) for a request."""
+        key = request_key(request)
+        entry = self.cassette.next(key)
+        if entry is None:
+            self.missed += 1
+            logger.warning(f"No recorded response for {request.method} {request.url.path} (key {key[:12]})")
+            return httpx.Response(404, json={'error': {
+                'message': f"No recorded response for this request in {self.cassette.path} (key {key[:12]})",
+                'type': 'replay_miss', 'code': 404
+            }}, request=request), 0.0
+        rng = random.Random(f"{self.seed}:{key}:{entry['seen']}")
+        delay = self._delay(rng, entry)
+        if self.error_rate and rng.random() < self.error_rate:
+            self.injected += 1
+            status = rng.choice(self.error_statuses)
+            return httpx.Response(status, json={'error': {
+                'message': f"Error {status} injected by llm_transport replay", 'type': 'replay_error', 'code': status
+            }}, request=request), delay
+        self.replayed += 1
+        return httpx.Response(entry['status'], headers=entry['headers'], content=entry['body'].encode('utf-8'),
+                              request=request), delay
+
+    def _delay(self, rng: random.Random, entry: Dict[str, Any]) -> float:
+        latency = self.latency
+        if latency == 'recorded':
+            return entry.get('latency_ms', 0.0) / 1000
+        if latency in (None, 'none'):
+            return 0.0
+        if isinstance(latency, (int, float)):
+            return latency / 1000
+        # Log-normal: the shape of real API latency, with its long tail
+        return rng.lognormvariate(math.log(latency['median_ms']), latency.get('sigma', 0.5)) / 1000
+
+    def summary(self) -> str:
+        if self.mode == 'record':
+            return f"📼 Cassette {self.cassette.path}: {len(self.cassette):,} recorded responses"
+        return (f"📼 Replayed {self.replayed:,} responses from {self.cassette.path}"
+                f" ({self.injected:,} injected errors, {self.missed:,} not recorded)")
+
+    def close(self) -> None:
+        if self._sync is not None:
+            self._sync.close()
+
+    async def aclose(self) -> None:
+        if self._async is not None:
+            await self._async.aclose()
+
+
+_transport: Optional[RecordReplayTransport] = None
+
+
+def configure_llm_transport(config: Optional[Dict[str, Any]]) -> Optional[RecordReplayTransport]:
+    """Send provider requests through ``config``'s llm_transport (or directly, without one)."""
+    global _transport
+    transport_config = (config or {}).get('llm_transport')
+    _transport = RecordReplayTransport.from_config(transport_config) if transport_config else None
+    if _transport:
+        logger.info(f"LLM requests {'replayed from' if _transport.mode == 'replay' else 'recorded to'} "
+                    f"{_transport.cassette.path} ({len(_transport.cassette):,} responses on file)")
+    return _transport
+
+
+def llm_transport() -> Optional[RecordReplayTransport]:
+    """The configured record/replay transport, or None to send requests directly."""
+    return _transport
+
+
+def replaying() -> bool:
+    return _transport is not None and _transport.mode == 'replay'
+
+
+def async_http_client(**kwargs) -> Optional[httpx.AsyncClient]:
+    """An httpx client for an OpenAI SDK client that sends through the configured transport, or None."""
+    if _transport is None:
+        return None
+    kwargs.setdefault('timeout', OPENAI_TIMEOUT)
+    return httpx.AsyncClient(transport=_transport, **kwargs)
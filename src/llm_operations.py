@@ -1,4 +1,5 @@
 import asyncio
+import inspect
 import json
 import logging
 import os
@@ -12,14 +13,30 @@ from tqdm import tqdm
 
 from .constants import (
     DEFAULT_API_SEMAPHORE_LIMIT, DEFAULT_DB_SEMAPHORE_LIMIT,
-    TRANSLATION_ENRICHMENTS, MAX_RETRY_ATTEMPTS, DEFAULT_KEY_COLUMN
+    TRANSLATION_ENRICHMENTS, MAX_RETRY_ATTEMPTS, DEFAULT_KEY_COLUMN, PROMPT_LAYOUTS
 )
 from .db_operations import (
     get_db_connection, store_raw_enrichment_response, ensure_enrichment_responses_table,
-    update_output_table, update_database, checkpoint_wal, get_or_create_prompt_id
+    update_output_table, update_database, get_or_create_prompt_id,
+    get_chunk_responses, prepare_enrichment_schema, EnrichmentWriteBuffer, ensure_output_table
+)
+from .schema_catalog import schema_catalog
+from .db_pool import run_db
+from .wal_checkpoint import run_checkpointer, format_wal_size
+from .enrichment_runs import RunTracker
+from .enrichment_fusion import FusedGroup, rows_needing
+from .metrics import observe_row, watch_write_buffer
+from .profiling import span
+from .llm.telemetry import call_context, acquire_slot, recorder, flush_call_records, FLUSH_THRESHOLD
+from .llm.concurrency import AdaptiveLimiter
+from .llm.retry import RetryBudget, call_with_retries
+from .llm.chunking import parse_chunking_config, chunk_budget, chunk_text, merge_chunk_results
+from .llm.token_utils import (
+    MODEL_CONTEXT_LIMITS, estimate_tokens, count_tokens, count_document_tokens, input_column_key,
+    truncate_input_text
 )
 from .schema_managers import validate_with_schema, get_schema_prompt_instructions, SchemaValidationError, LanguageValidationError
-from .core_utils import parse_input_columns_with_limits, apply_column_limits, detect_mojibake, try_fix_mojibake
+from .core_utils import parse_input_columns_with_limits, apply_column_limits, build_input_text, detect_mojibake, try_fix_mojibake
 
 # Import new modules for structured outputs
 try:
@@ -42,65 +59,8 @@ except ImportError:
     GEMINI_AVAILABLE = False
     # Don't log warning here - will log when actually trying to use Gemini
 
-# Model context limits (in tokens)
-MODEL_CONTEXT_LIMITS = {
-    'gpt-4o-mini': 128000,
-    'gpt-4o': 128000,
-    'gpt-4': 8192,
-    'gpt-4-32k': 32768,
-    'gpt-3.5-turbo': 16384,
-    'gpt-3.5-turbo-16k': 16384,
-    'gemini-2.5-flash-preview-05-20': 1000000,  # 1M context window
-    'models/gemini-2.5-flash-preview-05-20': 1000000,  # Alternative name
-    'gemini-2.5-flash': 1000000,  # 1M context window
-    'models/gemini-2.5-flash': 1000000,  # Alternative name
-    'gemini-2.0-flash': 1000000,  # 1M context window  
-    'models/gemini-2.0-flash': 1000000,  # Alternative name
-}
-
-def estimate_tokens(text: str) -> int:
-    """Rough token estimation: ~4 chars per token for most languages."""
-    return len(text) // 4
-
-def truncate_input_for_model(full_prompt: str, input_text: str, model: str, safety_margin: int = 2000) -> Tuple[str, bool]:
-    """
-    Truncate input_text if the full message would exceed model's context limit.
-    Returns (truncated_input_text, was_truncated)
-    """
-    context_limit = MODEL_CONTEXT_LIMITS.get(model, 8192)  # Default to conservative limit
-    
-    # Estimate tokens for the full prompt
-    prompt_tokens = estimate_tokens(full_prompt)
-    input_tokens = estimate_tokens(input_text)
-    total_tokens = prompt_tokens + input_tokens
-    
-    max_allowed_tokens = context_limit - safety_margin
-    
-    if total_tokens <= max_allowed_tokens:
-        return input_text, False
-    
-    # Calculate how much we need to truncate the input
-    max_input_tokens = max_allowed_tokens - prompt_tokens
-    if max_input_tokens <= 0:
-        logging.warning(f"Prompt itself is too long ({prompt_tokens} tokens), cannot fit any input")
-        return "", True
-    
-    # Truncate input text
-    max_input_chars = max_input_tokens * 4  # Rough conversion back to chars
-    truncated_input = input_text[:max_input_chars]
-    
-    # Try to truncate at word boundary
-    if len(truncated_input) < len(input_text):
-        last_space = truncated_input.rfind(' ')
-        if last_space > max_input_chars * 0.8:  # If we can find a space in the last 20%
-            truncated_input = truncated_input[:last_space]
-    
-    logging.warning(f"Truncated input from {len(input_text)} to {len(truncated_input)} chars (estimated {input_tokens} -> {estimate_tokens(truncated_input)} tokens)")
-    
-    return truncated_input, True
-
 # Initialize clients
-openai_client = AsyncOpenAI()
+openai_client = AsyncOpenAI(max_retries=0)  # Retried by call_with_retries
 gemini_client = None
 if GEMINI_AVAILABLE:
     gemini_api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_AI_API_KEY")
@@ -171,7 +131,8 @@ async def call_llm(model: str, messages: list, system_prompt: str = None, verbos
         raise
 
 async def call_llm_structured(model: str, messages: List[Dict], pydantic_model: Type[BaseModel], 
-                             system_prompt: str = None, verbose: bool = False, provider=None):
+                             system_prompt: str = None, verbose: bool = False, provider=None, cache_prefix: int = 0,
+                             stream: bool = False):
     """
     Make a structured LLM API call using provider-specific structured output APIs.
     
@@ -182,6 +143,8 @@ async def call_llm_structured(model: str, messages: List[Dict], pydantic_model:
         system_prompt: Optional system prompt
         verbose: Enable verbose logging
         provider: Optional pre-created provider (for efficiency)
+        cache_prefix: Number of leading messages that are the same for every row (prompt_layout: prefix)
+        stream: Stream the response and validate it field by field as it arrives (streaming: true)
         
     Returns:
         Parsed Pydantic model instance
@@ -198,13 +161,17 @@ async def call_llm_structured(model: str, messages: List[Dict], pydantic_model:
     # Prepare messages (system prompt already in messages if needed)
     if system_prompt and messages[0]['role'] != 'system':
         messages = [{'role': 'system', 'content': system_prompt}] + messages
+        if cache_prefix:
+            cache_prefix += 1  # the system prompt is part of the stable prefix
     
     try:
         # Use provider's structured output method
         result = await provider.generate_structured(
             messages=messages,
             pydantic_model=pydantic_model,
-            temperature=0.0  # Default to deterministic output
+            temperature=0.0,  # Default to deterministic output
+            **({'cache_prefix': cache_prefix} if cache_prefix else {}),
+            **({'stream': True} if stream else {})
         )
         
         if verbose:
@@ -241,11 +208,24 @@ def setup_enrichment_logging(verbose: bool):
     logger.addHandler(file_handler)
 
 async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_cols, output_cols, db_path, table, 
-                       enrichment_config, output_schema=None, system_prompt=None, overwrite=False, config=None, truncate=False, verbose=False, output_table=None, key_column=DEFAULT_KEY_COLUMN, enrichment_strategy=None, suppress_progress_messages=False):
-    """Process a batch of rows with the LLM"""
+                       enrichment_config, output_schema=None, system_prompt=None, overwrite=False, config=None, truncate=False, verbose=False, output_table=None, key_column=DEFAULT_KEY_COLUMN, enrichment_strategy=None, suppress_progress_messages=False, run_id=None, api_semaphore=None):
+    """Process a batch of rows with the LLM
+    
+    With a ``run_id`` (see enrichment_runs) the run record is checkpointed as results are committed.
+    ``api_semaphore`` bounds API calls across concurrently running enrichments (default: a limit per batch).
+    """
     if verbose:
         logging.info(f"Processing batch of {len(results)} rows")
     
+    # Map-reduce over token chunks instead of truncating long inputs (schema-driven enrichments only)
+    chunking = parse_chunking_config(enrichment_config.get('chunking'))
+    if chunking and not (enrichment_strategy and enrichment_strategy.pydantic_model):
+        logging.warning(f"chunking is only supported for schema-driven enrichments; ignoring it for '{enrichment_config.get('name')}'")
+        chunking = None
+    
+    prompt_layout = prompt_layout_for(enrichment_config, config)
+    streaming = streaming_for(enrichment_config, config)
+    
     # Get or create prompt_id for tracking prompt versions
     enrichment_name = enrichment_config.get('name', 'unknown')
     prompt_id = get_or_create_prompt_id(db_path, enrichment_name, prompt, system_prompt, model)
@@ -266,7 +246,7 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                 if sha1 != 'NO_SHA1':
                     # Check if we've already processed this sha1+enrichment+model combo
                     cursor.execute(
-                        "SELECT 1 FROM enrichment_responses WHERE sha1 = ? AND enrichment_name = ? AND model_used = ? LIMIT 1",
+                        "SELECT 1 FROM enrichment_responses WHERE sha1 = ? AND enrichment_name = ? AND model_used = ? AND chunk_index IS NULL LIMIT 1",
                         (sha1, enrichment_name, model)
                     )
                     if cursor.fetchone():
@@ -281,13 +261,10 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
             # This handles cases where enrichment_responses might be missing records
             if output_table:
                 # Check if output table exists
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (output_table,))
-                if cursor.fetchone():
+                output_info = schema_catalog.get(conn, db_path, output_table)
+                if output_info:
                     # Check if table has model_used column (derived table)
-                    cursor.execute(f"PRAGMA table_info({output_table})")
-                    columns_info = cursor.fetchall()
-                    column_names = [info[1] for info in columns_info]
-                    has_model_column = "model_used" in column_names
+                    has_model_column = output_info.has_column("model_used")
                     
                     # Check for any rows not already skipped
                     skipped_sha1s = {r['sha1'] for r in skipped_rows}
@@ -338,7 +315,7 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                 sha1 = row.get('sha1', 'NO_SHA1')
                 if sha1 != 'NO_SHA1':
                     cursor.execute(
-                        "SELECT 1 FROM enrichment_responses WHERE sha1 = ? AND enrichment_name = ? AND model_used = ? LIMIT 1",
+                        "SELECT 1 FROM enrichment_responses WHERE sha1 = ? AND enrichment_name = ? AND model_used = ? AND chunk_index IS NULL LIMIT 1",
                         (sha1, enrichment_name, model)
                     )
                     if cursor.fetchone():
@@ -360,76 +337,126 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
         if rows_to_process and not suppress_progress_messages:
             print(f"🔄 Processing {len(rows_to_process)} rows...")
     
+    run_tracker = RunTracker(db_path, run_id, results) if run_id else None
+    if run_tracker:
+        for skipped in skipped_rows:
+            run_tracker.done(skipped, skipped=True)
+    for _ in skipped_rows:
+        observe_row(enrichment_name, 'skipped')
+    
     if not rows_to_process:
         if verbose:
             logging.warning("No rows left to process!")
         elif not suppress_progress_messages:
             print("✅ All rows already processed!")
+        if run_tracker:
+            await asyncio.to_thread(run_tracker.finish, 'completed')
         return skipped_rows
 
     # Set up concurrency limits for API and DB access
-    semaphore = asyncio.Semaphore(DEFAULT_API_SEMAPHORE_LIMIT)  # Allow concurrent API calls
+    semaphore = api_semaphore or AdaptiveLimiter(DEFAULT_API_SEMAPHORE_LIMIT)  # Allow concurrent API calls
     db_semaphore = asyncio.Semaphore(DEFAULT_DB_SEMAPHORE_LIMIT)  # Limit database writes to prevent locks
+    # Schema-driven results for separate output tables are committed in batches
+    write_buffer = EnrichmentWriteBuffer(db_path)
+    watch_write_buffer(write_buffer)
     processed_results = []
     
     # Create provider once and reuse for all requests (much more efficient)
     llm_provider = None
     if enrichment_strategy and enrichment_strategy.pydantic_model:
         from .llm_providers.factory import get_llm_provider
-        llm_provider = get_llm_provider(model)
+        llm_provider = get_llm_provider(model, config)
         logging.debug(f"Created reusable {type(llm_provider).__name__} for {model}")
     
     async def process_and_save(row):
+        with call_context(sha1=row.get('sha1')), span('enrich.row'):
+            result = await enrich_and_save(row)
+        failed = not result or bool(result.get('error'))
+        observe_row(enrichment_name, 'failed' if failed else 'processed')
+        if run_tracker:
+            run_tracker.done(row, failed=failed)
+        if write_buffer.should_flush() or (run_tracker and run_tracker.due()):
+            async with db_semaphore:
+                # Everything the snapshot covers is queued or written by now, so it is committed after the flush
+                snapshot = run_tracker.snapshot() if run_tracker else None
+                await run_db(write_buffer.flush)
+                if run_tracker:
+                    await run_db(run_tracker.checkpoint, snapshot)
+        if recorder.pending(db_path) >= FLUSH_THRESHOLD:
+            async with db_semaphore:
+                await asyncio.to_thread(flush_call_records, db_path)
+        return result
+    
+    async def enrich_and_save(row):
         # NEW: Schema-driven structured output approach
         if enrichment_strategy and enrichment_strategy.pydantic_model:
             try:
-                result = await process_row_structured(
-                    row=row,
-                    input_cols=input_cols,
-                    parsed_input_cols=parsed_input_cols,
-                    prompt=prompt,
-                    model=model,
-                    semaphore=semaphore,
-                    pbar=pbar,
-                    pydantic_model=enrichment_strategy.pydantic_model,
-                    system_prompt=system_prompt,
-                    truncate=truncate,
-                    verbose=verbose,
-                    provider=llm_provider
-                )
+                if chunking:
+                    result = await process_row_chunked(
+                        row=row,
+                        input_cols=input_cols,
+                        parsed_input_cols=parsed_input_cols,
+                        prompt=prompt,
+                        model=model,
+                        semaphore=semaphore,
+                        pbar=pbar,
+                        pydantic_model=enrichment_strategy.pydantic_model,
+                        chunking=chunking,
+                        db_path=db_path,
+                        enrichment_name=enrichment_config['name'],
+                        prompt_id=prompt_id,
+                        system_prompt=system_prompt,
+                        verbose=verbose,
+                        provider=llm_provider,
+                        prompt_layout=prompt_layout,
+                        streaming=streaming
+                    )
+                else:
+                    result = await process_row_structured(
+                        row=row,
+                        input_cols=input_cols,
+                        parsed_input_cols=parsed_input_cols,
+                        prompt=prompt,
+                        model=model,
+                        semaphore=semaphore,
+                        pbar=pbar,
+                        pydantic_model=enrichment_strategy.pydantic_model,
+                        system_prompt=system_prompt,
+                        truncate=truncate,
+                        verbose=verbose,
+                        provider=llm_provider,
+                        prompt_layout=prompt_layout,
+                        streaming=streaming
+                    )
                 
                 if result:  # Store ALL results, including failures/nulls for audit trail
-                    async with db_semaphore:
-                        # DUAL STORAGE: 1. Store raw JSON in audit table
-                        # Handle case where raw_json might not exist (e.g., in error results)
-                        raw_json = result.get('raw_json')
-                        if not raw_json:
-                            # Create raw_json from the result data
-                            if result.get('updated'):
-                                raw_json = json.dumps(result['updated'], ensure_ascii=False)
-                            else:
-                                raw_json = json.dumps({'error': result.get('error', 'Unknown error')}, ensure_ascii=False)
-                        
-                        await asyncio.to_thread(
-                            store_raw_enrichment_response,
-                            db_path,
+                    # DUAL STORAGE: 1. Store raw JSON in audit table
+                    # Handle case where raw_json might not exist (e.g., in error results)
+                    raw_json = result.get('raw_json')
+                    if not raw_json:
+                        # Create raw_json from the result data
+                        if result.get('updated'):
+                            raw_json = json.dumps(result['updated'], ensure_ascii=False)
+                        else:
+                            raw_json = json.dumps({'error': result.get('error', 'Unknown error')}, ensure_ascii=False)
+                    
+                    if enrichment_strategy.storage_mode == "separate_table":
+                        # Queued: the response and its output row are committed together in batches
+                        write_buffer.add_response(
                             result['sha1'],
                             enrichment_config['name'],
                             raw_json,
                             model,
-                            result.get('enrichment_id'),  # Pass enrichment_id
-                            prompt_id,  # Pass prompt_id for tracking
-                            result.get('full_prompt')  # Pass full_prompt
+                            result.get('enrichment_id'),
+                            prompt_id,
+                            result.get('full_prompt'),
+                            input_text=result.pop('input_text', None)
                         )
-                        
                         # DUAL STORAGE: 2. Store parsed columns in target table
                         # Only store to output table if we have actual data
-                        if result.get('updated') and enrichment_strategy.storage_mode == "separate_table":
-                            # Use separate output table
+                        if result.get('updated'):
                             key_value = result.get(enrichment_strategy.key_column, result.get('sha1', 'NO_KEY'))
-                            await asyncio.to_thread(
-                                update_output_table,
-                                db_path,
+                            write_buffer.add_output(
                                 enrichment_strategy.output_table,
                                 enrichment_strategy.key_column,
                                 key_value,
@@ -437,16 +464,33 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                                 result.get('enrichment_id'),  # Pass enrichment_id
                                 model  # Pass model for multi-model support
                             )
-                        else:
-                            # Direct column mode - update source table
-                            # For single column, extract the value
-                            if len(enrichment_strategy.output_columns) == 1:
-                                column_name = enrichment_strategy.output_columns[0]
-                                column_value = result['updated'].get(column_name)
-                                # Convert enum to string if needed
-                                if hasattr(column_value, 'value'):
-                                    column_value = column_value.value
-                                await asyncio.to_thread(
+                        return result
+                    
+                    async with db_semaphore:
+                        with span('write.audit'):
+                            await run_db(
+                                store_raw_enrichment_response,
+                                db_path,
+                                result['sha1'],
+                                enrichment_config['name'],
+                                raw_json,
+                                model,
+                                result.get('enrichment_id'),  # Pass enrichment_id
+                                prompt_id,  # Pass prompt_id for tracking
+                                result.get('full_prompt'),  # Pass full_prompt
+                                input_text=result.pop('input_text', None)  # Document part, stored as its own blob
+                            )
+                        
+                        # DUAL STORAGE: 2. Direct column mode - update source table
+                        # For single column, extract the value
+                        if result.get('updated') and len(enrichment_strategy.output_columns) == 1:
+                            column_name = enrichment_strategy.output_columns[0]
+                            column_value = result['updated'].get(column_name)
+                            # Convert enum to string if needed
+                            if hasattr(column_value, 'value'):
+                                column_value = column_value.value
+                            with span('write.output'):
+                                await run_db(
                                     update_database,
                                     db_path,
                                     table,
@@ -485,7 +529,7 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                 async with db_semaphore:
                     # Store in enrichment_responses regardless of success/failure
                     raw_json = json.dumps(result.get('updated', {}), ensure_ascii=False) if result.get('updated') else json.dumps({'error': result.get('error', 'Unknown error')})
-                    await asyncio.to_thread(
+                    await run_db(
                         store_raw_enrichment_response,
                         db_path,
                         result['sha1'],
@@ -494,14 +538,15 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                         model,
                         result.get('enrichment_id'),
                         prompt_id,
-                        result.get('full_prompt')
+                        result.get('full_prompt'),
+                        input_text=result.pop('input_text', None)
                     )
                     
                     # Special handling for translation results which have multiple columns
                     if result.get('updated'):
                         # Update each column separately
                         for col in ['zh_json', 'en_json', 'english_translation']:
-                            await asyncio.to_thread(
+                            await run_db(
                                 update_database,
                                 db_path,
                                 table,
@@ -539,7 +584,7 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                 async with db_semaphore:
                     # Store in enrichment_responses regardless of success/failure
                     raw_json = json.dumps({'result': result.get('updated')}, ensure_ascii=False) if result.get('updated') else json.dumps({'error': result.get('error', 'Unknown error')})
-                    await asyncio.to_thread(
+                    await run_db(
                         store_raw_enrichment_response,
                         db_path,
                         result['sha1'],
@@ -548,7 +593,8 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                         model,
                         result.get('enrichment_id'),
                         prompt_id,
-                        result.get('full_prompt')
+                        result.get('full_prompt'),
+                        input_text=result.pop('input_text', None)
                     )
                     
                     # Only update output table if we have actual data
@@ -557,7 +603,7 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                             # Use separate output table
                             key_value = result.get(key_column, result.get('sha1', 'NO_KEY'))
                             output_data = {output_cols[0]: result['updated']}
-                            await asyncio.to_thread(
+                            await run_db(
                                 update_output_table,
                                 db_path,
                                 output_table,
@@ -569,7 +615,7 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                             )
                         else:
                             # Traditional update to source table
-                            await asyncio.to_thread(
+                            await run_db(
                                 update_database,
                                 db_path,
                                 table,
@@ -599,7 +645,7 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                 async with db_semaphore:
                     # Store in enrichment_responses regardless of success/failure
                     raw_json = json.dumps({'result': result.get('updated')}, ensure_ascii=False) if result.get('updated') else json.dumps({'error': result.get('error', 'Unknown error')})
-                    await asyncio.to_thread(
+                    await run_db(
                         store_raw_enrichment_response,
                         db_path,
                         result['sha1'],
@@ -608,7 +654,8 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                         model,
                         result.get('enrichment_id'),
                         prompt_id,
-                        result.get('full_prompt')
+                        result.get('full_prompt'),
+                        input_text=result.pop('input_text', None)
                     )
                     
                     # Only update output table if we have actual data
@@ -617,7 +664,7 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                             # Use separate output table
                             key_value = result.get(key_column, result.get('sha1', 'NO_KEY'))
                             output_data = {output_cols[0]: result['updated']}
-                            await asyncio.to_thread(
+                            await run_db(
                                 update_output_table,
                                 db_path,
                                 output_table,
@@ -629,7 +676,7 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                             )
                         else:
                             # Traditional update to source table
-                            await asyncio.to_thread(
+                            await run_db(
                                 update_database,
                                 db_path,
                                 table,
@@ -638,139 +685,216 @@ async def process_batch(results, prompt, model, pbar, input_cols, parsed_input_c
                             )
         return result
 
-    tasks = [process_and_save(row) for row in rows_to_process]
-    processed_results = await asyncio.gather(*tasks)
-    
-    # Run WAL checkpoint periodically to prevent WAL file from growing too large
-    # Do this every 1000 processed rows
-    total_processed = len([r for r in processed_results if r and r.get('updated')])
-    if total_processed > 0 and total_processed % 1000 == 0:
-        logging.info(f"Running WAL checkpoint after {total_processed} rows...")
-        await asyncio.to_thread(checkpoint_wal, db_path)
+    # Per-call telemetry (llm_calls) is tagged with this run, enrichment and database; the run's retries share a budget
+    with call_context(db_path=db_path, run_id=run_id or str(uuid.uuid4()), enrichment_name=enrichment_name,
+                      retry_budget=RetryBudget()):
+        tasks = [process_and_save(row) for row in rows_to_process]
+        # Keep the WAL bounded while the run writes, and show its size next to the progress bar
+        async with run_checkpointer(db_path, on_size=lambda size: _show_wal_size(pbar, size)):
+            status = 'interrupted'
+            try:
+                processed_results = await asyncio.gather(*tasks)
+                status = 'completed'
+            except Exception:
+                status = 'failed'
+                raise
+            finally:
+                snapshot = run_tracker.snapshot() if run_tracker else None
+                await run_db(write_buffer.flush)
+                await asyncio.to_thread(flush_call_records, db_path)
+                if run_tracker:
+                    await asyncio.to_thread(run_tracker.finish, status, snapshot)
+                await _release_prompt_caches(llm_provider)
     
     return processed_results + skipped_rows
 
+async def _release_prompt_caches(provider) -> None:
+    """Delete explicit prompt caches a provider created for this batch (see GeminiProvider)."""
+    release = getattr(provider, 'release_caches', None)
+    if inspect.iscoroutinefunction(release):
+        await release()
+
+def _show_wal_size(pbar, size: int) -> None:
+    if pbar is not None and hasattr(pbar, 'set_postfix_str'):
+        pbar.set_postfix_str(f"WAL {format_wal_size(size)}")
+
+def _build_structured_input(row: Dict, parsed_input_cols: List[Tuple[str, Optional[int]]],
+                            prompt: str, verbose: bool = False) -> Tuple[str, str]:
+    """Return (templated_prompt, input_text) for a row."""
+    # Use new column parsing with character limits
+    limited_data = apply_column_limits(row, parsed_input_cols)
+    
+    # Replace template variables in prompt with actual column values
+    templated_prompt = prompt
+    template_replacements = {}
+    for col, _ in parsed_input_cols:
+        if col not in ['rowid', 'sha1']:
+            # Handle both plain column names and table.column syntax
+            col_value = limited_data.get(col, '')
+            # Replace {column_name} with actual value
+            if f'{{{col}}}' in templated_prompt:
+                templated_prompt = templated_prompt.replace(f'{{{col}}}', str(col_value))
+                template_replacements[f'{{{col}}}'] = str(col_value)
+            # Also handle case where column has table prefix (e.g., {documents.title})
+            if '.' in col:
+                _, column_only = col.split('.', 1)
+                if f'{{{column_only}}}' in templated_prompt:
+                    templated_prompt = templated_prompt.replace(f'{{{column_only}}}', str(col_value))
+                    template_replacements[f'{{{column_only}}}'] = str(col_value)
+    
+    if template_replacements and verbose:
+        logging.info(f"Template substitutions: {template_replacements}")
+    
+    return templated_prompt, build_input_text(limited_data, parsed_input_cols)
+
+def _prefix_prompt(prompt: str, parsed_input_cols: List[Tuple[str, Optional[int]]]) -> str:
+    """The prompt with column placeholders pointing at the document part instead of holding its values.
+    
+    The result is the same for every row, so providers can cache it as a prompt prefix.
+    """
+    for col, _ in parsed_input_cols:
+        if col in ['rowid', 'sha1']:
+            continue
+        for name in [col] + ([col.split('.', 1)[1]] if '.' in col else []):
+            prompt = prompt.replace(f'{{{name}}}', f'({col}, given below)')
+    return prompt
+
+def prompt_layout_for(enrichment_config: Dict, config: Optional[Dict] = None) -> str:
+    """'inline' or 'prefix', from the enrichment or the top level of the config."""
+    return enrichment_config.get('prompt_layout', (config or {}).get('prompt_layout', PROMPT_LAYOUTS[0]))
+
+def streaming_for(enrichment_config: Dict, config: Optional[Dict] = None) -> bool:
+    """Whether structured responses are streamed, from the enrichment or the top level of the config."""
+    return bool(enrichment_config.get('streaming', (config or {}).get('streaming', False)))
+
+async def _call_structured_with_retries(model: str, messages: List[Dict], pydantic_model: Type[BaseModel],
+                                        system_prompt: str = None, verbose: bool = False, provider=None,
+                                        rowid='unknown', max_retries: int = 2, cache_prefix: int = 0,
+                                        stream: bool = False):
+    """Structured call with conversions and language validation, retried on LanguageValidationError.
+
+    With ``stream`` a streamed response that breaks a language requirement is
+    abandoned as soon as that shows, before the rest of it is generated.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            with call_context(attempt=attempt + 1), span('enrich.api'):
+                result = await call_llm_structured(model, messages, pydantic_model, system_prompt, verbose, provider,
+                                                   **({'cache_prefix': cache_prefix} if cache_prefix else {}),
+                                                   **({'stream': True} if stream else {}))
+            
+            with span('enrich.validate'):
+                # Apply field conversions if the model has them (BEFORE language validation)
+                if hasattr(result, 'apply_conversions'):
+                    result.apply_conversions(result)
+                
+                # Validate language requirements if the model has them (AFTER conversions)
+                if hasattr(result, 'validate_languages'):
+                    result.validate_languages(result)
+            
+            if attempt > 0:
+                logging.info(f"✅ Language validation passed on attempt {attempt + 1} for rowid {rowid}")
+            return result
+            
+        except LanguageValidationError as e:
+            if attempt < max_retries:
+                logging.warning(f"🔄 Language validation failed on attempt {attempt + 1} for rowid {rowid}: {str(e)[:100]}... Retrying...")
+                continue
+            raise
+
 async def process_row_structured(row: Dict, input_cols: List[str], parsed_input_cols: List[Tuple[str, Optional[int]]], 
                                prompt: str, model: str, semaphore: asyncio.Semaphore, pbar: tqdm,
                                pydantic_model: Type[BaseModel], system_prompt: str = None, 
-                               truncate: bool = False, verbose: bool = False, provider=None):
-    """Process a single row using structured outputs (OpenAI only)."""
-    async with semaphore:
+                               truncate: bool = False, verbose: bool = False, provider=None,
+                               prompt_layout: str = 'inline', streaming: bool = False):
+    """Process a single row using structured outputs.
+    
+    With ``prompt_layout='prefix'`` the instructions go first, unchanged for
+    every row, and the document follows in its own message, so the provider
+    can serve the instructions from its prompt cache. With ``streaming`` the
+    response is streamed and checked field by field as it arrives.
+    """
+    async with acquire_slot(semaphore):
         sha1 = row.get('sha1', 'NO_SHA1')
         # Generate a unique enrichment_id for this specific LLM call
         row_enrichment_id = str(uuid.uuid4())
         try:
-            # Use new column parsing with character limits
-            limited_data = apply_column_limits(row, parsed_input_cols)
-            
-            # Replace template variables in prompt with actual column values
-            templated_prompt = prompt
-            template_replacements = {}
-            for col, _ in parsed_input_cols:
-                if col not in ['rowid', 'sha1']:
-                    # Handle both plain column names and table.column syntax
-                    col_value = limited_data.get(col, '')
-                    # Replace {column_name} with actual value
-                    if f'{{{col}}}' in templated_prompt:
-                        templated_prompt = templated_prompt.replace(f'{{{col}}}', str(col_value))
-                        template_replacements[f'{{{col}}}'] = str(col_value)
-                    # Also handle case where column has table prefix (e.g., {documents.title})
-                    if '.' in col:
-                        _, column_only = col.split('.', 1)
-                        if f'{{{column_only}}}' in templated_prompt:
-                            templated_prompt = templated_prompt.replace(f'{{{column_only}}}', str(col_value))
-                            template_replacements[f'{{{column_only}}}'] = str(col_value)
+            with span('enrich.template'):
+                templated_prompt, input_text = _build_structured_input(row, parsed_input_cols, prompt, verbose)
+                if prompt_layout == 'prefix':
+                    # The column values are in the document part already
+                    templated_prompt = _prefix_prompt(prompt, parsed_input_cols)
             
-            if template_replacements and verbose:
-                logging.info(f"Template substitutions: {template_replacements}")
+                # Handle truncation if enabled
+                final_input_text = input_text
+                was_truncated = False
+                rowid = row.get('rowid', 'unknown')
             
-            input_text = "\n".join([
-                f"{col}: {limited_data.get(col, '')}" 
-                for col, _ in parsed_input_cols 
-                if col not in ['rowid', 'sha1']
-            ])
-            
-            # Handle truncation if enabled
-            final_input_text = input_text
-            was_truncated = False
-            rowid = row.get('rowid', 'unknown')
-            
-            if truncate:
-                logging.debug(f"Truncate enabled for rowid {rowid}, checking if needed...")
-                prompt_tokens = estimate_tokens(templated_prompt)
-                input_tokens = estimate_tokens(input_text)
-                total_tokens = prompt_tokens + input_tokens
-                logging.debug(f"Estimated tokens - prompt: {prompt_tokens}, input: {input_tokens}, total: {total_tokens}")
+                if truncate:
+                    logging.debug(f"Truncate enabled for rowid {rowid}, checking if needed...")
+                    # Memoised per (sha1, input columns) so each document is tokenised once per run
+                    input_tokens = count_document_tokens(
+                        input_text, model, row.get('sha1'), input_column_key(parsed_input_cols)
+                    )
+                    logging.debug(f"Input tokens for rowid {rowid}: {input_tokens}")
                 
-                final_input_text, was_truncated = truncate_input_for_model(templated_prompt, input_text, model)
-                if was_truncated:
-                    logging.info(f"✂️  Truncated input for rowid {rowid} (model: {model})")
+                    final_input_text, was_truncated = truncate_input_text(templated_prompt, input_text, model, input_tokens=input_tokens)
+                    if was_truncated:
+                        logging.info(f"✂️  Truncated input for rowid {rowid} (model: {model})")
+                    else:
+                        logging.debug(f"No truncation needed for rowid {rowid}")
                 else:
-                    logging.debug(f"No truncation needed for rowid {rowid}")
-            else:
-                logging.debug(f"Truncate disabled for rowid {rowid}")
+                    logging.debug(f"Truncate disabled for rowid {rowid}")
             
-            messages = [{"role": "user", "content": templated_prompt + "\n\n" + final_input_text}]
-            full_prompt_content = templated_prompt + "\n\n" + final_input_text
+                full_prompt_content = templated_prompt + "\n\n" + final_input_text
+                if prompt_layout == 'prefix':
+                    messages = [{"role": "user", "content": templated_prompt}, {"role": "user", "content": final_input_text}]
+                else:
+                    messages = [{"role": "user", "content": full_prompt_content}]
             
             # Make structured API call with retry logic for language validation
             max_retries = 2  # Total of 3 attempts (original + 2 retries)
             
-            for attempt in range(max_retries + 1):
-                try:
-                    result = await call_llm_structured(model, messages, pydantic_model, system_prompt, verbose, provider)
-                    
-                    # Apply field conversions if the model has them (BEFORE language validation)
-                    if hasattr(result, 'apply_conversions'):
-                        result.apply_conversions(result)
-                    
-                    # Validate language requirements if the model has them (AFTER conversions)
-                    if hasattr(result, 'validate_languages'):
-                        result.validate_languages(result)
-                    
-                    # Convert Pydantic model to dict for storage
-                    # Use mode='json' to properly serialize enums to their values
-                    result_dict = result.model_dump(mode='json')
-                    
-                    # Console progress - only show model response if verbose
-                    logging.debug(f"[{sha1[:8]}] Structured result: {result_dict}")
-                    if attempt > 0:
-                        logging.info(f"✅ Language validation passed on attempt {attempt + 1} for rowid {row.get('rowid', 'unknown')}")
-                    pbar.update(1)
-                    
-                    return {
-                        'enrichment_id': row_enrichment_id,  # Use the row-specific ID
-                        'rowid': row.get('rowid', 'NO_ROWID'), 
-                        'sha1': sha1,
-                        'original': {},  # Not applicable for structured outputs
-                        'updated': result_dict,
-                        'raw_json': result.model_dump_json(),
-                        'full_prompt': full_prompt_content
-                    }
-                    
-                except LanguageValidationError as e:
-                    if attempt < max_retries:
-                        logging.warning(f"🔄 Language validation failed on attempt {attempt + 1} for rowid {row.get('rowid', 'unknown')}: {str(e)[:100]}... Retrying...")
-                        # Don't update progress bar yet, we're retrying
-                        continue
-                    else:
-                        # Final attempt failed, log error and continue
-                        logging.error(f"❌ Language validation failed after {max_retries + 1} attempts for rowid {row.get('rowid', 'unknown')}: {str(e)}")
-                        pbar.update(1)
-                        return {
-                            'enrichment_id': row_enrichment_id,  # Use the row-specific ID
-                            'rowid': row.get('rowid', 'NO_ROWID'), 
-                            'sha1': sha1,
-                            'original': {}, 
-                            'updated': None, 
-                            'error': f"Language validation failed after {max_retries + 1} attempts: {str(e)}",
-                            'raw_json': json.dumps({'error': f"Language validation failed after {max_retries + 1} attempts: {str(e)}"}, ensure_ascii=False),
-                            'full_prompt': full_prompt_content
-                        }
-                        
-                except Exception as e:
-                    # For non-language validation errors, don't retry
-                    raise e
+            try:
+                result = await _call_structured_with_retries(
+                    model, messages, pydantic_model, system_prompt, verbose, provider,
+                    rowid=rowid, max_retries=max_retries, cache_prefix=1 if prompt_layout == 'prefix' else 0,
+                    **({'stream': True} if streaming else {})
+                )
+            except LanguageValidationError as e:
+                # Final attempt failed, log error and continue
+                logging.error(f"❌ Language validation failed after {max_retries + 1} attempts for rowid {rowid}: {str(e)}")
+                pbar.update(1)
+                return {
+                    'enrichment_id': row_enrichment_id,  # Use the row-specific ID
+                    'rowid': row.get('rowid', 'NO_ROWID'), 
+                    'sha1': sha1,
+                    'original': {}, 
+                    'updated': None, 
+                    'error': f"Language validation failed after {max_retries + 1} attempts: {str(e)}",
+                    'raw_json': json.dumps({'error': f"Language validation failed after {max_retries + 1} attempts: {str(e)}"}, ensure_ascii=False),
+                    'full_prompt': full_prompt_content,
+                    'input_text': final_input_text
+                }
+            
+            # Convert Pydantic model to dict for storage
+            # Use mode='json' to properly serialize enums to their values
+            result_dict = result.model_dump(mode='json')
+            
+            # Console progress - only show model response if verbose
+            logging.debug(f"[{sha1[:8]}] Structured result: {result_dict}")
+            pbar.update(1)
+            
+            return {
+                'enrichment_id': row_enrichment_id,  # Use the row-specific ID
+                'rowid': row.get('rowid', 'NO_ROWID'), 
+                'sha1': sha1,
+                'original': {},  # Not applicable for structured outputs
+                'updated': result_dict,
+                'raw_json': result.model_dump_json(),
+                'full_prompt': full_prompt_content,
+                'input_text': final_input_text
+            }
                 
         except Exception as e:
             rowid = row.get('rowid', 'unknown')
@@ -787,11 +911,144 @@ async def process_row_structured(row: Dict, input_cols: List[str], parsed_input_
                 'full_prompt': full_prompt_content if 'full_prompt_content' in locals() else None
             }
 
+DEFAULT_REDUCE_PROMPT = (
+    "The following JSON objects were extracted from consecutive parts of the same document "
+    "using the instructions below. Combine them into a single result for the whole document, "
+    "merging lists and resolving conflicting values."
+)
+
+async def process_row_chunked(row: Dict, input_cols: List[str], parsed_input_cols: List[Tuple[str, Optional[int]]],
+                              prompt: str, model: str, semaphore: asyncio.Semaphore, pbar: tqdm,
+                              pydantic_model: Type[BaseModel], chunking: Dict, db_path: str,
+                              enrichment_name: str, prompt_id: Optional[str] = None,
+                              system_prompt: str = None, verbose: bool = False, provider=None,
+                              prompt_layout: str = 'inline', streaming: bool = False):
+    """Map-reduce a long row: enrich overlapping token chunks concurrently, then merge.
+    
+    Each chunk response is stored in enrichment_responses with its chunk_index, so an
+    interrupted run only re-sends the chunks that are missing. ``prompt_layout`` and
+    ``streaming`` apply to the chunk and reduce calls as in process_row_structured:
+    with ``prefix`` the instructions are a separate first message shared by every
+    chunk (and every row), so the provider can cache them.
+    """
+    sha1 = row.get('sha1', 'NO_SHA1')
+    rowid = row.get('rowid', 'NO_ROWID')
+    row_enrichment_id = str(uuid.uuid4())
+    full_prompt_content = None
+    try:
+        templated_prompt, input_text = _build_structured_input(row, parsed_input_cols, prompt, verbose)
+        if prompt_layout == 'prefix':
+            # The column values are in the document part already
+            templated_prompt = _prefix_prompt(prompt, parsed_input_cols)
+        cache_prefix = 1 if prompt_layout == 'prefix' else 0
+        full_prompt_content = templated_prompt + "\n\n" + input_text
+        budget = chunk_budget(model, count_tokens(templated_prompt, model), chunking['chunk_tokens'])
+        chunks = chunk_text(input_text, model, budget, min(chunking['overlap_tokens'], budget // 2))
+        
+        if len(chunks) == 1:
+            # Fits in one call - identical to the unchunked path
+            return await process_row_structured(
+                row=row, input_cols=input_cols, parsed_input_cols=parsed_input_cols, prompt=prompt,
+                model=model, semaphore=semaphore, pbar=pbar, pydantic_model=pydantic_model,
+                system_prompt=system_prompt, truncate=False, verbose=verbose, provider=provider,
+                prompt_layout=prompt_layout, streaming=streaming
+            )
+        
+        chunk_count = len(chunks)
+        stored = await run_db(
+            get_chunk_responses, db_path, sha1, enrichment_name, model, prompt_id, chunk_count
+        )
+        if stored:
+            logging.info(f"♻️  Reusing {len(stored)}/{chunk_count} stored chunks for rowid {rowid}")
+        logging.info(f"🧩 Splitting rowid {rowid} into {chunk_count} chunks of <= {budget} tokens")
+        
+        async def run_chunk(index: int, chunk: str) -> Dict:
+            if index in stored:
+                return stored[index]
+            part = f"[Part {index + 1} of {chunk_count}]\n{chunk}"
+            content = f"{templated_prompt}\n\n{part}"
+            if prompt_layout == 'prefix':
+                messages = [{"role": "user", "content": templated_prompt}, {"role": "user", "content": part}]
+            else:
+                messages = [{"role": "user", "content": content}]
+            try:
+                async with acquire_slot(semaphore):
+                    result = await _call_structured_with_retries(
+                        model, messages, pydantic_model,
+                        system_prompt, verbose, provider, rowid=f"{rowid}#{index}", cache_prefix=cache_prefix,
+                        **({'stream': True} if streaming else {})
+                    )
+                raw_json = result.model_dump_json()
+            except Exception as e:
+                raw_json = json.dumps({'error': str(e)}, ensure_ascii=False)
+                result = None
+            await run_db(
+                store_raw_enrichment_response, db_path, sha1, enrichment_name, raw_json, model,
+                str(uuid.uuid4()), prompt_id, content, index, chunk_count, chunk
+            )
+            if result is None:
+                raise ValueError(f"chunk {index + 1}/{chunk_count} failed: {json.loads(raw_json)['error']}")
+            return result.model_dump(mode='json')
+        
+        outcomes = await asyncio.gather(*[run_chunk(i, c) for i, c in enumerate(chunks)], return_exceptions=True)
+        errors = [o for o in outcomes if isinstance(o, Exception)]
+        if errors:
+            raise errors[0]
+        
+        if chunking['reduce'] == 'llm':
+            reduce_instructions = (
+                f"{chunking.get('reduce_prompt') or DEFAULT_REDUCE_PROMPT}\n\n"
+                f"Instructions:\n{templated_prompt}"
+            )
+            partial_results = f"Partial results:\n{json.dumps(outcomes, ensure_ascii=False, indent=2)}"
+            if prompt_layout == 'prefix':
+                reduce_messages = [{"role": "user", "content": reduce_instructions},
+                                   {"role": "user", "content": partial_results}]
+            else:
+                reduce_messages = [{"role": "user", "content": f"{reduce_instructions}\n\n{partial_results}"}]
+            async with acquire_slot(semaphore):
+                final = await _call_structured_with_retries(
+                    model, reduce_messages, pydantic_model,
+                    system_prompt, verbose, provider, rowid=rowid, cache_prefix=cache_prefix,
+                    **({'stream': True} if streaming else {})
+                )
+        else:
+            final = pydantic_model.model_validate(merge_chunk_results(outcomes, chunking.get('reducers')))
+        
+        result_dict = final.model_dump(mode='json')
+        logging.debug(f"[{sha1[:8]}] Merged {chunk_count} chunk results: {result_dict}")
+        pbar.update(1)
+        return {
+            'enrichment_id': row_enrichment_id,
+            'rowid': rowid,
+            'sha1': sha1,
+            'original': {},
+            'updated': result_dict,
+            'raw_json': final.model_dump_json(),
+            'full_prompt': full_prompt_content,
+            'input_text': input_text,
+            'chunk_count': chunk_count
+        }
+        
+    except Exception as e:
+        logging.error(f"Error processing chunked rowid {rowid} (sha1: {sha1[:8]}): {str(e)}")
+        pbar.update(1)
+        return {
+            'enrichment_id': row_enrichment_id,
+            'rowid': rowid,
+            'sha1': sha1,
+            'original': {},
+            'updated': None,
+            'error': str(e),
+            'raw_json': json.dumps({'error': str(e)}, ensure_ascii=False),
+            'full_prompt': full_prompt_content
+        }
+
 async def process_row(row: Dict, input_cols: List[str], parsed_input_cols: List[Tuple[str, Optional[int]]], prompt: str, 
                      model: str, semaphore: asyncio.Semaphore, pbar: tqdm, 
                      output_col: str, output_schema = None, 
                      system_prompt: str = None, config: Dict = None, truncate: bool = False, verbose: bool = False):
-    async with semaphore:
+    async with acquire_slot(semaphore):
         sha1 = row.get('sha1', 'NO_SHA1')
         # Generate a unique enrichment_id for this specific LLM call
         row_enrichment_id = str(uuid.uuid4())
@@ -840,12 +1097,13 @@ async def process_row(row: Dict, input_cols: List[str], parsed_input_cols: List[
             
             if truncate:
                 logging.debug(f"Truncate enabled for rowid {rowid}, checking if needed...")
-                prompt_tokens = estimate_tokens(full_prompt)
-                input_tokens = estimate_tokens(input_text)
-                total_tokens = prompt_tokens + input_tokens
-                logging.debug(f"Estimated tokens - prompt: {prompt_tokens}, input: {input_tokens}, total: {total_tokens}")
+                # Memoised per (sha1, input columns) so each document is tokenised once per run
+                input_tokens = count_document_tokens(
+                    input_text, model, row.get('sha1'), input_column_key(parsed_input_cols)
+                )
+                logging.debug(f"Input tokens for rowid {rowid}: {input_tokens}")
                 
-                final_input_text, was_truncated = truncate_input_for_model(full_prompt, input_text, model)
+                final_input_text, was_truncated = truncate_input_text(full_prompt, input_text, model, input_tokens=input_tokens)
                 if was_truncated:
                     logging.info(f"✂️  Truncated input for rowid {rowid} (model: {model})")
                 else:
@@ -881,7 +1139,8 @@ async def process_row(row: Dict, input_cols: List[str], parsed_input_cols: List[
                         'original': row.get(output_col, ''), 
                         'updated': None,
                         'error': f"Schema validation failed: {e}",
-                        'full_prompt': full_prompt_content
+                        'full_prompt': full_prompt_content,
+                        'input_text': final_input_text
                     }
             
             # Console progress - only show model response if verbose
@@ -894,7 +1153,8 @@ async def process_row(row: Dict, input_cols: List[str], parsed_input_cols: List[
                 'sha1': sha1,
                 'original': row.get(output_col, ''), 
                 'updated': validated_result,
-                'full_prompt': full_prompt_content
+                'full_prompt': full_prompt_content,
+                'input_text': final_input_text
             }
                 
         except Exception as e:
@@ -916,29 +1176,8 @@ def apply_slice(value, slice_):
         return value
     return value[slice_] if isinstance(value, str) else value
 
-async def process_enrichment(
-    results: List[Dict],
-    enrichment_config: Dict,
-    model: str,
-    pbar: tqdm,
-    db_path: str,
-    table: str,
-    overwrite: bool = False,
-    config: Dict = None,
-    truncate: bool = False,
-    verbose: bool = False,
-    output_table: str = None,
-    key_column: str = DEFAULT_KEY_COLUMN,
-    enrichment_strategy: EnrichmentStrategy = None,
-    is_multi_model: bool = False
-):
-    """Process a single enrichment task"""
-    logging.info(f"🎯 Starting enrichment '{enrichment_config['name']}'")
-    logging.info(f"📊 Model: {model}, Rows: {len(results)}, Overwrite: {overwrite}")
-    
-    # Ensure enrichment_responses table exists ONCE before processing
-    ensure_enrichment_responses_table(db_path)
-    
+def load_enrichment_prompt(enrichment_config: Dict, config: Dict = None) -> str:
+    """Return the enrichment prompt with any append_file content appended."""
     prompt = enrichment_config.get('prompt', '')
     
     # Handle append_file feature
@@ -966,6 +1205,38 @@ async def process_enrichment(
             logging.error(f"❌ Error reading append_file: {e}")
             raise
     
+    return prompt
+
+async def process_enrichment(
+    results: List[Dict],
+    enrichment_config: Dict,
+    model: str,
+    pbar: tqdm,
+    db_path: str,
+    table: str,
+    overwrite: bool = False,
+    config: Dict = None,
+    truncate: bool = False,
+    verbose: bool = False,
+    output_table: str = None,
+    key_column: str = DEFAULT_KEY_COLUMN,
+    enrichment_strategy: EnrichmentStrategy = None,
+    is_multi_model: bool = False,
+    run_id: Optional[str] = None,
+    api_semaphore: Optional[asyncio.Semaphore] = None
+):
+    """Process a single enrichment task"""
+    logging.info(f"🎯 Starting enrichment '{enrichment_config['name']}'")
+    logging.info(f"📊 Model: {model}, Rows: {len(results)}, Overwrite: {overwrite}")
+    
+    # Re-read table metadata once per run, then keep it cached for the per-row writes
+    schema_catalog.reset()
+    
+    # Ensure enrichment_responses table exists ONCE before processing
+    ensure_enrichment_responses_table(db_path)
+    
+    prompt = load_enrichment_prompt(enrichment_config, config)
+    
     system_prompt = enrichment_config.get('system_prompt')
     output_schema = enrichment_config.get('schema')
     
@@ -992,6 +1263,18 @@ async def process_enrichment(
     # Keep backward compatibility - extract just column names for existing functions
     input_cols = [col_name for col_name, _ in parsed_input_cols]
     
+    # All DDL happens here, in one transaction, so per-row writes are pure DML
+    if enrichment_strategy and enrichment_strategy.pydantic_model:
+        separate = enrichment_strategy.storage_mode == "separate_table"
+        prepare_enrichment_schema(
+            db_path, table=table, output_columns=enrichment_strategy.output_columns,
+            output_table=enrichment_strategy.output_table if separate else None,
+            key_column=enrichment_strategy.key_column
+        )
+    else:
+        prepare_enrichment_schema(db_path, table=table, output_columns=output_cols, output_table=output_table,
+                                  key_column=key_column)
+    
     if verbose:
         logging.info(f"Processing enrichment '{enrichment_config['name']}' with input columns: {input_cols}")
         logging.info(f"Truncate mode: {truncate}")
@@ -1016,16 +1299,180 @@ async def process_enrichment(
         output_table=output_table,
         key_column=key_column,
         enrichment_strategy=enrichment_strategy,
-        suppress_progress_messages=is_multi_model
+        suppress_progress_messages=is_multi_model,
+        run_id=run_id,
+        api_semaphore=api_semaphore
     )
     
     return processed_results
 
+async def process_fused_enrichment(
+    results: List[Dict],
+    group: FusedGroup,
+    model: str,
+    pbar: tqdm,
+    db_path: str,
+    overwrite: bool = False,
+    config: Dict = None,
+    truncate: bool = False,
+    verbose: bool = False,
+    is_multi_model: bool = False,
+    run_id: Optional[str] = None,
+    api_semaphore: Optional[asyncio.Semaphore] = None
+):
+    """Process a fused group of enrichments with one structured call per row (see enrichment_fusion).
+    
+    Each response is split into the members' enrichment_responses records and
+    output tables. Unless ``overwrite``, a row is sent if any member still needs
+    it, and only the members that need it store its result.
+    """
+    logging.info(f"🎯 Starting fused enrichment '{group.label}'")
+    logging.info(f"📊 Model: {model}, Rows: {len(results)}, Overwrite: {overwrite}")
+    
+    schema_catalog.reset()
+    ensure_enrichment_responses_table(db_path)
+    for _, strategy in group.members:
+        # main only created the leader's output table
+        ensure_output_table(db_path, strategy.output_table, strategy.key_column, strategy.output_columns,
+                            is_derived_table=True)
+        prepare_enrichment_schema(
+            db_path, table=strategy.input_table, output_columns=strategy.output_columns,
+            output_table=strategy.output_table, key_column=strategy.key_column
+        )
+    
+    leader = group.enrichments[0]
+    prompt = group.prompt(config)
+    system_prompt = leader.get('system_prompt')
+    prompt_ids = {name: get_or_create_prompt_id(db_path, name, prompt, system_prompt, model) for name in group.names}
+    fields = group.fields()
+    
+    input_cols_raw = leader['input']['input_columns']
+    parsed_input_cols = parse_input_columns_with_limits([input_cols_raw] if isinstance(input_cols_raw, str) else input_cols_raw)
+    input_cols = [col_name for col_name, _ in parsed_input_cols]
+    
+    # Which members still need each row
+    def row_key(row):
+        return (row.get('rowid', 'NO_ROWID'), row.get('sha1', 'NO_SHA1'))
+    
+    needed = {}
+    for enrichment, strategy in group.members:
+        pending = results if overwrite else await run_db(
+            rows_needing, db_path, enrichment['name'], strategy.output_table, strategy.key_column, model, results
+        )
+        needed[enrichment['name']] = {row_key(row) for row in pending}
+    rows_to_process = [row for row in results if any(row_key(row) in keys for keys in needed.values())]
+    skipped_rows = [
+        {'rowid': row.get('rowid', 'NO_ROWID'), 'sha1': row.get('sha1', 'NO_SHA1'),
+         'original': "already processed (enrichment_responses)", 'updated': None}
+        for row in results if not any(row_key(row) in keys for keys in needed.values())
+    ]
+    
+    if not is_multi_model:
+        if skipped_rows:
+            print(f"⏭️  Skipping {len(skipped_rows)} rows (already have data)")
+        if rows_to_process:
+            print(f"🔄 Processing {len(rows_to_process)} rows with one request each for {len(group.names)} enrichments...")
+    
+    run_tracker = RunTracker(db_path, run_id, results) if run_id else None
+    if run_tracker:
+        for skipped in skipped_rows:
+            run_tracker.done(skipped, skipped=True)
+    for _ in skipped_rows:
+        observe_row(group.label, 'skipped')
+    
+    if not rows_to_process:
+        if not is_multi_model:
+            print("✅ All rows already processed!")
+        if run_tracker:
+            await asyncio.to_thread(run_tracker.finish, 'completed')
+        return skipped_rows
+    
+    semaphore = api_semaphore or AdaptiveLimiter(DEFAULT_API_SEMAPHORE_LIMIT)
+    db_semaphore = asyncio.Semaphore(DEFAULT_DB_SEMAPHORE_LIMIT)
+    write_buffer = EnrichmentWriteBuffer(db_path)
+    watch_write_buffer(write_buffer)
+    response_model = group.response_model()
+    
+    from .llm_providers.factory import get_llm_provider
+    llm_provider = get_llm_provider(model, config)
+    
+    async def process_and_save(row):
+        with call_context(sha1=row.get('sha1')), span('enrich.row'):
+            result = await process_row_structured(
+                row=row,
+                input_cols=input_cols,
+                parsed_input_cols=parsed_input_cols,
+                prompt=prompt,
+                model=model,
+                semaphore=semaphore,
+                pbar=pbar,
+                pydantic_model=response_model,
+                system_prompt=system_prompt,
+                truncate=truncate,
+                verbose=verbose,
+                provider=llm_provider,
+                prompt_layout=prompt_layout_for(leader, config),
+                streaming=streaming_for(leader, config)
+            )
+        
+        # Split the response back into each member's audit record and output row
+        input_text = result.pop('input_text', None)
+        parts = group.split(result.get('updated'))
+        for enrichment, strategy in group.members:
+            name = enrichment['name']
+            if row_key(row) not in needed[name]:
+                continue
+            part = parts[name]
+            raw_json = json.dumps(part if part is not None else {'error': result.get('error', 'Unknown error')},
+                                  ensure_ascii=False)
+            # enrichment_id is unique per record; the shared prefix ties the members of one call together
+            enrichment_id = f"{result['enrichment_id']}.{fields[name]}"
+            write_buffer.add_response(result['sha1'], name, raw_json, model, enrichment_id, prompt_ids[name],
+                                      result.get('full_prompt'), input_text=input_text)
+            if part:
+                key_value = result.get(strategy.key_column, result.get('sha1', 'NO_KEY'))
+                write_buffer.add_output(strategy.output_table, strategy.key_column, key_value, part,
+                                        enrichment_id, model)
+        
+        observe_row(group.label, 'failed' if result.get('error') else 'processed')
+        if run_tracker:
+            run_tracker.done(row, failed=bool(result.get('error')))
+        if write_buffer.should_flush() or (run_tracker and run_tracker.due()):
+            async with db_semaphore:
+                snapshot = run_tracker.snapshot() if run_tracker else None
+                await run_db(write_buffer.flush)
+                if run_tracker:
+                    await run_db(run_tracker.checkpoint, snapshot)
+        if recorder.pending(db_path) >= FLUSH_THRESHOLD:
+            async with db_semaphore:
+                await asyncio.to_thread(flush_call_records, db_path)
+        return result
+    
+    with call_context(db_path=db_path, run_id=run_id or str(uuid.uuid4()), enrichment_name=group.label,
+                      retry_budget=RetryBudget()):
+        async with run_checkpointer(db_path, on_size=lambda size: _show_wal_size(pbar, size)):
+            status = 'interrupted'
+            try:
+                processed_results = await asyncio.gather(*(process_and_save(row) for row in rows_to_process))
+                status = 'completed'
+            except Exception:
+                status = 'failed'
+                raise
+            finally:
+                snapshot = run_tracker.snapshot() if run_tracker else None
+                await run_db(write_buffer.flush)
+                await asyncio.to_thread(flush_call_records, db_path)
+                if run_tracker:
+                    await asyncio.to_thread(run_tracker.finish, status, snapshot)
+                await _release_prompt_caches(llm_provider)
+    
+    return list(processed_results) + skipped_rows
+
 async def process_translation(row: Dict, input_cols: List[Tuple[str, Optional[slice]]], prompt: str,
                             model: str, semaphore: asyncio.Semaphore, pbar: tqdm,
                             output_cols: List[str], output_schema: Optional[Type[BaseModel]] = None,
                             system_prompt: str = None, chunk_size: int = 3, truncate: bool = False):
-    async with semaphore:
+    async with acquire_slot(semaphore):
         sha1 = row.get('sha1', 'NO_SHA1')
         # Generate a unique enrichment_id for this specific LLM call
         row_enrichment_id = str(uuid.uuid4())
@@ -1077,36 +1524,21 @@ async def process_translation(row: Dict, input_cols: List[Tuple[str, Optional[sl
                                              for i, line in enumerate(chunk_lines, start=chunk_start))
                     
                     try:
-                        response = await openai_client.beta.chat.completions.parse(
+                        response = await call_with_retries(lambda: openai_client.beta.chat.completions.parse(
                             model=model,
                             messages=[
                                 {"role": "system", "content": "You are a precise Chinese to English translator."},
                                 {"role": "user", "content": f"Translate these numbered lines:\n\n{numbered_chunk}"}
                             ],
                             response_format=ChunkTranslation  # Dynamic model specific to this chunk!
-                        )
+                        ), description="Chunk translation")
                         
                         result = response.choices[0].message.parsed
                         return dict(result)  # Convert to regular dict for storage
                         
                     except Exception as e:
-                        logging.warning(f"Chunk translation failed, retrying once: {e}")
-                        # Retry once with a small delay
-                        try:
-                            await asyncio.sleep(2)
-                            response = await openai_client.beta.chat.completions.parse(
-                                model=model,
-                                messages=[
-                                    {"role": "system", "content": "You are a precise Chinese to English translator."},
-                                    {"role": "user", "content": f"Translate these numbered lines:\n\n{numbered_chunk}"}
-                                ],
-                                response_format=ChunkTranslation
-                            )
-                            result = response.choices[0].message.parsed
-                            return dict(result)
-                        except Exception as retry_e:
-                            logging.error(f"Chunk translation failed after retry: {retry_e}")
-                            return {str(i): "" for i in range(chunk_start, chunk_end)}
+                        logging.error(f"Chunk translation failed: {e}")
+                        return {str(i): "" for i in range(chunk_start, chunk_end)}
             
             # Process all chunks concurrently
             tasks = [process_chunk(i) for i in range(0, len(lines), chunk_size)]
@@ -11,9 +11,15 @@ class LLMProvider(Protocol):
         messages: List[Dict[str, str]],
         pydantic_model: Type[BaseModel],
         temperature: float = 0.0,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        cache_prefix: int = 0,
+        stream: bool = False
     ) -> BaseModel:
-        """Generate structured output using a Pydantic model."""
+        """Generate structured output using a Pydantic model.
+        
+        The first ``cache_prefix`` messages are identical across requests and may be served from a prompt cache.
+        With ``stream`` the response is streamed and validated field by field as it arrives.
+        """
         ...
     
     async def generate_text(
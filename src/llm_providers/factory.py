@@ -1,35 +1,73 @@
 """Factory for creating LLM providers."""
 
 import os
+import json
 import logging
-from typing import Union
+from typing import Any, Dict, Optional, Union
 from .openai_provider import OpenAIProvider
 from .gemini_provider import GeminiProvider
+from .pool import EndpointPool
+from ..llm.transport import replaying
 
 logger = logging.getLogger(__name__)
 
-def get_llm_provider(model: str) -> Union[OpenAIProvider, GeminiProvider]:
-    """Get the appropriate LLM provider for a model."""
-    
+# Endpoint pools are shared by every provider built from the same provider_pool config
+_pools: Dict[str, EndpointPool] = {}
+_default_pool_config: Optional[Dict[str, Any]] = None
+
+
+def configure_provider_pool(config: Optional[Dict[str, Any]]) -> None:
+    """Use ``config``'s provider_pool for providers created without a config."""
+    global _default_pool_config
+    _default_pool_config = (config or {}).get('provider_pool')
+
+
+def get_provider_pool(config: Optional[Dict[str, Any]] = None) -> Optional[EndpointPool]:
+    """The endpoint pool of a config (or the configured default), created on first use."""
+    pool_config = (config or {}).get('provider_pool') if config is not None else _default_pool_config
+    if not pool_config:
+        return None
+    key = json.dumps(pool_config, sort_keys=True, default=str)
+    if key not in _pools:
+        _pools[key] = EndpointPool.from_config(pool_config)
+        logger.debug(f"Created provider pool with {len(_pools[key].endpoints)} endpoints")
+    return _pools[key]
+
+
+def get_llm_provider(model: str, config: Optional[Dict[str, Any]] = None) -> Union[OpenAIProvider, GeminiProvider]:
+    """Get the appropriate LLM provider for a model.
+
+    Non-Gemini models are routed through the config's ``provider_pool`` when
+    one of its endpoints serves the model.
+    """
+
     # Determine provider based on model name
     if 'gemini' in model.lower():
         # Gemini model
         api_key = os.environ.get('GEMINI_API_KEY') or os.environ.get('GOOGLE_API_KEY')
+        if not api_key and replaying():
+            api_key = 'replay'  # answered from the cassette, never sent
         if not api_key:
             raise ValueError("GEMINI_API_KEY or GOOGLE_API_KEY environment variable is required for Gemini models")
-        
+
         logger.debug(f"Creating Gemini provider for model: {model}")
         return GeminiProvider(api_key=api_key, model=model)
-    
-    else:
-        # Default to OpenAI (includes gpt, claude via openai-compatible endpoints, etc.)
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required for OpenAI models")
-        
-        logger.debug(f"Creating OpenAI provider for model: {model}")
-        return OpenAIProvider(api_key=api_key, model=model)
+
+    pool = get_provider_pool(config)
+    if pool and pool.serves(model):
+        logger.debug(f"Creating pooled OpenAI-compatible provider for model: {model}")
+        return OpenAIProvider(api_key=None, model=model, pool=pool)
+
+    # Default to OpenAI (includes gpt, claude via openai-compatible endpoints, etc.)
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key and replaying():
+        api_key = 'replay'
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is required for OpenAI models")
+
+    logger.debug(f"Creating OpenAI provider for model: {model}")
+    return OpenAIProvider(api_key=api_key, model=model)
 
 def is_gemini_model(model: str) -> bool:
     """Check if a model is a Gemini model."""
-    return 'gemini' in model.lower()
\ No newline at end of file
+    return 'gemini' in model.lower()
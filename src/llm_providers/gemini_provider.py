@@ -1,38 +1,71 @@
 """Gemini provider implementation with structured output support."""
 
+import asyncio
+import hashlib
 import logging
 import os
-from typing import Dict, Any, Type, Optional, List
+import time
+from typing import Dict, Any, AsyncIterator, Type, Optional, List, Tuple
+import httpx
 from pydantic import BaseModel
 from google import genai
 
+from ..constants import MIN_CACHED_PREFIX_TOKENS, PROMPT_CACHE_TTL_SECONDS
+from ..llm.token_utils import approximate_tokens, get_model_context_limit
+from ..llm.telemetry import track_call
+from ..llm.retry import ContentFilteredError, InvalidResponseError, call_with_retries
+from ..llm.streaming import read_structured_stream
+from ..llm.transport import llm_transport
+
 logger = logging.getLogger(__name__)
 
+# finish_reason values meaning the answer was withheld, not cut short
+BLOCKED_FINISH_REASONS = ('SAFETY', 'RECITATION', 'BLOCKLIST', 'PROHIBITED_CONTENT', 'SPII')
+
 class GeminiProvider:
     """Google Gemini LLM provider."""
     
     def __init__(self, api_key: str, model: str):
-        self.client = genai.Client(api_key=api_key)
+        transport = llm_transport()
+        if transport:
+            # Recorded or replayed traffic (llm_transport in the config)
+            self.client = genai.Client(api_key=api_key, http_options={
+                'httpx_client': httpx.Client(transport=transport),
+                'httpx_async_client': httpx.AsyncClient(transport=transport),
+            })
+        else:
+            self.client = genai.Client(api_key=api_key)
         self.model = model
-        
-        # Model context limits
-        self.context_limits = {
-            "gemini-1.5-flash": 1048576,  # 1M tokens
-            "gemini-1.5-flash-8b": 1048576,  # 1M tokens
-            "gemini-1.5-pro": 2097152,  # 2M tokens
-            "gemini-2.0-flash": 1048576,  # 1M tokens
-            "gemini-2.5-flash": 1048576,  # 1M tokens
-            "gemini-pro": 32768,  # 32K tokens
-        }
+        # Context caches for stable prompt prefixes: prefix hash -> (cache name or None, created at)
+        self._caches: Dict[str, Tuple[Optional[str], float]] = {}
+        self._cache_lock = asyncio.Lock()
     
     async def generate_structured(
         self,
         messages: List[Dict[str, str]],
         pydantic_model: Type[BaseModel],
         temperature: float = 0.0,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        cache_prefix: int = 0,
+        stream: bool = False
     ) -> BaseModel:
-        """Generate structured output using Gemini's response_schema."""
+        """Generate structured output using Gemini's response_schema.
+        
+        The first ``cache_prefix`` messages are sent through a context cache
+        (created on first use) when Gemini accepts them as one. With ``stream``
+        the response is read with the async streaming API and checked field by
+        field as it arrives (see ``llm.streaming``).
+        """
+        config = {
+            "response_mime_type": "application/json",
+            "response_schema": pydantic_model,
+            "temperature": temperature,
+            "max_output_tokens": max_tokens
+        }
+        cached_content = await self._cached_content(self._format_messages(messages[:cache_prefix])) if cache_prefix else None
+        if cached_content:
+            config["cached_content"] = cached_content
+            messages = messages[cache_prefix:]
         
         # Convert messages to Gemini format
         content = self._format_messages(messages)
@@ -40,41 +73,66 @@ class GeminiProvider:
         logger.debug(f"Gemini structured output with model: {pydantic_model.__name__}")
         logger.debug(f"Schema fields: {list(pydantic_model.model_fields.keys())}")
         
+        async def request() -> BaseModel:
+            with track_call('gemini', self.model, content) as record:
+                if stream:
+                    return await self._stream_structured(record, content, config, pydantic_model)
+                response = await asyncio.to_thread(
+                    self.client.models.generate_content,
+                    model=self.model,
+                    contents=content,
+                    config=config
+                )
+                self._record_usage(record, response)
+                self._check_blocked(response)
+                
+                # Use the parsed response directly - EXACTLY like the official example
+                if hasattr(response, 'parsed') and response.parsed:
+                    logger.debug(f"Gemini structured output success using .parsed")
+                    return response.parsed
+                
+                # Fallback to text parsing if needed
+                if response.text:
+                    import json
+                    data = json.loads(response.text)
+                    result = pydantic_model(**data)
+                    logger.debug(f"Gemini structured output success via JSON parsing")
+                    return result
+                
+                raise InvalidResponseError("Gemini returned empty response")
+        
         try:
-            # Generate with structured output - EXACTLY like the official example
-            # But make it properly async!
-            import asyncio
-            response = await asyncio.to_thread(
-                self.client.models.generate_content,
-                model=self.model,
-                contents=content,
-                config={
-                    "response_mime_type": "application/json",
-                    "response_schema": pydantic_model,
-                    "temperature": temperature,
-                    "max_output_tokens": max_tokens
-                }
-            )
-            
-            # Use the parsed response directly - EXACTLY like the official example
-            if hasattr(response, 'parsed') and response.parsed:
-                logger.debug(f"Gemini structured output success using .parsed")
-                return response.parsed
-            
-            # Fallback to text parsing if needed
-            if response.text:
-                import json
-                data = json.loads(response.text)
-                result = pydantic_model(**data)
-                logger.debug(f"Gemini structured output success via JSON parsing")
-                return result
-            
-            raise ValueError("Gemini returned empty response")
-            
+            return await call_with_retries(request, description=f"Gemini {self.model} request",
+                                           model=self.model)
         except Exception as e:
             logger.error(f"Gemini structured output error: {e}")
             raise
     
+    async def _stream_structured(self, record, content: str, config: Dict[str, Any],
+                                 pydantic_model: Type[BaseModel]) -> BaseModel:
+        """One streamed structured request; an early exit closes the stream."""
+        chunks = await self.client.aio.models.generate_content_stream(
+            model=self.model,
+            contents=content,
+            config=config
+        )
+        last = None
+        
+        async def text() -> AsyncIterator[str]:
+            nonlocal last
+            async for chunk in chunks:
+                self._check_blocked(chunk)
+                last = chunk
+                yield chunk.text
+        
+        try:
+            return await read_structured_stream(text(), pydantic_model, record)
+        finally:
+            await chunks.aclose()
+            if last is not None:
+                # Usage is reported on the final chunk
+                self._record_usage(record, last)
+    
     async def generate_text(
         self,
         messages: List[Dict[str, str]],
@@ -84,18 +142,85 @@ class GeminiProvider:
         """Generate unstructured text output."""
         content = self._format_messages(messages)
         
-        import asyncio
-        response = await asyncio.to_thread(
-            self.client.models.generate_content,
-            model=self.model,
-            contents=content,
-            config={
-                "temperature": temperature,
-                "max_output_tokens": max_tokens
-            }
-        )
+        async def request() -> str:
+            with track_call('gemini', self.model, content) as record:
+                response = await asyncio.to_thread(
+                    self.client.models.generate_content,
+                    model=self.model,
+                    contents=content,
+                    config={
+                        "temperature": temperature,
+                        "max_output_tokens": max_tokens
+                    }
+                )
+                self._record_usage(record, response)
+                self._check_blocked(response)
+            return response.text
         
-        return response.text
+        return await call_with_retries(request, description=f"Gemini {self.model} request",
+                                       model=self.model)
+    
+    async def _cached_content(self, prefix: str) -> Optional[str]:
+        """Name of a context cache holding ``prefix``, or None if Gemini won't cache it."""
+        key = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+        async with self._cache_lock:
+            if key in self._caches:
+                name, created = self._caches[key]
+                # Replace caches shortly before they expire
+                if name is None or time.monotonic() - created < PROMPT_CACHE_TTL_SECONDS * 0.9:
+                    return name
+            name = None
+            if approximate_tokens(prefix) >= MIN_CACHED_PREFIX_TOKENS:
+                try:
+                    cache = await asyncio.to_thread(
+                        self.client.caches.create,
+                        model=self.model,
+                        config={
+                            "contents": [prefix],
+                            "ttl": f"{PROMPT_CACHE_TTL_SECONDS}s",
+                            "display_name": f"doctrail-{key[:12]}"
+                        }
+                    )
+                    name = cache.name
+                    logger.info(f"Created Gemini context cache {name} for the prompt prefix")
+                except Exception as e:
+                    logger.warning(f"Gemini context caching unavailable for {self.model}, sending full prompts: {e}")
+            self._caches[key] = (name, time.monotonic())
+            return name
+    
+    async def release_caches(self) -> None:
+        """Delete the context caches this provider created (they would otherwise live until their TTL)."""
+        async with self._cache_lock:
+            names = [name for name, _ in self._caches.values() if name]
+            self._caches.clear()
+        for name in names:
+            try:
+                await asyncio.to_thread(self.client.caches.delete, name=name)
+            except Exception as e:
+                logger.debug(f"Could not delete Gemini context cache {name}: {e}")
+    
+    @staticmethod
+    def _check_blocked(response) -> None:
+        """Raise ContentFilteredError if Gemini blocked the prompt or the answer."""
+        feedback = getattr(response, 'prompt_feedback', None)
+        if getattr(feedback, 'block_reason', None):
+            raise ContentFilteredError(f"Gemini blocked the prompt: {feedback.block_reason}")
+        for candidate in getattr(response, 'candidates', None) or []:
+            reason = str(getattr(candidate, 'finish_reason', '') or '')
+            if any(blocked in reason for blocked in BLOCKED_FINISH_REASONS):
+                raise ContentFilteredError(f"Gemini stopped the response: {reason}")
+    
+    @staticmethod
+    def _record_usage(record, response) -> None:
+        # The SDK call is blocking, so time to first byte is not observable here
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        record.set_usage(
+            getattr(usage, 'prompt_token_count', None),
+            getattr(usage, 'candidates_token_count', None),
+            getattr(usage, 'cached_content_token_count', None)
+        )
     
     def _format_messages(self, messages: List[Dict[str, str]]) -> str:
         """Convert OpenAI-style messages to Gemini format."""
@@ -121,11 +246,10 @@ class GeminiProvider:
     
     def count_tokens(self, text: str) -> int:
         """Count tokens for Gemini models."""
-        # Gemini uses roughly 1 token per 4 characters as an approximation
-        # This is not exact but provides a reasonable estimate
-        return len(text) // 4
+        # No local Gemini tokenizer; use the calibrated chars-per-token approximation
+        return approximate_tokens(text)
     
     @property
     def max_context_tokens(self) -> int:
         """Maximum context window size."""
-        return self.context_limits.get(self.model, 1048576)  # Default to 1M
\ No newline at end of file
+        return get_model_context_limit(self.model)
@@ -1,84 +1,145 @@
 """OpenAI provider implementation."""
 
+import hashlib
 import logging
-from typing import Dict, Any, Type, Optional, List
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Type, Optional, List, Tuple
 from pydantic import BaseModel
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
-try:
-    import tiktoken
-    TIKTOKEN_AVAILABLE = True
-except ImportError:
-    TIKTOKEN_AVAILABLE = False
-    logging.warning("tiktoken not available - token counting will use approximation")
+from ..llm.token_utils import count_tokens, get_model_context_limit
+from ..llm.telemetry import track_call, on_response_headers
+from ..llm.retry import ContentFilteredError, InvalidResponseError, call_with_retries
+from ..llm.streaming import read_structured_stream
+from ..llm.transport import async_http_client
+from .pool import EndpointPool
 
 logger = logging.getLogger(__name__)
 
 class OpenAIProvider:
-    """OpenAI LLM provider."""
+    """OpenAI LLM provider.
     
-    def __init__(self, api_key: str, model: str):
-        self.client = AsyncOpenAI(api_key=api_key)
+    With an ``EndpointPool`` each request is sent through an endpoint borrowed
+    from the pool instead of the single client.
+    """
+    
+    def __init__(self, api_key: Optional[str], model: str, pool: Optional[EndpointPool] = None):
+        # Response hook stamps time-to-first-byte on the active call record; retries
+        # are made by call_with_retries (so each attempt is classified and recorded), not the SDK
+        hooks = {'response': [on_response_headers]}
+        self.client = None if pool else AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=async_http_client(event_hooks=hooks) or DefaultAsyncHttpxClient(event_hooks=hooks)
+        )
         self.model = model
-        self.encoding = None
-        
-        # Model context limits
-        self.context_limits = {
-            "gpt-4": 8192,
-            "gpt-4-32k": 32768,
-            "gpt-4-turbo": 128000,
-            "gpt-4-turbo-preview": 128000,
-            "gpt-4o": 128000,
-            "gpt-4o-mini": 128000,
-            "gpt-3.5-turbo": 16385,
-            "gpt-3.5-turbo-16k": 16385,
-        }
+        self.pool = pool
+    
+    @asynccontextmanager
+    async def _client_for_request(self) -> AsyncIterator[Tuple[AsyncOpenAI, str]]:
+        """(client, provider label for telemetry) to send one request with."""
+        if self.pool is None:
+            yield self.client, 'openai'
+            return
+        async with self.pool.acquire(self.model) as endpoint:
+            yield endpoint.client, f"openai/{endpoint.name}"
+    
+    @staticmethod
+    def _prompt_text(messages: List[Dict[str, str]]) -> str:
+        return "\n".join(str(m.get('content', '')) for m in messages)
+    
+    @staticmethod
+    def _cache_options(messages: List[Dict[str, str]], cache_prefix: int) -> Dict[str, Any]:
+        """OpenAI caches long prompt prefixes automatically; a key per prefix keeps them on the same cache."""
+        if not cache_prefix:
+            return {}
+        prefix = OpenAIProvider._prompt_text(messages[:cache_prefix])
+        return {'prompt_cache_key': 'doctrail-' + hashlib.sha256(prefix.encode('utf-8')).hexdigest()[:24]}
+    
+    @staticmethod
+    def _record_usage(record, response) -> None:
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        record.set_usage(usage.prompt_tokens, usage.completion_tokens, getattr(details, 'cached_tokens', None))
     
     async def generate_structured(
         self,
         messages: List[Dict[str, str]],
         pydantic_model: Type[BaseModel],
         temperature: float = 0.0,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        cache_prefix: int = 0,
+        stream: bool = False
     ) -> BaseModel:
-        """Generate structured output using OpenAI's response_format."""
+        """Generate structured output using OpenAI's response_format.
+        
+        ``cache_prefix`` is the number of leading messages shared by every request of the run.
+        With ``stream`` the response is read as it is generated and checked field by field
+        (see ``llm.streaming``), so an invalid answer is abandoned early.
+        Transient failures are retried by ``call_with_retries``; refusals raise ``ContentFilteredError``.
+        """
         
         # Debug: Check what we're sending for structured output
         logger.debug(f"OpenAI structured output with model: {pydantic_model.__name__}")
         logger.debug(f"Schema fields: {list(pydantic_model.model_fields.keys())}")
         
+        async def request() -> BaseModel:
+            async with self._client_for_request() as (client, label):
+                with track_call(label, self.model, self._prompt_text(messages)) as record:
+                    if stream:
+                        return await self._stream_structured(client, record, messages, pydantic_model,
+                                                             temperature, max_tokens, cache_prefix)
+                    response = await client.beta.chat.completions.parse(
+                        model=self.model,
+                        messages=messages,
+                        response_format=pydantic_model,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        **self._cache_options(messages, cache_prefix)
+                    )
+                    self._record_usage(record, response)
+                    message = response.choices[0].message
+                    if getattr(message, 'refusal', None):
+                        raise ContentFilteredError(f"OpenAI refused the request: {message.refusal}")
+                    if message.parsed is None:
+                        raise InvalidResponseError("OpenAI structured output returned None")
+            return message.parsed
+        
         try:
-            response = await self.client.beta.chat.completions.parse(
-                model=self.model,
-                messages=messages,
-                response_format=pydantic_model,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            
-            parsed_result = response.choices[0].message.parsed
-            
-            if parsed_result is None:
-                logger.error("OpenAI returned None for structured output")
-                raise ValueError("OpenAI structured output returned None")
-            
-            logger.debug(f"OpenAI structured output success: {type(parsed_result)}")
-            return parsed_result
-            
+            parsed_result = await call_with_retries(request, description=f"OpenAI {self.model} request",
+                                                    model=self.model)
         except Exception as e:
             logger.error(f"OpenAI structured output error: {e}")
-            # Fall back to text generation + manual parsing
-            text_response = await self.generate_text(messages, temperature, max_tokens)
+            raise
+        
+        logger.debug(f"OpenAI structured output success: {type(parsed_result)}")
+        return parsed_result
+    
+    async def _stream_structured(self, client: AsyncOpenAI, record, messages: List[Dict[str, str]],
+                                 pydantic_model: Type[BaseModel], temperature: float,
+                                 max_tokens: Optional[int], cache_prefix: int) -> BaseModel:
+        """One streamed structured request; leaving the block early closes the connection."""
+        async with client.beta.chat.completions.stream(
+            model=self.model,
+            messages=messages,
+            response_format=pydantic_model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream_options={'include_usage': True},
+            **self._cache_options(messages, cache_prefix)
+        ) as events:
+            async def content() -> AsyncIterator[str]:
+                async for event in events:
+                    if event.type == 'content.delta':
+                        yield event.delta
+                    elif event.type == 'refusal.done':
+                        raise ContentFilteredError(f"OpenAI refused the request: {event.refusal}")
             
-            try:
-                # Try to parse as JSON
-                import json
-                data = json.loads(text_response)
-                return pydantic_model(**data)
-            except:
-                # Last resort - create empty model
-                logger.error(f"Failed to parse OpenAI response as JSON: {text_response[:200]}")
-                raise
+            parsed = await read_structured_stream(content(), pydantic_model, record)
+            self._record_usage(record, await events.get_final_completion())
+        return parsed
     
     async def generate_text(
         self,
@@ -87,31 +148,26 @@ class OpenAIProvider:
         max_tokens: Optional[int] = None
     ) -> str:
         """Generate unstructured text output."""
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        return response.choices[0].message.content
+        async def request() -> str:
+            async with self._client_for_request() as (client, label):
+                with track_call(label, self.model, self._prompt_text(messages)) as record:
+                    response = await client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+                    self._record_usage(record, response)
+            return response.choices[0].message.content
+        
+        return await call_with_retries(request, description=f"OpenAI {self.model} request",
+                                       model=self.model)
     
     def count_tokens(self, text: str) -> int:
-        """Count tokens using tiktoken or fallback to approximation."""
-        if not TIKTOKEN_AVAILABLE:
-            # Fallback: approximately 4 characters per token
-            return len(text) // 4
-            
-        if self.encoding is None:
-            try:
-                # Try to get the exact encoding for the model
-                self.encoding = tiktoken.encoding_for_model(self.model)
-            except KeyError:
-                # Default to cl100k_base for newer models
-                self.encoding = tiktoken.get_encoding("cl100k_base")
-        
-        return len(self.encoding.encode(text))
+        """Count tokens with the shared cached tiktoken encoder."""
+        return count_tokens(text, self.model)
     
     @property
     def max_context_tokens(self) -> int:
         """Maximum context window size."""
-        return self.context_limits.get(self.model, 8192)
\ No newline at end of file
+        return get_model_context_limit(self.model)
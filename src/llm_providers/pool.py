@@ -0,0 +1,252 @@
+"""
+Pool of OpenAI-compatible endpoints (``provider_pool`` in the config).
+
+Several API keys and OpenAI-compatible gateways (vLLM and the like) can serve
+the same models. Each request borrows an endpoint from the pool:
+
+* ``least_loaded`` routing picks the endpoint with the fewest requests in
+  flight relative to its weight; ``weighted`` routing is smooth weighted
+  round-robin.
+* Each endpoint can cap its concurrent requests (``max_concurrency``) and its
+  request rate (``requests_per_minute``); when every endpoint is at a cap the
+  request waits for the first one to free up.
+* An endpoint that fails ``EJECT_AFTER_FAILURES`` times in a row (timeouts,
+  5xx, authentication errors) is ejected for a while. Before it takes traffic
+  again, a health check (``GET /models``) must succeed; each failed check
+  doubles the ejection time. A rate-limited endpoint is only rested for its
+  ``Retry-After``.
+
+Endpoints that list ``models`` only serve those models; the others serve any
+model that is not a Gemini model.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from ..constants import PROVIDER_POOL_ROUTING
+from ..llm.retry import RATE_LIMIT, SERVER, TIMEOUT, classify_error, retry_after
+from ..llm.telemetry import on_response_headers
+from ..llm.transport import async_http_client
+
+logger = logging.getLogger(__name__)
+
+EJECT_AFTER_FAILURES = 3
+EJECT_SECONDS = 30.0
+MAX_EJECT_SECONDS = 600.0
+# Longest a request waits before re-checking the pool, even with nothing scheduled to change
+MAX_WAIT_SECONDS = 1.0
+
+
+@dataclass
+class Endpoint:
+    """One API key / base URL pair and its live state."""
+    name: str
+    api_key: str
+    base_url: Optional[str] = None
+    weight: float = 1.0
+    max_concurrency: Optional[int] = None
+    requests_per_minute: Optional[float] = None
+    models: Optional[List[str]] = None
+    in_flight: int = 0
+    failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+    needs_check: bool = False
+    current_weight: float = 0.0  # smooth weighted round-robin state
+    _sent: Deque[float] = field(default_factory=deque, repr=False)
+    _client: Optional[AsyncOpenAI] = field(default=None, repr=False)
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            # Retries are made by call_with_retries, which may pick another endpoint
+            hooks = {'response': [on_response_headers]}
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                http_client=async_http_client(event_hooks=hooks) or DefaultAsyncHttpxClient(event_hooks=hooks)
+            )
+        return self._client
+
+    def serves(self, model: str) -> bool:
+        return not self.models or model in self.models
+
+    def available(self, now: float) -> bool:
+        """Healthy, under its concurrency cap and under its rate limit."""
+        if now < self.ejected_until:
+            return False
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return False
+        return self._rate_wait(now) == 0
+
+    def _rate_wait(self, now: float) -> float:
+        """Seconds until the rate limit allows another request."""
+        if not self.requests_per_minute:
+            return 0.0
+        while self._sent and now - self._sent[0] >= 60:
+            self._sent.popleft()
+        if len(self._sent) < self.requests_per_minute:
+            return 0.0
+        return 60 - (now - self._sent[0])
+
+
+class EndpointPool:
+    """Routes requests across endpoints; see the module docstring."""
+
+    def __init__(self, endpoints: List[Endpoint], routing: str = PROVIDER_POOL_ROUTING[0]):
+        if routing not in PROVIDER_POOL_ROUTING:
+            raise ValueError(f"provider_pool.routing must be one of: {', '.join(PROVIDER_POOL_ROUTING)}")
+        if not endpoints:
+            raise ValueError("provider_pool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.routing = routing
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @classmethod
+    def from_config(cls, pool_config: Dict[str, Any]) -> 'EndpointPool':
+        endpoints = []
+        for i, spec in enumerate(pool_config.get('endpoints') or []):
+            name = spec.get('name') or f"endpoint-{i + 1}"
+            api_key = spec.get('api_key')
+            if api_key is None:
+                env = spec.get('api_key_env', 'OPENAI_API_KEY')
+                api_key = os.environ.get(env)
+                if not api_key:
+                    raise ValueError(f"provider_pool endpoint '{name}': environment variable {env} is not set")
+            endpoints.append(Endpoint(
+                name=name,
+                api_key=api_key,
+                base_url=spec.get('base_url'),
+                weight=float(spec.get('weight', 1)),
+                max_concurrency=spec.get('max_concurrency'),
+                requests_per_minute=spec.get('requests_per_minute'),
+                models=spec.get('models'),
+            ))
+        return cls(endpoints, pool_config.get('routing', PROVIDER_POOL_ROUTING[0]))
+
+    def serves(self, model: str) -> bool:
+        return any(endpoint.serves(model) for endpoint in self.endpoints)
+
+    @asynccontextmanager
+    async def acquire(self, model: str) -> AsyncIterator[Endpoint]:
+        """Borrow an endpoint for one request; failures inside are reported to its health state."""
+        endpoint = await self._choose(model)
+        try:
+            yield endpoint
+        except Exception as e:
+            self._failed(endpoint, e)
+            raise
+        else:
+            endpoint.failures = 0
+            endpoint.ejections = 0
+        finally:
+            endpoint.in_flight -= 1
+            self._wake()
+
+    async def _choose(self, model: str) -> Endpoint:
+        candidates = [e for e in self.endpoints if e.serves(model)]
+        if not candidates:
+            raise ValueError(f"No provider_pool endpoint serves model {model}")
+        while True:
+            now = time.monotonic()
+            # Ejected endpoints whose time is up must pass a health check first
+            for endpoint in candidates:
+                if endpoint.needs_check and now >= endpoint.ejected_until:
+                    await self._health_check(endpoint)
+            now = time.monotonic()
+            ready = [e for e in candidates if e.available(now)]
+            if ready:
+                endpoint = self._pick(ready)
+                endpoint.in_flight += 1
+                if endpoint.requests_per_minute:
+                    endpoint._sent.append(now)
+                return endpoint
+            # Wait for a request to finish, or for the earliest rate-limit / ejection window to pass
+            waits = [e.ejected_until - now for e in candidates if now < e.ejected_until < float('inf')]
+            waits += [e._rate_wait(now) for e in candidates if e._rate_wait(now) > 0]
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout=min(waits + [MAX_WAIT_SECONDS]))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def _pick(self, ready: List[Endpoint]) -> Endpoint:
+        if self.routing == 'least_loaded':
+            return min(ready, key=lambda e: ((e.in_flight + 1) / e.weight, -e.weight))
+        # Smooth weighted round-robin (as in nginx): spreads picks in proportion to weight
+        total = sum(e.weight for e in ready)
+        for endpoint in ready:
+            endpoint.current_weight += endpoint.weight
+        chosen = max(ready, key=lambda e: e.current_weight)
+        chosen.current_weight -= total
+        return chosen
+
+    def _failed(self, endpoint: Endpoint, error: Exception) -> None:
+        if time.monotonic() < endpoint.ejected_until:
+            return  # a request sent before the endpoint was ejected
+        kind = classify_error(error)
+        if kind == RATE_LIMIT:
+            # The key is fine, just busy: rest it for as long as the provider asks
+            endpoint.ejected_until = max(endpoint.ejected_until, time.monotonic() + (retry_after(error) or 1.0))
+            return
+        if kind not in (TIMEOUT, SERVER) and getattr(error, 'status_code', None) not in (401, 403):
+            return  # a bad request or an unparseable answer says nothing about the endpoint
+        endpoint.failures += 1
+        if endpoint.failures >= EJECT_AFTER_FAILURES:
+            self._eject(endpoint, f"{endpoint.failures} failures in a row ({str(error)[:100]})")
+
+    def _eject(self, endpoint: Endpoint, reason: str) -> None:
+        seconds = min(MAX_EJECT_SECONDS, EJECT_SECONDS * 2 ** endpoint.ejections)
+        endpoint.ejections += 1
+        endpoint.failures = 0
+        endpoint.ejected_until = time.monotonic() + seconds
+        endpoint.needs_check = True
+        logger.warning(f"Provider endpoint '{endpoint.name}' ejected for {seconds:.0f}s: {reason}")
+        # Waiters recompute how long to sleep now that the endpoint has a finite ejection window
+        self._wake()
+
+    async def _health_check(self, endpoint: Endpoint) -> None:
+        endpoint.needs_check = False
+        endpoint.ejected_until = float('inf')  # no traffic while the check runs
+        try:
+            await endpoint.client.models.list()
+        except Exception as e:
+            self._eject(endpoint, f"health check failed ({str(e)[:100]})")
+        else:
+            endpoint.ejected_until = 0.0
+            logger.info(f"Provider endpoint '{endpoint.name}' passed its health check and is back in the pool")
+        finally:
+            if endpoint.ejected_until == float('inf'):
+                # Cancelled mid-check: leave the check due so the next request runs it
+                endpoint.ejected_until = 0.0
+                endpoint.needs_check = True
+            self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """Current state of each endpoint (for logs and diagnostics)."""
+        now = time.monotonic()
+        return [{
+            'name': e.name,
+            'in_flight': e.in_flight,
+            'ejected_for': max(0.0, e.ejected_until - now),
+            'failures': e.failures,
+        } for e in self.endpoints]
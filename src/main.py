@@ -7,6 +7,7 @@ import tempfile
 import platform
 import socket
 import re
+import itertools
 
 import click
 import yaml
@@ -15,13 +16,26 @@ from typing import List, Optional, Dict
 from .constants import (
     SPINNER_CHARS, ERROR_NO_ENRICHMENTS, ERROR_NO_DATABASE,
     ERROR_ENRICHMENT_NOT_FOUND, DEFAULT_TABLE_NAME, DEFAULT_MODEL,
-    LOG_FILE_PATH, SUCCESS_ENRICHMENT
+    LOG_FILE_PATH, SUCCESS_ENRICHMENT, DEFAULT_API_SEMAPHORE_LIMIT, HEDGE_MAX_ROWS
 )
 from .db_operations import (
-    get_db_connection, ensure_output_table, ensure_output_column, execute_query, execute_query_optimized
+    get_db_connection, ensure_output_table, ensure_output_column, execute_query, execute_query_optimized,
+    split_limit
 )
-from .llm_operations import process_enrichment
-from .core_utils import load_pydantic_model, parse_input_cols, load_config
+from .enrichment_runs import query_hash, start_run
+from .enrichment_scheduler import EnrichmentScheduler, SharedRowSource
+from .llm.concurrency import AdaptiveLimiter
+from .llm.hedging import HedgePolicy
+from .llm.telemetry import call_context
+from .llm.transport import configure_llm_transport
+from .metrics import configure_metrics, watch_limiter, watch_pool, watch_wal
+from .llm_providers.factory import configure_provider_pool, get_provider_pool
+from .enrichment_fusion import plan_fusion, rows_needing
+from .wal_checkpoint import run_checkpointer
+from .storage_layout import table_exists
+from .profiling import TIMINGS_FORMATS, RunProfiler, format_timings, start_timings, stop_timings
+from .llm_operations import process_enrichment, process_fused_enrichment, load_enrichment_prompt, prompt_layout_for
+from .core_utils import load_pydantic_model, parse_input_cols, parse_input_columns_with_limits, load_config
 from .utils.logging_config import setup_logging
 from tqdm import tqdm
 import threading
@@ -31,7 +45,7 @@ from datetime import datetime
 from .ingest import process_ingest
 from .plugins.zotero_ingester import process_zotero_ingest
 from .utils.dependency_check import verify_dependencies
-from .utils.cost_estimation import estimate_enrichment_cost, format_cost_estimate, should_confirm_cost, validate_model, get_supported_models, get_models_with_structured_output
+from .utils.cost_estimation import estimate_selection_cost, format_cost_estimate, should_confirm_cost, validate_model, get_supported_models, get_models_with_structured_output
 from .utils.progress import create_progress_bar, SpinnerTqdm
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
@@ -40,8 +54,15 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 @click.group(context_settings=CONTEXT_SETTINGS, invoke_without_command=True)
 @click.option('--skip-requirements', is_flag=True, help='Skip system requirements check')
+@click.option('--timings', is_flag=True, help='Time each stage (query, templating, API, validation, writes) and print a report')
+@click.option('--timings-output', type=click.Path(dir_okay=False),
+              help='Also write the stage timings to this file (implies --timings)')
+@click.option('--timings-format', type=click.Choice(TIMINGS_FORMATS), default='json', show_default=True,
+              help='Format of --timings-output: a JSON report, or every span as a Chrome trace')
+@click.option('--profile', 'profile_path', type=click.Path(dir_okay=False),
+              help='Profile the whole run to this file (pyinstrument if installed, otherwise cProfile)')
 @click.pass_context
-def cli(ctx, skip_requirements):
+def cli(ctx, skip_requirements, timings, timings_output, timings_format, profile_path):
     """SQLite database enrichment tool."""
     # Store skip_requirements in context for subcommands
     ctx.ensure_object(dict)
@@ -51,6 +72,23 @@ def cli(ctx, skip_requirements):
     if ctx.invoked_subcommand is None:
         click.echo(ctx.get_help())
         ctx.exit(0)
+    
+    if timings or timings_output:
+        start_timings(trace=bool(timings_output) and timings_format == 'chrome')
+        ctx.call_on_close(lambda: _report_timings(timings_output, timings_format))
+    if profile_path:
+        profiler = RunProfiler(profile_path)
+        profiler.start()
+        ctx.call_on_close(lambda: click.echo(f"🔬 Profile ({profiler.engine}) written to {profiler.stop()}"))
+
+def _report_timings(output: Optional[str], fmt: str) -> None:
+    timer = stop_timings()
+    if timer is None:
+        return
+    click.echo("\n" + format_timings(timer.report()))
+    if output:
+        timer.write(output, fmt)
+        click.echo(f"📝 Stage timings written to {output}")
 
 def show_main_help():
     """Show the main help message."""
@@ -135,12 +173,22 @@ Run 'doctrail.py COMMAND --help' for more information on a command.
 @click.option('--truncate', is_flag=True, help='Truncate long inputs to fit model context window instead of failing')
 @click.option('--skip-cost-check', is_flag=True, help='Skip cost estimation and confirmation')
 @click.option('--cost-threshold', type=float, default=5.0, help='Cost threshold for confirmation prompt (default: $5.00)')
+@click.option('--stats', is_flag=True, help='Show recorded throughput, latency percentiles and cost per 1k documents for these enrichments, then exit')
+@click.option('--resume', 'resume_run', help='Continue an interrupted run (id or prefix, see "doctrail db runs") after its last checkpointed row')
+@click.option('--fuse', is_flag=True, help='Answer enrichments that read the same rows and columns with one request per row')
+@click.option('--hedge', is_flag=True, help=f'Resend requests slower than the model\'s p95 latency and keep the first answer (runs of up to {HEDGE_MAX_ROWS} rows)')
+@click.option('--record-llm', 'record_llm', metavar='FILE', help='Record LLM responses to a cassette file for offline replay')
+@click.option('--replay-llm', 'replay_llm', metavar='FILE', help='Answer LLM requests from a recorded cassette file instead of the API')
+@click.option('--metrics-port', type=int, help='Serve Prometheus metrics at http://127.0.0.1:PORT/metrics while the run lasts')
+@click.option('--metrics-file', metavar='FILE', help='Rewrite Prometheus metrics to FILE periodically (node_exporter textfile collector)')
 @click.pass_context
 def enrich(ctx, config: str, enrichments: tuple, limit: Optional[int], overwrite: bool, 
         verbose: bool, log_updates: bool, export: bool, output_dir: str, 
         formats: str, table: Optional[str], model: Optional[str], 
         db_path: Optional[str], batch_size: Optional[int], rowid: Optional[int],
-        sha1: Optional[str], truncate: bool, skip_cost_check: bool, cost_threshold: float):
+        sha1: Optional[str], truncate: bool, skip_cost_check: bool, cost_threshold: float, stats: bool,
+        resume_run: Optional[str], fuse: bool, hedge: bool, record_llm: Optional[str], replay_llm: Optional[str],
+        metrics_port: Optional[int], metrics_file: Optional[str]):
     """Enrich database content using LLM processing."""
     
     if not config:
@@ -175,14 +223,14 @@ def enrich(ctx, config: str, enrichments: tuple, limit: Optional[int], overwrite
     if not enrichments:
         raise click.BadParameter("--enrichments required")
     try:
-        return asyncio.run(_async_cli(ctx, config, enrichments, limit, overwrite, verbose, log_updates, table, model, db_path, batch_size, rowid, sha1, truncate, skip_cost_check, cost_threshold))
+        return asyncio.run(_async_cli(ctx, config, enrichments, limit, overwrite, verbose, log_updates, table, model, db_path, batch_size, rowid, sha1, truncate, skip_cost_check, cost_threshold, stats, resume_run, fuse, hedge, record_llm, replay_llm, metrics_port, metrics_file))
     except KeyboardInterrupt:
         # Graceful shutdown message already printed by signal handler
         click.echo("\n✋ Enrichment interrupted by user.", err=True)
-        click.echo("💡 Run the same command again to continue where you left off.", err=True)
+        click.echo("💡 Run the same command again, or add --resume <run id>, to continue where you left off.", err=True)
         return 1  # Exit with error code
 
-async def _async_cli(ctx, config: str, enrichments: tuple, limit: Optional[int], overwrite: bool, verbose: bool, log_updates: bool, table: Optional[str], model: Optional[str], db_path: Optional[str], batch_size: Optional[int], rowid: Optional[int], sha1: Optional[str], truncate: bool, skip_cost_check: bool, cost_threshold: float):
+async def _async_cli(ctx, config: str, enrichments: tuple, limit: Optional[int], overwrite: bool, verbose: bool, log_updates: bool, table: Optional[str], model: Optional[str], db_path: Optional[str], batch_size: Optional[int], rowid: Optional[int], sha1: Optional[str], truncate: bool, skip_cost_check: bool, cost_threshold: float, stats: bool = False, resume_run: Optional[str] = None, fuse: bool = False, hedge: bool = False, record_llm: Optional[str] = None, replay_llm: Optional[str] = None, metrics_port: Optional[int] = None, metrics_file: Optional[str] = None):
     # Set up logging based on verbosity
     setup_logging(verbose)
     results = [] 
@@ -222,6 +270,29 @@ Example:
     
     # Set db_path for the rest of the function
     db_path = actual_db_path
+    _configure_storage(db_path, config_data)
+    
+    # --record-llm / --replay-llm set the llm_transport mode and cassette
+    if record_llm and replay_llm:
+        raise click.UsageError("Use either --record-llm or --replay-llm, not both")
+    if record_llm or replay_llm:
+        config_data['llm_transport'] = {**(config_data.get('llm_transport') or {}),
+                                        'mode': 'record' if record_llm else 'replay',
+                                        'cassette': record_llm or replay_llm}
+    # --metrics-port / --metrics-file set where metrics go
+    if metrics_port is not None or metrics_file:
+        config_data['metrics'] = {**(config_data.get('metrics') or {}),
+                                  **({'port': metrics_port} if metrics_port is not None else {}),
+                                  **({'textfile': metrics_file} if metrics_file else {})}
+    
+    # Requests to OpenAI-compatible models go through the provider pool, if one is configured
+    try:
+        transport = configure_llm_transport(config_data)
+        metrics_exporter = configure_metrics(config_data)
+        configure_provider_pool(config_data)
+        get_provider_pool()
+    except ValueError as e:
+        raise click.UsageError(str(e))
     
     # Override model if specified via CLI
     if model:
@@ -238,6 +309,21 @@ Example:
     if specified_filters > 1:
         raise click.UsageError("Cannot specify multiple filters. Use only ONE of: --limit, --rowid, or --sha1.")
     
+    # A resumed run keeps its own query, limit and model
+    resumed = None
+    if resume_run:
+        if specified_filters or model or fuse:
+            raise click.UsageError("--resume continues a run with its original query and model; "
+                                   "don't combine it with --limit, --rowid, --sha1, --model or --fuse.")
+        from .enrichment_runs import get_run
+        try:
+            resumed = get_run(db_path, resume_run)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        if resumed is None:
+            raise click.UsageError(f"No enrichment run '{resume_run}' in {db_path} (see 'doctrail db runs')")
+        model = resumed['model']
+    
     # Process enrichments parameter (can be multiple values or comma-separated)
     requested_enrichments = []
     for enrichment_arg in enrichments:
@@ -251,6 +337,13 @@ Example:
     seen = set()
     requested_enrichments = [x for x in requested_enrichments if not (x in seen or seen.add(x))]
     
+    if stats:
+        # Report recorded per-call telemetry instead of running
+        from .db_operations import get_llm_calls
+        from .llm.telemetry import summarize_calls, format_call_stats
+        click.echo(format_call_stats(summarize_calls(get_llm_calls(db_path, requested_enrichments))))
+        return
+    
     
     # Validate enrichments section exists
     if 'enrichments' not in config_data:
@@ -259,6 +352,11 @@ Example:
     if not config_data['enrichments']:
         raise click.UsageError("No enrichments defined in config file")
     
+    if resumed and resumed['enrichment_name'] not in requested_enrichments:
+        raise click.UsageError(f"Run {resumed['run_id'][:8]} belongs to enrichment '{resumed['enrichment_name']}'")
+    if resumed:
+        requested_enrichments = [resumed['enrichment_name']]
+    
     # Find matching enrichment configs
     enrichment_configs = [e for e in config_data['enrichments'] if e['name'] in requested_enrichments]
     
@@ -293,6 +391,8 @@ Example:
         # Import schema-driven configuration
         from .enrichment_config import prepare_enrichment_for_processing
         
+        # Validate every enrichment before any of them starts
+        strategies = {}
         for enrichment_config in enrichment_configs:
             # NEW: Use schema-driven configuration system
             default_table = config_data.get('default_table', DEFAULT_TABLE_NAME)
@@ -326,6 +426,40 @@ Example:
                     error_msg += "\n📖 See schema documentation: ./doctrail.py schema --help\n"
                     raise click.UsageError(error_msg)
             
+            strategies[enrichment_config['name']] = strategy
+        
+        # Enrichments that read another one's output wait for it; the rest run concurrently
+        try:
+            scheduler = EnrichmentScheduler(enrichment_configs, config_data)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        
+        # With --fuse, enrichments sending the same document text share one request per row
+        fused = {}
+        if fuse:
+            fused = {group.names[0]: group for group in
+                     plan_fusion(enrichment_configs, strategies, config_data, scheduler.dependencies, model)}
+            try:
+                scheduler.fuse([group.names for group in fused.values()])
+            except ValueError as e:
+                raise click.UsageError(f"{e}\n   These enrichments can't be fused; run them without --fuse.")
+            if not fused:
+                print("ℹ️  --fuse: no enrichments share their query, input columns and models; running them separately")
+        if len(enrichment_configs) > 1:
+            print(f"🗺️  Enrichment order: {scheduler.describe()}")
+        
+        row_source = SharedRowSource()
+        # Shared by every enrichment; lowers itself while providers rate-limit us
+        api_semaphore = AdaptiveLimiter(config_data.get('api_concurrency', DEFAULT_API_SEMAPHORE_LIMIT))
+        watch_limiter(api_semaphore)
+        prompt_lock = asyncio.Lock()
+        bar_positions = itertools.count()
+        
+        async def run_enrichment(enrichment_config: dict) -> None:
+            strategy = strategies[enrichment_config['name']]
+            group = fused.get(enrichment_config['name'])
+            label = group.label if group else enrichment_config['name']
+            
             # Determine which table(s) to process
             tables_to_process = []
             if table:
@@ -359,7 +493,7 @@ Example:
                  
                 # Show task info (always show this)
                 print(f"\n{'='*50}")
-                print(f"🚀 Starting enrichment task: {enrichment_config['name']}")
+                print(f"🚀 Starting enrichment task: {label}")
                 if verbose:
                     print(f"📝 Description: {enrichment_config.get('description', 'No description provided')}")
                     from .enrichment_config import get_storage_summary
@@ -497,14 +631,26 @@ Example:
             # Ensure query includes rowid for proper processing
             query = ensure_rowid_in_query(query)
             
-            # Use optimized query execution if input_columns are specified
+            # Runs are recorded against the query without its LIMIT (the limit is stored separately)
+            run_query, row_limit = split_limit(query)
+            after_rowid = None
+            if resumed:
+                if query_hash(run_query) != resumed['query_hash']:
+                    raise click.UsageError(
+                        f"The query for '{enrichment_config['name']}' has changed since run {resumed['run_id'][:8]}.\n"
+                        f"   Then: {resumed['query']}\n   Now:  {run_query}\n"
+                        f"   Start a new run instead of resuming."
+                    )
+                after_rowid = resumed['last_rowid']
+                row_limit = resumed['row_limit'] - resumed['rows_done'] if resumed['row_limit'] is not None else None
+                print(f"⏯️  Resuming run {resumed['run_id'][:8]} after rowid {after_rowid} "
+                      f"({resumed['rows_done']:,} rows already done)")
+            
+            # Read the rows in keyset pages (fetching only the needed columns)
             input_columns = input_config.get('input_columns', ['raw_content'])
-            if input_columns and len(input_columns) > 0:
-                # Use optimized execution that fetches only needed columns
-                results = execute_query_optimized(db_path, query, input_columns)
-            else:
-                # Fall back to standard execution
-                results = execute_query(db_path, query)
+            # (enrichments starting together on the same selection share one fetch)
+            results = await row_source.fetch(db_path, query, input_columns, after_rowid=after_rowid,
+                                             limit=max(row_limit, 0) if row_limit is not None else None)
             # Always show total rows retrieved
             total_rows = len(results)
             print(f"📊 Retrieved {total_rows:,} rows from database")
@@ -580,33 +726,39 @@ Example:
                         f"   2. Add 'output_table: {enrichment_config['name']}_results' to create a derived table"
                     )
             
-            # Process with each model
-            all_results = []
-            for model_idx, model in enumerate(models):
+            # Process with each model (concurrently, sharing the API budget)
+            async def run_model(model_idx: int, model: str) -> list:
                 # Execute enrichment task with the retrieved results  
                 if len(models) > 1:
-                    pbar_desc = f"🤖 {enrichment_config['name']} [{model}]" if not verbose else f"Processing {enrichment_config['name']} with {model}"
+                    pbar_desc = f"🤖 {label} [{model}]" if not verbose else f"Processing {label} with {model}"
                 else:
-                    pbar_desc = f"🤖 {enrichment_config['name']}" if not verbose else f"Processing {enrichment_config['name']}"
+                    pbar_desc = f"🤖 {label}" if not verbose else f"Processing {label}"
                 
-                # Check how many rows this model actually needs to process
-                rows_to_process_for_model = len(results)
+                # Collect the rows this model actually needs to process
+                pending_rows = results
                 
-                if output_table and not overwrite:
+                if group and not overwrite:
+                    # A fused row is sent while any of the group's enrichments still needs it
+                    pending_keys = set()
+                    for member, member_strategy in group.members:
+                        pending_keys.update((row.get('rowid'), row.get('sha1')) for row in rows_needing(
+                            db_path, member['name'], member_strategy.output_table, member_strategy.key_column,
+                            model, results))
+                    pending_rows = [row for row in results if (row.get('rowid'), row.get('sha1')) in pending_keys]
+                elif output_table and not overwrite:
                     # For derived tables, check what's already done for THIS specific model
                     with get_db_connection(db_path) as conn:
                         cursor = conn.cursor()
                         # Check if output table exists
-                        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (output_table,))
-                        if cursor.fetchone():
+                        if table_exists(conn, output_table):
                             # Check if table has model_used column
                             cursor.execute(f"PRAGMA table_info({output_table})")
                             columns_info = cursor.fetchall()
                             column_names = [info[1] for info in columns_info]
                             has_model_column = "model_used" in column_names
                             
-                            # Count how many rows this specific model has already processed
-                            rows_done = 0
+                            # Keep rows this specific model has not processed yet
+                            pending_rows = []
                             for row in results:
                                 key_value = row.get(key_column, 'NO_KEY')
                                 if has_model_column:
@@ -615,92 +767,135 @@ Example:
                                 else:
                                     cursor.execute(f"SELECT 1 FROM {output_table} WHERE {key_column} = ? LIMIT 1", (key_value,))
                                 
-                                if cursor.fetchone():
-                                    rows_done += 1
-                            rows_to_process_for_model = len(results) - rows_done
+                                if not cursor.fetchone():
+                                    pending_rows.append(row)
                 elif not output_table and not overwrite:
-                    # For direct column mode, count rows with existing data
+                    # For direct column mode, skip rows with existing data
                     output_col = output_columns[0] if output_columns else None
                     if output_col:
-                        rows_to_process_for_model = sum(1 for row in results if not row.get(output_col))
+                        pending_rows = [row for row in results if not row.get(output_col)]
+                
+                rows_to_process_for_model = len(pending_rows)
                 
                 # Skip this model entirely if there's nothing to process
                 if rows_to_process_for_model == 0:
                     print(f"✅ {model}: All rows already processed!")
-                    continue
+                    return []
                 
-                # Cost estimation
+                # Cost estimation over every pending row (not an extrapolated sample)
                 if not skip_cost_check:
-                    # Get sample row for token counting
-                    sample_row = results[0] if results else {}
-                    # Parse input columns to get a sample
-                    input_columns_sample = {}
-                    for col in input_columns:
-                        col_name = col.split(':')[0]  # Remove character limit
-                        if '.' in col_name:
-                            _, col_only = col_name.split('.', 1)
-                            if col_only in sample_row:
-                                input_columns_sample[col_name] = sample_row[col_only]
-                        elif col_name in sample_row:
-                            input_columns_sample[col_name] = sample_row[col_name]
-                    
-                    # Get prompt and schema
-                    prompt_template = enrichment_config.get('prompt', '')
-                    schema = enrichment_config.get('schema', {})
-                    
-                    # Estimate cost
-                    total_cost, breakdown = estimate_enrichment_cost(
+                    total_cost, breakdown = estimate_selection_cost(
                         model=model,
-                        prompt_template=prompt_template,
-                        input_columns_sample=input_columns_sample,
-                        schema=schema,
+                        prompt_template=group.prompt(config_data) if group else load_enrichment_prompt(enrichment_config, config_data),
+                        rows=pending_rows,
+                        parsed_input_cols=parse_input_columns_with_limits(input_columns),
+                        schema=group.schema() if group else enrichment_config.get('schema', {}),
                         num_rows=len(results),
-                        rows_to_process=rows_to_process_for_model
+                        truncate=truncate or enrichment_config.get('truncate', False),
+                        cached_prompt=prompt_layout_for(enrichment_config, config_data) == 'prefix'
                     )
                     
-                    # Show cost estimate
-                    print(format_cost_estimate(breakdown))
-                    
-                    # Ask for confirmation if cost exceeds threshold
-                    if should_confirm_cost(total_cost, cost_threshold):
-                        if not click.confirm(f"\n💸 Estimated cost exceeds ${cost_threshold:.2f}. Continue?"):
-                            print("❌ Enrichment cancelled by user.")
-                            continue
+                    # Show cost estimate and ask for confirmation if it exceeds the threshold
+                    # (one enrichment at a time, so estimates and prompts don't interleave)
+                    async with prompt_lock:
+                        print(format_cost_estimate(breakdown))
+                        confirmed = (not should_confirm_cost(total_cost, cost_threshold) or
+                                     click.confirm(f"\n💸 Estimated cost exceeds ${cost_threshold:.2f}. Continue?"))
+                    if not confirmed:
+                        print("❌ Enrichment cancelled by user.")
+                        return []
+                
+                run_id = start_run(db_path, label, model, run_query, row_limit=row_limit,
+                                   rows_total=len(results), run_id=resumed['run_id'] if resumed else None)
+                if group:
+                    print(f"🧾 Run {run_id[:8]}")  # fused runs are not resumable
+                else:
+                    print(f"🧾 Run {run_id[:8]} (continue it later with --resume {run_id[:8]})")
                 
                 # Use spinner for non-verbose mode
                 progress_bar = create_progress_bar(
                     total=rows_to_process_for_model,
                     desc=pbar_desc,
-                    verbose=verbose
+                    verbose=verbose,
+                    position=next(bar_positions) if concurrent_bars else None
                 )
                 
-                with progress_bar as pbar:
-                    model_results = await process_enrichment(
-                        results=results,  # Now we're passing actual database results!
-                        enrichment_config=enrichment_config,
-                        model=model,
-                        pbar=pbar,
-                        db_path=db_path,
-                        table=strategy.input_table,
-                        overwrite=overwrite,
-                        config=config_data,
-                        truncate=truncate or enrichment_config.get('truncate', False),
-                        verbose=verbose,
-                        output_table=output_table,
-                        key_column=key_column,
-                        enrichment_strategy=strategy,
-                        is_multi_model=len(models) > 1
-                    )
-                    all_results.extend(model_results)
+                # Hedging is for spot checks; bulk runs would only pay for duplicate requests
+                hedge_policy = None
+                if hedge:
+                    if rows_to_process_for_model <= HEDGE_MAX_ROWS:
+                        hedge_policy = HedgePolicy()
+                        hedge_policy.seed(db_path, model)
+                    else:
+                        print(f"ℹ️  --hedge: {rows_to_process_for_model} rows is a bulk run "
+                              f"(hedging is for up to {HEDGE_MAX_ROWS}); not hedging {model}")
+                
+                with progress_bar as pbar, call_context(hedge=hedge_policy):
+                    if group:
+                        model_results = await process_fused_enrichment(
+                            results=results,
+                            group=group,
+                            model=model,
+                            pbar=pbar,
+                            db_path=db_path,
+                            overwrite=overwrite,
+                            config=config_data,
+                            truncate=truncate or enrichment_config.get('truncate', False),
+                            verbose=verbose,
+                            is_multi_model=len(models) > 1,
+                            run_id=run_id,
+                            api_semaphore=api_semaphore
+                        )
+                    else:
+                        model_results = await process_enrichment(
+                            results=results,  # Now we're passing actual database results!
+                            enrichment_config=enrichment_config,
+                            model=model,
+                            pbar=pbar,
+                            db_path=db_path,
+                            table=strategy.input_table,
+                            overwrite=overwrite,
+                            config=config_data,
+                            truncate=truncate or enrichment_config.get('truncate', False),
+                            verbose=verbose,
+                            output_table=output_table,
+                            key_column=key_column,
+                            enrichment_strategy=strategy,
+                            is_multi_model=len(models) > 1,
+                            run_id=run_id,
+                            api_semaphore=api_semaphore
+                        )
+                if hedge_policy and hedge_policy.summary():
+                    print(f"🪁 {model}: {hedge_policy.summary()}")
+                return model_results
             
-            results = all_results  # Use combined results for logging
+            concurrent_bars = len(enrichment_configs) > 1 or len(models) > 1
+            model_results = await asyncio.gather(*(run_model(i, m) for i, m in enumerate(models)))
+            results = [row for rows in model_results for row in rows]  # Use combined results for logging
             
             if log_updates:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                log_file = f"updates_{enrichment_config['name']}_{timestamp}.json"
+                log_file = f"updates_{label}_{timestamp}.json"
                 with open(log_file, 'w') as f:
                     json.dump(results, f, indent=2)
                 logging.info(f"Updates logged to {log_file}")
+        
+        if metrics_exporter:
+            watch_pool(get_provider_pool())
+            try:
+                metrics_exporter.start()
+            except OSError as e:
+                raise click.UsageError(f"Cannot serve metrics on port {metrics_exporter.port}: {e}")
+            print(metrics_exporter.describe())
+        try:
+            async with run_checkpointer(db_path) as checkpointer:
+                watch_wal(db_path, checkpointer)
+                await scheduler.run(run_enrichment, on_done=row_source.invalidate)
+        finally:
+            if metrics_exporter:
+                metrics_exporter.stop()
+        if transport:
+            print(transport.summary())
     
     except asyncio.CancelledError:
         # This is triggered by our signal handler
@@ -1054,13 +1249,168 @@ def export(ctx, config: str, export_type: str, output_dir: str, verbose: bool):
     final_output_dir = os.path.expanduser(output_dir or config_data.get('output_dir', './exports'))
     
     from .export_operations import export_documents
+    export_db_path = os.path.expanduser(config_data['database'])
+    _configure_storage(export_db_path, config_data)
     export_documents(
-        db_path=os.path.expanduser(config_data['database']),
+        db_path=export_db_path,
         config=config_data,
         output_dir=final_output_dir,
         export_name=export_type
     )
 
+@cli.command()
+@click.option('--host', default='127.0.0.1', help='Interface to listen on')
+@click.option('--port', type=int, default=8089, help='Port to listen on')
+@click.option('--latency-ms', type=float, default=500.0, help='Median response time in milliseconds (0 for none)')
+@click.option('--latency-sigma', type=float, default=0.5, help='Spread of the log-normal latency (0 for a fixed latency)')
+@click.option('--rate-limit', 'rate_limit_rate', type=float, default=0.0, help='Share of requests answered with 429 (0-1)')
+@click.option('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with each 429')
+@click.option('--prompt-tokens', type=int, help='Prompt tokens to report per request (default: estimated from the prompt)')
+@click.option('--completion-tokens', type=int, help='Completion tokens to report per request (default: estimated from the answer)')
+@click.option('--seed', type=int, help='Random seed for latencies, 429s and enum choices')
+@click.option('--verbose', is_flag=True, help='Enable verbose logging')
+def stub(host: str, port: int, latency_ms: float, latency_sigma: float, rate_limit_rate: float, retry_after: float,
+         prompt_tokens: Optional[int], completion_tokens: Optional[int], seed: Optional[int], verbose: bool):
+    """Run a local OpenAI/Gemini-compatible stub API for load tests."""
+    setup_logging(verbose)
+    if not 0 <= rate_limit_rate <= 1:
+        raise click.BadParameter("--rate-limit must be between 0 and 1")
+    from .llm.stub_server import StubSettings, run_stub_server
+    base_url = f"http://{host}:{port}"
+    click.echo(f"🧪 doctrail stub API on {base_url} (median latency {latency_ms:.0f}ms, {rate_limit_rate:.0%} rate limited)")
+    click.echo(f"   OPENAI_BASE_URL={base_url}/v1  GOOGLE_GEMINI_BASE_URL={base_url}  (stats: {base_url}/stats)")
+    run_stub_server(host, port, StubSettings(
+        latency_ms=latency_ms,
+        latency_sigma=latency_sigma,
+        rate_limit_rate=rate_limit_rate,
+        retry_after=retry_after,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        seed=seed,
+    ))
+
+@cli.group()
+def db():
+    """Database maintenance commands."""
+    pass
+
+def _configure_storage(db_path: str, config_data: dict) -> None:
+    """Attach the split-storage files the config asks for, and warn about tables left in the main file."""
+    from .storage_layout import configure_storage, misplaced_tables
+
+    try:
+        layout = configure_storage(db_path, config_data)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if layout is None or not os.path.exists(db_path):
+        return
+    with get_db_connection(db_path) as conn:
+        misplaced = misplaced_tables(conn, db_path)
+    if misplaced:
+        logging.warning(f"Tables {', '.join(misplaced)} are still in {db_path} and hide their split-storage copies; "
+                        f"run 'doctrail db split' to move them")
+
+def _resolve_db_path(config: Optional[str], db_path: Optional[str]) -> str:
+    """Database path from --db-path, else from the config file (whose storage layout is applied)."""
+    config_data = load_config(config) if config else None
+    if not db_path:
+        if not config_data:
+            raise click.UsageError("Provide --db-path or --config")
+        db_path = config_data.get('database')
+        if not db_path:
+            raise click.UsageError(ERROR_NO_DATABASE)
+    db_path = os.path.expanduser(db_path)
+    if not os.path.exists(db_path):
+        raise click.UsageError(f"Database file not found: {db_path}")
+    if config_data:
+        _configure_storage(db_path, config_data)
+    return db_path
+
+@db.command()
+@click.option('--config', help='Path to the configuration YAML file (for the database path)')
+@click.option('--db-path', help='Path to SQLite database')
+@click.option('--no-vacuum', is_flag=True, help='Skip VACUUM after compaction (faster, but the file does not shrink)')
+@click.option('--verbose', is_flag=True, help='Enable verbose logging')
+def compact(config: Optional[str], db_path: Optional[str], no_vacuum: bool, verbose: bool):
+    """Move inline prompts and long responses into deduplicated blobs, drop unreferenced blobs and vacuum."""
+    setup_logging(verbose)
+    from .db_operations import compact_enrichment_responses
+
+    db_path = _resolve_db_path(config, db_path)
+    click.echo(f"🗜️  Compacting enrichment_responses in {db_path}...")
+    stats = compact_enrichment_responses(db_path, vacuum=not no_vacuum)
+
+    saved = stats['size_before'] - stats['size_after']
+    click.echo(f"✅ Compacted {stats['rows_compacted']:,} rows into {stats['blobs']:,} blobs")
+    click.echo(f"   Size: {stats['size_before'] / 1e6:.1f} MB → {stats['size_after'] / 1e6:.1f} MB ({saved / 1e6:+.1f} MB saved)")
+
+@db.command()
+@click.option('--config', help='Path to the configuration YAML file (database path and enrichments to index for)')
+@click.option('--db-path', help='Path to SQLite database')
+@click.option('--apply', is_flag=True, help='Create and drop the recommended indexes (default: report only)')
+@click.option('--verbose', is_flag=True, help='Enable verbose logging')
+def indexes(config: Optional[str], db_path: Optional[str], apply: bool, verbose: bool):
+    """Recommend indexes for doctrail's resume and lookup queries, and drop redundant ones."""
+    setup_logging(verbose)
+    from .index_advisor import advise_indexes, targets_from_config
+
+    db_path = _resolve_db_path(config, db_path)
+    targets = targets_from_config(load_config(config)) if config else []
+    report = advise_indexes(db_path, targets, apply=apply)
+    plan = report['plan']
+
+    if not plan:
+        click.echo("✅ Indexes already match doctrail's queries")
+    for spec in plan.create:
+        click.echo(f"{'➕ Created' if report['applied'] else '➕ Create'} {spec.name} ON {spec.table}({', '.join(spec.columns)})"
+                   + (f" WHERE {spec.where}" if spec.where else "") + f"  -- {spec.reason}")
+    for drop in plan.drop:
+        click.echo(f"{'➖ Dropped' if report['applied'] else '➖ Drop'} {drop.name} ON {drop.table}  -- {drop.reason}")
+
+    click.echo("\nQuery plans:")
+    for query in report['queries']:
+        click.echo(f"  {query['label']}: {query['before']}")
+        if query['after'] is not None and query['after'] != query['before']:
+            click.echo(f"  {' ' * len(query['label'])}→ {query['after']}")
+    if plan and not report['applied']:
+        click.echo(click.style("\nRun again with --apply to make these changes", fg='cyan', dim=True))
+
+@db.command()
+@click.option('--config', required=True, help='Path to the configuration YAML file (with storage.layout: split)')
+@click.option('--db-path', help='Override the database path from the config')
+@click.option('--verbose', is_flag=True, help='Enable verbose logging')
+def split(config: str, db_path: Optional[str], verbose: bool):
+    """Move audit and output tables out of the main database into their split-storage files."""
+    setup_logging(verbose)
+    from .storage_layout import get_layout, move_tables_to_layout
+
+    db_path = _resolve_db_path(config, db_path)
+    layout = get_layout(db_path)
+    if layout is None:
+        raise click.UsageError("The config does not set storage.layout: split")
+
+    moved = move_tables_to_layout(db_path)
+    if not moved:
+        click.echo("✅ Nothing to move; tables are already in their split-storage files")
+    for table, rows in moved.items():
+        click.echo(f"📦 {table}: {rows:,} rows → {layout.schema_for(table)}")
+    if moved:
+        click.echo(click.style(f"\nRun VACUUM on {db_path} to return the freed space to the OS", fg='cyan', dim=True))
+
+@db.command()
+@click.option('--config', help='Path to the configuration YAML file (for the database path)')
+@click.option('--db-path', help='Path to SQLite database')
+@click.option('--enrichment', 'enrichment_names', multiple=True, help='Only runs of this enrichment (repeatable)')
+@click.option('--limit', type=int, default=20, show_default=True, help='Number of runs to show')
+@click.option('--verbose', is_flag=True, help='Enable verbose logging')
+def runs(config: Optional[str], db_path: Optional[str], enrichment_names: tuple, limit: int, verbose: bool):
+    """List recent enrichment runs with their progress and throughput."""
+    setup_logging(verbose)
+    from .enrichment_runs import list_runs, format_runs
+
+    db_path = _resolve_db_path(config, db_path)
+    click.echo(format_runs(list_runs(db_path, list(enrichment_names) or None, limit)))
+
 def validate_input_columns(results: List[dict], input_columns: List[str], enrichment_name: str) -> None:
     """Validate that all required input columns exist in the query results."""
     if not results:
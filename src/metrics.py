@@ -0,0 +1,312 @@
+"""
+Live metrics for long-running enrichments (``metrics`` in the config).
+
+Rows and LLM calls are counted as they finish (``observe_row`` from the batch
+loop, ``observe_call`` from ``track_call``). Live state is read when metrics
+are rendered: the API limiter's in-flight requests and concurrency window,
+provider pool endpoints, queued writes and the WAL size (see the ``watch_*``
+functions). ``MetricsExporter`` renders everything in the Prometheus text
+format, served at ``/metrics`` on a local port, rewritten to a file for
+node_exporter's textfile collector, or both. Without a ``metrics`` section
+nothing is collected and the hooks return at once.
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .constants import METRICS_RATE_WINDOW, METRICS_TEXTFILE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Recent call latencies kept per (enrichment, model) for the quantiles
+LATENCY_SAMPLES = 500
+
+_metrics: Optional['RunMetrics'] = None
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _sample(name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> str:
+    label_text = ','.join(f'{key}="{_escape(v)}"' for key, v in (labels or {}).items())
+    value_text = str(value) if isinstance(value, int) else repr(float(value))
+    return f"{name}{{{label_text}}} {value_text}" if label_text else f"{name} {value_text}"
+
+
+class RunMetrics:
+    """Counters, latency samples and watched live state of one process."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.last_progress: Optional[float] = None
+        self.rows: Counter = Counter()  # (enrichment, status)
+        self.calls: Counter = Counter()  # (enrichment, model, status)
+        self.tokens: Counter = Counter()  # (enrichment, model, kind)
+        self.cost: Counter = Counter()  # (enrichment, model)
+        self.latency_sum: Counter = Counter()
+        self.latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self._recent_tokens: Deque[Tuple[float, int]] = deque()
+        self.limiters: List[Any] = []
+        self.pool = None
+        self.write_buffers = weakref.WeakSet()
+        self.wal: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def observe_row(self, enrichment: str, status: str) -> None:
+        with self._lock:
+            self.rows[enrichment, status] += 1
+            if status != 'skipped':
+                self.last_progress = time.time()
+
+    def observe_call(self, record) -> None:
+        enrichment, model = record.enrichment_name or '', record.model
+        tokens = (record.prompt_tokens or 0) + (record.completion_tokens or 0)
+        with self._lock:
+            self.calls[enrichment, model, record.status] += 1
+            for kind in ('prompt', 'completion', 'cached'):
+                self.tokens[enrichment, model, kind] += getattr(record, f"{kind}_tokens") or 0
+            self.cost[enrichment, model] += record.cost_usd or 0.0
+            if record.status == 'ok' and record.latency_ms is not None:
+                self.latencies.setdefault((enrichment, model), deque(maxlen=LATENCY_SAMPLES)).append(record.latency_ms / 1000)
+                self.latency_sum[enrichment, model] += record.latency_ms / 1000
+            if tokens:
+                self._recent_tokens.append((time.monotonic(), tokens))
+
+    def tokens_per_second(self) -> float:
+        """Prompt and completion tokens per second over the last METRICS_RATE_WINDOW seconds."""
+        now = time.monotonic()
+        with self._lock:
+            while self._recent_tokens and self._recent_tokens[0][0] < now - METRICS_RATE_WINDOW:
+                self._recent_tokens.popleft()
+            recent = sum(tokens for _, tokens in self._recent_tokens)
+        return recent / min(METRICS_RATE_WINDOW, max(time.time() - self.started, 1.0))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str, samples: List[str]) -> None:
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", *samples])
+
+        with self._lock:
+            rows = dict(self.rows)
+            calls = dict(self.calls)
+            tokens = dict(self.tokens)
+            cost = dict(self.cost)
+            latency_sum = dict(self.latency_sum)
+            latencies = {key: sorted(values) for key, values in self.latencies.items()}
+            limiters = list(self.limiters)
+            buffers = list(self.write_buffers)
+            wal = dict(self.wal)
+            last_progress = self.last_progress
+
+        family('doctrail_start_time_seconds', 'gauge', 'Unix time the process started collecting metrics.',
+               [_sample('doctrail_start_time_seconds', round(self.started, 3))])
+        if last_progress is not None:
+            family('doctrail_last_progress_time_seconds', 'gauge', 'Unix time a row last finished (alert on stalls).',
+                   [_sample('doctrail_last_progress_time_seconds', round(last_progress, 3))])
+        family('doctrail_rows_total', 'counter', 'Rows finished, by enrichment and outcome.',
+               [_sample('doctrail_rows_total', count, {'enrichment': enrichment, 'status': status})
+                for (enrichment, status), count in sorted(rows.items())])
+        family('doctrail_llm_requests_total', 'counter', 'LLM requests, by enrichment, model and outcome.',
+               [_sample('doctrail_llm_requests_total', count, {'enrichment': e, 'model': m, 'status': s})
+                for (e, m, s), count in sorted(calls.items())])
+        family('doctrail_llm_tokens_total', 'counter', 'Tokens reported by providers (cached is part of prompt).',
+               [_sample('doctrail_llm_tokens_total', count, {'enrichment': e, 'model': m, 'kind': k})
+                for (e, m, k), count in sorted(tokens.items())])
+        family('doctrail_llm_tokens_per_second', 'gauge', f"Tokens per second over the last {METRICS_RATE_WINDOW:g}s.",
+               [_sample('doctrail_llm_tokens_per_second', round(self.tokens_per_second(), 3))])
+        family('doctrail_llm_cost_usd_total', 'counter', 'Computed cost of LLM requests in US dollars.',
+               [_sample('doctrail_llm_cost_usd_total', round(value, 6), {'enrichment': e, 'model': m})
+                for (e, m), value in sorted(cost.items())])
+
+        latency_samples = []
+        for (enrichment, model), values in sorted(latencies.items()):
+            labels = {'enrichment': enrichment, 'model': model}
+            for quantile in (0.5, 0.95):
+                value = values[min(len(values) - 1, int(round(quantile * (len(values) - 1))))]
+                latency_samples.append(_sample('doctrail_llm_latency_seconds', round(value, 4),
+                                               {**labels, 'quantile': quantile}))
+            latency_samples.append(_sample('doctrail_llm_latency_seconds_sum', round(latency_sum[enrichment, model], 4), labels))
+            latency_samples.append(_sample('doctrail_llm_latency_seconds_count',
+                                           calls.get((enrichment, model, 'ok'), 0), labels))
+        family('doctrail_llm_latency_seconds', 'summary',
+               f"Latency of successful LLM requests (quantiles over the last {LATENCY_SAMPLES}).", latency_samples)
+
+        if limiters:
+            family('doctrail_llm_in_flight', 'gauge', 'LLM requests holding an API slot.',
+                   [_sample('doctrail_llm_in_flight', sum(limiter.in_use for limiter in limiters))])
+            family('doctrail_api_concurrency_limit', 'gauge', 'Current concurrency window (lowered while rate-limited).',
+                   [_sample('doctrail_api_concurrency_limit', sum(getattr(limiter, 'limit', 0) for limiter in limiters))])
+            family('doctrail_api_concurrency_max', 'gauge', 'Configured api_concurrency.',
+                   [_sample('doctrail_api_concurrency_max', sum(getattr(limiter, 'max_limit', 0) for limiter in limiters))])
+        if self.pool is not None:
+            endpoints = self.pool.describe()
+            family('doctrail_endpoint_in_flight', 'gauge', 'Requests in flight per provider pool endpoint.',
+                   [_sample('doctrail_endpoint_in_flight', e['in_flight'], {'endpoint': e['name']}) for e in endpoints])
+            family('doctrail_endpoint_ejected', 'gauge', '1 while a provider pool endpoint is ejected.',
+                   [_sample('doctrail_endpoint_ejected', int(e['ejected_for'] > 0), {'endpoint': e['name']})
+                    for e in endpoints])
+        family('doctrail_write_queue_depth', 'gauge', 'Enrichment results queued for the next database commit.',
+               [_sample('doctrail_write_queue_depth', sum(len(buffer) for buffer in buffers))])
+        if wal:
+            family('doctrail_wal_bytes', 'gauge', 'Size of the database write-ahead log.',
+                   [_sample('doctrail_wal_bytes', manager.wal_size(), {'database': db_path})
+                    for db_path, manager in sorted(wal.items())])
+        return "\n".join(lines) + "\n"
+
+
+def observe_row(enrichment: str, status: str) -> None:
+    """Count a finished row (``processed``, ``failed`` or ``skipped``)."""
+    if _metrics is not None:
+        _metrics.observe_row(enrichment, status)
+
+
+def observe_call(record) -> None:
+    """Count a finished LLM call (a telemetry CallRecord)."""
+    if _metrics is not None:
+        _metrics.observe_call(record)
+
+
+def watch_limiter(limiter) -> None:
+    """Report an API limiter's in-flight requests and concurrency window."""
+    if _metrics is not None and hasattr(limiter, 'in_use'):
+        with _metrics._lock:
+            _metrics.limiters.append(limiter)
+
+
+def watch_pool(pool) -> None:
+    """Report the state of each provider pool endpoint."""
+    if _metrics is not None:
+        _metrics.pool = pool
+
+
+def watch_write_buffer(buffer) -> None:
+    """Report an EnrichmentWriteBuffer's queue depth for as long as it exists."""
+    if _metrics is not None:
+        with _metrics._lock:
+            _metrics.write_buffers.add(buffer)
+
+
+def watch_wal(db_path: str, checkpointer) -> None:
+    """Report a database's WAL size, read from its CheckpointManager."""
+    if _metrics is not None:
+        with _metrics._lock:
+            _metrics.wal[db_path] = checkpointer
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One line per scrape would bury the enrichment log
+        pass
+
+
+class MetricsExporter:
+    """Serves RunMetrics over HTTP and/or rewrites them to a textfile."""
+
+    def __init__(self, metrics: RunMetrics, port: Optional[int] = None, host: str = '127.0.0.1',
+                 textfile: Optional[str] = None, interval: float = METRICS_TEXTFILE_INTERVAL):
+        if port is None and not textfile:
+            raise ValueError("metrics needs a 'port', a 'textfile' or both")
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.textfile = os.path.expanduser(textfile) if textfile else None
+        self.interval = interval
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @classmethod
+    def from_config(cls, metrics_config: Dict[str, Any], metrics: RunMetrics) -> 'MetricsExporter':
+        return cls(metrics, port=metrics_config.get('port'), host=metrics_config.get('host', '127.0.0.1'),
+                   textfile=metrics_config.get('textfile'),
+                   interval=float(metrics_config.get('interval', METRICS_TEXTFILE_INTERVAL)))
+
+    def start(self) -> None:
+        """Start serving and writing.
+
+        Raises:
+            OSError: If the port cannot be bound
+        """
+        if self.port is not None:
+            self._server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+            self._server.daemon_threads = True
+            self._server.metrics = self.metrics
+            self.port = self._server.server_address[1]
+            self._threads.append(threading.Thread(target=self._server.serve_forever, name='doctrail-metrics', daemon=True))
+        if self.textfile:
+            self._threads.append(threading.Thread(target=self._write_loop, name='doctrail-metrics-file', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            try:
+                self.write_textfile()
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self.textfile}: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def write_textfile(self) -> None:
+        """Replace the textfile atomically, so a collector never reads half of it."""
+        directory = os.path.dirname(self.textfile)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.textfile}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(temporary, self.textfile)
+
+    def stop(self) -> None:
+        """Stop serving; the textfile is written one last time with the final counts."""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self.textfile:
+            try:
+                self.write_textfile()
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self.textfile}: {e}")
+
+    def describe(self) -> str:
+        targets = []
+        if self.port is not None:
+            targets.append(f"http://{self.host}:{self.port}/metrics")
+        if self.textfile:
+            targets.append(f"{self.textfile} (every {self.interval:g}s)")
+        return f"📡 Metrics: {' and '.join(targets)}"
+
+
+def configure_metrics(config: Optional[Dict[str, Any]]) -> Optional[MetricsExporter]:
+    """Collect metrics if ``config`` has a metrics section; returns its (not yet started) exporter."""
+    global _metrics
+    _metrics = None
+    metrics_config = (config or {}).get('metrics')
+    if not metrics_config:
+        return None
+    exporter = MetricsExporter.from_config(metrics_config, RunMetrics())
+    _metrics = exporter.metrics
+    return exporter
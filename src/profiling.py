@@ -0,0 +1,220 @@
+"""
+Per-stage timing spans and whole-run profiles (``--timings``, ``--profile``).
+
+Hot paths wrap their stages in ``span('enrich.api')`` and the like. While a
+run is being timed (``start_timings``), every span's wall time is kept, and
+``SpanTimer.report`` aggregates them per name into counts, percentiles and a
+latency histogram; ``write`` saves that as JSON or, with trace events, in
+Chrome trace format (for ``chrome://tracing`` or Perfetto). Spans measure wall
+time, so a span around an ``await`` includes time spent waiting on the event
+loop. Otherwise ``span`` hands back one shared no-op context manager, so a
+disabled span costs a function call.
+
+``RunProfiler`` samples the whole run with pyinstrument when it is installed
+and falls back to cProfile.
+"""
+
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import pyinstrument
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:
+    PYINSTRUMENT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+TIMINGS_FORMATS = ('json', 'chrome')
+# Upper bounds of the report's histogram buckets, in milliseconds
+HISTOGRAM_BOUNDS_MS = (1, 10, 100, 1000, 10000)
+
+_NOOP = nullcontext()
+_timer: Optional['SpanTimer'] = None
+
+
+def _bucket_label(bound: Optional[float]) -> str:
+    if bound is None:
+        return f">={HISTOGRAM_BOUNDS_MS[-1] // 1000}s"
+    return f"<{bound}ms" if bound < 1000 else f"<{bound // 1000}s"
+
+
+def _track() -> int:
+    """The asyncio task or thread a span runs in (a Chrome trace row)."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+class SpanTimer:
+    """Wall times of named spans for one run."""
+
+    def __init__(self, trace: bool = False):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        # (name, start, end, track) per span, kept only for Chrome traces
+        self.events: Optional[List[Tuple[str, float, float, int]]] = [] if trace else None
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.durations[name].append((end - start) * 1000)
+                if self.events is not None:
+                    self.events.append((name, start, end, _track()))
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Per-span count, total, percentiles and histogram, slowest total first."""
+        rows = []
+        for name, durations in self.durations.items():
+            values = sorted(durations)
+            pct = lambda p: round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))], 3)
+            histogram = {_bucket_label(bound): 0 for bound in (*HISTOGRAM_BOUNDS_MS, None)}
+            for value in values:
+                bound = next((b for b in HISTOGRAM_BOUNDS_MS if value < b), None)
+                histogram[_bucket_label(bound)] += 1
+            rows.append({
+                'span': name,
+                'count': len(values),
+                'total_ms': round(sum(values), 3),
+                'mean_ms': round(sum(values) / len(values), 3),
+                'p50_ms': pct(50),
+                'p95_ms': pct(95),
+                'p99_ms': pct(99),
+                'max_ms': round(values[-1], 3),
+                'histogram': histogram,
+            })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """The spans as Chrome trace events, one row per asyncio task or thread."""
+        tracks: Dict[int, int] = {}
+        pid = os.getpid()
+        events = [{
+            'name': name,
+            'cat': name.split('.', 1)[0],
+            'ph': 'X',
+            'ts': round((start - self.origin) * 1e6, 1),
+            'dur': round((end - start) * 1e6, 1),
+            'pid': pid,
+            'tid': tracks.setdefault(track, len(tracks) + 1),
+        } for name, start, end, track in (self.events or [])]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path: str, fmt: str = 'json') -> None:
+        if fmt not in TIMINGS_FORMATS:
+            raise ValueError(f"timings format must be one of: {', '.join(TIMINGS_FORMATS)}")
+        data = self.chrome_trace() if fmt == 'chrome' else {'spans': self.report()}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=None if fmt == 'chrome' else 2)
+
+
+def format_timings(report: List[Dict[str, Any]]) -> str:
+    """Render SpanTimer.report output for the terminal."""
+    if not report:
+        return "No spans recorded."
+    buckets = [_bucket_label(bound) for bound in (*HISTOGRAM_BOUNDS_MS, None)]
+    lines = [
+        "⏱️  Stage timings",
+        f"{'span':<24} {'count':>8} {'total':>10} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}  "
+        + " ".join(f"{b:>7}" for b in buckets),
+    ]
+
+    def ms(value: float) -> str:
+        return f"{value / 1000:.2f}s" if value >= 1000 else f"{value:.1f}ms"
+
+    for row in report:
+        lines.append(
+            f"{row['span']:<24} {row['count']:>8,} {ms(row['total_ms']):>10} {ms(row['mean_ms']):>9} "
+            f"{ms(row['p50_ms']):>9} {ms(row['p95_ms']):>9} {ms(row['max_ms']):>9}  "
+            + " ".join(f"{row['histogram'][b]:>7,}" for b in buckets)
+        )
+    return "\n".join(lines)
+
+
+def start_timings(trace: bool = False) -> SpanTimer:
+    """Start recording spans; with ``trace`` each span is also kept for a Chrome trace."""
+    global _timer
+    _timer = SpanTimer(trace)
+    return _timer
+
+
+def stop_timings() -> Optional[SpanTimer]:
+    """Stop recording spans and return what was recorded."""
+    global _timer
+    timer, _timer = _timer, None
+    return timer
+
+
+def span(name: str) -> ContextManager[None]:
+    """Time a block as ``name`` if spans are being recorded."""
+    timer = _timer
+    if timer is None:
+        return _NOOP
+    return timer.span(name)
+
+
+class RunProfiler:
+    """A profile of the whole process, written to a file when stopped.
+
+    With pyinstrument installed the run is sampled, and ``path`` gets an HTML
+    report (``.html``), a speedscope profile (``.json``) or text. Without it,
+    or for a ``.prof``/``.pstats`` path, cProfile writes pstats data (for
+    ``python -m pstats`` or snakeviz). Both see the main thread only, so work
+    sent to worker threads shows as the wait for it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        extension = os.path.splitext(path)[1].lower()
+        self.engine = 'pyinstrument' if PYINSTRUMENT_AVAILABLE and extension not in ('.prof', '.pstats') else 'cprofile'
+        self._profiler = None
+
+    def start(self) -> None:
+        if self.engine == 'pyinstrument':
+            # async_mode='disabled': sample everything on the thread, not one coroutine's context
+            self._profiler = pyinstrument.Profiler(async_mode='disabled')
+            self._profiler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self) -> str:
+        """Stop profiling and write the profile; returns its path."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.engine == 'cprofile':
+            self._profiler.disable()
+            self._profiler.dump_stats(self.path)
+            return self.path
+        session = self._profiler.stop()
+        extension = os.path.splitext(self.path)[1].lower()
+        if extension == '.html':
+            output = self._profiler.output_html()
+        elif extension == '.json':
+            from pyinstrument.renderers import SpeedscopeRenderer
+            output = SpeedscopeRenderer().render(session)
+        else:
+            output = self._profiler.output_text(unicode=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(output)
+        return self.path
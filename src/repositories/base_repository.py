@@ -5,7 +5,7 @@ from typing import List, Dict, Optional, Any
 from contextlib import contextmanager
 import sqlite3
 
-from ..db_operations import get_db_connection
+from ..db_pool import connection_pool
 from ..types import RowDict
 
 
@@ -22,8 +22,8 @@ class BaseRepository(ABC):
     
     @contextmanager
     def get_connection(self):
-        """Get database connection context manager."""
-        with get_db_connection(self.db_path) as conn:
+        """Borrow a pooled connection; uncommitted changes are rolled back on exit."""
+        with connection_pool.connection(self.db_path) as conn:
             yield conn
     
     def execute_query(self, query: str, params: Optional[tuple] = None) -> List[RowDict]:
@@ -37,8 +37,8 @@ class BaseRepository(ABC):
             List of row dictionaries
         """
         with self.get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
             if params:
                 cursor.execute(query, params)
@@ -97,7 +97,8 @@ class BaseRepository(ABC):
         Returns:
             True if table exists
         """
-        query = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
+        # Searches attached databases too (split storage)
+        query = "SELECT 1 FROM pragma_table_info(?)"
         result = self.execute_scalar(query, (table_name,))
         return result is not None
     
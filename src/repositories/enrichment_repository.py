@@ -5,6 +5,7 @@ from datetime import datetime
 import json
 
 from .base_repository import BaseRepository
+from ..storage_layout import schema_for
 from ..types import RowDict
 
 
@@ -68,7 +69,7 @@ class EnrichmentRepository(BaseRepository):
         Returns:
             List of enrichment response records
         """
-        query = "SELECT * FROM enrichment_responses WHERE 1=1"
+        query = "SELECT * FROM enrichment_responses_full WHERE 1=1"
         params = []
         
         if sha1:
@@ -86,8 +87,9 @@ class EnrichmentRepository(BaseRepository):
     
     def ensure_enrichment_responses_table(self) -> None:
         """Ensure enrichment_responses table exists."""
-        query = """
-            CREATE TABLE IF NOT EXISTS enrichment_responses (
+        schema = schema_for(self.db_path, 'enrichment_responses')
+        query = f"""
+            CREATE TABLE IF NOT EXISTS {schema}.enrichment_responses (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 enrichment_id TEXT,
                 sha1 TEXT NOT NULL,
@@ -102,17 +104,10 @@ class EnrichmentRepository(BaseRepository):
         """
         self.execute_update(query)
         
-        # Create indexes
-        self.execute_update(
-            "CREATE INDEX IF NOT EXISTS idx_enrichment_responses_sha1 "
-            "ON enrichment_responses(sha1)"
-        )
-        self.execute_update(
-            "CREATE INDEX IF NOT EXISTS idx_enrichment_responses_name "
-            "ON enrichment_responses(enrichment_name)"
-        )
+        # Lookups by sha1 and enrichment_name use the resume index created by
+        # db_operations.ensure_enrichment_responses_table
         self.execute_update(
-            "CREATE INDEX IF NOT EXISTS idx_enrichment_responses_created "
+            f"CREATE INDEX IF NOT EXISTS {schema}.idx_enrichment_responses_created "
             "ON enrichment_responses(created_at DESC)"
         )
     
@@ -134,14 +129,14 @@ class EnrichmentRepository(BaseRepository):
         """
         if model:
             query = """
-                SELECT * FROM enrichment_responses 
+                SELECT * FROM enrichment_responses_full
                 WHERE sha1 = ? AND enrichment_name = ? AND model_used = ?
                 ORDER BY created_at DESC LIMIT 1
             """
             params = (sha1, enrichment_name, model)
         else:
             query = """
-                SELECT * FROM enrichment_responses 
+                SELECT * FROM enrichment_responses_full
                 WHERE sha1 = ? AND enrichment_name = ?
                 ORDER BY created_at DESC LIMIT 1
             """
@@ -0,0 +1,128 @@
+"""
+Cached table metadata so hot write paths don't re-introspect the schema.
+
+Each table is introspected (columns, primary key, indexes) the first time it
+is needed and served from memory afterwards. Doctrail's own DDL goes through
+``ensure_columns`` (or calls ``invalidate``) so the cache stays accurate; the
+catalog is reset at the start of every enrichment run to pick up changes made
+outside doctrail between runs.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class TableInfo:
+    """Introspected shape of one table."""
+    name: str
+    columns: Tuple[str, ...]
+    primary_key: str  # 'rowid' when the table has no single-column primary key
+    indexes: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    unique_keys: Tuple[Tuple[str, ...], ...] = ()  # primary key and full (non-partial) unique indexes
+
+    def has_column(self, column: str) -> bool:
+        return column in self.columns
+
+    def has_unique_key(self, columns: Tuple[str, ...]) -> bool:
+        """True if ``columns`` (in any order) exactly match a uniqueness constraint, i.e. can be an ON CONFLICT target."""
+        wanted = {col.lower() for col in columns}
+        return any({col.lower() for col in key} == wanted for key in self.unique_keys)
+
+
+class SchemaCatalog:
+    """Process-wide cache of TableInfo keyed by (database, table)."""
+
+    def __init__(self):
+        self._tables: Dict[Tuple[str, str], TableInfo] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(db_path: str, table: str) -> Tuple[str, str]:
+        return os.path.abspath(os.path.expanduser(db_path)), table.lower()
+
+    @staticmethod
+    def _introspect(conn: sqlite3.Connection, table: str) -> Optional[TableInfo]:
+        columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+        if not columns:
+            return None
+        pk_columns = [col[1] for col in sorted(columns, key=lambda col: col[5]) if col[5]]
+        indexes = {}
+        unique_keys = [tuple(pk_columns)] if pk_columns else []
+        for index in conn.execute(f"PRAGMA index_list({table})").fetchall():
+            index_columns = tuple(col[2] for col in conn.execute(f"PRAGMA index_info({index[1]})").fetchall())
+            indexes[index[1]] = index_columns
+            # index_list rows are (seq, name, unique, origin, partial)
+            if index[2] and not (len(index) > 4 and index[4]):
+                unique_keys.append(index_columns)
+        return TableInfo(
+            name=table,
+            columns=tuple(col[1] for col in columns),
+            primary_key=pk_columns[0] if len(pk_columns) == 1 else 'rowid',
+            indexes=indexes,
+            unique_keys=tuple(unique_keys),
+        )
+
+    def get(self, conn: sqlite3.Connection, db_path: str, table: str) -> Optional[TableInfo]:
+        """TableInfo for a table, introspecting through ``conn`` on a cache miss. None if it doesn't exist."""
+        key = self._key(db_path, table)
+        with self._lock:
+            info = self._tables.get(key)
+        if info is not None:
+            return info
+        info = self._introspect(conn, table)
+        if info is not None:
+            with self._lock:
+                self._tables[key] = info
+        return info
+
+    def ensure_columns(self, conn: sqlite3.Connection, db_path: str, table: str,
+                       columns: Dict[str, str]) -> List[str]:
+        """Add any of ``columns`` ({name: type}) the table lacks. Returns the names added.
+
+        The ALTERs run on ``conn`` without committing, so callers can batch them
+        into one migration transaction.
+        """
+        info = self.get(conn, db_path, table)
+        if info is None:
+            raise sqlite3.OperationalError(f"no such table: {table}")
+        missing = [(name, col_type) for name, col_type in columns.items() if not info.has_column(name)]
+        if not missing:
+            return []
+        for name, col_type in missing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+            logging.info(f"Added '{name}' column to {table}")
+        # Refresh from the altering connection; callers invalidate if they roll back
+        self.refresh(conn, db_path, table)
+        return [name for name, _ in missing]
+
+    def refresh(self, conn: sqlite3.Connection, db_path: str, table: str) -> Optional[TableInfo]:
+        """Re-introspect a table through ``conn`` after DDL (it may hold uncommitted changes)."""
+        info = self._introspect(conn, table)
+        with self._lock:
+            if info is None:
+                self._tables.pop(self._key(db_path, table), None)
+            else:
+                self._tables[self._key(db_path, table)] = info
+        return info
+
+    def invalidate(self, db_path: str, table: Optional[str] = None) -> None:
+        """Forget cached metadata for one table, or for every table of a database."""
+        with self._lock:
+            if table is not None:
+                self._tables.pop(self._key(db_path, table), None)
+            else:
+                path = self._key(db_path, '')[0]
+                for key in [k for k in self._tables if k[0] == path]:
+                    del self._tables[key]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tables.clear()
+
+
+schema_catalog = SchemaCatalog()
@@ -0,0 +1,226 @@
+"""
+Split storage: audit tables and derived output tables in their own SQLite files.
+
+With ``storage: {layout: split}`` in the config, the database named by
+``database`` keeps the documents (and FTS), while
+
+- ``enrichment_responses``, ``prompts``, ``blobs``, ``llm_calls`` and
+  ``enrichment_runs`` live in an audit database (default ``<stem>.audit.db``
+  next to the main file), and
+- every enrichment ``output_table`` lives in its own file
+  (default ``<stem>.<table>.db``, or under ``output_dir``).
+
+Pooled connections ATTACH these files when they are opened. SQLite resolves
+unqualified table names across attached databases, so queries, ALTERs and
+PRAGMAs need no changes; only statements that create objects are qualified
+with ``schema_for``. Each file has its own WAL, so audit writes don't contend
+with writes to the content database, and each file can be vacuumed or backed
+up on its own. A transaction that writes to several files is atomic per file,
+not across files.
+
+Without a registered layout every table maps to ``main`` and nothing changes.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+AUDIT_SCHEMA = 'audit'
+AUDIT_TABLES = frozenset({
+    'enrichment_responses', 'enrichment_responses_full', 'enrichment_responses_plain', 'prompts', 'blobs', 'llm_calls',
+    'enrichment_runs'
+})
+# SQLite's default SQLITE_MAX_ATTACHED
+MAX_ATTACHED = 10
+
+
+@dataclass(frozen=True)
+class StorageLayout:
+    """Which file each table lives in, for one main database."""
+    db_path: str
+    audit_path: str
+    output_paths: Dict[str, str] = field(default_factory=dict)  # output table -> file
+
+    @staticmethod
+    def output_schema(table: str) -> str:
+        return f"out_{table}"
+
+    def schema_for(self, table: str) -> str:
+        if table in AUDIT_TABLES:
+            return AUDIT_SCHEMA
+        if table in self.output_paths:
+            return self.output_schema(table)
+        return 'main'
+
+    def attachments(self) -> List[Tuple[str, str]]:
+        """(schema, file) pairs to ATTACH, audit first."""
+        return [(AUDIT_SCHEMA, self.audit_path)] + [
+            (self.output_schema(table), path) for table, path in sorted(self.output_paths.items())
+        ]
+
+    def files(self) -> List[str]:
+        return [self.db_path] + [path for _, path in self.attachments()]
+
+
+_layouts: Dict[str, StorageLayout] = {}
+_lock = threading.Lock()
+
+
+def _key(db_path: str) -> str:
+    return os.path.abspath(os.path.expanduser(db_path))
+
+
+def build_layout(db_path: str, config: Dict[str, Any]) -> Optional[StorageLayout]:
+    """The layout described by a config's ``storage`` section, or None for a single file."""
+    storage = config.get('storage') or {}
+    if storage.get('layout', 'single') != 'split':
+        return None
+    db_path = _key(db_path)
+    base_dir = os.path.dirname(db_path)
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    audit_path = os.path.expanduser(storage.get('audit_database') or os.path.join(base_dir, f"{stem}.audit.db"))
+    output_dir = os.path.expanduser(storage.get('output_dir') or base_dir)
+
+    output_tables = sorted({e['output_table'] for e in config.get('enrichments') or [] if e.get('output_table')})
+    if len(output_tables) + 1 > MAX_ATTACHED:
+        raise ValueError(
+            f"Split storage can attach at most {MAX_ATTACHED} databases, but the config has "
+            f"{len(output_tables)} output tables plus the audit database"
+        )
+    return StorageLayout(
+        db_path=db_path,
+        audit_path=_key(audit_path),
+        output_paths={table: _key(os.path.join(output_dir, f"{stem}.{table}.db")) for table in output_tables},
+    )
+
+
+def register_layout(layout: StorageLayout) -> None:
+    """Use ``layout`` for every connection to its database opened from now on."""
+    from .db_pool import connection_pool
+
+    with _lock:
+        _layouts[_key(layout.db_path)] = layout
+    # Idle connections were opened without the attachments
+    connection_pool.close_all(layout.db_path)
+    logging.info(f"Split storage: audit tables in {layout.audit_path}, "
+                 f"{len(layout.output_paths)} output table(s) in their own files")
+
+
+def unregister_layout(db_path: str) -> None:
+    from .db_pool import connection_pool
+
+    with _lock:
+        _layouts.pop(_key(db_path), None)
+    connection_pool.close_all(db_path)
+
+
+def configure_storage(db_path: str, config: Dict[str, Any]) -> Optional[StorageLayout]:
+    """Register the config's storage layout for ``db_path``, if it asks for one."""
+    layout = build_layout(db_path, config)
+    if layout is not None:
+        register_layout(layout)
+    return layout
+
+
+def get_layout(db_path: str) -> Optional[StorageLayout]:
+    with _lock:
+        return _layouts.get(_key(db_path))
+
+
+def schema_for(db_path: str, table: str) -> str:
+    """Schema ('main', 'audit' or 'out_<table>') that holds ``table`` for this database."""
+    layout = get_layout(db_path)
+    return layout.schema_for(table) if layout else 'main'
+
+
+def qualified(db_path: str, table: str, name: Optional[str] = None) -> str:
+    """``schema.name`` for an object belonging to ``table`` (``name`` defaults to the table itself)."""
+    return f"{schema_for(db_path, table)}.{name or table}"
+
+
+def file_for(db_path: str, table: str) -> str:
+    """Path of the SQLite file that holds ``table``."""
+    layout = get_layout(db_path)
+    if layout is None or layout.schema_for(table) == 'main':
+        return db_path
+    return dict(layout.attachments())[layout.schema_for(table)]
+
+
+def attach_databases(conn: sqlite3.Connection, db_path: str) -> None:
+    """ATTACH the layout's files to a freshly opened connection (no-op without a layout)."""
+    layout = get_layout(db_path)
+    if layout is None:
+        return
+    for schema, path in layout.attachments():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+        conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+        conn.execute(f"PRAGMA {schema}.synchronous=NORMAL")
+
+
+def table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    """True if a table or view named ``table`` exists in any attached database."""
+    return bool(conn.execute(f"PRAGMA table_info({table})").fetchall())
+
+
+def misplaced_tables(conn: sqlite3.Connection, db_path: str) -> List[str]:
+    """Tables still in the main file that the layout puts elsewhere (they shadow the attached copies)."""
+    layout = get_layout(db_path)
+    if layout is None:
+        return []
+    rows = conn.execute("SELECT name FROM main.sqlite_master WHERE type IN ('table', 'view')").fetchall()
+    return [name for (name,) in rows if layout.schema_for(name) != 'main']
+
+
+def move_tables_to_layout(db_path: str) -> Dict[str, int]:
+    """Move tables from the main file into the files the registered layout assigns them to.
+
+    Each table is recreated from its original definition (constraints and
+    indexes included) in its target file, its rows are copied, and the main
+    copy is dropped. Views are dropped and recreated by doctrail on next use.
+    Run VACUUM on the main file afterwards to reclaim the space.
+
+    Returns:
+        {table: rows moved}
+    """
+    from .db_operations import get_db_connection
+    from .schema_catalog import schema_catalog
+
+    moved = {}
+    with get_db_connection(db_path) as conn:
+        for table in misplaced_tables(conn, db_path):
+            schema = schema_for(db_path, table)
+            kind, create_sql = conn.execute(
+                "SELECT type, sql FROM main.sqlite_master WHERE name = ?", (table,)
+            ).fetchone()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if kind == 'view':
+                    conn.execute(f"DROP VIEW main.{table}")
+                    conn.commit()
+                    continue
+                if conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = ?", (table,)).fetchone():
+                    raise sqlite3.OperationalError(f"{table} exists in both the main file and {schema}; merge them by hand")
+                index_sql = [sql for (sql,) in conn.execute(
+                    "SELECT sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+                ).fetchall()]
+                conn.execute(re.sub(r'^(\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?)(["`\[]?\w+["`\]]?)',
+                                    rf'\1{schema}.\2', create_sql, count=1, flags=re.IGNORECASE))
+                conn.execute(f"INSERT INTO {schema}.{table} SELECT * FROM main.{table}")
+                moved[table] = conn.execute(f"SELECT COUNT(*) FROM {schema}.{table}").fetchone()[0]
+                conn.execute(f"DROP TABLE main.{table}")
+                for sql in index_sql:
+                    conn.execute(re.sub(r'^(\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?)',
+                                        rf'\1{schema}.', sql, count=1, flags=re.IGNORECASE))
+                conn.commit()
+                logging.info(f"Moved {table} ({moved[table]:,} rows) to {schema}")
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                schema_catalog.invalidate(db_path, table)
+    return moved
@@ -69,7 +69,7 @@ def extract_schema_types(schema_managers_path: Path) -> Set[str]:
 
 
 def extract_model_limits(llm_ops_path: Path) -> Dict[str, int]:
-    """Extract model context limits from llm_operations.py"""
+    """Extract model context limits from llm/token_utils.py"""
     with open(llm_ops_path, 'r') as f:
         content = f.read()
     
@@ -238,7 +238,7 @@ def build(readme: bool, docs: bool, all: bool, check: bool):
         # Extract various information
         commands = extract_cli_commands(src_path / "main.py")
         schema_types = extract_schema_types(src_path / "schema_managers.py")
-        model_limits = extract_model_limits(src_path / "llm_operations.py")
+        model_limits = extract_model_limits(src_path / "llm" / "token_utils.py")
         config_examples = extract_config_examples(examples_path)
         
         if check:
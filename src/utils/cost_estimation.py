@@ -5,7 +5,20 @@ Cost estimation for LLM API calls in doctrail.
 import json
 import logging
 from typing import Dict, Tuple, Optional, List
-import tiktoken
+
+from ..llm.token_utils import (
+    MODEL_ENCODINGS, get_encoding_for_model, count_tokens as _count_tokens,
+    count_tokens_batch, cache_count, get_cached_count, input_column_key,
+    get_model_context_limit, detect_script, calibrator
+)
+from ..core_utils import apply_column_limits, build_input_text
+from ..constants import MIN_CACHED_PREFIX_TOKENS
+
+# Above this many input characters the selection is estimated from a calibrated
+# sample instead of tokenising every row
+EXACT_COUNT_CHAR_BUDGET = 50_000_000
+CALIBRATION_SAMPLE_CHARS = 5_000_000
+SYSTEM_PROMPT_OVERHEAD = 200  # Approximate tokens for structured output instructions
 
 # Model pricing per 1M tokens (as of the user's provided data)
 MODEL_PRICING = {
@@ -75,57 +88,9 @@ MODEL_PRICING = {
     "gpt-4-turbo-preview": (10.00, None, 30.00),
 }
 
-# Model to encoding mapping
-MODEL_ENCODINGS = {
-    # GPT-4.x models likely use o200k_base
-    "gpt-4.1": "o200k_base",
-    "gpt-4.1-mini": "o200k_base",
-    "gpt-4.1-nano": "o200k_base",
-    "gpt-4.5-preview": "o200k_base",
-    # GPT-4o models use o200k_base
-    "gpt-4o": "o200k_base",
-    "gpt-4o-mini": "o200k_base",
-    # O-series models likely use o200k_base
-    "o1": "o200k_base",
-    "o3": "o200k_base",
-    "o3-mini": "o200k_base",
-    "o4-mini": "o200k_base",
-    # Legacy models
-    "gpt-4": "cl100k_base",
-    "gpt-4-turbo": "cl100k_base",
-    "gpt-4-turbo-preview": "cl100k_base",
-    "gpt-3.5-turbo": "cl100k_base",
-    "gpt-3.5-turbo-0125": "cl100k_base",
-    "gpt-3.5-turbo-1106": "cl100k_base",
-}
-
-
-def get_encoding_for_model(model: str) -> str:
-    """Get the encoding name for a model."""
-    # Strip version suffixes for lookup
-    base_model = model.split("-20")[0]
-    
-    # Check direct mapping first
-    if model in MODEL_ENCODINGS:
-        return MODEL_ENCODINGS[model]
-    elif base_model in MODEL_ENCODINGS:
-        return MODEL_ENCODINGS[base_model]
-    else:
-        # Default to o200k_base for newer models
-        logging.warning(f"Unknown model '{model}', defaulting to o200k_base encoding")
-        return "o200k_base"
-
-
 def count_tokens(text: str, model: str) -> int:
-    """Count tokens in text for a specific model."""
-    try:
-        encoding_name = get_encoding_for_model(model)
-        encoding = tiktoken.get_encoding(encoding_name)
-        return len(encoding.encode(text))
-    except Exception as e:
-        logging.warning(f"Error counting tokens: {e}. Using rough estimate.")
-        # Rough estimate: ~4 characters per token
-        return len(text) // 4
+    """Count tokens in text for a specific model (shared cached encoders)."""
+    return _count_tokens(text, model)
 
 
 def estimate_output_tokens(schema: Dict, num_rows: int) -> int:
@@ -159,6 +124,209 @@ def estimate_output_tokens(schema: Dict, num_rows: int) -> int:
     return tokens_per_row * num_rows
 
 
+def get_model_pricing(model: str) -> Tuple[float, Optional[float], float]:
+    """Return (input, cached_input, output) prices per 1M tokens for a model."""
+    pricing = MODEL_PRICING.get(model)
+    if not pricing:
+        # Try base model name
+        base_model = model.split("-20")[0]
+        pricing = MODEL_PRICING.get(base_model)
+    
+    if not pricing:
+        logging.warning(f"No pricing data for model '{model}', using gpt-4o pricing as estimate")
+        pricing = MODEL_PRICING.get("gpt-4o")
+    
+    return pricing
+
+
+def _percentile(sorted_values: List[int], pct: float) -> int:
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _row_input_length(row: Dict, parsed_input_cols: List[Tuple[str, Optional[int]]]) -> Tuple[int, str]:
+    """Length of a row's build_input_text output and a short head for script detection.
+    
+    Computed without materialising the text, so it stays cheap on large selections.
+    """
+    length, head = -1, ''
+    for col, limit in parsed_input_cols:
+        if col in ('rowid', 'sha1'):
+            continue
+        value = row.get(col)
+        if value is None and '.' in col:
+            value = row.get(col.split('.', 1)[1])
+        value = '' if value is None else (value if isinstance(value, str) else str(value))
+        size = min(len(value), limit) if limit else len(value)
+        length += len(col) + 3 + size  # "col: value" plus newline separator
+        if len(head) < 256:
+            head += value[:256]
+    return max(length, 0), head
+
+
+def count_selection_input_tokens(
+    model: str,
+    rows: List[Dict],
+    parsed_input_cols: List[Tuple[str, Optional[int]]],
+    exact_char_budget: int = EXACT_COUNT_CHAR_BUDGET,
+    sample_chars: int = CALIBRATION_SAMPLE_CHARS
+) -> Tuple[List[int], Dict[str, any]]:
+    """
+    Count input tokens for every row of a selection.
+    
+    Selections up to ``exact_char_budget`` characters are tokenised exactly
+    (threaded, memoised per sha1 so truncation later reuses the counts). Larger
+    selections tokenise an evenly spaced sample, derive chars-per-token ratios
+    per script, and extrapolate per row from its length, with bounds taken
+    from the spread of per-row ratios in the sample.
+    
+    Returns:
+        (per-row token counts, info dict with mode and bounds)
+    """
+    column_key = input_column_key(parsed_input_cols)
+    
+    def row_text(row: Dict) -> str:
+        return build_input_text(apply_column_limits(row, parsed_input_cols, warn_missing=False), parsed_input_cols)
+    
+    measured = [_row_input_length(row, parsed_input_cols) for row in rows]
+    total_chars = sum(length for length, _ in measured)
+    
+    if total_chars <= exact_char_budget:
+        counts: List[Optional[int]] = [
+            get_cached_count(model, row.get('sha1'), column_key) if row.get('sha1') else None
+            for row in rows
+        ]
+        missing = [i for i, count in enumerate(counts) if count is None]
+        for i, count in zip(missing, count_tokens_batch([row_text(rows[i]) for i in missing], model)):
+            counts[i] = count
+            if rows[i].get('sha1'):
+                cache_count(model, rows[i]['sha1'], column_key, None, count)
+        total = sum(counts)
+        return counts, {'mode': 'exact', 'total_lower': total, 'total_upper': total}
+    
+    # Evenly spaced sample of roughly sample_chars characters
+    step = max(1, total_chars // sample_chars)
+    sample_idx = list(range(0, len(rows), step))
+    sample_counts = count_tokens_batch([row_text(rows[i]) for i in sample_idx], model)
+    
+    ratios: Dict[str, List[float]] = {}
+    for i, count in zip(sample_idx, sample_counts):
+        if count > 0:
+            length, head = measured[i]
+            ratios.setdefault(detect_script(head), []).append(length / count)
+    mean_ratio = {script: sum(values) / len(values) for script, values in ratios.items()}
+    
+    exact = dict(zip(sample_idx, sample_counts))
+    counts = []
+    for i, (length, head) in enumerate(measured):
+        if i in exact:
+            counts.append(exact[i])
+        else:
+            script = detect_script(head)
+            counts.append(round(length / (mean_ratio.get(script) or calibrator.ratio(script))))
+    
+    all_ratios = sorted(r for values in ratios.values() for r in values)
+    total = sum(counts)
+    lower = upper = total
+    if all_ratios:
+        mean_all = sum(all_ratios) / len(all_ratios)
+        lower = round(total * mean_all / _percentile(all_ratios, 95))
+        upper = round(total * mean_all / _percentile(all_ratios, 5))
+    return counts, {'mode': f'calibrated ({len(sample_idx):,} row sample)', 'total_lower': lower, 'total_upper': upper}
+
+
+def estimate_selection_cost(
+    model: str,
+    prompt_template: str,
+    rows: List[Dict],
+    parsed_input_cols: List[Tuple[str, Optional[int]]],
+    schema: Dict,
+    num_rows: int,
+    truncate: bool = False,
+    safety_margin: int = 2000,
+    cached_prompt: bool = False
+) -> Tuple[float, Dict[str, any]]:
+    """
+    Estimate the cost of an enrichment from every row that will be processed.
+    
+    Args:
+        model: Model name
+        prompt_template: Enrichment prompt (including any appended file)
+        rows: The rows that still need processing
+        parsed_input_cols: Parsed input column specs (name, char limit)
+        schema: Output schema (for output token estimate)
+        num_rows: Total rows selected by the query
+        truncate: Whether over-long inputs will be truncated to the context window
+        safety_margin: Tokens reserved for the response
+        cached_prompt: The prompt is sent as a stable prefix (prompt_layout: prefix), so after
+            the first request it is billed at the cached input rate
+    
+    Returns:
+        (total_cost, cost_breakdown) - breakdown is compatible with format_cost_estimate
+    """
+    input_price, cached_price, output_price = get_model_pricing(model)
+    rows_to_process = len(rows)
+    
+    prompt_tokens = count_tokens(prompt_template, model) + SYSTEM_PROMPT_OVERHEAD
+    input_counts, info = count_selection_input_tokens(model, rows, parsed_input_cols)
+    
+    context_limit = get_model_context_limit(model)
+    max_input = max(0, context_limit - safety_margin - prompt_tokens)
+    rows_over_context = sum(1 for count in input_counts if count > max_input)
+    billed_counts = [min(count, max_input) for count in input_counts] if truncate else input_counts
+    
+    total_input_tokens = prompt_tokens * rows_to_process + sum(billed_counts)
+    # Scale the bounds by the same billed/raw ratio
+    raw_total = sum(input_counts) or 1
+    billed_ratio = sum(billed_counts) / raw_total
+    input_lower = prompt_tokens * rows_to_process + round(info['total_lower'] * billed_ratio)
+    input_upper = prompt_tokens * rows_to_process + round(info['total_upper'] * billed_ratio)
+    
+    total_output_tokens = estimate_output_tokens(schema or {}, rows_to_process)
+    
+    cached_input_tokens = 0
+    if cached_prompt and prompt_tokens >= MIN_CACHED_PREFIX_TOKENS and rows_to_process > 1:
+        cached_input_tokens = prompt_tokens * (rows_to_process - 1)
+    cached_price = cached_price if cached_price is not None else input_price
+    
+    input_cost = ((total_input_tokens - cached_input_tokens) * input_price + cached_input_tokens * cached_price) / 1_000_000
+    output_cost = (total_output_tokens / 1_000_000) * output_price
+    total_cost = input_cost + output_cost
+    
+    per_row = sorted(prompt_tokens + count for count in billed_counts)
+    breakdown = {
+        "model": model,
+        "total_rows_in_query": num_rows,
+        "rows_to_process": rows_to_process,
+        "rows_already_processed": num_rows - rows_to_process,
+        "input_tokens_per_row": total_input_tokens // rows_to_process if rows_to_process > 0 else 0,
+        "output_tokens_per_row": total_output_tokens // rows_to_process if rows_to_process > 0 else 0,
+        "total_input_tokens": total_input_tokens,
+        "total_output_tokens": total_output_tokens,
+        "total_tokens": total_input_tokens + total_output_tokens,
+        "input_price_per_1m": input_price,
+        "cached_input_tokens": cached_input_tokens,
+        "cached_price_per_1m": cached_price,
+        "output_price_per_1m": output_price,
+        "input_cost": input_cost,
+        "output_cost": output_cost,
+        "total_cost": total_cost,
+        "estimation_mode": info['mode'],
+        "input_tokens_lower": input_lower,
+        "input_tokens_upper": input_upper,
+        "p50_input_tokens": _percentile(per_row, 50),
+        "p95_input_tokens": _percentile(per_row, 95),
+        "max_input_tokens": per_row[-1] if per_row else 0,
+        "context_limit": context_limit,
+        "rows_over_context": rows_over_context,
+        "truncate": truncate,
+    }
+    
+    return total_cost, breakdown
+
+
 def estimate_enrichment_cost(
     model: str,
     prompt_template: str,
@@ -173,18 +341,7 @@ def estimate_enrichment_cost(
     Returns:
         (total_cost, cost_breakdown)
     """
-    # Get pricing for model
-    pricing = MODEL_PRICING.get(model)
-    if not pricing:
-        # Try base model name
-        base_model = model.split("-20")[0]
-        pricing = MODEL_PRICING.get(base_model)
-    
-    if not pricing:
-        logging.warning(f"No pricing data for model '{model}', using gpt-4o pricing as estimate")
-        pricing = MODEL_PRICING.get("gpt-4o")
-    
-    input_price, _, output_price = pricing
+    input_price, _, output_price = get_model_pricing(model)
     
     # Estimate input tokens
     # Build a sample prompt with the template and sample data
@@ -246,6 +403,23 @@ def format_cost_estimate(breakdown: Dict[str, any]) -> str:
         f"      Total: ${breakdown['total_cost']:.4f}",
     ]
     
+    if 'p50_input_tokens' in breakdown:
+        # Distribution details go right after the input token line
+        details = [
+            f"      Estimation: {breakdown['estimation_mode']}",
+            f"      Input per row: p50 {breakdown['p50_input_tokens']:,} / p95 {breakdown['p95_input_tokens']:,} / max {breakdown['max_input_tokens']:,} tokens",
+        ]
+        if breakdown['input_tokens_lower'] != breakdown['input_tokens_upper']:
+            details.append(f"      Input range: {breakdown['input_tokens_lower']:,} - {breakdown['input_tokens_upper']:,} tokens")
+        lines[7:7] = details
+        if breakdown['rows_over_context']:
+            action = "will be truncated" if breakdown['truncate'] else "exceed the context window (use --truncate or chunking)"
+            lines.append(f"\n   ✂️  {breakdown['rows_over_context']:,} rows {action} ({breakdown['context_limit']:,} token limit)")
+    
+    if breakdown.get('cached_input_tokens'):
+        lines.insert(lines.index(f"      Output: ${breakdown['output_cost']:.4f} (${breakdown['output_price_per_1m']:.2f}/1M tokens)"),
+                     f"      (of which {breakdown['cached_input_tokens']:,} cached prompt tokens at ${breakdown['cached_price_per_1m']:.2f}/1M)")
+    
     if breakdown['total_cost'] > 1.00:
         lines.append(f"\n   ⚠️  Estimated cost: ${breakdown['total_cost']:.2f}")
     
@@ -14,7 +14,7 @@ class SpinnerTqdm(tqdm):
         self.use_spinner = kwargs.pop('use_spinner', False)
         if self.use_spinner:
             self.spinner = itertools.cycle(SPINNER_CHARS)
-            kwargs['bar_format'] = '{desc} {spinner} {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} docs [{rate_fmt}]'
+            kwargs['bar_format'] = '{desc} {spinner} {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} docs [{rate_fmt}{postfix}]'
         super().__init__(*args, **kwargs)
     
     def format_meter(self, n, total, elapsed, ncols=None, prefix='', ascii=False, 
@@ -0,0 +1,183 @@
+"""
+WAL checkpointing driven by the size of the -wal file.
+
+SQLite's automatic checkpoints stall while long-running readers hold old
+snapshots, and a TRUNCATE checkpoint waits for every reader and writer, so
+neither works well during a long enrichment. ``CheckpointManager`` checks the
+-wal file periodically and picks the mildest checkpoint that keeps it bounded:
+
+- below ``passive_bytes`` nothing is done;
+- at an idle point (no pooled connection in use for ``idle_seconds``) it runs
+  TRUNCATE, which also shrinks the file;
+- above ``restart_bytes`` it runs RESTART even while busy, so the next writer
+  starts over at the beginning of the log;
+- otherwise it runs PASSIVE, which never blocks readers or writers.
+
+``run_checkpointer`` runs a manager as a background task for the duration of
+an ``async with`` block.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from .constants import WAL_CHECK_INTERVAL, WAL_IDLE_SECONDS, WAL_PASSIVE_BYTES, WAL_RESTART_BYTES
+from .db_pool import connection_pool
+from .storage_layout import get_layout
+
+
+@dataclass
+class CheckpointResult:
+    mode: str
+    busy: bool  # the checkpoint could not finish (readers or writers in the way)
+    wal_frames: int
+    checkpointed_frames: int
+    wal_bytes_before: int
+    wal_bytes_after: int
+    seconds: float
+
+
+def format_wal_size(size: int) -> str:
+    return f"{size / (1024 * 1024):.0f}MB" if size >= 1024 * 1024 else f"{size / 1024:.0f}KB"
+
+
+class CheckpointManager:
+    """Decides when and how to checkpoint one database's WAL."""
+
+    def __init__(self, db_path: str, passive_bytes: int = WAL_PASSIVE_BYTES,
+                 restart_bytes: int = WAL_RESTART_BYTES, idle_seconds: float = WAL_IDLE_SECONDS,
+                 conn: Optional[sqlite3.Connection] = None):
+        """``conn`` runs the checkpoints on the caller's own connection instead of a pooled one."""
+        self.db_path = db_path
+        self.conn = conn
+        self.passive_bytes = passive_bytes
+        self.restart_bytes = restart_bytes
+        self.idle_seconds = idle_seconds
+        self.last_result: Optional[CheckpointResult] = None
+        self.size_listeners: List[Callable[[int], None]] = []  # see run_checkpointer
+        self.checkpoints = 0
+
+    def wal_paths(self) -> List[str]:
+        """The -wal files of the database and, with split storage, of its attached files."""
+        layout = get_layout(self.db_path)
+        return [f"{path}-wal" for path in (layout.files() if layout else [self.db_path])]
+
+    def wal_size(self) -> int:
+        """Total size of the -wal files (``PRAGMA wal_checkpoint`` covers all attached databases)."""
+        total = 0
+        for path in self.wal_paths():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def is_idle(self) -> bool:
+        """No doctrail connection to the database is in use and none was returned in the last idle_seconds."""
+        in_use, since_release = connection_pool.activity(self.db_path)
+        return in_use == 0 and (since_release is None or since_release >= self.idle_seconds)
+
+    def choose_mode(self, wal_bytes: int, idle: bool) -> Optional[str]:
+        if wal_bytes < self.passive_bytes:
+            return None
+        if idle:
+            return 'TRUNCATE'
+        if wal_bytes >= self.restart_bytes:
+            return 'RESTART'
+        return 'PASSIVE'
+
+    def checkpoint(self, mode: str) -> CheckpointResult:
+        """Run ``PRAGMA wal_checkpoint(mode)``."""
+        before = self.wal_size()
+        start = time.perf_counter()
+        with (nullcontext(self.conn) if self.conn is not None else connection_pool.connection(self.db_path)) as conn:
+            busy, wal_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        result = CheckpointResult(mode, bool(busy), wal_frames, checkpointed, before, self.wal_size(),
+                                  time.perf_counter() - start)
+        self.last_result = result
+        self.checkpoints += 1
+        level = logging.INFO if mode != 'PASSIVE' else logging.DEBUG
+        logging.log(level, f"WAL checkpoint ({mode}): {format_wal_size(before)} -> {format_wal_size(result.wal_bytes_after)}, "
+                           f"{checkpointed}/{wal_frames} frames in {result.seconds:.2f}s" + (" (busy)" if busy else ""))
+        return result
+
+    def tick(self, idle: Optional[bool] = None) -> Optional[CheckpointResult]:
+        """Checkpoint if the WAL has grown enough. ``idle`` overrides the pool-based idle detection."""
+        wal_bytes = self.wal_size()
+        mode = self.choose_mode(wal_bytes, self.is_idle() if idle is None else idle)
+        if mode is None:
+            return None
+        try:
+            return self.checkpoint(mode)
+        except Exception as e:
+            logging.warning(f"WAL checkpoint failed (non-critical): {e}")
+            return None
+
+    def finish(self) -> Optional[CheckpointResult]:
+        """End-of-run checkpoint: TRUNCATE whatever is left in the WAL."""
+        if self.wal_size() == 0:
+            return None
+        try:
+            return self.checkpoint('TRUNCATE')
+        except Exception as e:
+            logging.warning(f"WAL checkpoint failed (non-critical): {e}")
+            return None
+
+
+_active: Dict[str, CheckpointManager] = {}
+
+
+@asynccontextmanager
+async def run_checkpointer(db_path: str, interval: float = WAL_CHECK_INTERVAL,
+                           on_size: Optional[Callable[[int], None]] = None) -> AsyncIterator[CheckpointManager]:
+    """Check the WAL every ``interval`` seconds while the block runs, and TRUNCATE it at the end.
+
+    ``on_size`` is called with the -wal file size after every check, e.g. to
+    show it in a progress bar. Blocks nested in (or running concurrently with)
+    another one for the same database share its checker; only the outermost
+    block truncates at the end, so concurrent enrichments don't stall each other.
+    """
+    key = os.path.abspath(os.path.expanduser(db_path))
+    listeners = [on_size] if on_size else []
+    active = _active.get(key)
+    if active is not None:
+        active.size_listeners.extend(listeners)
+        try:
+            yield active
+        finally:
+            for listener in listeners:
+                active.size_listeners.remove(listener)
+        return
+
+    manager = CheckpointManager(db_path)
+    manager.size_listeners = listeners
+
+    def report() -> None:
+        size = manager.wal_size()
+        for listener in list(manager.size_listeners):
+            listener(size)
+
+    async def loop():
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(manager.tick)
+            report()
+
+    _active[key] = manager
+    task = asyncio.create_task(loop())
+    try:
+        yield manager
+    finally:
+        del _active[key]
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(manager.finish)
+        report()
@@ -0,0 +1,38 @@
+"""Unit tests for the benchmark suite's corpus generation and baseline comparison."""
+
+import os
+import sqlite3
+from benchmarks.compare import compare, direction
+from benchmarks.corpus import populate_database, write_corpus
+from src.schema_managers import contains_hanzi
+
+
+def results(**stages):
+    return {'stages': stages}
+
+
+def test_corpus_is_reproducible_and_mixes_languages(tmp_path):
+    first = write_corpus(str(tmp_path / 'a'), 40, 500, zh_share=0.5, html_share=0.25, seed=7)
+    second = write_corpus(str(tmp_path / 'b'), 40, 500, zh_share=0.5, html_share=0.25, seed=7)
+    assert [open(a).read() for a in first] == [open(b).read() for b in second]
+    assert 0 < sum(p.endswith('.html') for p in first) < 40
+    assert 0 < sum(contains_hanzi(open(p).read()) for p in first) < 40
+
+    db_path = str(tmp_path / 'bench.db')
+    populate_database(db_path, 25, 300, seed=7)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0] == 25
+
+
+def test_regressions_respect_direction_and_thresholds():
+    assert (direction('enrich.rows_per_s'), direction('enrich.llm_p95_ms'), direction('enrich.rows')) == (1, -1, None)
+    baseline = results(enrich={'rows': 100, 'rows_per_s': 50.0, 'wall_s': 2.0, 'llm_p99_ms': 100.0, 'peak_rss_mb': 100.0})
+    baseline['thresholds'] = {'enrich.llm_p99_ms': 1.0}
+    current = results(enrich={'rows': 10, 'rows_per_s': 35.0, 'wall_s': 1.5, 'llm_p99_ms': 180.0, 'peak_rss_mb': 119.0})
+
+    by_metric = {c['metric']: c for c in compare(current, baseline, threshold=0.2)}
+    assert 'enrich.rows' not in by_metric
+    assert by_metric['enrich.rows_per_s']['regressed']  # 30% slower
+    assert not by_metric['enrich.wall_s']['regressed']  # faster
+    assert not by_metric['enrich.llm_p99_ms']['regressed']  # within its own threshold
+    assert not by_metric['enrich.peak_rss_mb']['regressed']
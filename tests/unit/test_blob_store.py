@@ -0,0 +1,102 @@
+"""Unit tests for compressed, deduplicated blob storage of enrichment responses."""
+
+import sqlite3
+import pytest
+from src.blob_store import compress_text, decompress_text, COMPRESS_MIN_CHARS, RAW_JSON_INLINE_LIMIT
+from src.db_operations import (
+    compact_enrichment_responses, ensure_enrichment_responses_table, ensure_prompts_table,
+    get_db_connection, get_enrichment_response_history, store_raw_enrichment_response
+)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    ensure_enrichment_responses_table(path)
+    return path
+
+
+def count(db_path, query):
+    with get_db_connection(db_path) as conn:
+        return conn.execute(query).fetchone()[0]
+
+
+def test_compress_roundtrip():
+    text = "文書 text " * 1000
+    codec, data = compress_text(text)
+    assert codec == 'zlib' and len(data) < len(text.encode('utf-8'))
+    assert decompress_text(codec, data) == text
+    # Short texts stay plain so SQL outside doctrail can read them
+    assert compress_text("short") == ('none', "short")
+    assert decompress_text(None, None) is None
+
+
+class TestStoreRawEnrichmentResponse:
+    """Test blob-backed storage through store_raw_enrichment_response."""
+
+    def test_prompt_and_document_stored_once(self, db_path):
+        document = "content: " + "long document text " * 200
+        for name in ("summary", "topics"):
+            for model in ("gpt-4o-mini", "gemini-2.5-flash"):
+                store_raw_enrichment_response(
+                    db_path, "sha", name, '{"a": 1}', model, full_prompt=f"Do {name}\n\n{document}",
+                    input_text=document
+                )
+        # One document blob plus one instruction blob per enrichment
+        assert count(db_path, "SELECT COUNT(*) FROM blobs") == 3
+        assert count(db_path, "SELECT COUNT(*) FROM enrichment_responses WHERE full_prompt IS NOT NULL") == 0
+
+        history = get_enrichment_response_history(db_path, sha1="sha", enrichment_name="topics")
+        assert history[0]['full_prompt'] == f"Do topics\n\n{document}"
+
+    def test_long_response_moved_to_blob(self, db_path):
+        raw_json = '{"text": "' + "x" * RAW_JSON_INLINE_LIMIT + '"}'
+        store_raw_enrichment_response(db_path, "sha", "e", raw_json, "m")
+        assert count(db_path, "SELECT length(raw_json) FROM enrichment_responses") == 0
+        assert count(db_path, "SELECT codec FROM blobs") == 'zlib'
+        assert get_enrichment_response_history(db_path)[0]['parsed_json']['text'].startswith("xxx")
+
+    def test_plain_view_readable_without_doctrail(self, db_path):
+        short_doc = "content: plain text"
+        long_doc = "content: " + "y" * COMPRESS_MIN_CHARS
+        store_raw_enrichment_response(db_path, "a", "e", '{"a": 1}', "m",
+                                      full_prompt=f"Do e\n\n{short_doc}", input_text=short_doc)
+        store_raw_enrichment_response(db_path, "b", "e", '{"a": 2}', "m",
+                                      full_prompt=f"Do e\n\n{long_doc}", input_text=long_doc)
+        # A bare connection, as the sqlite3 shell or Datasette would open it: no blob_text()
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute("SELECT sha1, raw_json, full_prompt FROM enrichment_responses_plain ORDER BY sha1").fetchall()
+            with pytest.raises(sqlite3.OperationalError, match="blob_text"):
+                conn.execute("SELECT full_prompt FROM enrichment_responses_full").fetchall()
+        finally:
+            conn.close()
+        # The compressed document reads as NULL rather than as a truncated prompt
+        assert rows == [('a', '{"a": 1}', f"Do e\n\n{short_doc}"), ('b', '{"a": 2}', None)]
+
+
+def test_compact_legacy_rows(db_path):
+    ensure_prompts_table(db_path)
+    document = "content: " + "legacy text " * 500
+    long_response = '{"text": "' + "z" * RAW_JSON_INLINE_LIMIT + '"}'
+    with get_db_connection(db_path) as conn:
+        conn.execute(
+            "INSERT INTO prompts (prompt_id, enrichment_name, prompt_text, prompt_hash) VALUES ('p1', 'e', 'Summarise', 'h')"
+        )
+        for i in range(5):
+            conn.execute(
+                "INSERT INTO enrichment_responses (enrichment_id, sha1, enrichment_name, raw_json, model_used, prompt_id, full_prompt) "
+                "VALUES (?, 'sha', 'e', ?, 'm', 'p1', ?)",
+                (f"id{i}", long_response if i == 0 else '{}', f"Summarise\n\n{document}")
+            )
+        conn.commit()
+
+    stats = compact_enrichment_responses(db_path)
+    assert stats['rows_compacted'] == 5
+    assert stats['blobs'] == 3
+    assert count(db_path, "SELECT COUNT(*) FROM enrichment_responses WHERE full_prompt IS NOT NULL") == 0
+    history = get_enrichment_response_history(db_path)
+    assert all(r['full_prompt'] == f"Summarise\n\n{document}" for r in history)
+    assert long_response in [r['raw_json'] for r in history]
+    # Nothing left to do on a second pass
+    assert compact_enrichment_responses(db_path, vacuum=False)['rows_compacted'] == 0
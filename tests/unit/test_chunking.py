@@ -0,0 +1,147 @@
+"""Unit tests for chunked (map-reduce) enrichment helpers."""
+
+import asyncio
+import pytest
+from pydantic import BaseModel
+from src import llm_operations
+from src.llm.chunking import parse_chunking_config, chunk_text, merge_chunk_results
+from src.llm.token_utils import ApproximateEncoding
+from src.db_operations import (
+    ensure_enrichment_responses_table, store_raw_enrichment_response, get_chunk_responses
+)
+
+
+class TestParseChunkingConfig:
+    """Test parse_chunking_config function."""
+
+    def test_disabled(self):
+        assert parse_chunking_config(None) is None
+        assert parse_chunking_config(False) is None
+
+    def test_true_uses_defaults(self):
+        settings = parse_chunking_config(True)
+        assert settings['reduce'] == 'merge'
+        assert settings['chunk_tokens'] > settings['overlap_tokens']
+
+    def test_invalid_overlap(self):
+        with pytest.raises(ValueError):
+            parse_chunking_config({'chunk_tokens': 100, 'overlap_tokens': 100})
+
+    def test_unknown_reducer(self):
+        with pytest.raises(ValueError):
+            parse_chunking_config({'reducers': {'topics': 'intersect'}})
+
+
+class TestChunkText:
+    """Test chunk_text function."""
+
+    def test_short_text_single_chunk(self):
+        assert chunk_text("short", "gpt-4o", 100, 10, encoding=ApproximateEncoding()) == ["short"]
+
+    def test_chunks_overlap_and_cover_text(self):
+        text = "abcdefghijklmnopqrstuvwxyz" * 4
+        chunks = chunk_text(text, "gpt-4o", 5, 1, encoding=ApproximateEncoding())
+        assert len(chunks) > 1
+        assert all(len(c) <= 20 for c in chunks)
+        # Each chunk starts with the last token (4 chars) of the previous one
+        assert chunks[1].startswith(chunks[0][-4:])
+        assert chunks[-1].endswith(text[-4:])
+
+    def test_multibyte_text_not_split_mid_character(self):
+        text = "中文字符测试" * 10
+        chunks = chunk_text(text, "gpt-4o", 5, 0, encoding=ApproximateEncoding())
+        assert "".join(chunks) == text
+
+
+class TestMergeChunkResults:
+    """Test merge_chunk_results function."""
+
+    def test_union_lists_and_first_scalar(self):
+        merged = merge_chunk_results([
+            {'topics': ['a', 'b'], 'title': None, 'count': 1},
+            {'topics': ['b', 'c'], 'title': 'Report', 'count': 2},
+        ])
+        assert merged == {'topics': ['a', 'b', 'c'], 'title': 'Report', 'count': 1}
+
+    def test_reducer_override(self):
+        merged = merge_chunk_results(
+            [{'count': 1, 'summary': 'x'}, {'count': 5, 'summary': 'y'}],
+            {'count': 'max', 'summary': 'concat'}
+        )
+        assert merged == {'count': 5, 'summary': 'x\n\ny'}
+
+    def test_all_null_field(self):
+        assert merge_chunk_results([{'a': None}, {'a': []}]) == {'a': None}
+
+
+def test_get_chunk_responses_skips_errors(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    ensure_enrichment_responses_table(db_path)
+    store_raw_enrichment_response(db_path, 's1', 'e', '{"x": 1}', 'm', 'id0', 'p1', None, 0, 2)
+    store_raw_enrichment_response(db_path, 's1', 'e', '{"error": "boom"}', 'm', 'id1', 'p1', None, 1, 2)
+    store_raw_enrichment_response(db_path, 's1', 'e', '{"x": 3}', 'm', 'id2', 'p2', None, 1, 2)
+
+    assert get_chunk_responses(db_path, 's1', 'e', 'm', 'p1', 2) == {0: {'x': 1}}
+    assert get_chunk_responses(db_path, 's1', 'e', 'm', 'p1', 3) == {}
+
+
+def test_chunked_enrichment_streams_chunk_and_reduce_calls(tmp_path, monkeypatch):
+    class Topics(BaseModel):
+        topics: list
+
+    calls = []
+
+    async def fake_call(model, messages, pydantic_model, *args, **kwargs):
+        calls.append(kwargs.get('stream', False))
+        return pydantic_model(topics=['a'])
+
+    monkeypatch.setattr(llm_operations, 'call_llm_structured', fake_call)
+    db_path = str(tmp_path / "test.db")
+    ensure_enrichment_responses_table(db_path)
+    chunking = {**parse_chunking_config({'chunk_tokens': 50, 'overlap_tokens': 0}), 'reduce': 'llm'}
+
+    async def run():
+        return await llm_operations.process_row_chunked(
+            row={'rowid': 1, 'sha1': 's1', 'content': 'word ' * 200}, input_cols=['content'],
+            parsed_input_cols=[('content', None)], prompt='List topics', model='gpt-4o-mini',
+            semaphore=asyncio.Semaphore(4), pbar=llm_operations.tqdm(disable=True), pydantic_model=Topics,
+            chunking=chunking, db_path=db_path, enrichment_name='e', streaming=True
+        )
+
+    result = asyncio.run(run())
+    assert result['chunk_count'] > 1
+    # Every chunk call plus the reduce call
+    assert len(calls) == result['chunk_count'] + 1 and all(calls)
+
+
+def test_chunked_enrichment_sends_a_shared_prefix(tmp_path, monkeypatch):
+    class Topics(BaseModel):
+        topics: list
+
+    calls = []
+
+    async def fake_call(model, messages, pydantic_model, *args, **kwargs):
+        calls.append((messages, kwargs.get('cache_prefix', 0)))
+        return pydantic_model(topics=['a'])
+
+    monkeypatch.setattr(llm_operations, 'call_llm_structured', fake_call)
+    db_path = str(tmp_path / "test.db")
+    ensure_enrichment_responses_table(db_path)
+    chunking = {**parse_chunking_config({'chunk_tokens': 50, 'overlap_tokens': 0}), 'reduce': 'llm'}
+
+    async def run():
+        return await llm_operations.process_row_chunked(
+            row={'rowid': 1, 'sha1': 's1', 'title': 'Report', 'content': 'word ' * 200},
+            input_cols=['title', 'content'], parsed_input_cols=[('title', None), ('content', None)],
+            prompt='List topics of {title}', model='gpt-4o-mini', semaphore=asyncio.Semaphore(4),
+            pbar=llm_operations.tqdm(disable=True), pydantic_model=Topics, chunking=chunking,
+            db_path=db_path, enrichment_name='e', prompt_layout='prefix'
+        )
+
+    result = asyncio.run(run())
+    chunk_calls, reduce_call = calls[:-1], calls[-1]
+    assert len(chunk_calls) == result['chunk_count']
+    # Every chunk starts with the same row-independent instructions, marked as a cacheable prefix
+    assert {messages[0]['content'] for messages, _ in chunk_calls} == {'List topics of (title, given below)'}
+    assert all(len(messages) == 2 and prefix == 1 for messages, prefix in calls)
+    assert reduce_call[0][1]['content'].startswith('Partial results:')
@@ -0,0 +1,101 @@
+"""Unit tests for the SQLite connection pool."""
+
+import asyncio
+import sqlite3
+import pytest
+from src import db_pool
+from src.db_pool import ConnectionPool, run_db
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    return path
+
+
+def test_connections_are_configured_once_and_reused(db_path):
+    pool = ConnectionPool()
+    waits = []
+    pool.add_wait_listener(lambda path, wait, reused: waits.append(reused))
+
+    with pool.connection(db_path) as conn:
+        first = conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+    with pool.connection(db_path) as conn:
+        assert conn is first
+
+    assert waits == [False, True]
+    assert (pool.stats.opened, pool.stats.reused) == (1, 1)
+    pool.close_all()
+
+
+def test_release_resets_connection_state(db_path):
+    pool = ConnectionPool()
+    with pool.connection(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        conn.execute("INSERT INTO t VALUES (1)")  # never committed
+    with pool.connection(db_path) as conn:
+        assert conn.row_factory is None
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close_all()
+
+
+def test_closed_connections_are_not_pooled(db_path):
+    pool = ConnectionPool()
+    with pool.connection(db_path) as conn:
+        conn.close()
+    assert pool.idle_count(db_path) == 0
+
+
+def test_run_db_retries_locked_database(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(db_pool.asyncio, "sleep", fake_sleep)
+    calls = []
+
+    def write():
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return "ok"
+
+    assert asyncio.run(run_db(write)) == "ok"
+    assert len(calls) == 2 and sleeps == [2]
+
+
+def test_run_db_does_not_retry_other_errors():
+    def broken():
+        raise sqlite3.OperationalError("no such table: missing")
+
+    with pytest.raises(sqlite3.OperationalError, match="no such table"):
+        asyncio.run(run_db(broken))
+
+
+def test_connections_opened_in_run_db_do_not_sleep_on_a_lock(db_path, monkeypatch):
+    pool = ConnectionPool()
+    opens = []
+
+    def locked(path, timeout):
+        opens.append(path)
+        raise sqlite3.OperationalError("database is locked")
+
+    def no_blocking_sleep(seconds):
+        raise AssertionError("acquire slept in a run_db worker")
+
+    async def fake_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(pool, "_open", locked)
+    monkeypatch.setattr(db_pool.time, "sleep", no_blocking_sleep)
+    monkeypatch.setattr(db_pool.asyncio, "sleep", fake_sleep)
+
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        asyncio.run(run_db(pool.acquire, db_path, retries=2))
+    # One open per run_db attempt; the backoff happened on the event loop
+    assert len(opens) == 2
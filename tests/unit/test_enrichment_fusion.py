@@ -0,0 +1,89 @@
+"""Unit tests for fused enrichments (several schemas answered by one request per row)."""
+
+import sqlite3
+from src.db_operations import ensure_enrichment_responses_table, ensure_output_table, store_raw_enrichment_response
+from src.enrichment_config import prepare_enrichment_for_processing
+from src.enrichment_fusion import FusedGroup, plan_fusion, rows_needing
+from src.enrichment_scheduler import EnrichmentScheduler
+
+QUERY = "SELECT rowid, sha1 FROM documents ORDER BY rowid"
+
+
+def enrichment(name, output_table, query=QUERY, **extra):
+    return {'name': name, 'output_table': output_table, 'prompt': f"Answer {name}.",
+            'schema': {f"{name}_label": {'enum': ['yes', 'no']}},
+            'input': {'query': query, 'input_columns': ['raw_content']}, **extra}
+
+
+CONFIG = {
+    'sql_queries': {'all_docs': QUERY},
+    'enrichments': [
+        enrichment('topic', 'topics'),
+        enrichment('tone', 'tones', query='all_docs'),  # same query, by name
+        enrichment('other_model', 'others', model='gpt-4o'),
+        enrichment('needs_topic', 'needs', query="SELECT d.rowid, d.sha1 FROM documents d JOIN topics t ON t.sha1 = d.sha1"),
+        {'name': 'direct', 'output_column': 'flag', 'prompt': "Flag it.", 'schema': {'flag': {'type': 'boolean'}},
+         'input': {'query': QUERY, 'input_columns': ['raw_content']}},
+    ],
+}
+
+
+def strategies():
+    return {e['name']: prepare_enrichment_for_processing(e, 'documents')[0] for e in CONFIG['enrichments']}
+
+
+def test_only_compatible_enrichments_are_fused():
+    scheduler = EnrichmentScheduler(CONFIG['enrichments'], CONFIG)
+    groups = plan_fusion(CONFIG['enrichments'], strategies(), CONFIG, scheduler.dependencies)
+    assert [group.names for group in groups] == [['topic', 'tone']]
+
+    scheduler.fuse([group.names for group in groups])
+    assert scheduler.dependencies['needs_topic'] == {'topic'}
+    assert 'tone' not in scheduler.dependencies
+    assert scheduler.describe() == 'direct, other_model, topic+tone → needs_topic'
+
+
+def test_dependent_enrichments_are_not_fused():
+    enrichments = [enrichment('first', 'firsts'), enrichment('second', 'seconds', depends_on=['first'])]
+    config = {'enrichments': enrichments}
+    dependencies = EnrichmentScheduler(enrichments, config).dependencies
+    found = {e['name']: prepare_enrichment_for_processing(e, 'documents')[0] for e in enrichments}
+    assert plan_fusion(enrichments, found, config, dependencies) == []
+
+
+def test_response_model_splits_into_each_schema():
+    found = strategies()
+    group = FusedGroup([CONFIG['enrichments'][0], CONFIG['enrichments'][1]], [found['topic'], found['tone']])
+    model = group.response_model()
+
+    response = model(topic={'topic_label': 'yes'}, tone={'tone_label': 'no'})
+    model.apply_conversions(response)
+    model.validate_languages(response)
+
+    assert group.split(response.model_dump(mode='json')) == {'topic': {'topic_label': 'yes'}, 'tone': {'tone_label': 'no'}}
+    assert group.split(None) == {'topic': None, 'tone': None}
+    prompt = group.prompt()
+    assert prompt.index("Answer topic.") < prompt.index("Answer tone.")
+    assert set(group.schema()) == {'topic.topic_label', 'tone.tone_label'}
+
+
+def test_field_names_are_valid_and_distinct():
+    group = FusedGroup([{'name': 'a-b'}, {'name': 'a_b'}, {'name': '1st'}], [None, None, None])
+    assert group.fields() == {'a-b': 'a_b', 'a_b': 'task_2_a_b', '1st': 'task_3_1st'}
+
+
+def test_rows_needing_checks_responses_and_output_rows(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE documents (sha1 TEXT PRIMARY KEY, raw_content TEXT)")
+    rows = [{'rowid': i, 'sha1': f"s{i}"} for i in (1, 2, 3)]
+    assert rows_needing(db_path, 'topic', 'topics', 'sha1', 'm', rows) == rows
+
+    ensure_enrichment_responses_table(db_path)
+    store_raw_enrichment_response(db_path, 's1', 'topic', '{}', 'm')
+    ensure_output_table(db_path, 'topics', 'sha1', ['topic_label'], is_derived_table=True)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO topics (sha1, model_used, topic_label) VALUES ('s2', 'm', 'yes')")
+
+    assert rows_needing(db_path, 'topic', 'topics', 'sha1', 'm', rows) == rows[2:]
+    assert rows_needing(db_path, 'topic', 'topics', 'sha1', 'other', rows) == rows
@@ -0,0 +1,89 @@
+"""Unit tests for keyset row fetching and enrichment run checkpoints."""
+
+import sqlite3
+import pytest
+from src.db_operations import fetch_rows_keyset, split_limit
+from src.enrichment_runs import RunTracker, get_run, list_runs, query_hash, start_run
+
+QUERY = "SELECT rowid, sha1 FROM documents WHERE n % 2 = 0 ORDER BY rowid"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE documents (sha1 TEXT PRIMARY KEY, n INTEGER, raw_content TEXT)")
+        conn.executemany("INSERT INTO documents VALUES (?, ?, ?)", [(f"s{i}", i, f"text {i}") for i in range(1, 51)])
+    return path
+
+
+def test_keyset_pages_match_a_single_query(db_path):
+    rows = fetch_rows_keyset(db_path, QUERY, ["raw_content"], page_size=7)
+    assert [row["rowid"] for row in rows] == list(range(2, 51, 2))
+    assert rows[0]["raw_content"] == "text 2"
+
+    resumed = fetch_rows_keyset(db_path, QUERY + " LIMIT 5", ["raw_content"], after_rowid=20, page_size=2)
+    assert [row["rowid"] for row in resumed] == [22, 24, 26, 28, 30]
+
+
+def test_queries_not_ordered_by_rowid_run_in_one_go(db_path):
+    rows = fetch_rows_keyset(db_path, "SELECT rowid, sha1 FROM documents ORDER BY n DESC LIMIT 3", ["raw_content"],
+                             after_rowid=40)
+    assert [row["rowid"] for row in rows] == [50, 49, 48]
+
+
+def test_split_limit():
+    assert split_limit(QUERY + " LIMIT 10;") == (QUERY, 10)
+    assert split_limit(QUERY) == (QUERY, None)
+    assert query_hash(QUERY) == query_hash(QUERY.replace(" ", "  "))
+
+
+def test_watermark_only_covers_contiguous_finished_rows(db_path):
+    rows = [{"rowid": i, "sha1": f"s{i}"} for i in (2, 4, 6, 8)]
+    run_id = start_run(db_path, "summary", "m", QUERY, rows_total=len(rows))
+    tracker = RunTracker(db_path, run_id, rows)
+
+    tracker.done(rows[1])
+    tracker.done(rows[0], skipped=True)
+    tracker.done(rows[3], failed=True)
+    tracker.checkpoint(tracker.snapshot())
+
+    run = get_run(db_path, run_id[:6])
+    assert (run["last_rowid"], run["last_sha1"]) == (4, "s4")
+    assert (run["rows_done"], run["rows_skipped"], run["rows_failed"]) == (3, 1, 1)
+    assert run["status"] == "running"
+
+    tracker.done(rows[2])
+    tracker.finish("completed")
+    run = get_run(db_path, run_id)
+    assert (run["last_rowid"], run["rows_done"], run["status"]) == (8, 4, "completed")
+    assert run["finished_at"] is not None
+    assert [r["run_id"] for r in list_runs(db_path, ["summary"])] == [run_id]
+
+
+def test_resumed_run_keeps_its_progress(db_path):
+    first = [{"rowid": 2, "sha1": "s2"}, {"rowid": 4, "sha1": "s4"}]
+    run_id = start_run(db_path, "summary", "m", QUERY, rows_total=3)
+    tracker = RunTracker(db_path, run_id, first)
+    tracker.done(first[0])
+    tracker.finish("interrupted")
+
+    assert start_run(db_path, "summary", "m", QUERY, run_id=run_id) == run_id
+    rest = [{"rowid": 4, "sha1": "s4"}, {"rowid": 6, "sha1": "s6"}]
+    tracker = RunTracker(db_path, run_id, rest)
+    for row in rest:
+        tracker.done(row)
+    tracker.finish("completed")
+
+    run = get_run(db_path, run_id)
+    assert (run["last_rowid"], run["rows_done"], run["status"]) == (6, 3, "completed")
+
+
+def test_unordered_rows_have_no_watermark(db_path):
+    rows = [{"rowid": 6, "sha1": "s6"}, {"rowid": 2, "sha1": "s2"}]
+    run_id = start_run(db_path, "summary", "m", "SELECT rowid, sha1 FROM documents ORDER BY n DESC")
+    tracker = RunTracker(db_path, run_id, rows)
+    for row in rows:
+        tracker.done(row)
+    tracker.finish("completed")
+    assert get_run(db_path, run_id)["last_rowid"] is None
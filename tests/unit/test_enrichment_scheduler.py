@@ -0,0 +1,111 @@
+"""Unit tests for the enrichment dependency scheduler and shared row fetches."""
+
+import asyncio
+import sqlite3
+import pytest
+from src.enrichment_scheduler import (
+    EnrichmentScheduler, SharedRowSource, build_dependencies, execution_levels
+)
+from src.wal_checkpoint import run_checkpointer
+
+CONFIG = {
+    'sql_queries': {'legal_docs': "SELECT rowid, sha1 FROM documents WHERE doc_type = 'legal'"},
+    'enrichments': [
+        {'name': 'classify', 'output_column': 'doc_type',
+         'input': {'query': "SELECT rowid, sha1 FROM documents WHERE doc_type IS NULL", 'input_columns': ['raw_content']}},
+        {'name': 'summarize', 'output_table': 'summaries',
+         'input': {'query': "SELECT rowid, sha1 FROM documents", 'input_columns': ['raw_content']}},
+        {'name': 'extract_legal', 'output_table': 'legal',
+         'input': {'query': 'legal_docs', 'input_columns': ['raw_content']}},
+        {'name': 'translate', 'output_column': 'translation',
+         'input': {'query': "SELECT rowid, sha1 FROM documents", 'input_columns': ['summaries.summary']}},
+        {'name': 'report', 'output_column': 'report', 'depends_on': ['translate'],
+         'input': {'query': "SELECT rowid, sha1 FROM documents", 'input_columns': ['raw_content']}},
+    ],
+}
+
+
+def test_dependencies_come_from_queries_columns_and_depends_on():
+    deps = build_dependencies(CONFIG['enrichments'], CONFIG)
+    assert deps == {
+        'classify': set(),  # its own "doc_type IS NULL" filter is not a dependency
+        'summarize': set(),
+        'extract_legal': {'classify'},
+        'translate': {'summarize'},
+        'report': {'translate'},
+    }
+    assert execution_levels(deps) == [['classify', 'summarize'], ['extract_legal', 'translate'], ['report']]
+
+
+def test_cycles_are_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        execution_levels({'a': {'b'}, 'b': {'a'}, 'c': set()})
+
+
+def test_independent_enrichments_overlap_and_dependents_wait():
+    scheduler = EnrichmentScheduler(CONFIG['enrichments'], CONFIG)
+    events = []
+
+    async def run_one(enrichment):
+        events.append(('start', enrichment['name']))
+        await asyncio.sleep(0.01)
+        events.append(('end', enrichment['name']))
+        return enrichment['name'].upper()
+
+    results = asyncio.run(scheduler.run(run_one))
+
+    assert results['report'] == 'REPORT'
+    # Both roots start before either finishes
+    assert events[:2] == [('start', 'classify'), ('start', 'summarize')]
+    for name, deps in scheduler.dependencies.items():
+        for dep in deps:
+            assert events.index(('end', dep)) < events.index(('start', name))
+
+
+def test_failure_skips_dependents_only():
+    scheduler = EnrichmentScheduler(CONFIG['enrichments'], CONFIG)
+    ran = []
+
+    async def run_one(enrichment):
+        if enrichment['name'] == 'summarize':
+            raise RuntimeError("boom")
+        ran.append(enrichment['name'])
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(scheduler.run(run_one))
+    assert sorted(ran) == ['classify', 'extract_legal']
+
+
+def test_same_selection_is_fetched_once(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE documents (sha1 TEXT PRIMARY KEY, raw_content TEXT)")
+        conn.executemany("INSERT INTO documents VALUES (?, ?)", [("a", "alpha"), ("b", "beta")])
+    source = SharedRowSource()
+    query = "SELECT rowid, sha1 FROM documents ORDER BY rowid"
+
+    async def fetch_twice():
+        return await asyncio.gather(
+            source.fetch(db_path, query, ['raw_content']),
+            source.fetch(db_path, query.replace(' ', '  '), ['raw_content']),
+        )
+
+    first, second = asyncio.run(fetch_twice())
+    assert source.shared == 1
+    assert first == second and first is not second
+    first[0]['raw_content'] = 'changed'
+    assert second[0]['raw_content'] == 'alpha'
+
+
+def test_nested_checkpointers_share_one_manager(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    sqlite3.connect(db_path).close()
+
+    async def nested():
+        async with run_checkpointer(db_path) as outer:
+            async with run_checkpointer(db_path, on_size=lambda size: None) as inner:
+                assert inner is outer
+                assert len(outer.size_listeners) == 1
+            assert outer.size_listeners == []
+
+    asyncio.run(nested())
@@ -0,0 +1,128 @@
+"""Unit tests for the extractor cascade scheduler."""
+
+import sqlite_utils
+from src.ingest.extractor_scheduler import (
+    ExtractionResult, ExtractorRegistry, ExtractorScheduler, ExtractorStats,
+    MIN_ATTEMPTS_FOR_STATS, REEXPLORE_AFTER_SKIPS, detect_pdf_producer
+)
+
+
+def make_registry(calls):
+    """Registry with a cheap extractor that yields garbage and an expensive good one."""
+    def cheap(path):
+        calls.append('cheap')
+        return ExtractionResult('???')
+
+    def expensive(path):
+        calls.append('expensive')
+        return ExtractionResult('good text')
+
+    registry = ExtractorRegistry()
+    registry.register('pdf', 'cheap', 1.0, cheap, lambda c: c != '???')
+    registry.register('pdf', 'expensive', 10.0, expensive)
+    return registry
+
+
+class TestExtractorScheduler:
+    """Test candidate ordering and early success."""
+
+    def test_default_order_by_cost(self):
+        """Without history, cheaper extractors run first."""
+        calls = []
+        scheduler = ExtractorScheduler(make_registry(calls))
+        result, name, rejected = scheduler.run('pdf', 'doc.pdf', scope='dir:x')
+        assert calls == ['cheap', 'expensive']
+        assert name == 'expensive'
+        assert result.content == 'good text'
+        assert rejected.content == '???'
+
+    def test_skips_extractor_that_always_fails(self):
+        """An extractor with no successes for a scope is skipped."""
+        calls = []
+        stats = ExtractorStats()
+        for _ in range(MIN_ATTEMPTS_FOR_STATS):
+            stats.record('pdf', 'dir:scans', 'cheap', False, 1.0)
+        scheduler = ExtractorScheduler(make_registry(calls), stats)
+        _, name, _ = scheduler.run('pdf', 'doc.pdf', scope='dir:scans')
+        assert calls == ['expensive']
+        assert name == 'expensive'
+
+    def test_history_is_per_scope(self):
+        """Failures in one scope do not affect another."""
+        calls = []
+        stats = ExtractorStats()
+        for _ in range(MIN_ATTEMPTS_FOR_STATS):
+            stats.record('pdf', 'dir:scans', 'cheap', False, 1.0)
+        scheduler = ExtractorScheduler(make_registry(calls), stats)
+        assert [c.name for c in scheduler.plan('pdf', 'dir:other')] == ['cheap', 'expensive']
+
+    def test_skipped_extractor_is_retried_and_can_recover(self):
+        """A skipped extractor is tried again periodically; once it succeeds it is back in the cascade."""
+        calls = []
+        stats = ExtractorStats()
+        for _ in range(MIN_ATTEMPTS_FOR_STATS):
+            stats.record('pdf', 'dir:scans', 'cheap', False, 1.0)
+        registry = make_registry(calls)
+        scheduler = ExtractorScheduler(registry, stats)
+        for _ in range(REEXPLORE_AFTER_SKIPS):
+            scheduler.run('pdf', 'doc.pdf', scope='dir:scans')
+        assert 'cheap' not in calls
+
+        # The cheap tool was upgraded and now gives usable text
+        registry.register('pdf', 'cheap', 1.0, lambda path: calls.append('cheap') or ExtractionResult('text'))
+        calls.clear()
+        _, name, _ = scheduler.run('pdf', 'doc.pdf', scope='dir:scans')
+        assert (calls, name) == (['cheap'], 'cheap')
+        assert 'cheap' in [c.name for c in scheduler.plan('pdf', 'dir:scans')]
+
+    def test_skip_count_is_persisted(self, tmp_path):
+        """Re-tries are spread across ingest runs, not restarted by each one."""
+        db = sqlite_utils.Database(tmp_path / "test.db")
+        stats = ExtractorStats()
+        for _ in range(MIN_ATTEMPTS_FOR_STATS):
+            stats.record('pdf', 's', 'cheap', False, 1.0)
+        ExtractorScheduler(make_registry([]), stats).plan('pdf', 's')
+        stats.save(db)
+        loaded = ExtractorStats()
+        loaded.load(db)
+        assert loaded.get('pdf', 's', 'cheap').skipped == 1
+
+    def test_never_skips_all_candidates(self):
+        """If every extractor has always failed, all are still tried."""
+        calls = []
+        stats = ExtractorStats()
+        for _ in range(MIN_ATTEMPTS_FOR_STATS):
+            stats.record('pdf', 's', 'cheap', False, 1.0)
+            stats.record('pdf', 's', 'expensive', False, 1.0)
+        scheduler = ExtractorScheduler(make_registry(calls), stats)
+        assert len(scheduler.plan('pdf', 's')) == 2
+
+
+class TestExtractorStats:
+    """Test statistics persistence."""
+
+    def test_save_and_load(self, tmp_path):
+        db = sqlite_utils.Database(tmp_path / "test.db")
+        stats = ExtractorStats()
+        stats.record('pdf', 'dir:a', 'pdftotext', True, 0.5)
+        stats.record('pdf', 'dir:a', 'pdftotext', False, 1.5)
+        stats.save(db)
+
+        loaded = ExtractorStats()
+        loaded.load(db)
+        stat = loaded.get('pdf', 'dir:a', 'pdftotext')
+        assert stat.attempts == 2
+        assert stat.successes == 1
+        assert stat.mean_seconds == 1.0
+
+    def test_load_without_table(self, tmp_path):
+        db = sqlite_utils.Database(tmp_path / "empty.db")
+        stats = ExtractorStats()
+        stats.load(db)
+        assert stats.get('pdf', 'x', 'y').attempts == 0
+
+
+def test_detect_pdf_producer(tmp_path):
+    pdf = tmp_path / "scan.pdf"
+    pdf.write_bytes(b"%PDF-1.4\n1 0 obj << /Producer (ScanSoft PDF 3.1) >> endobj\n%%EOF")
+    assert detect_pdf_producer(str(pdf)) == "ScanSoft PDF"
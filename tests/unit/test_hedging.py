@@ -0,0 +1,80 @@
+"""Unit tests for hedged requests."""
+
+import asyncio
+import pytest
+from src.db_operations import store_llm_calls
+from src.llm.hedging import HedgePolicy, hedged
+from src.llm.retry import call_with_retries
+from src.llm.telemetry import call_context, latency_window
+
+
+def slow_then_fast(delays):
+    """A request whose n-th copy takes delays[n] seconds and returns n."""
+    started = []
+
+    async def request():
+        copy = len(started)
+        started.append(copy)
+        await asyncio.sleep(delays[copy])
+        return copy
+
+    return request, started
+
+
+def test_slow_request_is_hedged_and_loser_cancelled():
+    latency_window.seed('hedge-fast', [(10.0, 0.001)] * 20)  # p95: 10ms
+    policy = HedgePolicy()
+    request, started = slow_then_fast([5, 0])
+
+    async def run():
+        with call_context(hedge=policy):
+            return await call_with_retries(request, model='hedge-fast')
+
+    assert asyncio.run(asyncio.wait_for(run(), timeout=2)) == 1
+    assert started == [0, 1]
+    assert (policy.hedges, policy.won) == (1, 1)
+    assert "1 answered first" in policy.summary()
+
+
+def test_fast_requests_and_unknown_models_are_not_hedged():
+    latency_window.seed('hedge-slow', [(5000.0, None)] * 20)
+    policy = HedgePolicy()
+    request, started = slow_then_fast([0, 0])
+    assert asyncio.run(hedged(request, policy, 'hedge-slow')) == 0
+
+    request, started_unknown = slow_then_fast([0.05, 0])
+    assert asyncio.run(hedged(request, policy, 'hedge-never-seen')) == 0
+    assert started == [0] and started_unknown == [0]
+    assert policy.hedges == 0 and policy.summary() is None
+
+
+def test_hedges_are_capped_by_count_and_cost():
+    latency_window.seed('hedge-costly', [(1.0, 0.2)] * 20)
+    policy = HedgePolicy(max_hedges=5, max_extra_cost=0.5)
+    assert [policy.take('hedge-costly') for _ in range(3)] == [True, True, False]
+    assert policy.extra_cost == pytest.approx(0.4)
+
+    policy = HedgePolicy(max_hedges=1)
+    assert [policy.take('hedge-costly') for _ in range(2)] == [True, False]
+
+
+def test_primary_error_is_raised_when_both_copies_fail():
+    latency_window.seed('hedge-failing', [(10.0, None)] * 20)
+
+    async def request():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError, match="down"):
+        asyncio.run(hedged(request, HedgePolicy(), 'hedge-failing'))
+
+
+def test_policy_seeds_from_recorded_calls(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    store_llm_calls(db_path, [
+        {'model': 'hedge-recorded', 'provider': 'openai', 'attempt': 1, 'status': 'ok', 'latency_ms': float(i),
+         'started_at': '2024-01-01T00:00:00'} for i in range(1, 31)
+    ])
+    policy = HedgePolicy()
+    policy.seed(db_path, 'hedge-recorded')
+    assert policy.delay('hedge-recorded') == pytest.approx(0.029)
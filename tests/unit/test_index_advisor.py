@@ -0,0 +1,68 @@
+"""Unit tests for the index advisor."""
+
+import sqlite3
+import pytest
+from src.index_advisor import IndexTarget, advise_indexes, targets_from_config
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A database with the indexes older doctrail versions created."""
+    path = str(tmp_path / "test.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE documents (sha1 TEXT PRIMARY KEY, raw_content TEXT, summary TEXT)")
+        conn.execute("""
+            CREATE TABLE enrichment_responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, enrichment_id TEXT UNIQUE, sha1 TEXT NOT NULL,
+                enrichment_name TEXT NOT NULL, raw_json TEXT NOT NULL, model_used TEXT NOT NULL,
+                prompt_id TEXT, chunk_index INTEGER, chunk_count INTEGER, created_at TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX idx_enrichment_responses_sha1 ON enrichment_responses(sha1)")
+        conn.execute("CREATE INDEX idx_enrichment_responses_enrichment ON enrichment_responses(enrichment_name)")
+        conn.execute("CREATE INDEX idx_enrichment_responses_enrichment_id ON enrichment_responses(enrichment_id)")
+        conn.execute("CREATE INDEX idx_enrichment_responses_composite ON enrichment_responses(sha1, enrichment_name, model_used)")
+    return path
+
+
+def index_names(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+
+
+def test_targets_from_config():
+    config = {'enrichments': [
+        {'name': 'summary', 'schema': {'summary': 'str'}},
+        {'name': 'entities', 'schema': {'people': 'list', 'places': 'list'}, 'output_table': 'entities'},
+    ]}
+    assert targets_from_config(config) == [
+        IndexTarget('documents', 'sha1', None, 'summary'),
+        IndexTarget('documents', 'sha1', 'entities', None),
+    ]
+
+
+def test_report_only_changes_nothing(db_path):
+    before = index_names(db_path)
+    report = advise_indexes(db_path, [IndexTarget('documents', pending_column='summary')])
+    assert not report['applied']
+    assert {spec.name for spec in report['plan'].create} == {
+        'idx_enrichment_responses_resume', 'idx_documents_summary_pending'
+    }
+    assert {drop.name for drop in report['plan'].drop} == {
+        'idx_enrichment_responses_sha1', 'idx_enrichment_responses_composite', 'idx_enrichment_responses_enrichment_id'
+    }
+    assert index_names(db_path) == before
+
+
+def test_apply_improves_query_plans(db_path):
+    report = advise_indexes(db_path, [IndexTarget('documents', pending_column='summary')], apply=True)
+    plans = {query['label']: query for query in report['queries']}
+
+    assert plans['documents.summary pending']['before'] == 'SCAN documents'
+    assert 'idx_documents_summary_pending' in plans['documents.summary pending']['after']
+    assert 'COVERING INDEX idx_enrichment_responses_resume' in plans['resume check']['after']
+    assert index_names(db_path) == {
+        'idx_enrichment_responses_enrichment', 'idx_enrichment_responses_resume', 'idx_documents_summary_pending'
+    }
+    # Nothing left to change on a second pass
+    assert not advise_indexes(db_path, [IndexTarget('documents', pending_column='summary')])['plan']
@@ -0,0 +1,95 @@
+"""Unit tests for recording and replaying LLM traffic."""
+
+import asyncio
+import json
+import httpx
+import pytest
+from src.config.validators import ConfigValidator
+from src.llm import transport as transport_module
+from src.llm.transport import Cassette, RecordReplayTransport, configure_llm_transport
+from src.llm_providers.factory import get_llm_provider
+
+
+def completion(content):
+    return {
+        'id': 'cmpl', 'object': 'chat.completion', 'created': 0, 'model': 'm',
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+        'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+    }
+
+
+def recorder(tmp_path):
+    """A record-mode transport whose 'network' answers with the prompt reversed."""
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        prompt = json.loads(request.content)['messages'][0]['content']
+        return httpx.Response(200, json=completion(prompt[::-1]))
+
+    transport = RecordReplayTransport('record', Cassette(str(tmp_path / 'llm.jsonl')))
+    transport._async = httpx.MockTransport(handler)
+    return transport, sent
+
+
+def ask(transport, prompts, base_url='http://api.test/v1'):
+    async def run():
+        async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
+            responses = await asyncio.gather(*(
+                client.post('/chat/completions', json={'model': 'm', 'messages': [{'role': 'user', 'content': p}]})
+                for p in prompts
+            ))
+        return [(r.status_code, r.json()) for r in responses]
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def no_transport():
+    yield
+    transport_module._transport = None
+
+
+def test_recorded_responses_replay_offline(tmp_path):
+    transport, sent = recorder(tmp_path)
+    recorded = ask(transport, ['abc', 'hello'])
+    assert len(sent) == 2 and len(Cassette(str(tmp_path / 'llm.jsonl'))) == 2
+
+    replay = RecordReplayTransport('replay', Cassette(str(tmp_path / 'llm.jsonl')), latency='none')
+    # Another host, same requests: answered from the cassette, in any order
+    assert ask(replay, ['hello', 'abc'], base_url='http://gateway:8000/v1') == recorded[::-1]
+    status, body = ask(replay, ['never recorded'])[0]
+    assert status == 404 and 'No recorded response' in body['error']['message']
+    assert (replay.replayed, replay.missed) == (2, 1)
+
+
+def test_injected_errors_and_latency_are_repeatable(tmp_path):
+    transport, _ = recorder(tmp_path)
+    prompts = [f"doc {i}" for i in range(40)]
+    ask(transport, prompts)
+
+    def replay_once():
+        replay = RecordReplayTransport('replay', Cassette(str(tmp_path / 'llm.jsonl')), error_rate=0.25,
+                                       latency={'median_ms': 1, 'sigma': 0.5}, seed=3)
+        return [status for status, _ in ask(replay, prompts)], replay
+
+    statuses, replay = replay_once()
+    assert statuses == replay_once()[0]
+    assert 0 < replay.injected < 40 and set(statuses) <= {200, 429, 500, 503}
+    assert replay.summary().startswith(f"📼 Replayed {40 - replay.injected} responses")
+
+
+def test_providers_replay_without_api_keys(tmp_path, monkeypatch):
+    cassette = str(tmp_path / 'llm.jsonl')
+    transport = configure_llm_transport({'llm_transport': {'mode': 'record', 'cassette': cassette}})
+    transport._async = httpx.MockTransport(lambda request: httpx.Response(200, json=completion('recorded')))
+    asyncio.run(get_llm_provider('m').generate_text([{'role': 'user', 'content': 'hi'}]))
+
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    configure_llm_transport({'llm_transport': {'mode': 'replay', 'cassette': cassette, 'latency': 'none'}})
+    provider = get_llm_provider('m')
+    assert asyncio.run(provider.generate_text([{'role': 'user', 'content': 'hi'}])) == 'recorded'
+
+    errors = ConfigValidator().validate({'database': 'x.db', 'llm_transport': {
+        'mode': 'rewind', 'latency': 'slow', 'error_rate': 2
+    }})
+    assert len(errors) == 4
@@ -0,0 +1,78 @@
+"""Unit tests for the Prometheus metrics exporter."""
+
+import urllib.request
+
+from src import metrics
+from src.config.validators import ConfigValidator
+from src.db_operations import EnrichmentWriteBuffer
+from src.llm.concurrency import AdaptiveLimiter
+from src.llm.telemetry import CallRecord
+from src.metrics import configure_metrics, observe_call, observe_row, watch_limiter, watch_write_buffer
+
+
+def call(status='ok', latency_ms=100.0, enrichment='sentiment'):
+    return CallRecord(model='gpt-4o-mini', provider='openai', started_at='2024-01-01T00:00:00',
+                      enrichment_name=enrichment, status=status, latency_ms=latency_ms,
+                      prompt_tokens=100, completion_tokens=20, cost_usd=0.001)
+
+
+def test_hooks_do_nothing_without_a_metrics_section():
+    assert configure_metrics({}) is None
+    observe_row('sentiment', 'processed')
+    observe_call(call())
+    assert metrics._metrics is None
+
+
+def test_render_reports_counters_quantiles_and_live_state(tmp_path):
+    exporter = configure_metrics({'metrics': {'textfile': str(tmp_path / 'doctrail.prom')}})
+    try:
+        observe_row('sentiment', 'processed')
+        observe_row('sentiment', 'failed')
+        observe_row('say "hi"', 'skipped')
+        for latency in (100.0, 200.0, 300.0):
+            observe_call(call(latency_ms=latency))
+        observe_call(call(status='error', latency_ms=None))
+        limiter = AdaptiveLimiter(8)
+        watch_limiter(limiter)
+        buffer = EnrichmentWriteBuffer(str(tmp_path / 'db.sqlite'))
+        buffer.add_response('abc', 'sentiment', '{}', 'gpt-4o-mini')
+        watch_write_buffer(buffer)
+        text = exporter.metrics.render()
+    finally:
+        configure_metrics(None)
+
+    assert 'doctrail_rows_total{enrichment="sentiment",status="processed"} 1' in text
+    assert 'doctrail_rows_total{enrichment="say \\"hi\\"",status="skipped"} 1' in text
+    assert 'doctrail_llm_requests_total{enrichment="sentiment",model="gpt-4o-mini",status="error"} 1' in text
+    assert 'doctrail_llm_tokens_total{enrichment="sentiment",model="gpt-4o-mini",kind="prompt"} 400' in text
+    assert 'quantile="0.5"} 0.2' in text and 'quantile="0.95"} 0.3' in text
+    assert 'doctrail_llm_latency_seconds_count{enrichment="sentiment",model="gpt-4o-mini"} 3' in text
+    assert 'doctrail_api_concurrency_limit 8' in text
+    assert 'doctrail_write_queue_depth 1' in text
+    assert '# TYPE doctrail_llm_latency_seconds summary' in text
+
+
+def test_exporter_serves_http_and_writes_the_textfile(tmp_path):
+    textfile = tmp_path / 'metrics' / 'doctrail.prom'
+    exporter = configure_metrics({'metrics': {'port': 0, 'textfile': str(textfile), 'interval': 60}})
+    try:
+        exporter.start()
+        observe_row('sentiment', 'processed')
+        with urllib.request.urlopen(f"http://127.0.0.1:{exporter.port}/metrics", timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert 'status="processed"} 1' in response.read().decode()
+        observe_row('sentiment', 'processed')
+        exporter.stop()
+    finally:
+        configure_metrics(None)
+    # The final write has the final counts, and no temporary file is left behind
+    assert 'status="processed"} 2' in textfile.read_text()
+    assert [p.name for p in textfile.parent.iterdir()] == ['doctrail.prom']
+
+
+def test_metrics_section_is_validated():
+    validator = ConfigValidator()
+    assert validator._validate_metrics({'port': 9464}) == []
+    assert validator._validate_metrics({}) == ["metrics needs a 'port', a 'textfile' or both"]
+    assert validator._validate_metrics({'port': 'x', 'interval': 0}) == [
+        "metrics.port must be a port number", "metrics.interval must be a positive number of seconds"]
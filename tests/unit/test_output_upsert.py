@@ -0,0 +1,85 @@
+"""Unit tests for UPSERT-based output table writes and the batched result writer."""
+
+import sqlite3
+import pytest
+from src.db_operations import (
+    EnrichmentWriteBuffer, ensure_enrichment_responses_table, ensure_output_table,
+    prepare_enrichment_schema, update_output_table
+)
+from src.schema_catalog import schema_catalog
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    schema_catalog.reset()
+    ensure_output_table(path, "results", "sha1", ["label", "tags"], is_derived_table=True)
+    prepare_enrichment_schema(path, output_columns=["label", "tags"], output_table="results")
+    return path
+
+
+def fetch(db_path, query, params=()):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def test_upsert_preserves_created_at_and_skips_nulls(db_path):
+    update_output_table(db_path, "results", "sha1", "a", {"label": "x", "tags": ["t1"]}, "run1", "m")
+    (created_at, first_updated), = fetch(db_path, "SELECT created_at, updated_at FROM results")
+
+    update_output_table(db_path, "results", "sha1", "a", {"label": "y", "tags": "null"}, "run2", "m")
+    update_output_table(db_path, "results", "sha1", "a", {"label": None, "tags": []}, "run3", "m")
+
+    rows = fetch(db_path, "SELECT label, tags, enrichment_id, created_at, updated_at FROM results")
+    assert len(rows) == 1
+    label, tags, enrichment_id, kept_created_at, updated_at = rows[0]
+    assert (label, tags, enrichment_id) == ("y", '["t1"]', "run2")
+    assert kept_created_at == created_at
+    assert updated_at >= first_updated
+
+
+def test_models_are_kept_apart(db_path):
+    update_output_table(db_path, "results", "sha1", "a", {"label": "x"}, model_used="m1")
+    update_output_table(db_path, "results", "sha1", "a", {"label": "y"}, model_used="m2")
+    assert fetch(db_path, "SELECT model_used, label FROM results ORDER BY model_used") == [("m1", "x"), ("m2", "y")]
+
+
+def test_legacy_table_gets_unique_index(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    schema_catalog.reset()
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE results (sha1 TEXT, label TEXT)")
+    prepare_enrichment_schema(path, output_columns=["label"], output_table="results")
+
+    update_output_table(path, "results", "sha1", "a", {"label": "x"})
+    update_output_table(path, "results", "sha1", "a", {"label": "y"})
+    assert fetch(path, "SELECT label FROM results") == [("y",)]
+    assert fetch(path, "SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_results_sha1_unique'") == [(1,)]
+
+
+def test_duplicate_rows_fall_back_to_row_by_row(tmp_path):
+    path = str(tmp_path / "dupes.db")
+    schema_catalog.reset()
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE results (sha1 TEXT, label TEXT)")
+        conn.execute("INSERT INTO results (sha1, label) VALUES ('a', 'old'), ('a', 'old')")
+    prepare_enrichment_schema(path, output_columns=["label"], output_table="results")
+
+    update_output_table(path, "results", "sha1", "a", {"label": "new"})
+    update_output_table(path, "results", "sha1", "b", {"label": "new"})
+    assert fetch(path, "SELECT sha1, label FROM results ORDER BY sha1") == [("a", "new"), ("a", "new"), ("b", "new")]
+
+
+def test_write_buffer_commits_responses_with_outputs(db_path):
+    ensure_enrichment_responses_table(db_path)
+    buffer = EnrichmentWriteBuffer(db_path, batch_size=4)
+    for sha1 in ("a", "b"):
+        buffer.add_response(sha1, "classify", '{"label": "x"}', "m")
+        buffer.add_output("results", "sha1", sha1, {"label": "x"}, model_used="m")
+    assert buffer.should_flush()
+    assert fetch(db_path, "SELECT COUNT(*) FROM results") == [(0,)]
+
+    assert buffer.flush() == 2
+    assert len(buffer) == 0 and not buffer.should_flush()
+    assert fetch(db_path, "SELECT COUNT(*) FROM enrichment_responses") == [(2,)]
+    assert fetch(db_path, "SELECT sha1 FROM results ORDER BY sha1") == [("a",), ("b",)]
@@ -0,0 +1,65 @@
+"""Unit tests for stage timing spans and run profiles."""
+
+import asyncio
+import json
+import pstats
+
+from src import profiling
+from src.profiling import RunProfiler, format_timings, span, start_timings, stop_timings
+
+
+def test_spans_are_free_and_unrecorded_when_timings_are_off():
+    assert stop_timings() is None
+    assert span('enrich.api') is span('write.audit')
+    with span('enrich.api'):
+        pass
+    assert profiling._timer is None
+
+
+def test_report_aggregates_spans_into_percentiles_and_histogram():
+    timer = start_timings()
+    try:
+        for ms in (0.5, 5, 5, 50, 2000):
+            timer.durations['enrich.api'].append(ms)
+        with span('enrich.template'):
+            pass
+    finally:
+        assert stop_timings() is timer
+    report = {row['span']: row for row in timer.report()}
+    api = report['enrich.api']
+    assert api['count'] == 5 and api['p50_ms'] == 5 and api['max_ms'] == 2000
+    assert api['histogram'] == {'<1ms': 1, '<10ms': 2, '<100ms': 1, '<1s': 0, '<10s': 1, '>=10s': 0}
+    assert timer.report()[0]['span'] == 'enrich.api'
+    assert report['enrich.template']['count'] == 1
+    assert 'enrich.api' in format_timings(timer.report())
+
+
+def test_chrome_trace_has_a_row_per_task(tmp_path):
+    timer = start_timings(trace=True)
+
+    async def row(name):
+        with span(name):
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(row('enrich.row'), row('enrich.row'))
+
+    try:
+        asyncio.run(run())
+    finally:
+        stop_timings()
+    path = tmp_path / 'trace.json'
+    timer.write(str(path), 'chrome')
+    events = json.loads(path.read_text())['traceEvents']
+    assert [e['ph'] for e in events] == ['X', 'X']
+    assert {e['tid'] for e in events} == {1, 2}
+    assert all(e['dur'] >= 10_000 and e['cat'] == 'enrich' for e in events)
+
+
+def test_cprofile_output_for_pstats_paths(tmp_path):
+    profiler = RunProfiler(str(tmp_path / 'run.prof'))
+    assert profiler.engine == 'cprofile'
+    profiler.start()
+    sum(range(1000))
+    stats = pstats.Stats(profiler.stop())
+    assert stats.total_calls > 0
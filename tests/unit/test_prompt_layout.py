@@ -0,0 +1,55 @@
+"""Unit tests for the cache-friendly (prefix) prompt layout."""
+
+import asyncio
+from unittest.mock import MagicMock
+from pydantic import BaseModel
+from src.llm_operations import process_row_structured
+from src.llm_providers.openai_provider import OpenAIProvider
+
+
+class Answer(BaseModel):
+    label: str
+
+
+def run_row(row, prompt, layout, system_prompt=None):
+    calls = []
+
+    async def generate_structured(messages, pydantic_model, temperature=0.0, cache_prefix=0):
+        calls.append((messages, cache_prefix))
+        return pydantic_model(label="x")
+
+    provider = MagicMock()
+    provider.generate_structured = generate_structured
+    result = asyncio.run(process_row_structured(
+        row=row, input_cols=['title', 'raw_content'], parsed_input_cols=[('title', None), ('raw_content', None)],
+        prompt=prompt, model='gpt-4o-mini', semaphore=asyncio.Semaphore(1), pbar=MagicMock(),
+        pydantic_model=Answer, system_prompt=system_prompt, provider=provider, prompt_layout=layout
+    ))
+    return result, calls[0]
+
+
+def test_prefix_layout_keeps_the_instructions_identical_across_rows():
+    prompt = "Label the document titled {title}."
+    first, (messages, cache_prefix) = run_row({'sha1': 'a', 'title': 'One', 'raw_content': 'alpha'}, prompt, 'prefix', "Be brief.")
+    _, (other_messages, _) = run_row({'sha1': 'b', 'title': 'Two', 'raw_content': 'beta'}, prompt, 'prefix', "Be brief.")
+
+    assert cache_prefix == 2  # system prompt + instructions
+    assert messages[:2] == other_messages[:2]
+    assert messages[1]['content'] == "Label the document titled (title, given below)."
+    assert messages[2]['content'] == "title: One\nraw_content: alpha"
+    assert first['full_prompt'] == messages[1]['content'] + "\n\n" + messages[2]['content']
+
+
+def test_inline_layout_is_unchanged():
+    _, (messages, cache_prefix) = run_row({'sha1': 'a', 'title': 'One', 'raw_content': 'alpha'},
+                                          "Label {title}.", 'inline')
+    assert cache_prefix == 0
+    assert messages == [{'role': 'user', 'content': "Label One.\n\ntitle: One\nraw_content: alpha"}]
+
+
+def test_openai_cache_key_depends_only_on_the_prefix():
+    first = [{'role': 'user', 'content': 'instructions'}, {'role': 'user', 'content': 'doc 1'}]
+    second = [{'role': 'user', 'content': 'instructions'}, {'role': 'user', 'content': 'doc 2'}]
+    assert OpenAIProvider._cache_options(first, 0) == {}
+    assert OpenAIProvider._cache_options(first, 1) == OpenAIProvider._cache_options(second, 1)
+    assert OpenAIProvider._cache_options(first, 2) != OpenAIProvider._cache_options(second, 2)
@@ -0,0 +1,158 @@
+"""Unit tests for routing requests across a pool of OpenAI-compatible endpoints."""
+
+import asyncio
+import time
+from collections import Counter
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from src.config.validators import ConfigValidator
+from src.llm import retry as retry_module
+from src.llm_providers.factory import get_llm_provider
+from src.llm_providers.openai_provider import OpenAIProvider
+from src.llm_providers.pool import EJECT_AFTER_FAILURES, Endpoint, EndpointPool
+
+
+class MockServer:
+    """In-process OpenAI-compatible server: answers chat completions and /models, or fails on demand."""
+
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.down = False
+
+    def handler(self, request):
+        if request.url.path.endswith('/models'):
+            return httpx.Response(503 if self.down else 200, json={'object': 'list', 'data': []})
+        self.requests += 1
+        if self.down:
+            return httpx.Response(500, json={'error': {'message': f'{self.name} is down'}})
+        return httpx.Response(200, json={
+            'id': 'cmpl', 'object': 'chat.completion', 'created': 0, 'model': 'm',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': self.name}}],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+        })
+
+    def endpoint(self, **options):
+        endpoint = Endpoint(name=self.name, api_key='k', base_url=f'http://{self.name}/v1', **options)
+        endpoint._client = AsyncOpenAI(api_key='k', base_url=endpoint.base_url, max_retries=0,
+                                       http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.handler)))
+        return endpoint
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    class Asyncio:
+        def __getattr__(self, name):
+            return getattr(asyncio, name)
+        sleep = staticmethod(no_sleep)
+
+    monkeypatch.setattr(retry_module, 'asyncio', Asyncio())
+
+
+def pooled_provider(pool, model='m'):
+    return OpenAIProvider(api_key=None, model=model, pool=pool)
+
+
+def ask(provider, times):
+    async def run():
+        return await asyncio.gather(*(provider.generate_text([{'role': 'user', 'content': 'hi'}]) for _ in range(times)))
+    return asyncio.run(run())
+
+
+def test_weighted_routing_follows_weights():
+    a, b = MockServer('a'), MockServer('b')
+    pool = EndpointPool([a.endpoint(weight=2), b.endpoint(weight=1)], routing='weighted')
+    answers = ask(pooled_provider(pool), 30)
+    assert Counter(answers) == {'a': 20, 'b': 10}
+
+
+def test_least_loaded_respects_concurrency_caps():
+    a, b = MockServer('a'), MockServer('b')
+    pool = EndpointPool([a.endpoint(max_concurrency=1), b.endpoint(max_concurrency=1)])
+    peaks = []
+
+    async def run():
+        async def borrow():
+            async with pool.acquire('m') as endpoint:
+                peaks.append(sum(e.in_flight for e in pool.endpoints))
+                await asyncio.sleep(0.01)
+                return endpoint.name
+        return await asyncio.gather(*(borrow() for _ in range(6)))
+
+    names = asyncio.run(run())
+    assert max(peaks) == 2
+    assert Counter(names) == {'a': 3, 'b': 3}
+
+
+def test_failing_endpoint_is_ejected_and_readmitted_after_a_health_check():
+    a, b = MockServer('a'), MockServer('b')
+    a.down = True
+    pool = EndpointPool([a.endpoint(), b.endpoint()])
+    provider = pooled_provider(pool)
+
+    # Failed requests are retried, on whichever endpoint is healthy
+    assert set(ask(provider, 10)) == {'b'}
+    ejected = pool.endpoints[0]
+    assert a.requests >= EJECT_AFTER_FAILURES
+    assert ejected.ejected_until > time.monotonic() and ejected.needs_check and ejected.ejections == 1
+    sent = a.requests
+    ask(provider, 5)
+    assert a.requests == sent
+
+    # Still down at the health check: ejected again
+    ejected.ejected_until = 0.0
+    ask(provider, 1)
+    assert ejected.ejected_until > time.monotonic() and ejected.ejections == 2
+
+    a.down = False
+    ejected.ejected_until = 0.0
+    assert 'a' in ask(provider, 4)
+    assert not ejected.needs_check and ejected.ejections == 0
+
+
+def test_cancelled_health_check_leaves_the_endpoint_due_for_a_check():
+    a = MockServer('a')
+    endpoint = a.endpoint()
+    endpoint.needs_check = True
+    pool = EndpointPool([endpoint])
+    started = asyncio.Event()
+
+    async def hang(request):
+        started.set()
+        await asyncio.sleep(60)
+
+    endpoint._client = AsyncOpenAI(api_key='k', base_url=endpoint.base_url, max_retries=0,
+                                   http_client=httpx.AsyncClient(transport=httpx.MockTransport(hang)))
+
+    async def run():
+        task = asyncio.create_task(pool._choose('m'))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert endpoint.needs_check and endpoint.ejected_until == 0.0
+
+
+def test_factory_routes_pooled_models_and_validates_config(monkeypatch):
+    monkeypatch.setenv('GATEWAY_KEY', 'secret')
+    config = {'provider_pool': {'endpoints': [
+        {'name': 'gateway', 'base_url': 'http://gpu:8000/v1', 'api_key_env': 'GATEWAY_KEY', 'models': ['llama-3']}
+    ]}}
+    pooled = get_llm_provider('llama-3', config)
+    assert pooled.pool is not None and pooled.pool.endpoints[0].api_key == 'secret'
+    assert get_llm_provider('llama-3', config).pool is pooled.pool  # shared between providers
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'x')
+    assert get_llm_provider('gpt-4o-mini', config).pool is None
+
+    errors = ConfigValidator().validate({'database': 'x.db', 'provider_pool': {
+        'routing': 'random', 'endpoints': [{'weight': 0, 'max_concurrency': 'many'}]
+    }})
+    assert len(errors) == 3
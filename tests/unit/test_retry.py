@@ -0,0 +1,140 @@
+"""Unit tests for LLM request retries and the adaptive concurrency limit."""
+
+import asyncio
+import httpx
+import openai
+import pytest
+from google.genai import errors as genai_errors
+from src.llm import retry as retry_module
+from src.llm.concurrency import AdaptiveLimiter
+from src.llm.retry import (
+    ContentFilteredError, InvalidResponseError, RetryBudget, RetryPolicy, call_with_retries, classify_error,
+    retry_after
+)
+from src.llm.telemetry import acquire_slot, call_context, track_call
+
+
+def status_error(status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=httpx.Request('POST', 'https://api.test'))
+    cls = {429: openai.RateLimitError, 500: openai.InternalServerError, 400: openai.BadRequestError}[status]
+    return cls("failed", response=response, body=None)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    """Record backoff delays instead of waiting (only inside the retry module)."""
+    slept = []
+
+    class RecordingAsyncio:
+        def __getattr__(self, name):
+            return getattr(asyncio, name)
+
+        async def sleep(self, delay):
+            slept.append(delay)
+
+    monkeypatch.setattr(retry_module, 'asyncio', RecordingAsyncio())
+    return slept
+
+
+def test_errors_are_classified():
+    assert classify_error(status_error(429)) == 'rate_limit'
+    assert classify_error(status_error(500)) == 'server'
+    assert classify_error(status_error(400)) == 'client'
+    assert classify_error(httpx.ReadTimeout("slow")) == 'timeout'
+    assert classify_error(genai_errors.ServerError(503, {'error': {'message': 'overloaded'}})) == 'server'
+    assert classify_error(InvalidResponseError("empty")) == 'invalid_schema'
+    assert classify_error(ContentFilteredError("refused")) == 'content_filter'
+
+
+def test_retry_after_from_headers_and_gemini_details():
+    assert retry_after(status_error(429, {'retry-after': '7'})) == 7
+    assert retry_after(status_error(429, {'retry-after-ms': '1500'})) == 1.5
+    assert retry_after(status_error(429)) is None
+    error = genai_errors.ClientError(429, {'error': {'details': [
+        {'@type': 'type.googleapis.com/google.rpc.RetryInfo', 'retryDelay': '31s'}
+    ]}})
+    assert retry_after(error) == 31
+
+
+def test_transient_failures_are_retried_with_backoff(no_sleep):
+    outcomes = [status_error(500), status_error(429, {'retry-after': '5'}), 'ok']
+    attempts = []
+
+    async def request():
+        with track_call('openai', 'gpt-4o-mini') as record:
+            attempts.append(record.attempt)
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+    assert asyncio.run(call_with_retries(request, RetryPolicy(base_delay=2))) == 'ok'
+    assert attempts == [1, 2, 3]
+    assert 0 <= no_sleep[0] <= 2
+    assert 5 <= no_sleep[1] <= 6
+
+
+def test_permanent_failures_and_spent_budget_are_not_retried(no_sleep):
+    calls = []
+
+    async def fails(error):
+        calls.append(error)
+        raise error
+
+    with pytest.raises(ContentFilteredError):
+        asyncio.run(call_with_retries(lambda: fails(ContentFilteredError("refused"))))
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(call_with_retries(lambda: fails(status_error(400))))
+    assert len(calls) == 2
+
+    budget = RetryBudget(ratio=0, minimum=1)
+
+    async def with_budget():
+        with call_context(retry_budget=budget):
+            return await call_with_retries(lambda: fails(status_error(500)))
+
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(with_budget())
+    assert (budget.requests, budget.retries) == (2, 1)
+    assert len(no_sleep) == 1
+
+
+def test_rate_limits_lower_the_limit_and_successes_raise_it():
+    limiter = AdaptiveLimiter(8)
+
+    async def rate_limited_then_ok():
+        outcomes = [status_error(429), 'ok']
+
+        async def request():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        async with acquire_slot(limiter):
+            return await call_with_retries(request)
+
+    assert asyncio.run(rate_limited_then_ok()) == 'ok'
+    assert limiter.limit == 4
+    limiter.throttle()  # same burst: no further decrease
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.succeeded()
+    assert limiter.limit == 5
+
+
+def test_limiter_bounds_requests_in_flight():
+    limiter = AdaptiveLimiter(2)
+    peak = []
+
+    async def worker():
+        async with limiter:
+            peak.append(limiter.in_use)
+            await asyncio.sleep(0)
+
+    async def main():
+        await asyncio.gather(*(worker() for _ in range(6)))
+
+    asyncio.run(main())
+    assert max(peak) == 2
+    assert limiter.in_use == 0
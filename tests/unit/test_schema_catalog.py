@@ -0,0 +1,74 @@
+"""Unit tests for the schema metadata cache."""
+
+import sqlite3
+import pytest
+from src import db_operations
+from src.db_operations import prepare_enrichment_schema, update_database, update_output_table, ensure_output_table
+from src.schema_catalog import schema_catalog
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE documents (sha1 TEXT PRIMARY KEY, content TEXT)")
+    conn.execute("INSERT INTO documents VALUES ('a', 'x'), ('b', 'y')")
+    conn.commit()
+    conn.close()
+    schema_catalog.reset()
+    return path
+
+
+@pytest.fixture
+def traced_sql(monkeypatch):
+    """Record every statement run through get_db_connection."""
+    statements = []
+    original = db_operations.get_db_connection.__wrapped__
+
+    def traced(*args, **kwargs):
+        for conn in original(*args, **kwargs):
+            conn.set_trace_callback(statements.append)
+            yield conn
+
+    monkeypatch.setattr(db_operations, "get_db_connection", db_operations.contextmanager(traced))
+    return statements
+
+
+def test_introspects_primary_key_and_columns(db_path):
+    with sqlite3.connect(db_path) as conn:
+        info = schema_catalog.get(conn, db_path, "documents")
+    assert info.primary_key == "sha1"
+    assert info.has_column("content")
+    assert not info.has_column("summary")
+
+
+def test_row_writes_issue_no_ddl_after_migration(db_path, traced_sql):
+    prepare_enrichment_schema(db_path, table="documents", output_columns=["summary"])
+    traced_sql.clear()
+
+    for sha1 in ("a", "b"):
+        update_database(db_path, "documents", "summary", [{"sha1": sha1, "rowid": 1, "original": "", "updated": "s"}])
+
+    assert not [s for s in traced_sql if "table_info" in s or s.upper().startswith("ALTER")]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM documents WHERE summary = 's'").fetchone()[0] == 2
+
+
+def test_output_table_writes_use_cached_schema(db_path, traced_sql):
+    ensure_output_table(db_path, "results", "sha1", ["label"], is_derived_table=True)
+    prepare_enrichment_schema(db_path, output_columns=["label"], output_table="results")
+    traced_sql.clear()
+
+    update_output_table(db_path, "results", "sha1", "a", {"label": "x"}, model_used="m")
+    update_output_table(db_path, "results", "sha1", "a", {"label": "y"}, model_used="m")
+
+    assert not [s for s in traced_sql if "table_info" in s or s.upper().startswith("ALTER")]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT label FROM results WHERE sha1 = 'a' AND model_used = 'm'").fetchall() == [("y",)]
+
+
+def test_ensure_columns_invalidates(db_path):
+    with sqlite3.connect(db_path) as conn:
+        assert schema_catalog.ensure_columns(conn, db_path, "documents", {"topic": "TEXT"}) == ["topic"]
+        assert schema_catalog.get(conn, db_path, "documents").has_column("topic")
+        assert schema_catalog.ensure_columns(conn, db_path, "documents", {"topic": "TEXT"}) == []
@@ -0,0 +1,71 @@
+"""Unit tests for full-selection cost estimation."""
+
+import pytest
+from src.utils import cost_estimation
+from src.utils.cost_estimation import count_selection_input_tokens, estimate_selection_cost
+
+
+@pytest.fixture
+def approx_encoding(monkeypatch):
+    """Use the deterministic 4 chars/token encoder regardless of tiktoken availability."""
+    from src.llm import token_utils
+    monkeypatch.setattr(token_utils, "get_encoding", lambda model: token_utils.ApproximateEncoding())
+    monkeypatch.setattr(token_utils, "_count_cache", token_utils.OrderedDict())
+    return token_utils
+
+
+def make_rows(n, size=400):
+    return [{'sha1': f'sha{i}', 'content': 'x' * (size + i)} for i in range(n)]
+
+
+class TestCountSelectionInputTokens:
+    """Test exact and calibrated counting modes."""
+
+    def test_exact_mode_counts_every_row(self, approx_encoding):
+        rows = make_rows(10)
+        counts, info = count_selection_input_tokens('gpt-4o', rows, [('content', None)])
+        assert info['mode'] == 'exact'
+        assert counts == [approx_encoding.count_tokens(f"content: {r['content']}", 'gpt-4o') for r in rows]
+
+    def test_exact_mode_memoises_per_sha1(self, approx_encoding):
+        rows = make_rows(3)
+        count_selection_input_tokens('gpt-4o', rows, [('content', 100)])
+        assert approx_encoding.get_cached_count('gpt-4o', 'sha0', 'content:100') is not None
+
+    def test_calibrated_mode_above_budget(self, approx_encoding):
+        rows = make_rows(200)
+        exact, _ = count_selection_input_tokens('gpt-4o', rows, [('content', None)])
+        counts, info = count_selection_input_tokens(
+            'gpt-4o', rows, [('content', None)], exact_char_budget=1000, sample_chars=5000
+        )
+        assert info['mode'].startswith('calibrated')
+        assert info['total_lower'] <= sum(counts) <= info['total_upper']
+        assert sum(counts) == pytest.approx(sum(exact), rel=0.02)
+
+
+def test_estimate_selection_cost_reports_distribution(approx_encoding):
+    rows = make_rows(20)
+    cost, breakdown = estimate_selection_cost(
+        'gpt-4o-mini', 'Summarise', rows, [('content', None)],
+        {'summary': {'type': 'string'}}, num_rows=20
+    )
+    assert cost > 0
+    assert breakdown['rows_to_process'] == 20
+    assert breakdown['estimation_mode'] == 'exact'
+    assert breakdown['p50_input_tokens'] <= breakdown['p95_input_tokens'] <= breakdown['max_input_tokens']
+    assert breakdown['rows_over_context'] == 0
+    assert 'p50' in cost_estimation.format_cost_estimate(breakdown)
+
+
+def test_prefix_layout_bills_the_prompt_at_the_cached_rate(approx_encoding):
+    rows = make_rows(10)
+    codebook = 'Code the document. ' * 400  # well over the provider caching minimum
+    args = ('gpt-4o-mini', codebook, rows, [('content', None)], {'code': {'type': 'string'}})
+    full_cost, full = estimate_selection_cost(*args, num_rows=10)
+    cached_cost, cached = estimate_selection_cost(*args, num_rows=10, cached_prompt=True)
+
+    assert full['cached_input_tokens'] == 0
+    prompt_tokens = approx_encoding.count_tokens(codebook, 'gpt-4o-mini') + cost_estimation.SYSTEM_PROMPT_OVERHEAD
+    assert cached['cached_input_tokens'] == 9 * prompt_tokens  # every request after the first
+    assert cached_cost < full_cost
+    assert 'cached prompt tokens' in cost_estimation.format_cost_estimate(cached)
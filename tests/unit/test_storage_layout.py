@@ -0,0 +1,91 @@
+"""Unit tests for split storage (audit and output tables in attached files)."""
+
+import sqlite3
+import pytest
+from src.db_operations import (
+    ensure_enrichment_responses_table, ensure_output_table, execute_query_optimized,
+    prepare_enrichment_schema, store_raw_enrichment_response, update_output_table
+)
+from src.schema_catalog import schema_catalog
+from src.storage_layout import (
+    build_layout, configure_storage, move_tables_to_layout, schema_for, unregister_layout
+)
+
+CONFIG = {'storage': {'layout': 'split'}, 'enrichments': [{'name': 'summary', 'output_table': 'summaries'}]}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "corpus.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE documents (sha1 TEXT PRIMARY KEY, raw_content TEXT)")
+        conn.executemany("INSERT INTO documents VALUES (?, ?)", [("a", "alpha"), ("b", "beta")])
+    schema_catalog.reset()
+    yield path
+    unregister_layout(path)
+    schema_catalog.reset()
+
+
+def tables_in(path):
+    with sqlite3.connect(path) as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'")}
+
+
+def create_enrichment_tables(path):
+    ensure_enrichment_responses_table(path)
+    ensure_output_table(path, "summaries", "sha1", ["summary"], is_derived_table=True)
+    prepare_enrichment_schema(path, output_columns=["summary"], output_table="summaries")
+    store_raw_enrichment_response(path, "a", "summary", '{"summary": "A"}', "m")
+    update_output_table(path, "summaries", "sha1", "a", {"summary": "A"}, "run1", "m")
+
+
+def test_tables_are_created_in_their_own_files(db_path, tmp_path):
+    layout = configure_storage(db_path, CONFIG)
+    assert schema_for(db_path, "enrichment_responses") == "audit"
+    assert schema_for(db_path, "summaries") == "out_summaries"
+    assert schema_for(db_path, "documents") == "main"
+
+    create_enrichment_tables(db_path)
+
+    assert tables_in(db_path) == {"documents"}
+    assert {"enrichment_responses", "enrichment_responses_full", "blobs"} <= tables_in(layout.audit_path)
+    assert layout.output_paths["summaries"] == str(tmp_path / "corpus.summaries.db")
+    assert "summaries" in tables_in(layout.output_paths["summaries"])
+
+
+def test_table_columns_resolve_across_files(db_path):
+    configure_storage(db_path, CONFIG)
+    create_enrichment_tables(db_path)
+
+    rows = execute_query_optimized(db_path, "SELECT rowid, sha1 FROM documents ORDER BY sha1",
+                                   ["raw_content", "summaries.summary"])
+    assert [(row["raw_content"], row["summary"]) for row in rows] == [("alpha", "A"), ("beta", None)]
+
+
+def test_split_moves_existing_tables(db_path):
+    create_enrichment_tables(db_path)
+    assert "summaries" in tables_in(db_path)
+
+    layout = configure_storage(db_path, CONFIG)
+    moved = move_tables_to_layout(db_path)
+
+    assert moved == {"enrichment_responses": 1, "blobs": 0, "summaries": 1}
+    assert tables_in(db_path) == {"documents"}
+    assert "enrichment_responses" in tables_in(layout.audit_path)
+    # Constraints and indexes came along, so UPSERTs still work after the move
+    update_output_table(db_path, "summaries", "sha1", "a", {"summary": "A2"}, "run2", "m")
+    with sqlite3.connect(layout.output_paths["summaries"]) as conn:
+        assert conn.execute("SELECT summary FROM summaries").fetchall() == [("A2",)]
+        assert "idx_summaries_model" in {row[1] for row in conn.execute("PRAGMA index_list(summaries)")}
+
+
+def test_too_many_output_tables(db_path):
+    config = {'storage': {'layout': 'split'},
+              'enrichments': [{'name': f'e{i}', 'output_table': f't{i}'} for i in range(10)]}
+    with pytest.raises(ValueError, match="at most 10"):
+        build_layout(db_path, config)
+
+
+def test_single_file_is_the_default(db_path):
+    assert build_layout(db_path, {'enrichments': CONFIG['enrichments']}) is None
+    assert schema_for(db_path, "enrichment_responses") == "main"
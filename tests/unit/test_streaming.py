@@ -0,0 +1,99 @@
+"""Unit tests for streamed structured responses."""
+
+import asyncio
+import json
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from pydantic import ValidationError
+from src.llm.retry import InvalidResponseError
+from src.llm.streaming import IncrementalJSONObject, read_structured_stream
+from src.llm.telemetry import CallRecord
+from src.llm_providers.openai_provider import OpenAIProvider
+from src.pydantic_schema import create_pydantic_model_from_schema
+from src.schema_managers import LanguageValidationError
+
+
+Answer = create_pydantic_model_from_schema({
+    'title_en': {'type': 'string', 'lang': 'en'},
+    'year': {'type': 'integer'},
+    'tags': {'type': 'array', 'items': {'type': 'string'}},
+}, 'Answer')
+
+
+def chunked(text, size=3):
+    async def chunks():
+        for i in range(0, len(text), size):
+            yield text[i:i + size]
+    return chunks()
+
+
+class Consumed:
+    """Counts how many chunks a reader took before stopping."""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.taken = 0
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            self.taken += 1
+            yield piece
+
+
+def test_fields_are_reported_as_they_complete():
+    parser = IncrementalJSONObject()
+    assert parser.feed('{"title_en": "A, {b}", "ye') == [('title_en', 'A, {b}')]
+    assert parser.partial_string() is None
+    assert parser.feed('ar": 1999, "tags": ["x", "y"]') == [('year', 1999)]
+    assert parser.feed('}') == [('tags', ['x', 'y'])]
+    assert parser.fields == {'title_en': 'A, {b}', 'year': 1999, 'tags': ['x', 'y']}
+
+
+def test_stream_is_parsed_into_the_model_and_first_token_recorded():
+    record = CallRecord(model='m', provider='openai', started_at='2024-01-01T00:00:00')
+    text = json.dumps({'title_en': 'On rivers', 'year': 2001, 'tags': ['a']})
+    result = asyncio.run(read_structured_stream(chunked(text), Answer, record))
+    assert result.year == 2001 and result.tags == ['a']
+    assert record.ttft_ms is not None
+
+
+def test_invalid_fields_abort_the_stream_early():
+    stream = Consumed(['{"year": "', 'soon", ', '"title_en": "x"}'])
+    with pytest.raises(ValidationError):
+        asyncio.run(read_structured_stream(stream, Answer))
+    assert stream.taken == 2
+
+    with pytest.raises(InvalidResponseError):
+        asyncio.run(read_structured_stream(chunked('{"colour": "red", "year": 1}'), Answer))
+
+
+def test_english_field_is_rejected_at_the_first_chinese_character():
+    stream = Consumed(['{"title_en": "The ', '河流', ' and more of it', ' still going"}'])
+    with pytest.raises(LanguageValidationError):
+        asyncio.run(read_structured_stream(stream, Answer))
+    assert stream.taken == 2
+
+
+def test_openai_provider_streams_structured_output():
+    content = json.dumps({'title_en': 'On rivers', 'year': 2001, 'tags': []})
+    sent = []
+
+    def handler(request):
+        sent.append(json.loads(request.content))
+        chunks = [{'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': content[i:i + 8]},
+                                'finish_reason': None}]} for i in range(0, len(content), 8)]
+        chunks.append({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+        chunks.append({'choices': [], 'usage': {'prompt_tokens': 5, 'completion_tokens': 7, 'total_tokens': 12}})
+        body = ''.join(
+            f"data: {json.dumps({'id': 'c', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'm', **c})}\n\n"
+            for c in chunks
+        ) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=body, headers={'content-type': 'text/event-stream'})
+
+    provider = OpenAIProvider(api_key='k', model='m')
+    provider.client = AsyncOpenAI(api_key='k', max_retries=0,
+                                  http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    result = asyncio.run(provider.generate_structured([{'role': 'user', 'content': 'hi'}], Answer, stream=True))
+    assert result.title_en == 'On rivers'
+    assert sent[0]['stream'] is True and sent[0]['stream_options'] == {'include_usage': True}
@@ -0,0 +1,82 @@
+"""Unit tests for the local OpenAI/Gemini stub API."""
+
+import asyncio
+from enum import Enum
+from typing import List, Optional
+import pytest
+from aiohttp.test_utils import TestServer
+from google import genai
+from openai import AsyncOpenAI, RateLimitError
+from pydantic import BaseModel
+from src.llm.retry import RATE_LIMIT, classify_error, retry_after
+from src.llm.stub_server import StubServer, StubSettings
+from src.llm_providers.gemini_provider import GeminiProvider
+from src.llm_providers.openai_provider import OpenAIProvider
+
+
+class Tone(str, Enum):
+    calm = 'calm'
+    angry = 'angry'
+
+
+class Speaker(BaseModel):
+    name: str
+    age: Optional[int]
+
+
+class Analysis(BaseModel):
+    tone: Tone
+    speakers: List[Speaker]
+    summary: str
+    confident: bool
+
+
+def serve(settings, use):
+    """Run ``use(base_url)`` against a stub server; returns its result and the server."""
+    stub = StubServer(settings)
+
+    async def run():
+        server = TestServer(stub.app())
+        await server.start_server()
+        try:
+            return await use(str(server.make_url('')).rstrip('/'))
+        finally:
+            await server.close()
+
+    return asyncio.run(run()), stub
+
+
+def test_openai_structured_and_streamed_answers_match_the_schema():
+    async def use(base_url):
+        provider = OpenAIProvider(api_key='k', model='gpt-4o-mini')
+        provider.client = AsyncOpenAI(api_key='k', base_url=f"{base_url}/v1", max_retries=0)
+        messages = [{'role': 'user', 'content': 'analyse this'}]
+        return await asyncio.gather(*(
+            provider.generate_structured(messages, Analysis, stream=stream) for stream in (False, True) * 5
+        ))
+
+    answers, stub = serve(StubSettings(latency_ms=5, seed=1), use)
+    assert all(isinstance(a, Analysis) and a.speakers[0].name for a in answers)
+    assert stub.requests == 10 and 1 < stub.peak_in_flight <= 10
+
+
+def test_gemini_structured_answer_matches_the_schema():
+    async def use(base_url):
+        provider = GeminiProvider(api_key='k', model='gemini-2.0-flash')
+        provider.client = genai.Client(api_key='k', http_options={'base_url': base_url})
+        return await provider.generate_structured([{'role': 'user', 'content': 'analyse this'}], Analysis)
+
+    answer, _ = serve(StubSettings(latency_ms=0), use)
+    assert isinstance(answer, Analysis) and answer.tone in Tone
+
+
+def test_injected_rate_limits_are_classified():
+    async def use(base_url):
+        client = AsyncOpenAI(api_key='k', base_url=f"{base_url}/v1", max_retries=0)
+        with pytest.raises(RateLimitError) as raised:
+            await client.chat.completions.create(model='m', messages=[{'role': 'user', 'content': 'hi'}])
+        return raised.value
+
+    error, stub = serve(StubSettings(latency_ms=0, rate_limit_rate=1.0, retry_after=2), use)
+    assert classify_error(error) == RATE_LIMIT and retry_after(error) == 2
+    assert stub.rate_limited == 1
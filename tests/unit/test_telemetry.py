@@ -0,0 +1,87 @@
+"""Unit tests for per-call LLM telemetry."""
+
+import asyncio
+import pytest
+from src.db_operations import get_llm_calls
+from src.llm import telemetry
+from src.llm.telemetry import (
+    acquire_slot, call_context, compute_cost, flush_call_records, summarize_calls, track_call
+)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    yield path
+    telemetry.recorder.drain(path)
+
+
+class TestTrackCall:
+    """Test call recording and persistence."""
+
+    def test_records_context_usage_and_cost(self, db_path):
+        with call_context(db_path=db_path, run_id='r1', enrichment_name='classify', sha1='abc', attempt=2):
+            with track_call('openai', 'gpt-4o-mini') as record:
+                record.set_usage(1000, 100, cached_tokens=400)
+
+        assert flush_call_records(db_path) == 1
+        [row] = get_llm_calls(db_path)
+        assert row['enrichment_name'] == 'classify'
+        assert row['sha1'] == 'abc'
+        assert row['attempt'] == 2
+        assert row['status'] == 'ok'
+        assert row['http_status'] == 200
+        assert row['latency_ms'] >= 0
+        assert row['cost_usd'] == pytest.approx(compute_cost('gpt-4o-mini', 1000, 100, 400))
+
+    def test_records_errors(self, db_path):
+        class RateLimited(Exception):
+            status_code = 429
+
+        with call_context(db_path=db_path):
+            with pytest.raises(RateLimited):
+                with track_call('openai', 'gpt-4o-mini'):
+                    raise RateLimited("slow down")
+
+        flush_call_records(db_path)
+        [row] = get_llm_calls(db_path)
+        assert row['status'] == 'error'
+        assert row['http_status'] == 429
+
+    def test_calls_outside_a_run_are_not_buffered(self, db_path):
+        with track_call('openai', 'gpt-4o-mini'):
+            pass
+        assert flush_call_records(db_path) == 0
+
+    def test_queue_wait_recorded(self, db_path):
+        async def run():
+            with call_context(db_path=db_path):
+                async with acquire_slot(asyncio.Semaphore(1)):
+                    with track_call('gemini', 'gemini-2.5-flash'):
+                        pass
+
+        asyncio.run(run())
+        flush_call_records(db_path)
+        assert get_llm_calls(db_path)[0]['queue_wait_ms'] is not None
+
+
+def test_cached_tokens_billed_at_cached_rate():
+    assert compute_cost('gpt-4o', 1_000_000, 0, cached_tokens=1_000_000) == pytest.approx(1.25)
+    assert compute_cost('gpt-4o', 1_000_000, 0) == pytest.approx(2.50)
+
+
+def test_summarize_calls():
+    rows = [
+        {'run_id': 'r', 'enrichment_name': 'e', 'sha1': f's{i}', 'model': 'm', 'provider': 'openai',
+         'attempt': 1, 'status': 'ok', 'http_status': 200, 'error': None, 'queue_wait_ms': 0.0,
+         'ttfb_ms': None, 'latency_ms': 1000.0 * (i + 1), 'prompt_tokens': 10, 'completion_tokens': 5,
+         'cached_tokens': 0, 'cost_usd': 0.01, 'started_at': f'2026-01-01T00:00:{i:02d}'}
+        for i in range(10)
+    ]
+    [summary] = summarize_calls(rows)
+    assert summary['documents'] == 10
+    assert summary['p50_ms'] == 5000.0
+    assert summary['p99_ms'] == 10000.0
+    assert summary['cost_per_1k_docs'] == pytest.approx(10.0)
+    # 10 documents over 19 seconds of run time
+    assert summary['docs_per_minute'] == pytest.approx(10 / 19 * 60)
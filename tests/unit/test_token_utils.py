@@ -86,4 +86,64 @@ class TestCalculateAvailableTokens:
         """Test with custom safety margin."""
         available = calculate_available_tokens("gpt-4", prompt_tokens=1000, safety_margin=500)
         # 8192 - 1000 - 500 = 6692
-        assert available == 6692
\ No newline at end of file
+        assert available == 6692
+
+@pytest.fixture
+def approx_encoding(monkeypatch):
+    """Use the deterministic 4 chars/token encoder regardless of tiktoken availability."""
+    from src.llm import token_utils
+    monkeypatch.setattr(token_utils, "get_encoding", lambda model: token_utils.ApproximateEncoding())
+    monkeypatch.setattr(token_utils, "_count_cache", token_utils.OrderedDict())
+    return token_utils
+
+
+class TestCountTokens:
+    """Test shared token counting."""
+    
+    def test_batch_matches_single(self, approx_encoding):
+        texts = ["a" * 8, "b" * 13, ""]
+        assert approx_encoding.count_tokens_batch(texts, "gpt-4o") == [
+            approx_encoding.count_tokens(t, "gpt-4o") for t in texts
+        ]
+    
+    def test_document_count_memoised(self, approx_encoding):
+        first = approx_encoding.count_document_tokens("a" * 40, "gpt-4o", "sha", "content")
+        # Same (sha1, column, limit) returns the memoised count without re-encoding
+        second = approx_encoding.count_document_tokens("different", "gpt-4o", "sha", "content")
+        assert first == second == 10
+        assert approx_encoding.count_document_tokens("a" * 40, "gpt-4o", "sha", "content", 500) == 10
+    
+    def test_input_column_key(self, approx_encoding):
+        assert approx_encoding.input_column_key([("content", 500), ("title", None)]) == "content:500,title"
+
+
+class TestTokenRatioCalibrator:
+    """Test per-script chars-per-token calibration."""
+    
+    def test_default_ratios(self):
+        from src.llm.token_utils import TokenRatioCalibrator
+        calibrator = TokenRatioCalibrator()
+        assert calibrator.approximate("a" * 400) == 100
+        assert calibrator.approximate("中文" * 50) == 100
+    
+    def test_learns_from_observations(self):
+        from src.llm.token_utils import TokenRatioCalibrator
+        calibrator = TokenRatioCalibrator()
+        calibrator.observe("a" * 6000, 1000)
+        assert calibrator.approximate("a" * 600) == 100
+
+
+class TestTruncateInputText:
+    """Test token-accurate input truncation."""
+    
+    def test_no_truncation(self, approx_encoding):
+        text, truncated = approx_encoding.truncate_input_text("prompt", "short input", "gpt-4o")
+        assert text == "short input"
+        assert truncated is False
+    
+    def test_truncates_to_budget(self, approx_encoding):
+        input_text = "word " * 20000
+        text, truncated = approx_encoding.truncate_input_text("prompt", input_text, "gpt-4", safety_margin=1000)
+        assert truncated is True
+        assert approx_encoding.count_tokens("prompt", "gpt-4") + approx_encoding.count_tokens(text, "gpt-4") <= 8192 - 1000
+        assert input_text.startswith(text)
@@ -0,0 +1,56 @@
+"""Unit tests for size-driven WAL checkpointing."""
+
+import asyncio
+import pytest
+from src.db_pool import connection_pool
+from src.wal_checkpoint import CheckpointManager, run_checkpointer
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    with connection_pool.connection(path) as conn:
+        conn.execute("CREATE TABLE t (x TEXT)")
+        conn.executemany("INSERT INTO t VALUES (?)", [("x" * 1000,) for _ in range(200)])
+        conn.commit()
+    yield path
+    connection_pool.close_all(path)
+
+
+def test_mode_escalation():
+    manager = CheckpointManager("unused.db", passive_bytes=100, restart_bytes=1000)
+    assert manager.choose_mode(50, idle=True) is None
+    assert manager.choose_mode(500, idle=False) == "PASSIVE"
+    assert manager.choose_mode(5000, idle=False) == "RESTART"
+    assert manager.choose_mode(500, idle=True) == "TRUNCATE"
+
+
+def test_busy_pool_is_not_idle(db_path):
+    manager = CheckpointManager(db_path, idle_seconds=0)
+    with connection_pool.connection(db_path):
+        assert not manager.is_idle()
+    assert manager.is_idle()
+
+
+def test_tick_checkpoints_large_wal(db_path):
+    manager = CheckpointManager(db_path, passive_bytes=1024)
+    assert manager.wal_size() > 1024
+
+    result = manager.tick(idle=False)
+    assert result.mode == "PASSIVE" and not result.busy
+    assert result.checkpointed_frames == result.wal_frames
+
+    assert manager.tick(idle=True).mode == "TRUNCATE"
+    assert manager.wal_size() == 0
+    assert manager.tick() is None
+
+
+def test_run_checkpointer_truncates_at_exit(db_path):
+    sizes = []
+
+    async def run():
+        async with run_checkpointer(db_path, interval=60, on_size=sizes.append):
+            pass
+
+    asyncio.run(run())
+    assert sizes == [0]